@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+import time
+from enum import Enum
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+from micropy import data
+from micropy.exceptions import PyDeviceError, PyDeviceProfileError
+from micropy.logger import Log
+from micropy.pyd import (
+    MessageHandlers,
+    MetaPyDeviceBackend,
+    PyDevice,
+    broker,
+    profiler,
+    read_fingerprint,
+    session,
+)
+from micropy.pyd.backend_upydevice import UPyDeviceBackend
+from micropy.pyd.calibrate import (
+    CHUNK_SIZES,
+    SAMPLE_SIZE,
+    CalibrationTrial,
+    LinkProfileStore,
+    calibrate,
+)
+from rich import box
+from rich.console import Console
+from rich.filesize import decimal
+from rich.table import Table
+
+from .devices import device_backend
+
+
+class AttachBackend(str, Enum):
+    upydevice = "upydevice"
+    rshell = "rshell"
+
+
+device_app = typer.Typer(name="device", rich_markup_mode="markdown", no_args_is_help=True)
+
+
+@device_app.callback()
+def device_callback() -> None:
+    """Inspect and diagnose devices.
+
+    \b
+    Record the serial traffic of a command with `--record-session`,
+    then see where the time went:
+
+     -  *micropy deploy* `/dev/ttyUSB0` *--record-session* `session.jsonl`
+
+     -  *micropy device analyze* `session.jsonl`
+
+    \b
+    Tune transfers to a device once with:
+
+     -  *micropy device calibrate* `/dev/ttyUSB0`
+
+    \b
+    Keep a device connected between commands with:
+
+     -  *micropy device attach* `/dev/ttyUSB0`
+
+    \b
+    See the heap and time a script takes on a device with:
+
+     -  *micropy device profile* `/dev/ttyUSB0` `main.py`
+    """
+    pass
+
+
+@device_app.command(name="analyze")
+def device_analyze(
+    recording: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="Session recorded with --record-session."
+    ),
+) -> None:
+    """Report time spent per command type in a recorded session.
+
+    \b
+    Commands are grouped by kind (i.e. write, read, checksum), with the
+    time spent waiting on the device and the bytes sent each way.
+    Time not spent waiting on the device was spent on the host.
+
+    \b
+    Sessions recorded with the upydevice backend can also be replayed
+    in place of the device, with `--backend replay`:
+
+        \b
+        $ micropy deploy session.jsonl --backend replay
+        \b
+
+    """
+    log = Log.get_logger("MicroPy")
+    try:
+        loaded = session.SessionRecording.load(recording)
+    except PyDeviceError as e:
+        log.error(str(e))
+        raise typer.Exit(1) from e
+    report = session.analyze(loaded)
+    header = loaded.header
+    log.title(f"Session of $[{header.get('port')}] ({header.get('backend')})")
+    table = Table(box=box.SIMPLE)
+    table.add_column("Command")
+    table.add_column("Count", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Share", justify="right")
+    table.add_column("Sent", justify="right")
+    table.add_column("Received", justify="right")
+    table.add_column("Throughput", justify="right")
+    for stats in report.commands:
+        share = stats.seconds / report.duration if report.duration else 0.0
+        table.add_row(
+            stats.kind,
+            str(stats.count),
+            f"{stats.seconds:.2f}s",
+            f"{share:.0%}",
+            decimal(stats.sent),
+            decimal(stats.received),
+            f"{decimal(int(stats.throughput))}/s",
+        )
+    host = report.duration - report.device_seconds
+    table.add_row("[dim]host[/]", "", f"[dim]{host:.2f}s[/]", "", "", "", "")
+    Console().print(table)
+    log.info(
+        f"{report.exchanges} exchanges in $[{report.duration:.2f}s], "
+        f"{decimal(report.sent)} sent, {decimal(report.received)} received "
+        f"($[{decimal(int(report.throughput))}/s] effective)."
+    )
+
+
+@device_app.command(name="calibrate")
+def device_calibrate(
+    port: str = typer.Argument(..., help="Port of device to calibrate."),
+    chunk_size: Optional[List[int]] = typer.Option(
+        None,
+        "--chunk-size",
+        "-s",
+        help=f"Chunk sizes to try. Defaults to {', '.join(map(str, CHUNK_SIZES))}.",
+        show_default=False,
+    ),
+    sample_size: int = typer.Option(SAMPLE_SIZE, help="Bytes transferred per trial.", min=1),
+    repeats: int = typer.Option(2, help="Transfers per trial.", min=1),
+    save: bool = typer.Option(True, help="Save the profile for later transfers to the device."),
+) -> None:
+    """Find the fastest reliable transfer settings for a device.
+
+    \b
+    Times writes and reads of a sample file to the device with each
+    transfer mode and chunk size. The fastest setting that transferred
+    intact is saved for the device, and used by later commands
+    (i.e. *deploy*, *stubs create*) instead of probing the device.
+
+    \b
+    Settings are saved per device fingerprint (firmware and modules),
+    so recalibrate after flashing new firmware. While the device is
+    attached, its broker calibrates the link and uses the result.
+
+    """
+    log = Log.get_logger("MicroPy")
+    log.title(f"Connecting to Pyboard @ $[{port}]")
+    try:
+        pyb: PyDevice[MetaPyDeviceBackend] = PyDevice(
+            port, auto_connect=True, backend=device_backend(port, UPyDeviceBackend)
+        )
+    except (SystemExit, PyDeviceError) as e:
+        log.error(f"Failed to connect, are you sure $[{port}] is correct?")
+        raise typer.Exit(1) from e
+
+    def _on_trial(trial: CalibrationTrial) -> None:
+        status = "ok" if trial.ok else "unreliable"
+        log.info(
+            f"{trial.direction} {trial.mode} @ {trial.chunk_size}: "
+            f"{decimal(int(trial.throughput))}/s ({status})"
+        )
+
+    log.title(f"Calibrating $[{port}]")
+    try:
+        fingerprint = read_fingerprint(pyb.pydevice)
+        result = calibrate(
+            pyb.pydevice,
+            chunk_sizes=chunk_size or CHUNK_SIZES,
+            sample_size=sample_size,
+            repeats=repeats,
+            on_trial=_on_trial,
+        )
+    except PyDeviceError as e:
+        log.error(f"Failed to calibrate $[{port}]: {e}")
+        raise typer.Exit(1) from e
+    finally:
+        pyb.disconnect()
+    table = Table(box=box.SIMPLE)
+    table.add_column("Direction")
+    table.add_column("Mode")
+    table.add_column("Chunk", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Throughput", justify="right")
+    table.add_column("Reliable")
+    for trial in result.trials:
+        table.add_row(
+            trial.direction,
+            trial.mode,
+            str(trial.chunk_size),
+            f"{trial.seconds:.2f}s",
+            f"{decimal(int(trial.throughput))}/s",
+            "yes" if trial.ok else "[red]no[/]",
+        )
+    Console().print(table)
+    profile = result.profile
+    write_mode = "raw-paste" if profile.raw_paste else "repl"
+    read_mode = "stream" if profile.stream_reads else "chunked"
+    log.info(
+        f"Writes: $[{write_mode}] @ {profile.write_chunk_size} "
+        f"({decimal(int(profile.write_throughput))}/s), "
+        f"reads: $[{read_mode}] @ {profile.read_chunk_size} "
+        f"({decimal(int(profile.read_throughput))}/s)."
+    )
+    if save:
+        LinkProfileStore(data.LINK_PROFILES).save(fingerprint, profile)
+        log.success(f"Saved link profile for $[{fingerprint.machine}].")
+
+
+@device_app.command(name="attach")
+def device_attach(
+    port: str = typer.Argument(..., help="Port of device to attach to."),
+    backend: AttachBackend = typer.Option(AttachBackend.upydevice, help="PyDevice backend to use."),
+    foreground: bool = typer.Option(
+        False, "--foreground", help="Serve from this process until interrupted."
+    ),
+    timeout: float = typer.Option(30.0, help="Seconds to wait for the device to connect.", min=0),
+) -> None:
+    """Keep a device connected for later commands.
+
+    \b
+    Starts a background process holding the connection to the device.
+    While attached, commands on the port (i.e. *deploy*, *stubs create*)
+    go through it instead of connecting to the device themselves.
+
+    \b
+    Stop it with:
+
+        \b
+        $ micropy device detach /dev/ttyUSB0
+        \b
+
+    """
+    log = Log.get_logger("MicroPy")
+    if broker.is_running(port):
+        log.success(f"Already attached to $[{port}].")
+        return
+    if foreground:
+        log.title(f"Attaching to $[{port}], press Ctrl-C to detach.")
+        raise typer.Exit(broker.main([port, "--backend", backend.value]))
+    log.title(f"Attaching to $[{port}]")
+    log_path = broker.socket_path(port).with_suffix(".log")
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_path.open("ab") as output:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "micropy.pyd.broker", port, "--backend", backend.value],
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + timeout
+    while not broker.is_running(port):
+        if process.poll() is not None or time.monotonic() > deadline:
+            if process.poll() is None:
+                process.terminate()
+            log.error(f"Failed to attach to $[{port}], see $[{log_path}] for details.")
+            raise typer.Exit(1)
+        time.sleep(0.1)
+    log.success(f"Attached to $[{port}] (pid {process.pid}).")
+
+
+@device_app.command(name="detach")
+def device_detach(
+    port: str = typer.Argument(..., help="Port of attached device."),
+) -> None:
+    """Disconnect a device kept connected with *attach*."""
+    log = Log.get_logger("MicroPy")
+    if not broker.shutdown(port):
+        log.info(f"No device attached at $[{port}].")
+        return
+    log.success(f"Detached from $[{port}].")
+
+
+def _us(value: float) -> str:
+    return f"{value / 1000:.1f}ms" if value >= 1000 else f"{value:.0f}us"
+
+
+@device_app.command(name="profile")
+def device_profile(
+    port: str = typer.Argument(..., help="Port of device to run the script on."),
+    script: Path = typer.Argument(..., exists=True, dir_okay=False, help="Script to profile."),
+) -> None:
+    """Run a script on a device, reporting its heap usage and timing.
+
+    \b
+    Free and allocated heap and the time elapsed are sampled as the script
+    starts and ends, and around each call of the functions and methods it
+    defines at its top level. The script is run from a temporary file,
+    so nothing is left on the device.
+
+    \b
+    Heap is only seen at samples, so the peak is the highest sampled.
+
+    """
+    log = Log.get_logger("MicroPy")
+    log.title(f"Connecting to Pyboard @ $[{port}]")
+    try:
+        pyb: PyDevice[MetaPyDeviceBackend] = PyDevice(
+            port, auto_connect=True, backend=device_backend(port, UPyDeviceBackend)
+        )
+    except (SystemExit, PyDeviceError) as e:
+        log.error(f"Failed to connect, are you sure $[{port}] is correct?")
+        raise typer.Exit(1) from e
+    log.title(f"Profiling $[{script.name}] on $[{port}]")
+    consumer = MessageHandlers(on_message=lambda x: isinstance(x, str) and log.info(x.rstrip()))
+    failure = None
+    try:
+        report = profiler.profile_script(pyb.pydevice, script.read_text(), consumer=consumer)
+    except PyDeviceProfileError as e:
+        # still report what was sampled before it failed.
+        log.error(f"Failed to profile $[{script.name}]: {e}")
+        report, failure = e.report, e
+    finally:
+        pyb.disconnect()
+    if not report.samples:
+        log.error(f"No samples received, $[{script.name}] may have failed to start.")
+        raise typer.Exit(1) from failure
+    if report.functions:
+        table = Table(box=box.SIMPLE)
+        table.add_column("Function")
+        table.add_column("Calls", justify="right")
+        table.add_column("Total", justify="right")
+        table.add_column("Mean", justify="right")
+        table.add_column("Max", justify="right")
+        table.add_column("Heap growth", justify="right")
+        for stats in report.functions:
+            table.add_row(
+                stats.name,
+                str(stats.calls),
+                _us(stats.total_us),
+                _us(stats.mean_us),
+                _us(stats.max_us),
+                decimal(stats.max_growth) if stats.max_growth > 0 else "-",
+            )
+        Console().print(table)
+    log.info(
+        f"Ran in $[{_us(report.duration_us)}], "
+        f"heap peaked at $[{decimal(report.peak_alloc)}] allocated "
+        f"({decimal(report.peak_growth)} over baseline), "
+        f"least free $[{decimal(report.min_free)}]."
+    )
+    if report.error is not None:
+        log.error(f"$[{script.name}] raised {report.error}.")
+    if report.error is not None or failure is not None:
+        raise typer.Exit(1) from failure
@@ -0,0 +1,143 @@
+"""Helpers for commands that operate on several devices at once."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence, Type
+
+import typer
+from micropy import data
+from micropy.logger import Log, ServiceLog
+from micropy.pyd import (
+    MessageHandlers,
+    MetaPyDeviceBackend,
+    ProgressStreamConsumer,
+    TelemetryConsumer,
+    broker,
+    discovery,
+)
+from micropy.pyd.parallel import GLOB_CHARS, DeviceResult, expand_ports
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+__all__ = [
+    "resolve_ports",
+    "device_logger",
+    "device_consumers",
+    "session_path",
+    "device_telemetry",
+    "device_backend",
+    "print_device_summary",
+]
+
+
+def _device_port(cache: discovery.DeviceCache, pattern: str) -> str:
+    if GLOB_CHARS & set(pattern) or Path(pattern).exists():
+        return pattern
+    return cache.port_for(pattern) or pattern
+
+
+def resolve_ports(log: ServiceLog, patterns: Sequence[str]) -> list[str]:
+    """Expand port arguments, exiting if none match a device.
+
+    Unique ids (or id prefixes) of boards recently listed by
+    `micropy devices` select the port the board was found on.
+    """
+    cache = discovery.DeviceCache(data.DEVICE_CACHE)
+    ports = expand_ports(_device_port(cache, pattern) for pattern in patterns)
+    if not ports:
+        log.error(f"No devices found matching: $[{', '.join(patterns)}]")
+        raise typer.Exit(1)
+    return ports
+
+
+def device_logger(port: Optional[str] = None) -> ServiceLog:
+    """Logger for device output, titled with `port` when running several devices."""
+    return Log.add_logger(f"Pyboard {port}" if port else "Pyboard", "bright_white")
+
+
+def device_consumers(pyb_log: ServiceLog, *, describe: bool = True) -> dict[str, Any]:
+    """Stream and message consumers for a device, as :class:`~micropy.pyd.PyDevice` kwargs.
+
+    Args:
+        pyb_log: Device logger, see :func:`device_logger`.
+        describe: Prefix progress bars with the device logger title.
+
+    """
+
+    def _get_desc(name: str, cfg: Optional[dict[str, Any]]) -> tuple[str, dict[str, Any]]:
+        desc = f"{pyb_log.get_service()} {name}"
+        return name, {**(cfg or {}), "desc": desc}
+
+    return dict(
+        stream_consumer=ProgressStreamConsumer(on_description=_get_desc if describe else None),
+        message_consumer=MessageHandlers(
+            on_message=lambda x: isinstance(x, str) and pyb_log.info(x.strip())
+        ),
+    )
+
+
+def session_path(path: Optional[Path], port: str, *, many: bool) -> Optional[Path]:
+    """Session recording for `port`, suffixed with the port name when recording several devices."""
+    if path is None or not many:
+        return path
+    return path.with_name(f"{path.stem}-{Path(port).name}{path.suffix}")
+
+
+def device_telemetry(path: Optional[Path], port: str, *, many: bool) -> Optional[TelemetryConsumer]:
+    """Telemetry consumer writing transfer records of `port`, if requested.
+
+    Files are suffixed with the port name when recording several devices,
+    as with :func:`session_path`.
+    """
+    path = session_path(path, port, many=many)
+    return TelemetryConsumer(path) if path is not None else None
+
+
+def device_backend(
+    port: str, backend: Type[MetaPyDeviceBackend], *, record_session: Optional[Path] = None
+) -> Type[MetaPyDeviceBackend]:
+    """Backend to connect to `port` with, through its broker if attached.
+
+    Sessions are recorded on the serial link, so are never brokered.
+    """
+    if record_session is None and broker.is_running(port):
+        return broker.BrokerPyDeviceBackend
+    return backend
+
+
+def print_device_summary(
+    results: Sequence[DeviceResult[Any]],
+    *,
+    title: str,
+    detail: Callable[[Any], str] = str,
+) -> None:
+    """Print a table of per-device results.
+
+    Args:
+        results: Results from :func:`~micropy.pyd.parallel.run_parallel`.
+        title: Table title.
+        detail: Formats the value of a successful result.
+
+    """
+    table = Table(title=title, box=box.SIMPLE)
+    table.add_column("Port")
+    table.add_column("Status")
+    table.add_column("Time", justify="right")
+    table.add_column("Detail")
+    styles = {"ok": "green", "failed": "red", "timed out": "yellow"}
+    for result in results:
+        if result.timed_out:
+            info = "device did not respond"
+        elif result.error is not None:
+            info = str(result.error) or type(result.error).__name__
+        else:
+            info = str(detail(result.value))
+        table.add_row(
+            result.port,
+            f"[{styles[result.status]}]{result.status}[/]",
+            f"{result.duration:.1f}s",
+            info,
+        )
+    Console().print(table)
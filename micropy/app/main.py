@@ -7,17 +7,36 @@ from typing import List, Optional, cast
 import micropy.exceptions as exc
 import questionary as prompt
 import typer
-from micropy import logger, utils
+from micropy import data, logger, utils
 from micropy.main import MicroPy
 from micropy.project import Project, modules
+from micropy.pyd import MetaPyDeviceBackend, PyDevice, discovery
+from micropy.pyd import sync as device_sync
+from micropy.pyd.calibrate import LinkProfileStore
+from micropy.pyd.parallel import expand_ports, run_parallel
 from micropy.stubs.stubs import Stub
 from micropy.utils._compat import metadata
 from questionary import Choice
-
-from .stubs import stubs_app
+from rich import box
+from rich.console import Console
+from rich.filesize import decimal
+from rich.table import Table
+
+from .device import device_app
+from .devices import (
+    device_backend,
+    device_consumers,
+    device_logger,
+    device_telemetry,
+    print_device_summary,
+    resolve_ports,
+    session_path,
+)
+from .stubs import CreateBackend, TransferChecksum, stubs_app
 
 app = typer.Typer(name="micropy-cli", no_args_is_help=True, rich_markup_mode="markdown")
 app.add_typer(stubs_app)
+app.add_typer(device_app)
 
 
 @app.callback()
@@ -306,3 +325,212 @@ def main_install(
             pkg_name = str(e.package)
             mpy.log.error(f"Failed to install {pkg_name}!" " Is it available on PyPi?", exception=e)
             raise typer.Abort() from e
+
+
+def main_deploy(
+    ctx: typer.Context,
+    port: List[str] = typer.Argument(
+        ...,
+        help="Serial ports used to connect to devices. Globs (i.e. /dev/ttyUSB*) are expanded. "
+        "Boards listed by `micropy devices` can also be given by unique id.",
+    ),
+    backend: CreateBackend = typer.Option(CreateBackend.upydevice, help="PyDevice backend to use."),
+    checksum: TransferChecksum = typer.Option(
+        TransferChecksum.sha256, help="Checksum used to detect changed files."
+    ),
+    prune: bool = typer.Option(
+        False,
+        help="Remove all device files that are not part of the project, "
+        "not only those previously deployed.",
+    ),
+    force: bool = typer.Option(
+        False, "-f", "--force", help="Query the device even if nothing changed locally."
+    ),
+    dry_run: bool = typer.Option(False, help="Show changes without applying them."),
+    jobs: Optional[int] = typer.Option(
+        None,
+        "-j",
+        "--jobs",
+        help="Devices to deploy to at once. Defaults to all of them.",
+        rich_help_panel="Devices",
+    ),
+    timeout: float = typer.Option(
+        300,
+        help="Seconds before an unresponsive device is abandoned, when using several devices.",
+        rich_help_panel="Devices",
+    ),
+    record_session: Optional[Path] = typer.Option(
+        None,
+        "--record-session",
+        help="Record device serial traffic to this file, see `micropy device analyze`.",
+        rich_help_panel="Devices",
+    ),
+    telemetry: Optional[Path] = typer.Option(
+        None,
+        "--telemetry",
+        help="Append per-transfer timings, retries and resets to this JSON lines file.",
+        rich_help_panel="Devices",
+    ),
+) -> None:
+    """Deploy project to a device, uploading only changed files.
+
+    \b
+    Files in `src/` are deployed to the device root and installed
+    packages to `/lib`. Files are compared by size and checksum, so
+    only new or changed files are uploaded. Previously deployed files
+    that were removed from the project are deleted from the device.
+
+    \b
+    The last deployed state is cached per board, so when nothing
+    changed locally only the id of the board is read.
+
+        \b
+        $ micropy deploy /dev/ttyUSB0
+        \b
+
+    \b
+    Several devices can be deployed to at once, with a summary of each:
+
+        \b
+        $ micropy deploy "/dev/ttyUSB*"
+        \b
+
+    """
+    mpy: MicroPy = ctx.ensure_object(MicroPy)
+    project = ensure_project(ctx)
+    log = mpy.log
+    ports = resolve_ports(log, port)
+    files = device_sync.collect_files(
+        [(project.path / "src", ""), (project.data_path / project.name, "lib")]
+    )
+    cache = device_sync.ManifestCache(project.data_path / "device_manifest.json")
+    local = device_sync.build_manifest(files, checksum=checksum.value)
+
+    def deploy_device(port: str, pyb_log: logger.ServiceLog) -> Optional[device_sync.SyncPlan]:
+        log.title(f"Connecting to Pyboard @ $[{port}]")
+        try:
+            pyb: PyDevice[MetaPyDeviceBackend] = PyDevice(
+                port,
+                auto_connect=True,
+                backend=device_backend(port, backend.backend, record_session=record_session),
+                checksum=checksum.value,
+                record_session=session_path(record_session, port, many=len(ports) > 1),
+                link_profiles=LinkProfileStore(data.LINK_PROFILES),
+                telemetry=device_telemetry(telemetry, port, many=len(ports) > 1),
+                **device_consumers(pyb_log, describe=len(ports) > 1),
+            )
+        except (SystemExit, exc.PyDeviceError):
+            log.error(f"Failed to connect, are you sure $[{port}] is correct?")
+            return None
+        log.title(f"Deploying $[{project.name}] to $[{port}]")
+        try:
+            plan = device_sync.sync(
+                pyb.pydevice,
+                files,
+                manifest=local,
+                cache=cache,
+                checksum=checksum.value,
+                consumer=pyb.consumer,
+                prune=prune,
+                force=force,
+                dry_run=dry_run,
+            )
+        finally:
+            pyb.disconnect()
+        for path in plan.upload:
+            log.info(f"$[+] {path}")
+        for path in plan.delete:
+            log.info(f"$[-] {path}")
+        if not plan.changed:
+            log.success(f"Device $[{port}] is up to date.")
+            return plan
+        counts = _counts(plan)
+        log.success(f"Dry run: {counts}" if dry_run else f"Deployed to $[{port}]! ({counts})")
+        return plan
+
+    if len(ports) == 1:
+        plan = deploy_device(ports[0], device_logger())
+        if plan is None:
+            raise typer.Exit(1)
+        return
+
+    def _worker(port: str) -> device_sync.SyncPlan:
+        plan = deploy_device(port, device_logger(port))
+        if plan is None:
+            raise exc.PyDeviceError("Failed to connect.")
+        return plan
+
+    results = run_parallel(ports, _worker, max_workers=jobs, timeout=timeout)
+    print_device_summary(results, title="Dry run" if dry_run else "Deployed", detail=_counts)
+    if not all(r.ok for r in results):
+        raise typer.Exit(1)
+
+
+def _counts(plan: device_sync.SyncPlan) -> str:
+    return f"{len(plan.upload)} upload, {len(plan.delete)} delete, {len(plan.unchanged)} unchanged"
+
+
+app.command(name="deploy")(main_deploy)
+app.command(name="sync", help="Alias of deploy.")(main_deploy)
+
+
+@app.command(name="devices")
+def main_devices(
+    port: Optional[List[str]] = typer.Argument(
+        None,
+        help="Ports to probe. Globs (i.e. /dev/ttyUSB*) are expanded. "
+        "Defaults to every USB serial port.",
+        show_default=False,
+    ),
+    timeout: float = typer.Option(
+        discovery.PROBE_TIMEOUT, help="Seconds to wait on each response from a port.", min=0.1
+    ),
+    refresh: bool = typer.Option(False, "--refresh", help="Probe ports even if recently probed."),
+) -> None:
+    """List MicroPython boards attached to this machine.
+
+    \b
+    Every port is probed at once, so ports without a board are ruled
+    out within the timeout. Boards found are remembered for a few
+    minutes, and can be given by unique id (or the start of it)
+    in place of a port in later commands:
+
+        \b
+        $ micropy devices
+        $ micropy deploy 3c71bf
+        \b
+
+    \b
+    Probing interrupts any program running on a board.
+
+    """
+    log = logger.Log.get_logger("MicroPy")
+    cache = discovery.DeviceCache(data.DEVICE_CACHE)
+    devices = None if port or refresh else cache.load()
+    if devices is None:
+        log.title("Probing ports for MicroPython boards")
+        devices = discovery.discover(
+            expand_ports(port) if port else None,
+            timeout=timeout,
+            cache=cache,
+            on_result=lambda r: log.debug(f"{r.port}: {r.error or r.status} ({r.duration:.2f}s)"),
+        )
+    if not devices:
+        log.error("No MicroPython boards found.")
+        raise typer.Exit(1)
+    table = Table(box=box.SIMPLE)
+    table.add_column("Port")
+    table.add_column("Id")
+    table.add_column("Firmware")
+    table.add_column("Board")
+    table.add_column("Free memory", justify="right")
+    for device in devices:
+        table.add_row(
+            device.port,
+            device.unique_id or "[dim]-[/]",
+            f"{device.sysname} {device.release}",
+            device.machine,
+            decimal(device.mem_free) if device.mem_free is not None else "",
+        )
+    Console().print(table)
+    log.success(f"Found {len(devices)} MicroPython board{'s' if len(devices) != 1 else ''}.")
@@ -1,30 +1,52 @@
 from __future__ import annotations
 
+import io
 import sys
 import tempfile
+import threading
 from enum import Enum
 from pathlib import Path
 from typing import List, Optional, Type
 
 import micropy.exceptions as exc
 import typer
+from micropy import data
 from micropy.exceptions import PyDeviceError
-from micropy.logger import Log
+from micropy.logger import Log, ServiceLog
 from micropy.main import MicroPy
 from micropy.pyd import (
+    ConsumerDelegate,
     DevicePath,
-    MessageHandlers,
     MetaPyDeviceBackend,
-    ProgressStreamConsumer,
     PyDevice,
+    read_fingerprint,
 )
+from micropy.pyd.backend_replay import ReplayPyDeviceBackend
 from micropy.pyd.backend_rshell import RShellPyDeviceBackend
 from micropy.pyd.backend_upydevice import UPyDeviceBackend
+from micropy.pyd.calibrate import LinkProfileStore
+from micropy.pyd.framing import FrameDecoder
+from micropy.pyd.parallel import run_in_background, run_parallel
 from micropy.stubs import source as stubs_source
-from micropy.utils.stub import prepare_create_stubs
+from micropy.stubs.stubs import Stub
+from micropy.utils.stub import (
+    check_create_stubs_options,
+    create_stubs_cache_key,
+    prepare_create_stubs,
+)
 from stubber.codemod import board as stub_board
 from stubber.codemod.modify_list import ListChangeSet
 
+from .devices import (
+    device_backend,
+    device_consumers,
+    device_logger,
+    device_telemetry,
+    print_device_summary,
+    resolve_ports,
+    session_path,
+)
+
 stubs_app = typer.Typer(name="stubs", rich_markup_mode="markdown", no_args_is_help=True)
 
 
@@ -51,9 +73,17 @@ def stubs_callback():
     pass
 
 
+class TransferChecksum(str, Enum):
+    sha256 = "sha256"
+    crc32 = "crc32"
+
+
 class CreateBackend(str, Enum):
+    backend: Type[MetaPyDeviceBackend]
+
     upydevice = ("upydevice", UPyDeviceBackend)
     rshell = ("rshell", RShellPyDeviceBackend)
+    replay = ("replay", ReplayPyDeviceBackend)
 
     def __new__(cls, value: str, backend: Type[MetaPyDeviceBackend]):
         obj = str.__new__(cls, value)
@@ -73,8 +103,16 @@ def create_changeset(
 @stubs_app.command(name="create")
 def stubs_create(
     ctx: typer.Context,
-    port: str = typer.Argument(..., help="Serial port used to connect to device"),
+    port: List[str] = typer.Argument(
+        ...,
+        help="Serial ports used to connect to devices. Globs (i.e. /dev/ttyUSB*) are expanded. "
+        "Boards listed by `micropy devices` can also be given by unique id.",
+    ),
     backend: CreateBackend = typer.Option(CreateBackend.upydevice, help="PyDevice backend to use."),
+    checksum: TransferChecksum = typer.Option(
+        TransferChecksum.sha256,
+        help="Checksum used to verify files read from the device. crc32 is cheaper on slow boards.",
+    ),
     variant: stub_board.CreateStubsVariant = typer.Option(
         stub_board.CreateStubsVariant.BASE,
         "-v",
@@ -111,6 +149,43 @@ def stubs_create(
         help="Cross compile to .mpy via mpy-cross.",
         rich_help_panel="Stubs",
     ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Stream stubs to the host as they are generated instead of writing them to the device.",
+        rich_help_panel="Stubs",
+    ),
+    force: bool = typer.Option(
+        False,
+        "-f",
+        "--force",
+        help="Regenerate stubs even if stubs for a matching device firmware are installed.",
+        rich_help_panel="Stubs",
+    ),
+    jobs: Optional[int] = typer.Option(
+        None,
+        "-j",
+        "--jobs",
+        help="Devices to create stubs from at once. Defaults to all of them.",
+        rich_help_panel="Devices",
+    ),
+    timeout: float = typer.Option(
+        900,
+        help="Seconds before an unresponsive device is abandoned, when using several devices.",
+        rich_help_panel="Devices",
+    ),
+    record_session: Optional[Path] = typer.Option(
+        None,
+        "--record-session",
+        help="Record device serial traffic to this file, see `micropy device analyze`.",
+        rich_help_panel="Devices",
+    ),
+    telemetry: Optional[Path] = typer.Option(
+        None,
+        "--telemetry",
+        help="Append per-transfer timings, retries and resets to this JSON lines file.",
+        rich_help_panel="Devices",
+    ),
 ):
     """Create stubs from micropython-enabled devices.
 
@@ -137,69 +212,140 @@ def stubs_create(
      - **db**: Persist stub progress across reboots.\n
      - **lvgl**: Additional support for LVGL devices.\n
 
+    \n
+    **Stream stubs to host** (for devices with little flash):\n
+     - `micropy stubs create --stream /dev/ttyUSB0`
+
+    \n
+    **Create stubs from several devices at once**:\n
+     - `micropy stubs create /dev/ttyUSB0 /dev/ttyUSB1`\n
+     - `micropy stubs create "/dev/ttyUSB*"`
+
+    \n
+    If stubs were previously created from a device with identical firmware
+    (and the same module options), they are reused. Pass `--force` to regenerate them.
+
     """
     mp: MicroPy = ctx.ensure_object(MicroPy)
     log = mp.log
-    log.title(f"Connecting to Pyboard @ $[{port}]")
-    pyb_log = Log.add_logger("Pyboard", "bright_white")
-
-    def _get_desc(name: str, cfg: dict):
-        desc = f"{pyb_log.get_service()} {name}"
-        return name, cfg | dict(desc=desc)
-
-    message_handler = MessageHandlers(
-        on_message=lambda x: isinstance(x, str) and pyb_log.info(x.strip())
-    )
     try:
-        pyb = PyDevice(
-            port,
-            auto_connect=True,
-            stream_consumer=ProgressStreamConsumer(on_description=_get_desc),
-            message_consumer=message_handler,
-            backend=backend.backend,
-        )
-    except (SystemExit, PyDeviceError):
-        log.error(f"Failed to connect, are you sure $[{port}] is correct?")
+        check_create_stubs_options(variant=variant, stream=stream)
+    except ValueError as e:
+        log.error(str(e))
         return None
-
-    log.success("Connected!")
+    ports = resolve_ports(log, port)
+    modules_set = create_changeset(module, replace=not module_defaults)
+    exclude_set = create_changeset(exclude, replace=not exclude_defaults)
+    # prepare (and cross compile) createstubs on the host while devices connect,
+    # abandoned at exit if every device matches installed stubs.
+    prepared = run_in_background(
+        prepare_create_stubs,
+        variant=variant,
+        modules_set=modules_set,
+        exclude_set=exclude_set,
+        compile=compile,
+        stream=stream,
+    )
+    changeset_key = create_stubs_cache_key(
+        variant=variant, modules_set=modules_set, exclude_set=exclude_set
+    )
     if module or exclude:
         log.title("Preparing createstubs for:")
         log.info(f"Modules: {', '.join(module or [])}")
         log.info(f"Exclude: {', '.join(exclude or [])}")
-    create_stubs = prepare_create_stubs(
-        variant=variant,
-        modules_set=create_changeset(module, replace=not module_defaults),
-        exclude_set=create_changeset(exclude, replace=not exclude_defaults),
-        compile=compile,
-    )
-    dev_path = DevicePath("createstubs.mpy") if compile else DevicePath("createstubs.py")
-    log.info("Executing stubber on pyboard...")
-    try:
-        pyb.run_script(create_stubs, DevicePath(dev_path))
-    except Exception as e:
-        # TODO: Handle more usage cases
-        log.error(f"Failed to execute script: {e!s}", exception=e)
-        raise
-    log.success("Done!")
-    log.info("Copying stubs...")
-    with tempfile.TemporaryDirectory() as tmpdir:
-        pyb.copy_from(
-            DevicePath("/stubs"),
-            tmpdir,
-            verify_integrity=True,
-            # exclude due to ps1 var possibly different.
-            exclude_integrity={"sys.py", "usys.py"},
+    stubs_lock = threading.Lock()
+
+    def create_device_stubs(port: str, pyb_log: ServiceLog) -> Optional[Stub]:
+        log.title(f"Connecting to Pyboard @ $[{port}]")
+        try:
+            pyb = PyDevice(
+                port,
+                auto_connect=True,
+                backend=device_backend(port, backend.backend, record_session=record_session),
+                checksum=checksum.value,
+                record_session=session_path(record_session, port, many=len(ports) > 1),
+                link_profiles=LinkProfileStore(data.LINK_PROFILES),
+                telemetry=device_telemetry(telemetry, port, many=len(ports) > 1),
+                **device_consumers(pyb_log),
+            )
+        except (SystemExit, PyDeviceError):
+            log.error(f"Failed to connect, are you sure $[{port}] is correct?")
+            return None
+
+        log.success(f"Connected to $[{port}]!")
+        fingerprint = None
+        try:
+            fingerprint = read_fingerprint(pyb.pydevice)
+        except Exception as e:
+            log.debug(f"Failed to read device fingerprint: {e}")
+        if fingerprint and not force:
+            with stubs_lock:
+                existing = mp.stubs.find_by_fingerprint(fingerprint.digest, changeset=changeset_key)
+            if existing is not None:
+                pyb.disconnect()
+                log.success(f"Device matches installed stubs: $[{existing.name}]")
+                log.info("Use $[--force] to regenerate them anyways.")
+                return existing
+        # workers share the prepared buffer, so each takes its own copy of the script.
+        script = prepared.result()
+        create_stubs = (
+            io.StringIO(script.getvalue())
+            if isinstance(script, io.StringIO)
+            else io.BytesIO(script.getvalue())
         )
-        out_dir = Path(tmpdir)
-        stub_path = next(out_dir.iterdir())
-        log.info(f"Copied Stubs: $[{stub_path.name}]")
-        stub_path = mp.stubs.from_stubber(stub_path, out_dir)
-        stub = mp.stubs.add(str(stub_path))
-    pyb.remove(dev_path)
-    pyb.disconnect()
-    log.success(f"Added {stub.name} to stubs!")
-    return stub
+        dev_path = DevicePath("createstubs.mpy") if compile else DevicePath("createstubs.py")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_dir = Path(tmpdir)
+            decoder = FrameDecoder(out_dir, consumer=pyb.consumer) if stream else None
+            log.info(f"Executing stubber on $[{port}]...")
+            try:
+                pyb.run_script(
+                    create_stubs,
+                    DevicePath(dev_path),
+                    consumer=ConsumerDelegate(decoder, pyb.consumer) if decoder else None,
+                )
+            except Exception as e:
+                # TODO: Handle more usage cases
+                log.error(f"Failed to execute script: {e!s}", exception=e)
+                raise
+            log.success("Done!")
+            if decoder is not None:
+                decoder.close()
+            else:
+                log.info("Copying stubs...")
+                pyb.copy_from(
+                    DevicePath("/stubs"),
+                    tmpdir,
+                    verify_integrity=True,
+                    # exclude due to ps1 var possibly different.
+                    exclude_integrity={"sys.py", "usys.py"},
+                )
+            stub_path = next(out_dir.iterdir())
+            log.info(f"Copied Stubs: $[{stub_path.name}]")
+            stub_fingerprint = (
+                {**fingerprint.to_dict(), "changeset": changeset_key} if fingerprint else None
+            )
+            with stubs_lock:
+                stub_path = mp.stubs.from_stubber(stub_path, out_dir, fingerprint=stub_fingerprint)
+                stub = mp.stubs.add(str(stub_path), force=force)
+        pyb.disconnect()
+        log.success(f"Added {stub.name} to stubs!")
+        return stub
+
+    if len(ports) == 1:
+        return create_device_stubs(ports[0], device_logger())
+
+    def _worker(port: str) -> Stub:
+        stub = create_device_stubs(port, device_logger(port))
+        if stub is None:
+            raise PyDeviceError("Failed to connect.")
+        return stub
+
+    results = run_parallel(ports, _worker, max_workers=jobs, timeout=timeout)
+    print_device_summary(results, title="Stubs", detail=lambda stub: stub.name)
+    if not all(r.ok for r in results):
+        raise typer.Exit(1)
+    return [r.value for r in results]
 
 
 @stubs_app.command(name="add")
@@ -292,3 +438,30 @@ def stubs_list(ctx: typer.Context):
         mpy.log.info(f"Total: {len(proj.stubs)}")
         stubs = mpy.stubs.iter_by_firmware(stubs=proj.stubs)
         print_stubs(stubs)
+
+
+@stubs_app.command(name="which")
+def stubs_which(
+    ctx: typer.Context,
+    query: str = typer.Argument(..., help="Module (uasyncio) or symbol (network.WLAN) to find."),
+) -> None:
+    """Find installed stubs providing a module or symbol.
+
+    \n
+    **Find a module**:\n
+     - `micropy stubs which uasyncio`
+
+    \n
+    **Find a symbol**:\n
+     - `micropy stubs which network.WLAN`\n
+     - `micropy stubs which WLAN`
+    """
+    mpy: MicroPy = ctx.ensure_object(MicroPy)
+    results = mpy.stubs.which(query)
+    if not results:
+        mpy.log.warn(f"No installed stubs provide: $[{query}].")
+        sys.exit(1)
+    mpy.log.title(f"Stubs providing $[{query}]:")
+    for match in results:
+        name = f"{match.module}.{match.symbol}" if match.symbol else match.module
+        mpy.log.info(f"$[{match.stub}] :: {name} ($w[{match.path.name}])")
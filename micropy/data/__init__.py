@@ -8,7 +8,17 @@ data files used by MicropyCli
 
 from pathlib import Path
 
-__all__ = ["ROOT", "SCHEMAS", "REPO_SOURCES", "FILES", "STUB_DIR", "LOG_FILE", "STUBBER"]
+__all__ = [
+    "ROOT",
+    "SCHEMAS",
+    "REPO_SOURCES",
+    "FILES",
+    "STUB_DIR",
+    "LOG_FILE",
+    "LINK_PROFILES",
+    "DEVICE_CACHE",
+    "STUBBER",
+]
 
 # Paths
 MOD_PATH = Path(__file__).parent
@@ -25,6 +35,8 @@ REPO_SOURCES = PATH / "sources.json"
 FILES = Path.home() / ".micropy"
 STUB_DIR = FILES / "stubs"
 LOG_FILE = FILES / "micropy.log"
+LINK_PROFILES = FILES / "link_profiles.json"
+DEVICE_CACHE = FILES / "devices.json"
 
 # Libraries
 LIB = ROOT / "lib"
@@ -2,6 +2,11 @@
 
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from micropy.pyd.profiler import ProfileReport
+
 
 class MicropyException(Exception):
     """Generic MicroPy Exception."""
@@ -76,3 +81,15 @@ class PyDeviceFileIntegrityError(PyDeviceError):
                 device_path=device_path, device_sum=device_sum, digest=digest
             )
         )
+
+
+class PyDeviceUnsupportedError(PyDeviceError):
+    """Raised when a device does not support a requested feature."""
+
+
+class PyDeviceProfileError(PyDeviceError):
+    """Raised when profiling a script fails, with a report of the samples received."""
+
+    def __init__(self, message: str | None, report: ProfileReport):
+        super().__init__(message)
+        self.report = report
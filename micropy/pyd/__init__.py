@@ -1,7 +1,9 @@
 """Module for interfacing with py-devices."""
 
 from .abc import (
+    DeviceEntry,
     DevicePath,
+    EventConsumer,
     HostPath,
     MessageConsumer,
     MetaPyDevice,
@@ -9,8 +11,11 @@ from .abc import (
     PyDeviceConsumer,
     StreamConsumer,
 )
+from .batch import BatchResult, CommandBatch
 from .consumers import ConsumerDelegate, MessageHandlers, ProgressStreamConsumer, StreamHandlers
+from .fingerprint import DeviceFingerprint, read_fingerprint
 from .pydevice import PyDevice
+from .telemetry import TelemetryConsumer, TransferRecord
 
 __all__ = [
     "PyDevice",
@@ -21,8 +26,16 @@ __all__ = [
     "PyDeviceConsumer",
     "MessageConsumer",
     "StreamConsumer",
+    "EventConsumer",
     "MetaPyDevice",
     "MetaPyDeviceBackend",
+    "DeviceEntry",
     "DevicePath",
     "HostPath",
+    "CommandBatch",
+    "BatchResult",
+    "DeviceFingerprint",
+    "read_fingerprint",
+    "TelemetryConsumer",
+    "TransferRecord",
 ]
@@ -3,12 +3,26 @@ from __future__ import annotations
 import abc
 from io import BytesIO, StringIO
 from pathlib import Path
-from typing import Any, AnyStr, Generic, NewType, Protocol, TypeVar
+from typing import Any, AnyStr, Generic, Literal, NamedTuple, NewType, Protocol, TypeVar
 
 HostPath = NewType("HostPath", str)
 DevicePath = NewType("DevicePath", str)
 
 
+class DeviceEntry(NamedTuple):
+    """File or directory on a device, as returned by `walk`."""
+
+    path: DevicePath
+    type: Literal["file", "dir"]
+    size: int
+    # modification time in device epoch seconds, if the filesystem tracks it.
+    mtime: int | None = None
+
+    @property
+    def is_dir(self) -> bool:
+        return self.type == "dir"
+
+
 class StartHandler(Protocol):
     def __call__(self, *, name: str | None = None, size: int | None = None) -> Any: ...
 
@@ -25,6 +39,14 @@ class MessageHandler(Protocol):
     def __call__(self, data: AnyStr) -> Any: ...
 
 
+# recoveries made during transfers, reported to consumers handling `on_event`.
+TransferEvent = Literal["retry", "reset", "integrity_failure"]
+
+
+class EventHandler(Protocol):
+    def __call__(self, event: TransferEvent, **details: Any) -> Any: ...
+
+
 class StreamConsumer(Protocol):
     @property
     @abc.abstractmethod
@@ -45,6 +67,12 @@ class MessageConsumer(Protocol):
     def on_message(self) -> MessageHandler: ...
 
 
+class EventConsumer(Protocol):
+    @property
+    @abc.abstractmethod
+    def on_event(self) -> EventHandler: ...
+
+
 class PyDeviceConsumer(MessageConsumer, StreamConsumer, Protocol): ...
 
 
@@ -93,6 +121,11 @@ class MetaPyDeviceBackend(abc.ABC):
     @abc.abstractmethod
     def list_dir(self, path: DevicePath) -> list[DevicePath]: ...
 
+    @abc.abstractmethod
+    def walk(
+        self, path: DevicePath | str = "/", *, consumer: MessageConsumer | None = None
+    ) -> list[DeviceEntry]: ...
+
     @abc.abstractmethod
     def remove(self, path: DevicePath) -> None: ...
 
@@ -144,6 +177,9 @@ class MetaPyDevice(abc.ABC, Generic[AnyBackend]):
     @abc.abstractmethod
     def remove(self, target_path: DevicePath) -> None: ...
 
+    @abc.abstractmethod
+    def walk(self, target_path: DevicePath | str = "/") -> list[DeviceEntry]: ...
+
     @abc.abstractmethod
     def run_script(
         self, content: AnyStr | StringIO | BytesIO, target_path: DevicePath | None = None
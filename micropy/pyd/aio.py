@@ -0,0 +1,352 @@
+"""Asyncio interface to device backends.
+
+Serial I/O in the device backends is blocking, so :class:`AsyncPyDeviceBackend`
+runs each backend call on a dedicated worker thread per device. Calls to one
+device are serialized in order, while the event loop (and any other device)
+is free to make progress during a transfer. Worker threads are daemons, as in
+:mod:`~micropy.pyd.parallel`, so a hung device does not keep the process alive.
+
+Progress and output can be consumed as async iterators with
+:class:`AsyncStreamConsumer`, :class:`AsyncMessageConsumer` or both at once with
+:class:`AsyncConsumer`, and synchronous code (i.e. the CLI) can drive
+coroutines with :class:`BackgroundLoop`::
+
+    with BackgroundLoop() as loop:
+        device = loop.run(AsyncPyDeviceBackend.establish("/dev/ttyUSB0"))
+        loop.run(device.connect())
+        loop.run(device.push_file(HostPath("main.py"), DevicePath("/main.py")))
+        loop.run(device.aclose())
+"""
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from typing import Any, AnyStr, Awaitable, Callable, Literal, NamedTuple, Optional, Type, TypeVar
+
+from .abc import DeviceEntry, DevicePath, HostPath, MetaPyDeviceBackend, PyDeviceConsumer
+from .backend_upydevice import UPyDeviceBackend
+
+__all__ = [
+    "ConsumerEvent",
+    "AsyncStreamConsumer",
+    "AsyncMessageConsumer",
+    "AsyncConsumer",
+    "AsyncPyDeviceBackend",
+    "BackgroundLoop",
+    "background_loop",
+]
+
+T = TypeVar("T")
+
+
+class ConsumerEvent(NamedTuple):
+    """Consumer callback, as yielded by :class:`AsyncConsumer`."""
+
+    kind: Literal["start", "update", "end", "message"]
+    name: Optional[str] = None
+    size: Optional[int] = None
+    data: Any = None
+
+
+_CLOSED = object()
+
+
+class _AsyncEvents:
+    """Queue of consumer events for async iteration, fed from any thread."""
+
+    def __init__(self, *, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue: asyncio.Queue[Any] = asyncio.Queue()
+
+    def _put(self, event: Any) -> None:
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def close(self) -> None:
+        """End iteration once all queued events are consumed."""
+        self._put(_CLOSED)
+
+    def __aiter__(self) -> _AsyncEvents:
+        return self
+
+    async def __anext__(self) -> ConsumerEvent:
+        event = await self._queue.get()
+        if event is _CLOSED:
+            raise StopAsyncIteration
+        return event
+
+
+class AsyncStreamConsumer(_AsyncEvents):
+    """Stream consumer yielding progress events for async iteration.
+
+    Args:
+        loop: Event loop to deliver events on. Defaults to the running loop.
+
+    """
+
+    def on_start(self, *, name: str | None = None, size: int | None = None) -> None:
+        self._put(ConsumerEvent("start", name=name, size=size))
+
+    def on_update(self, *, size: int | None = None) -> None:
+        self._put(ConsumerEvent("update", size=size))
+
+    def on_end(self) -> None:
+        self._put(ConsumerEvent("end"))
+
+
+class AsyncMessageConsumer(_AsyncEvents):
+    """Message consumer yielding output for async iteration.
+
+    Args:
+        loop: Event loop to deliver events on. Defaults to the running loop.
+
+    """
+
+    def on_message(self, data: AnyStr) -> None:
+        self._put(ConsumerEvent("message", data=data))
+
+
+class AsyncConsumer(AsyncStreamConsumer, AsyncMessageConsumer):
+    """Consumer that queues progress and output for async iteration.
+
+    Implements both the stream and message consumer protocols, and is
+    safe to call from backend worker threads::
+
+        consumer = AsyncConsumer()
+        task = asyncio.create_task(device.pull_file(src, dest, consumer=consumer))
+        task.add_done_callback(lambda _: consumer.close())
+        async for event in consumer:
+            ...
+
+    Args:
+        loop: Event loop to deliver events on. Defaults to the running loop.
+
+    """
+
+
+class _DeviceWorker:
+    """Daemon thread running calls to one device, one at a time, in order."""
+
+    def __init__(self, name: str):
+        self._calls: queue.SimpleQueue[Optional[tuple[Future[Any], Callable[[], Any]]]] = (
+            queue.SimpleQueue()
+        )
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while (call := self._calls.get()) is not None:
+            future, fn = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, fn: Callable[[], T]) -> Future[T]:
+        future: Future[T] = Future()
+        self._calls.put((future, fn))
+        return future
+
+    def shutdown(self) -> None:
+        """Stop once queued calls are done."""
+        self._calls.put(None)
+
+
+class AsyncPyDeviceBackend:
+    """Async wrapper around a device backend.
+
+    Args:
+        backend: Established device backend to wrap.
+
+    """
+
+    backend: MetaPyDeviceBackend
+
+    def __init__(self, backend: MetaPyDeviceBackend):
+        self.backend = backend
+        self._worker = _DeviceWorker(f"pyd-{getattr(backend, 'location', '')}")
+
+    @classmethod
+    async def establish(
+        cls, target: str, *, backend: Type[MetaPyDeviceBackend] = UPyDeviceBackend
+    ) -> AsyncPyDeviceBackend:
+        """Establish a backend for `target` without blocking the event loop."""
+        worker = _DeviceWorker(f"pyd-{target}")
+        try:
+            established = await asyncio.wrap_future(
+                worker.submit(lambda: backend().establish(target))
+            )
+        finally:
+            worker.shutdown()
+        return cls(established)
+
+    async def _run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        # leave consumer unset rather than None, so backend defaults apply.
+        if kwargs.get("consumer", ...) is None:
+            del kwargs["consumer"]
+        return await asyncio.wrap_future(self._worker.submit(partial(fn, *args, **kwargs)))
+
+    @property
+    def location(self) -> str:
+        return self.backend.location
+
+    @property
+    def connected(self) -> bool:
+        return self.backend.connected
+
+    async def __aenter__(self) -> AsyncPyDeviceBackend:
+        if not self.connected:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    async def connect(self) -> None:
+        await self._run(self.backend.connect)
+
+    async def disconnect(self) -> None:
+        await self._run(self.backend.disconnect)
+
+    async def aclose(self) -> None:
+        """Disconnect and release the worker thread."""
+        try:
+            await self.disconnect()
+        finally:
+            self._worker.shutdown()
+
+    async def reset(self) -> None:
+        await self._run(self.backend.reset)
+
+    async def resolve_path(self, target_path: DevicePath | str | Path) -> DevicePath:
+        return await self._run(self.backend.resolve_path, target_path)
+
+    async def push_file(
+        self,
+        source_path: HostPath,
+        target_path: DevicePath,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> None:
+        await self._run(
+            self.backend.push_file, source_path, target_path, consumer=consumer, **kwargs
+        )
+
+    async def pull_file(
+        self,
+        source_path: DevicePath,
+        target_path: HostPath,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> None:
+        await self._run(
+            self.backend.pull_file, source_path, target_path, consumer=consumer, **kwargs
+        )
+
+    async def copy_dir(
+        self,
+        source_path: DevicePath,
+        target_path: HostPath,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        return await self._run(
+            self.backend.copy_dir, source_path, target_path, consumer=consumer, **kwargs
+        )
+
+    async def list_dir(self, path: DevicePath) -> list[DevicePath]:
+        return await self._run(self.backend.list_dir, path)
+
+    async def walk(
+        self, path: DevicePath | str = "/", *, consumer: PyDeviceConsumer | None = None
+    ) -> list[DeviceEntry]:
+        return await self._run(self.backend.walk, path, consumer=consumer)
+
+    async def remove(self, path: DevicePath) -> None:
+        await self._run(self.backend.remove, path)
+
+    async def eval(self, command: str, *, consumer: PyDeviceConsumer | None = None) -> Any:
+        return await self._run(self.backend.eval, command, consumer=consumer)
+
+    async def eval_script(
+        self,
+        contents: AnyStr,
+        target_path: DevicePath | None = None,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+    ) -> Any:
+        return await self._run(self.backend.eval_script, contents, target_path, consumer=consumer)
+
+
+class BackgroundLoop:
+    """Event loop running on a background thread, for synchronous callers.
+
+    Use as a context manager; the loop is stopped on exit::
+
+        with BackgroundLoop() as loop:
+            pending = loop.submit(asyncio.to_thread(prepare_host_files))
+            device_work()
+            host_files = pending.result()
+
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> BackgroundLoop:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="micropy-loop", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self._loop is None or self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    def submit(self, coro: Awaitable[T]) -> Future[T]:
+        """Schedule a coroutine on the loop.
+
+        Raises:
+            RuntimeError: Loop is not running.
+
+        """
+        if self._loop is None:
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            raise RuntimeError("Background loop is not running.")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)  # type: ignore[arg-type]
+
+    def run(self, coro: Awaitable[T], *, timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+
+_shared_loop: Optional[BackgroundLoop] = None
+_shared_lock = threading.Lock()
+
+
+def background_loop() -> BackgroundLoop:
+    """Background loop shared by synchronous callers, started on first use."""
+    global _shared_loop
+    with _shared_lock:
+        if _shared_loop is None:
+            _shared_loop = BackgroundLoop().__enter__()
+        return _shared_loop
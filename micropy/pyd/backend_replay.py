@@ -0,0 +1,139 @@
+"""Replay recorded serial sessions.
+
+:class:`ReplayPyDeviceBackend` plays a recording made with ``--record-session``
+back through the upydevice backend, in place of a device. Device output is
+released as soon as the host has written what it wrote in the recording,
+so a replay runs the same way every time, without a device or the delays
+of the original link.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+import upydevice
+from micropy.exceptions import PyDeviceError, PyDeviceUnsupportedError
+from serial import SerialBase
+
+from .backend_upydevice import UPyDeviceBackend
+from .session import SessionRecording
+
+__all__ = ["ReplaySerial", "ReplayPyDeviceBackend"]
+
+# consecutive reads with nothing to replay before giving up.
+MAX_STARVED_READS = 10_000
+
+
+class ReplaySerial(SerialBase):
+    """Serial port serving the device output of a recording.
+
+    Host writes are matched to recorded writes by length, as generated
+    names (i.e. temporary script paths) may differ between runs.
+
+    Args:
+        recording: Recording to replay.
+
+    """
+
+    def __init__(self, recording: SessionRecording):
+        self._events = recording.events
+        self._index = 0
+        # bytes of the current event already consumed.
+        self._offset = 0
+        self._starved = 0
+        super().__init__()
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def _reconfigure_port(self) -> None:
+        pass
+
+    def reset_input_buffer(self) -> None:
+        pass
+
+    def reset_output_buffer(self) -> None:
+        pass
+
+    @property
+    def exhausted(self) -> bool:
+        return self._index >= len(self._events)
+
+    def _advance(self, size: int) -> bytes:
+        event = self._events[self._index]
+        data = event.data[self._offset : self._offset + size]
+        self._offset += len(data)
+        if self._offset >= len(event.data):
+            self._index += 1
+            self._offset = 0
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        size = 0
+        for index in range(self._index, len(self._events)):
+            event = self._events[index]
+            if event.direction != "rx":
+                break
+            size += len(event.data) - (self._offset if index == self._index else 0)
+        return size
+
+    def read(self, size: int = 1) -> bytes:
+        data = b""
+        while len(data) < size and not self.exhausted:
+            if self._events[self._index].direction != "rx":
+                break
+            data += self._advance(size - len(data))
+        if data:
+            self._starved = 0
+            return data
+        # hosts poll for output in a loop, which would never end.
+        self._starved += 1
+        if self._starved > MAX_STARVED_READS:
+            raise PyDeviceError("Replay diverged from the recording: host is waiting on output.")
+        return data
+
+    def write(self, data: bytes) -> int:
+        self._starved = 0
+        remaining = len(data)
+        while remaining:
+            if self.exhausted or self._events[self._index].direction != "tx":
+                raise PyDeviceError(
+                    f"Replay diverged from the recording at event {self._index}: "
+                    f"unexpected write of {data[:32]!r}."
+                )
+            remaining -= len(self._advance(remaining))
+        return len(data)
+
+
+class _ReplaySerialDevice(upydevice.SerialDevice):
+    """Serial device that skips port enumeration, as there is no port."""
+
+    def _get_serial_port_data(self, serialport: str) -> tuple[str, str, str]:
+        return ("Replayed MicroPython", "micropy", "REPLAY")
+
+
+class ReplayPyDeviceBackend(UPyDeviceBackend):
+    """UPyDevice backend playing back a recorded session.
+
+    The target given to :meth:`establish` is the path of the recording.
+    Only sessions recorded with the upydevice backend can be replayed.
+    """
+
+    recording: Optional[SessionRecording] = None
+
+    def establish(self, target: str) -> ReplayPyDeviceBackend:
+        self.recording = SessionRecording.load(Path(target))
+        if self.recording.backend != "upydevice":
+            raise PyDeviceUnsupportedError(
+                f"Can not replay a session recorded with {self.recording.backend}."
+            )
+        self.location = target
+        # recordings start once connected, after device detection.
+        self._pydevice = _ReplaySerialDevice(None, init=False, autodetect=False)
+        self._pydevice.serial = ReplaySerial(self.recording)
+        return self
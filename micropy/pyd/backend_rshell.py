@@ -4,15 +4,19 @@ from contextlib import contextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING, AnyStr, cast
 
-from micropy.exceptions import PyDeviceConnectionError
+from micropy.exceptions import PyDeviceConnectionError, PyDeviceError
+from micropy.pyd import scripts
 from micropy.pyd.abc import (
+    DeviceEntry,
     DevicePath,
     HostPath,
     MessageConsumer,
     MessageHandler,
     MetaPyDeviceBackend,
-    PyDeviceConsumer,
 )
+from micropy.pyd.consumers import NoOpConsumer
+from micropy.pyd.framing import TreeDecoder
+from serial import SerialBase
 
 if TYPE_CHECKING:
     from typing import type_check_only  # pragma: no cover
@@ -81,6 +85,7 @@ class RShellConsumer:
 
 
 class RShellPyDeviceBackend(MetaPyDeviceBackend):
+    backend_name: str = "rshell"
     _connected: bool = False
     _verbose: bool = False
     _rsh: rsh
@@ -101,6 +106,14 @@ class RShellPyDeviceBackend(MetaPyDeviceBackend):
     def connected(self) -> bool:
         return self._connected
 
+    @property
+    def serial(self) -> SerialBase | None:
+        """Serial link to the device, if connected over serial."""
+        if not self.connected:
+            return None
+        serial = getattr(self._pydevice, "serial", None)
+        return serial if isinstance(serial, SerialBase) else None
+
     def resolve_path(self, path: str | DevicePath | Path) -> DevicePath:
         _path = path
         if str(path)[0] == "/":
@@ -165,6 +178,22 @@ class RShellPyDeviceBackend(MetaPyDeviceBackend):
         tree = self._rsh.auto(rsh.listdir, str(dir_path))
         return tree
 
+    def walk(
+        self, path: DevicePath | str = "/", *, consumer: MessageConsumer | None = None
+    ) -> list[DeviceEntry]:
+        """Recursively list directory on pyboard in a single command.
+
+        Args:
+            path: device path to directory
+
+        """
+        decoder = TreeDecoder(consumer=consumer or NoOpConsumer)
+        self.eval_script(scripts.WALK_SCRIPT.format(root=path), consumer=decoder)
+        if not decoder.finished:
+            raise PyDeviceError(f"Walk of {path} ended unexpectedly.")
+        # walk reports device paths; map them to rshell paths.
+        return [e._replace(path=self.resolve_path(e.path)) for e in decoder.entries]
+
     def copy_dir(
         self, source_path: HostPath | DevicePath, target_path: HostPath | DevicePath, **rsync
     ):
@@ -204,7 +233,7 @@ class RShellPyDeviceBackend(MetaPyDeviceBackend):
                 self._pydevice.exit_raw_repl()
                 self._repl_active = False
 
-    def eval(self, command: str, *, consumer: MessageConsumer = None):
+    def eval(self, command: str, *, consumer: MessageConsumer | None = None):
         """Execute bytes on pyboard."""
         _handler = None if consumer is None else RShellConsumer(consumer.on_message).on_message
         ret, ret_err = self._pydevice.exec_raw(command, data_consumer=_handler)
@@ -217,7 +246,7 @@ class RShellPyDeviceBackend(MetaPyDeviceBackend):
         contents: AnyStr,
         target_path: DevicePath | None = None,
         *,
-        consumer: PyDeviceConsumer = None,
+        consumer: MessageConsumer | None = None,
     ):
         _contents: str | bytes = contents
         if isinstance(_contents, bytes):
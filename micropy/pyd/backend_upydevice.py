@@ -4,26 +4,51 @@ import binascii
 import hashlib
 import io
 import random
-import stat
 import string
+import textwrap
 import time
-from functools import wraps
+import zlib
+from functools import cached_property, wraps
 from pathlib import Path, PurePosixPath
-from typing import AnyStr, Callable, Generator, Optional, TypeVar, Union
+from typing import Any, AnyStr, BinaryIO, Callable, Generator, Optional, TypeVar, Union
 
+import attr
 import upydevice
-from boltons import iterutils
-from micropy.exceptions import PyDeviceConnectionError, PyDeviceError, PyDeviceFileIntegrityError
+from micropy.exceptions import (
+    PyDeviceConnectionError,
+    PyDeviceError,
+    PyDeviceFileIntegrityError,
+    PyDeviceUnsupportedError,
+)
 from rich import print
+from serial import SerialBase
 from typing_extensions import ParamSpec, TypeAlias
 from upydevice.phantom import UOS as UPY_UOS
 
-from .abc import DevicePath, HostPath, MessageConsumer, MetaPyDeviceBackend, PyDeviceConsumer
-from .consumers import NoOpConsumer
+from . import compression, scripts
+from .abc import (
+    DeviceEntry,
+    DevicePath,
+    HostPath,
+    MessageConsumer,
+    MetaPyDeviceBackend,
+    PyDeviceConsumer,
+)
+from .batch import CommandBatch
+from .checksum import DEFAULT_CHECKSUM, ChecksumAlgorithm, device_checksum_code, new_checksum
+from .compression import DeviceCompression
+from .consumers import ConsumerDelegate, NoOpConsumer, notify
+from .framing import ChunkStreamDecoder, FrameDecoder, TreeDecoder
+from .rawpaste import RawPasteTransport
+from .transfer import ChunkSizeTuner, LinkProfile, TransferState, iter_chunks, spool
 
 AnyUPyDevice: TypeAlias = Union[upydevice.SerialDevice, upydevice.WebSocketDevice]
 
 BUFFER_SIZE = 512
+MAX_RETRIES = 4
+REPL_PROMPT = b">>> "
+# filesystems mounted below a virtual root, i.e. on the pyboard.
+ROOT_MOUNTS = ("/flash", "/sd")
 
 T = TypeVar("T")
 P = ParamSpec("P")
@@ -35,30 +60,56 @@ class UOS(UPY_UOS):
         return self.dev_dict
 
 
+def _encode_chunk(chunk: bytes) -> str:
+    """Python expression evaluating to `chunk` on the device.
+
+    Text mostly reads back as itself in a bytes literal, while escaping
+    binary data can take up to 4 bytes per byte; whichever of the literal
+    and base64 (4 bytes per 3) is shorter is sent.
+    """
+    literal = repr(chunk)
+    encoded = f"ubinascii.a2b_base64('{binascii.b2a_base64(chunk, newline=False).decode()}')"
+    return literal if len(literal) <= len(encoded) else encoded
+
+
 def retry(fn: Callable[P, T]) -> Callable[P, T | None]:
+    """Retry a transfer, resuming from its last acknowledged offset.
+
+    The wrapped function receives a :class:`TransferState` as `transfer`
+    that persists across attempts. Integrity failures restart the
+    transfer from scratch, any other failure resumes it. Both are reported
+    to the `consumer` the function is called with, if it handles events.
+    """
+
     @wraps(fn)
     def _wrapper(self_: UPyDeviceBackend, *args: P.args, **kwargs: P.kwargs) -> T | None:
         _result: T | None = None
-        retry_count = 0
+        transfer: TransferState = kwargs.setdefault("transfer", TransferState())  # type: ignore
+        integrity = kwargs.pop("verify_integrity", None)
+        consumer = kwargs.get("consumer")
 
-        while retry_count < 4:
+        while transfer.attempts < MAX_RETRIES:
             try:
-                if (integrity := kwargs.pop("verify_integrity", None)) is not None:
+                if integrity is not None:
                     # skip integrity check on last retry as last ditch.
-                    kwargs["verify_integrity"] = integrity and retry_count < 3
+                    kwargs["verify_integrity"] = integrity and transfer.attempts < MAX_RETRIES - 1
                     if integrity and not kwargs["verify_integrity"]:
                         print("Attempting again without file integrity check...")
                 _result = fn(self_, *args, **kwargs)  # type: ignore
             except PyDeviceFileIntegrityError as e:
-                retry_count += 1
+                transfer.attempts += 1
+                notify(consumer, "integrity_failure", offset=transfer.offset, error=str(e))
+                transfer.restart()
                 print(e)
                 self_.reset()
+                notify(consumer, "reset")
             except Exception as e:
-                retry_count += 1
-                self_.BUFFER_SIZE = BUFFER_SIZE // pow(2, retry_count + 1)
-                print("reducing buffer size to:", self_.BUFFER_SIZE)
+                transfer.attempts += 1
+                notify(consumer, "retry", offset=transfer.offset, error=str(e))
                 print(e)
+                print(f"resuming from offset {transfer.offset}...")
                 self_.reset()
+                notify(consumer, "reset")
             else:
                 break
         return _result
@@ -67,10 +118,26 @@ def retry(fn: Callable[P, T]) -> Callable[P, T | None]:
 
 
 class UPyDeviceBackend(MetaPyDeviceBackend):
+    backend_name: str = "upydevice"
     BUFFER_SIZE: int = BUFFER_SIZE
+    # default checksum used to verify transfers with this device.
+    checksum: ChecksumAlgorithm = DEFAULT_CHECKSUM
+    # device flash bytes for cached scripts, 0 to upload scripts every run.
+    script_cache_budget: int = 64 * 1024
+    # smallest file compressed for transfers, None to never compress.
+    compress_min_size: int | None = 2 * 1024
 
     _pydevice: AnyUPyDevice
     _uos: UOS | None = None
+    # None until raw-paste support has been probed.
+    _raw_paste_supported: bool | None = None
+    # None until detected, once per connection.
+    _root: DevicePath | None = None
+    _mounts: tuple[DevicePath, ...] = ()
+    # None until probed, once per connection.
+    _compression: DeviceCompression | None = None
+    # calibrated transfer settings, used instead of probing the device.
+    link_profile: LinkProfile | None = None
 
     def _ensure_connected(self):
         if not self.connected:
@@ -87,17 +154,48 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
             self._uos = UOS(self._pydevice)
         return self._uos
 
+    def _detect_root(self) -> tuple[DevicePath, tuple[DevicePath, ...]]:
+        """Query the device filesystem root and mounts below it.
+
+        Boards with a virtual root (i.e. the pyboard) boot with their
+        working directory on the mount they booted from (``/flash`` or
+        ``/sd``); any other board has a regular root filesystem.
+
+        Raises:
+            PyDeviceError: Device could not be queried.
+
+        """
+        try:
+            results = self._pydevice.cmd(
+                "import uos;(uos.getcwd(),uos.listdir('/'))", rtn_resp=True, silent=True
+            )
+        except Exception as e:
+            raise PyDeviceError(f"Failed to detect device root: {e}") from e
+        try:
+            cwd, entries = results
+        except (TypeError, ValueError):
+            return DevicePath("/"), ()
+        if cwd not in ROOT_MOUNTS:
+            return DevicePath("/"), ()
+        mounts = tuple(DevicePath(m) for m in ROOT_MOUNTS if m[1:] in entries)
+        return DevicePath(cwd), mounts
+
     def _pyb_root(self) -> DevicePath:
-        results = self.uos.stat("/flash")
-        if "Traceback" or "ENOENT" in results:
-            return DevicePath("/")
-        return DevicePath("/flash")
+        if self._root is None:
+            try:
+                self._root, self._mounts = self._detect_root()
+            except PyDeviceError:
+                # not cached, so detection is retried on next use.
+                return DevicePath("/")
+        return self._root
 
     def resolve_path(self, path: DevicePath | str | Path) -> DevicePath:
         _root = PurePosixPath(self._pyb_root())
         _path = PurePosixPath(path)
         if _path.is_absolute():
-            if _root == _path or _root in list(_path.parents):
+            if any(
+                m == _path or m in _path.parents for m in (_root, *map(PurePosixPath, self._mounts))
+            ):
                 return DevicePath(str(_path))
             _path = _path.relative_to(list(_path.parents)[-1])
         return DevicePath(str(_root / _path))
@@ -108,20 +206,86 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
         return self
 
     def connect(self):
+        self._root = None
+        self._compression = None
         try:
             self._pydevice.connect()
         except (SystemExit, Exception) as e:
             raise PyDeviceConnectionError(self.location) from e
 
     def disconnect(self):
+        self._root = None
+        self._compression = None
         if self.connected:
             self._pydevice.disconnect()
 
+    @cached_property
+    def write_tuner(self) -> ChunkSizeTuner:
+        """Chunk size for REPL writes, tuned from observed errors."""
+        return ChunkSizeTuner(self.BUFFER_SIZE, maximum=2048)
+
+    @cached_property
+    def read_tuner(self) -> ChunkSizeTuner:
+        """Upper bound on read chunk size, tuned from observed errors."""
+        return ChunkSizeTuner(4096)
+
+    def use_link_profile(self, profile: LinkProfile | None) -> None:
+        """Transfer with calibrated settings, or None to go back to probing the device."""
+        self.link_profile = profile
+        # tuners start over from the new settings.
+        self.__dict__.pop("write_tuner", None)
+        self.__dict__.pop("read_tuner", None)
+        self._raw_paste_supported = None
+        if profile is None:
+            return
+        write_size = min(profile.write_chunk_size, self.write_tuner.maximum)
+        self.write_tuner.size = self.write_tuner.maximum = write_size
+        self.read_tuner.size = self.read_tuner.maximum = profile.read_chunk_size
+        if not profile.raw_paste:
+            self._raw_paste_supported = False
+
+    def _serial(self) -> SerialBase | None:
+        serial = getattr(getattr(self, "_pydevice", None), "serial", None)
+        return serial if isinstance(serial, SerialBase) else None
+
+    @property
+    def serial(self) -> SerialBase | None:
+        """Serial link to the device, if connected over serial."""
+        return self._serial()
+
+    def _wait_ready(self, serial: SerialBase, *, timeout: float = 8.0) -> bool:
+        """Poll the REPL until it answers with a prompt.
+
+        Returns:
+            True if the device answered before `timeout` seconds.
+
+        """
+        deadline = time.monotonic() + timeout
+        buffer = b""
+        while time.monotonic() < deadline:
+            serial.write(b"\r")
+            probe_deadline = min(deadline, time.monotonic() + 0.1)
+            while time.monotonic() < probe_deadline:
+                if not serial.in_waiting:
+                    time.sleep(0.005)
+                    continue
+                buffer = (buffer + serial.read(serial.in_waiting))[-64:]
+                if buffer.endswith(REPL_PROMPT):
+                    return True
+        return False
+
     def reset(self):
         self._pydevice.reset()
-        time.sleep(2)
+        serial = self._serial()
+        if serial is None:
+            # nothing to probe; give the device time to boot.
+            time.sleep(2)
+            self._pydevice.connect()
+            time.sleep(4)
+            return
         self._pydevice.connect()
-        time.sleep(4)
+        if not self._wait_ready(serial):
+            raise PyDeviceConnectionError(self.location)
 
     @property
     def connected(self) -> bool:
@@ -130,103 +294,378 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
     def list_dir(self, path: DevicePath) -> list[DevicePath]:
         return [DevicePath(p) for p in self.uos.listdir(self.resolve_path(path))]
 
+    def walk(
+        self, path: DevicePath | str = "/", *, consumer: MessageConsumer | None = None
+    ) -> list[DeviceEntry]:
+        """Recursively list a device directory in a single command.
+
+        Args:
+            path: Device directory to walk.
+            consumer: Consumer for any other device output.
+
+        Raises:
+            PyDeviceError: Walk ended unexpectedly.
+
+        Returns:
+            Every file and directory below `path`, parents before children.
+
+        """
+        decoder = TreeDecoder(consumer=consumer or NoOpConsumer)
+        script = scripts.WALK_SCRIPT.format(root=self.resolve_path(path))
+        self.eval(f"exec({script!r})", consumer=decoder)
+        if not decoder.finished:
+            raise PyDeviceError(f"Walk of {path} ended unexpectedly.")
+        return decoder.entries
+
     def iter_files(self, path: DevicePath) -> Generator[DevicePath, None, None]:
-        path = self.resolve_path(path)
-        self._pydevice.cmd("import uos", silent=True)
-        results = self._pydevice.cmd(f"list(uos.ilistdir('{path}'))", silent=True, rtn_resp=True)
-        if not results:
-            return
-        for file_result in results:
-            name, type_, _, _ = file_result
-            abs_path = PurePosixPath(path) / name
-            if type_ == stat.S_IFDIR:
-                yield from self.iter_files(abs_path)
-            else:
-                yield abs_path
+        for entry in self.walk(path):
+            if not entry.is_dir:
+                yield entry.path
 
     def copy_dir(
         self,
         source_path: DevicePath,
         target_path: HostPath,
         exclude_integrity: Optional[set[str]] = None,
-        **kwargs,
+        *,
+        bulk: bool = True,
+        **kwargs: Any,
     ):
         target_path = Path(str(target_path))  # type: ignore
         source_path = self.resolve_path(source_path)
         exclude_integrity = exclude_integrity or set()
-        for file_path in self.iter_files(source_path):
+        verify_integrity = kwargs.pop("verify_integrity", True)
+
+        def _is_excluded(file_path: DevicePath | PurePosixPath) -> bool:
+            return file_path in exclude_integrity or Path(file_path).name in exclude_integrity
+
+        if bulk:
+            consumer = kwargs.get("consumer", None) or NoOpConsumer
+            checksum = (kwargs.get("checksum") or self.checksum) if verify_integrity else None
+            try:
+                decoder = self.pull_tree(
+                    source_path, target_path, consumer=consumer, checksum=checksum
+                )
+            except Exception as e:
+                consumer.on_message(f"Failed to bulk pull {source_path}; falling back ({e})")
+            else:
+                # re-read any files that failed verification individually.
+                for file_path in decoder.failed:
+                    if not verify_integrity or _is_excluded(file_path):
+                        continue
+                    self.pull_file(
+                        file_path,
+                        HostPath(str(decoder.files[file_path])),
+                        verify_integrity=True,
+                        **kwargs,
+                    )
+                return
+
+        for entry in self.walk(source_path):
+            if entry.is_dir:
+                continue
+            file_path = entry.path
             rel_path = PurePosixPath(file_path).relative_to(
                 list(PurePosixPath(file_path).parents)[-1]
             )
             # handles os-path conversion
             file_dest = Path(target_path / rel_path)
             file_dest.parent.mkdir(parents=True, exist_ok=True)
-            integ_exclude = (
-                file_path in exclude_integrity or Path(file_path).name in exclude_integrity
-            )
-            integrity = kwargs.pop("verify_integrity", True) and not integ_exclude
+            integrity = verify_integrity and not _is_excluded(file_path)
             self.pull_file(
-                file_path, HostPath(str(file_dest)), verify_integrity=integrity, **kwargs
+                file_path,
+                HostPath(str(file_dest)),
+                verify_integrity=integrity,
+                size=entry.size,
+                **kwargs,
             )
 
-    def push_file(
-        self, source_path: HostPath, target_path: DevicePath, binary: bool = False, **kwargs
-    ) -> None:
-        src_path = Path(str(source_path))
-        src_contents = src_path.read_bytes() if binary else src_path.read_text()
-        self.write_file(src_contents, target_path, **kwargs)
+    def pull_tree(
+        self,
+        source_path: DevicePath,
+        target_path: HostPath | Path,
+        *,
+        consumer: PyDeviceConsumer = NoOpConsumer,
+        checksum: ChecksumAlgorithm | None = DEFAULT_CHECKSUM,
+    ) -> FrameDecoder:
+        """Pull a device directory tree in a single framed stream.
+
+        A helper script walks `source_path` on the device and streams every
+        file back with a running digest, so the whole tree is transferred
+        with one command rather than several round trips per file.
+
+        Args:
+            source_path: Device directory to pull.
+            target_path: Host directory to write files to.
+            consumer: Consumer for progress and output.
+            checksum: Checksum to verify each file with, or None to skip verification.
+
+        Returns:
+            Decoder holding received files and any that failed verification.
+
+        """
+        decoder = FrameDecoder(Path(str(target_path)), consumer=consumer, checksum=checksum)
+        script = scripts.TREE_PULL_SCRIPT.format(
+            root=self.resolve_path(source_path),
+            chunk_size=self._compute_chunk_size(),
+            checksum=device_checksum_code(checksum),
+        )
+        try:
+            self.eval_script(script, consumer=ConsumerDelegate(decoder, consumer))
+        finally:
+            decoder.close()
+        if not decoder.finished:
+            raise PyDeviceError(f"Stream of {source_path} ended unexpectedly.")
+        return decoder
+
+    def push_file(self, source_path: HostPath, target_path: DevicePath, **kwargs: Any) -> None:
+        """Write a host file to the device, reading it a chunk at a time."""
+        with Path(str(source_path)).open("rb") as source:
+            self.write_file(source, target_path, **kwargs)
 
-    def pull_file(self, source_path: DevicePath, target_path: HostPath, **kwargs) -> None:
+    def pull_file(self, source_path: DevicePath, target_path: HostPath, **kwargs: Any) -> None:
+        """Read a device file to the host, writing it a chunk at a time.
+
+        The file is received alongside `target_path` and only replaces it once
+        complete, so a failed read leaves any existing file untouched.
+        """
         src_path = self.resolve_path(source_path)
         targ_path = Path(str(target_path))
-        source_contents = self.read_file(src_path, **kwargs)
-        if source_contents is None:
+        part_path = targ_path.with_name(f"{targ_path.name}.part")
+        kwargs.setdefault("stream", self.link_profile.stream_reads if self.link_profile else True)
+        with part_path.open("w+b") as sink:
+            size = self.read_file_into(src_path, sink, **kwargs)
+        if size is None:
             # TODO: properly report failure to read/copy file.
+            part_path.unlink()
+            return None
+        part_path.replace(targ_path)
+
+    def _raw_paste_transport(self) -> RawPasteTransport | None:
+        serial = self._serial()
+        if self._raw_paste_supported is False or serial is None:
             return None
-        targ_path.write_text(source_contents)
+        return RawPasteTransport(serial)
+
+    def _resume_offset(self, target_path: DevicePath, transfer: TransferState) -> int:
+        """Offset to resume a write from, bounded by what the device persisted."""
+        if not transfer.offset:
+            return 0
+        try:
+            device_size = int(self.uos.stat(str(target_path))[6])
+        except Exception:
+            device_size = 0
+        transfer.offset = min(transfer.offset, device_size)
+        return transfer.offset
+
+    def _write_file_raw_paste(
+        self,
+        source: BinaryIO,
+        target_path: DevicePath,
+        *,
+        consumer: PyDeviceConsumer,
+        transfer: TransferState,
+    ) -> bool:
+        """Write file over raw-paste mode, if the device supports it.
+
+        Returns:
+            False if raw-paste is unavailable and the caller should fall back.
+
+        """
+        transport = self._raw_paste_transport()
+        if transport is None:
+            return False
+        offset = self._resume_offset(target_path, transfer)
+        block_size = (
+            self.link_profile.write_chunk_size if self.link_profile else self._compute_chunk_size()
+        )
+
+        def _on_ack(new_offset: int) -> None:
+            transfer.offset = new_offset
+
+        try:
+            with transport:
+                transport.write_file(
+                    source,
+                    target_path,
+                    block_size=block_size,
+                    consumer=consumer,
+                    offset=offset,
+                    on_ack=_on_ack,
+                )
+        except PyDeviceUnsupportedError:
+            self._raw_paste_supported = False
+            consumer.on_message("Device does not support raw-paste mode, falling back.")
+            return False
+        self._raw_paste_supported = True
+        return True
+
+    def _device_compression(self) -> DeviceCompression:
+        """Compression support of the device, probed once per connection."""
+        if self._compression is None:
+            batch = self.batch()
+            batch.add(scripts.COMPRESSION_PROBE_SCRIPT)
+            probed = batch.add("_zc", result=True)
+            batch.flush(check=False)
+            module, can_compress = probed.value if probed.ok else (None, False)
+            self._compression = DeviceCompression(module, bool(can_compress))
+        return self._compression
+
+    def _compressible(self, size: int) -> bool:
+        return self.compress_min_size is not None and size >= self.compress_min_size
+
+    def _free_space(self, path: DevicePath) -> int | None:
+        """Free bytes on the filesystem holding `path`, None if the device cannot tell."""
+        batch = self.batch()
+        batch.add(f"import uos; _s = uos.statvfs('{PurePosixPath(path).parent}')")
+        free = batch.add("_s[0] * _s[3]", result=True)
+        batch.flush(check=False)
+        return int(free.value) if free.ok else None
+
+    def _write_file_compressed(
+        self,
+        source: BinaryIO,
+        size: int,
+        target_path: DevicePath,
+        *,
+        consumer: PyDeviceConsumer,
+        transfer: TransferState,
+    ) -> bool:
+        """Write file compressed, if the device can decompress it and it is worthwhile.
+
+        The compressed file is staged next to `target_path`, so an interrupted
+        transfer resumes as any other would, then decompressed into place on
+        the device a chunk at a time. Both files are on flash at once, so the
+        file is only compressed if the device has room for both.
+
+        Returns:
+            False if the file was not written and the caller should write it uncompressed.
+
+        """
+        if not self._compressible(size):
+            return False
+        support = self._device_compression()
+        if not support.decompress:
+            return False
+        with compression.compress(source) as packed:
+            packed_size = packed.seek(0, io.SEEK_END)
+            if not compression.worthwhile(size, packed_size):
+                return False
+            # a resumed transfer already passed this check, its staged file now taking up space.
+            free = None if transfer.offset else self._free_space(target_path)
+            if free is not None and free < packed_size + size:
+                consumer.on_message(
+                    f"Not enough space to stage {Path(target_path).name} compressed "
+                    f"({free} bytes free), writing it uncompressed."
+                )
+                return False
+            staged = DevicePath(f"{target_path}{compression.STAGING_SUFFIX}")
+            consumer.on_message(
+                f"Compressed {Path(target_path).name}: {size} -> {packed_size} bytes"
+            )
+            self._write_file_plain(packed, staged, consumer=consumer, transfer=transfer)
+        batch = self.batch(consumer=consumer)
+        batch.add(
+            scripts.INFLATE_SCRIPT.format(
+                module=support.module,
+                source=staged,
+                target=target_path,
+                decoder=support.decoder("_f"),
+                chunk_size=self.BUFFER_SIZE,
+            )
+        )
+        written = batch.add("_n", result=True)
+        batch.flush(check=False)
+        if written.ok and written.value == size:
+            return True
+        consumer.on_message(
+            f"Failed to decompress {target_path} on device ({written.error}), "
+            "falling back to uncompressed transfers."
+        )
+        self._compression = DeviceCompression()
+        transfer.restart()
+        return False
+
+    def _write_file_plain(
+        self,
+        source: BinaryIO,
+        target_path: DevicePath,
+        *,
+        consumer: PyDeviceConsumer,
+        transfer: TransferState,
+    ) -> None:
+        if self._write_file_raw_paste(source, target_path, consumer=consumer, transfer=transfer):
+            return
+        size = source.seek(0, io.SEEK_END)
+        offset = self._resume_offset(target_path, transfer)
+        with self.batch(consumer=consumer) as batch:
+            batch.add("import gc, ubinascii")
+            if offset:
+                batch.add(f"f = open('{target_path!s}', 'r+b'); _ = f.seek({offset})")
+            else:
+                batch.add(f"f = open('{target_path!s}', 'wb')")
 
-    def _iter_hex_chunks(self, content: str):
-        chunked_content = iterutils.chunked_iter(content, self.BUFFER_SIZE)
-        for chunk in chunked_content:
-            hex_chunk = binascii.hexlify(chunk.encode())
-            yield hex_chunk
+        consumer.on_start(name=f"Writing {target_path!s}", size=size)
+        if offset:
+            consumer.on_update(size=offset)
+
+        source.seek(offset)
+        while chunk := source.read(self.write_tuner.size):
+            cmd = f"contents = {_encode_chunk(chunk)}; f.write(contents)"
+            try:
+                self._pydevice.cmd(cmd, silent=True)
+            except Exception:
+                self.write_tuner.record_failure()
+                raise
+            self.write_tuner.record_success()
+            offset = transfer.offset = offset + len(chunk)
+            consumer.on_update(size=len(chunk))
+        consumer.on_end()
+        with self.batch(consumer=consumer) as batch:
+            batch.add("f.close()")
+            batch.add("gc.collect()")
 
     @retry
     def write_file(
         self,
-        contents: str | bytes,
+        contents: str | bytes | BinaryIO,
         target_path: DevicePath,
         *,
         consumer: PyDeviceConsumer = NoOpConsumer,
+        transfer: TransferState | None = None,
     ) -> None:
-        is_bytes = isinstance(contents, bytes)
-        target_path = self.resolve_path(target_path)
-        self._pydevice.cmd("import gc")
-        self._pydevice.cmd("import ubinascii")
-        self._pydevice.cmd(f"f = open('{target_path!s}', 'wb')")
-
-        content_iter = (
-            iterutils.chunked_iter(contents, self.BUFFER_SIZE)
-            if is_bytes
-            else self._iter_hex_chunks(contents)
-        )
+        """Write a file to the device.
+
+        Files of at least :attr:`compress_min_size` bytes are sent
+        compressed if the device can decompress them and has the flash
+        to hold the compressed and decompressed file at once.
 
-        content_size = len(contents)
-        consumer.on_start(name=f"Writing {target_path!s}", size=content_size)
+        Args:
+            contents: File contents, or a seekable binary stream to read them from
+                a chunk at a time.
+            target_path: Device path to write to.
+            consumer: Consumer for progress and output.
+            transfer: Progress of a previous attempt to resume from.
 
-        for chunk in content_iter:
-            cmd = (
-                f"contents = {chunk}; f.write(contents)"
-                if is_bytes
-                else f"contents = ubinascii.unhexlify('{chunk.decode()}'); f.write(contents)"
+        """
+        transfer = transfer or TransferState()
+        if isinstance(contents, (str, bytes)):
+            source: BinaryIO = io.BytesIO(
+                contents if isinstance(contents, bytes) else contents.encode()
             )
-            self._pydevice.cmd(cmd, silent=True)
-            consumer.on_update(size=len(chunk))
-        consumer.on_end()
-        self._pydevice.cmd("f.close()")
-        self._pydevice.cmd("import gc; gc.collect()")
+        else:
+            source = contents
+        size = source.seek(0, io.SEEK_END)
+        target_path = self.resolve_path(target_path)
+        if self._write_file_compressed(
+            source, size, target_path, consumer=consumer, transfer=transfer
+        ):
+            return
+        self._write_file_plain(source, target_path, consumer=consumer, transfer=transfer)
 
     def _compute_chunk_size(self) -> int:
+        if self.link_profile is not None:
+            return self.link_profile.read_chunk_size
         mem_free = int(
             self._pydevice.cmd("import gc;_=gc.collect();gc.mem_free()", rtn_resp=True, silent=True)
         )
@@ -239,14 +678,18 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
         chunk_size: int = 256,
         content_size: Optional[int] = None,
         pos: int = 0,
+        checksum: ChecksumAlgorithm = DEFAULT_CHECKSUM,
     ) -> str:
         checksum_cmd = ";".join(
             [
-                "import ubinascii, uhashlib, gc",
+                "import ubinascii, gc",
+                f"exec({device_checksum_code(checksum)!r})",
+                "h=_C()",
                 "f=open('{path}', 'rb')",
-                "sha = uhashlib.sha256()",
-                "__=[sha.update(f.read({chunk_size})) and gc.collect() for _ in range({pos}, {file_size}, {chunk_size})]",
-                "ubinascii.hexlify(sha.digest()).decode()",
+                "__=[h.update(f.read({chunk_size})) for _ in range({pos}, {file_size}, {chunk_size})]",
+                "f.close()",
+                "_=gc.collect()",
+                "h.hexdigest()",
             ]
         )
         if content_size is None:
@@ -256,51 +699,245 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
         )
         return self._pydevice.cmd(sum_cmd, silent=True, rtn_resp=True)
 
-    @retry
-    def read_file(
+    def _read_file_stream(
         self,
         target_path: DevicePath,
         *,
+        chunk_size: int,
         consumer: PyDeviceConsumer = NoOpConsumer,
-        verify_integrity: bool = True,
-    ) -> str:
-        target_path = self.resolve_path(target_path)
+        checksum: ChecksumAlgorithm | None = DEFAULT_CHECKSUM,
+        transfer: TransferState | None = None,
+        max_resumes: int = 3,
+    ) -> str | None:
+        """Read a file in a single offset framed stream into the transfer buffer.
 
-        read_chunk_cmd = (
-            "f=open('{path}', 'rb');_=f.seek({pos});ch=f.read({chunk_size});f.close();ch"
-        )
+        The device opens the file once and streams every chunk back. If
+        the stream breaks or a chunk is corrupted, reading resumes from
+        the last acknowledged offset rather than from the start.
 
-        content_size = self.uos.stat(str(target_path))[6]
-        buffer = io.BytesIO()
-        pos = 0
-        chunk_size = self._compute_chunk_size()
-        consumer.on_start(
-            name=f"Reading {Path(target_path).name} (xsize: {chunk_size})", size=int(content_size)
+        Raises:
+            PyDeviceError: Stream failed to complete after `max_resumes` attempts.
+
+        Returns:
+            Device checksum of the file, if requested.
+
+        """
+        transfer = transfer or TransferState()
+        decoder = ChunkStreamDecoder(consumer=consumer, buffer=transfer.buffer)
+        delegate = ConsumerDelegate(decoder, consumer)
+        resumes = 0
+        while True:
+            error: Exception | None = None
+            script = scripts.STREAM_READ_SCRIPT.format(
+                path=target_path,
+                pos=decoder.offset,
+                chunk_size=chunk_size,
+                checksum=device_checksum_code(checksum),
+                hash_prefix=int(checksum is not None),
+            )
+            try:
+                self.eval(f"exec({script!r})", consumer=delegate)
+            except Exception as e:
+                error = e
+                consumer.on_message(f"Stream interrupted at {decoder.offset}; resuming ({e})")
+                self.read_tuner.record_failure()
+                chunk_size = self.read_tuner.limit(chunk_size)
+                self.reset()
+                notify(consumer, "reset")
+            transfer.offset = decoder.offset
+            if decoder.finished:
+                self.read_tuner.record_success()
+                return decoder.device_digest
+            resumes += 1
+            if resumes > max_resumes:
+                raise PyDeviceError(f"Failed to stream {target_path} after {resumes} attempts.")
+            notify(
+                consumer, "retry", offset=decoder.offset, error=str(error or "incomplete stream")
+            )
+            consumer.on_message(f"Resuming read of {target_path} from {decoder.offset}.")
+
+    def _read_file_chunked(
+        self,
+        target_path: DevicePath,
+        *,
+        content_size: int,
+        chunk_size: int,
+        consumer: PyDeviceConsumer = NoOpConsumer,
+        checksum: ChecksumAlgorithm | None = DEFAULT_CHECKSUM,
+        transfer: TransferState | None = None,
+    ) -> str | None:
+        read_chunk_cmd = (
+            "f=open('{path}', 'rb');_=f.seek({pos});ch=f.read({chunk_size});f.close();{update}ch"
         )
-        hasher = hashlib.sha256()
+        transfer = transfer or TransferState()
+        buffer = transfer.buffer
+        pos = transfer.offset = buffer.seek(0, io.SEEK_END)
+        # device keeps a running checksum of served chunks until it is reset.
+        hashing = checksum is not None and pos == 0
         while pos < content_size:
+            update = ""
+            if hashing:
+                update = "_h.update(ch);"
+                if pos == 0:
+                    update = (
+                        f"import ubinascii;exec({device_checksum_code(checksum)!r});_h=_C();"
+                        + update
+                    )
             try:
-                cmd = read_chunk_cmd.format(path=str(target_path), pos=pos, chunk_size=chunk_size)
+                cmd = read_chunk_cmd.format(
+                    path=str(target_path), pos=pos, chunk_size=chunk_size, update=update
+                )
                 next_chunk = self._pydevice.cmd(cmd, rtn_resp=True, silent=True)
             except Exception as e:
                 consumer.on_message(f"Failed to read chunk; retrying ({e})")
+                notify(consumer, "retry", offset=pos, error=str(e))
+                self.read_tuner.record_failure()
                 self.reset()
-                chunk_size = self._compute_chunk_size()
+                notify(consumer, "reset")
+                hashing = False
+                chunk_size = self.read_tuner.limit(self._compute_chunk_size())
                 continue
             if len(next_chunk) == 0:
                 consumer.on_message("Failed to read chunk (no data); retrying.")
+                notify(consumer, "retry", offset=pos, error="no data")
+                self.read_tuner.record_failure()
                 self.reset()
+                notify(consumer, "reset")
+                hashing = False
                 continue
-            hasher.update(next_chunk)
+            self.read_tuner.record_success()
             buffer.write(next_chunk)
-            pos += chunk_size
+            pos = transfer.offset = pos + len(next_chunk)
             consumer.on_update(size=len(next_chunk))
-        consumer.on_end()
+        device_sum = None
+        if hashing:
+            device_sum = self._pydevice.cmd("_h.hexdigest()", rtn_resp=True, silent=True)
+        return device_sum
+
+    def _stage_compressed_read(
+        self, target_path: DevicePath, content_size: int, *, consumer: PyDeviceConsumer
+    ) -> tuple[DevicePath, int] | None:
+        """Compress a file on the device for reading, if the device can and it is worthwhile.
+
+        Returns:
+            Device path and size of the compressed file, or None to read the file as is.
+
+        """
+        if not self._compressible(content_size):
+            return None
+        support = self._device_compression()
+        if not support.compress:
+            return None
+        staged = DevicePath(f"{target_path}{compression.STAGING_SUFFIX}")
+        batch = self.batch(consumer=consumer)
+        batch.add(
+            scripts.DEFLATE_SCRIPT.format(
+                source=target_path,
+                target=staged,
+                encoder=support.encoder("_o"),
+                chunk_size=self.BUFFER_SIZE,
+                max_size=compression.max_compressed_size(content_size),
+            )
+        )
+        compressed = batch.add("_n", result=True)
+        batch.flush(check=False)
+        if not compressed.ok:
+            consumer.on_message(
+                f"Failed to compress {target_path} on device ({compressed.error}), "
+                "falling back to uncompressed reads."
+            )
+            self._compression = attr.evolve(support, compress=False)
+            return None
+        if not compression.worthwhile(content_size, compressed.value):
+            return None
+        return staged, compressed.value
+
+    @retry
+    def read_file_into(
+        self,
+        target_path: DevicePath,
+        sink: BinaryIO,
+        *,
+        consumer: PyDeviceConsumer = NoOpConsumer,
+        verify_integrity: bool = True,
+        stream: bool = False,
+        checksum: ChecksumAlgorithm | None = None,
+        size: int | None = None,
+        transfer: TransferState | None = None,
+    ) -> int:
+        """Read a file from the device into a binary stream, a chunk at a time.
+
+        The device checksum is computed while serving chunks, so verifying
+        integrity does not read the file a second time. Files of at least
+        :attr:`compress_min_size` bytes are compressed for the transfer if the
+        device can compress them, and verified as compressed.
 
-        if verify_integrity:
-            device_sum = self._compute_device_file_digest(
-                target_path, chunk_size=chunk_size, content_size=content_size, pos=0
+        Args:
+            target_path: Device path to read.
+            sink: Seekable binary stream to write the file to, read back
+                to verify it (i.e. a file opened with ``w+b``).
+            consumer: Consumer for progress and output.
+            verify_integrity: Compare checksum of received contents with the device.
+            stream: Stream the file through a single open handle
+                instead of reopening it for each chunk.
+            checksum: Checksum algorithm to verify with.
+                Defaults to :attr:`checksum` of the backend.
+            size: File size, if already known (i.e. from :meth:`walk`).
+            transfer: Progress of a previous attempt to resume from.
+
+        Returns:
+            File size.
+
+        """
+        transfer = transfer or TransferState()
+        target_path = self.resolve_path(target_path)
+        checksum = (checksum or self.checksum) if verify_integrity else None
+        content_size = int(self.uos.stat(str(target_path))[6] if size is None else size)
+        staged = self._stage_compressed_read(target_path, content_size, consumer=consumer)
+        source_path, source_size = staged or (target_path, content_size)
+        if not transfer.offset or (staged is not None) == (transfer.buffer is sink):
+            # starting over, or resuming what was read in the other mode.
+            transfer.buffer = sink if staged is None else spool()
+            transfer.restart()
+        received = transfer.buffer
+        chunk_size = self.read_tuner.limit(self._compute_chunk_size())
+        consumer.on_start(
+            name=f"Reading {Path(target_path).name} (xsize: {chunk_size})", size=source_size
+        )
+        if transfer.offset:
+            consumer.on_update(size=transfer.offset)
+        if stream:
+            device_sum = self._read_file_stream(
+                source_path,
+                chunk_size=chunk_size,
+                consumer=consumer,
+                checksum=checksum,
+                transfer=transfer,
+            )
+        else:
+            device_sum = self._read_file_chunked(
+                source_path,
+                content_size=source_size,
+                chunk_size=chunk_size,
+                consumer=consumer,
+                checksum=checksum,
+                transfer=transfer,
             )
+        consumer.on_end()
+
+        if checksum is not None:
+            if device_sum is None:
+                # running checksum was lost to a reset; fall back to a full pass.
+                device_sum = self._compute_device_file_digest(
+                    source_path,
+                    chunk_size=chunk_size,
+                    content_size=source_size,
+                    pos=0,
+                    checksum=checksum,
+                )
+            hasher = new_checksum(checksum)
+            for chunk in iter_chunks(received):
+                hasher.update(chunk)
             digest = hasher.hexdigest()
             if device_sum != digest:
                 raise PyDeviceFileIntegrityError(
@@ -308,8 +945,55 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
                 )
             consumer.on_message(f"Verified integrity: {Path(target_path).name}")
 
-        value = buffer.getvalue().decode()
-        return value
+        if staged is not None:
+            self.remove(source_path)
+            sink.seek(0)
+            sink.truncate()
+            try:
+                decompressed = compression.decompress(received, sink)
+            except zlib.error as e:
+                raise PyDeviceFileIntegrityError(
+                    device_path=Path(target_path).name,
+                    device_sum=f"{content_size} bytes",
+                    digest=f"corrupt ({e})",
+                ) from e
+            if decompressed != content_size:
+                raise PyDeviceFileIntegrityError(
+                    device_path=Path(target_path).name,
+                    device_sum=f"{content_size} bytes",
+                    digest=f"{decompressed} bytes",
+                )
+            received.close()
+        return content_size
+
+    def read_file(self, target_path: DevicePath, **kwargs: Any) -> str | None:
+        """Read a file from the device into memory.
+
+        Args:
+            target_path: Device path to read.
+            **kwargs: Options of :meth:`read_file_into`.
+
+        Returns:
+            Decoded file contents, or None if the file could not be read.
+
+        """
+        sink = io.BytesIO()
+        if self.read_file_into(target_path, sink, **kwargs) is None:
+            return None
+        return sink.getvalue().decode()
+
+    def batch(self, *, consumer: MessageConsumer = NoOpConsumer) -> CommandBatch:
+        """Create a batch of statements to execute in a single round trip.
+
+        Args:
+            consumer: Consumer for any output of the statements.
+
+        """
+
+        def _execute(script: str, decoder: MessageConsumer) -> None:
+            self.eval(f"exec({script!r})", consumer=decoder)
+
+        return CommandBatch(_execute, consumer=consumer)
 
     def eval(self, command: str, *, consumer: MessageConsumer = NoOpConsumer) -> str | None:
         return self._pydevice.cmd(
@@ -323,12 +1007,61 @@ class UPyDeviceBackend(MetaPyDeviceBackend):
         *,
         consumer: PyDeviceConsumer = NoOpConsumer,
     ):
+        data = contents if isinstance(contents, bytes) else contents.encode()
+        if target_path and 0 < len(data) <= self.script_cache_budget:
+            if self._eval_cached_script(data, Path(target_path).suffix, consumer=consumer):
+                return
         _target_path = (
             self.resolve_path(target_path) if target_path else f"{self._rand_device_path()}.py"
         )
         self.write_file(contents, DevicePath(_target_path), consumer=consumer)
-        self.eval(f"import {Path(_target_path).stem}", consumer=consumer)
-        self.uos.remove(str(_target_path))
+        batch = self.batch(consumer=consumer)
+        imported = batch.add(f"import {Path(_target_path).stem}")
+        batch.cleanup(f"import uos; uos.remove('{_target_path!s}')")
+        batch.flush(check=False)
+        if imported.error is not None:
+            consumer.on_message(f"Script failed: {imported.error}")
+
+    def _eval_cached_script(
+        self, data: bytes, suffix: str, *, consumer: PyDeviceConsumer = NoOpConsumer
+    ) -> bool:
+        """Run a script from the device script cache, uploading it only if missing.
+
+        Scripts are cached by content hash, so a changed script is uploaded
+        under a new name and the least recently used scripts are evicted
+        to stay within :attr:`script_cache_budget`.
+
+        Returns:
+            False if the cache is unusable (i.e. read-only filesystem) and the script did not run.
+
+        """
+        module = f"_mpy_{hashlib.sha256(data).hexdigest()[:16]}"
+        cache_dir = str(self.resolve_path(DevicePath(scripts.SCRIPT_CACHE_DIR)))
+        name = f"{module}{suffix or '.py'}"
+        run = (
+            f"import sys\nif {cache_dir!r} not in sys.path:\n    sys.path.append({cache_dir!r})\n"
+            f"import {module}"
+        )
+        batch = self.batch(consumer=consumer)
+        batch.add(scripts.SCRIPT_CACHE_SCRIPT)
+        checked = batch.add(
+            f"_h = _sc({cache_dir!r}, {name!r}, {len(data)}, {self.script_cache_budget})"
+        )
+        cached = batch.add("_h", result=True)
+        imported = batch.add(f"if _h:\n{textwrap.indent(run, '    ')}")
+        batch.cleanup(f"import sys\nsys.modules.pop({module!r}, None)")
+        batch.flush(check=False)
+        if checked.error is not None:
+            return False
+        if not cached.value:
+            self.write_file(data, DevicePath(f"{cache_dir}/{name}"), consumer=consumer)
+            batch = self.batch(consumer=consumer)
+            imported = batch.add(run)
+            batch.cleanup(f"import sys\nsys.modules.pop({module!r}, None)")
+            batch.flush(check=False)
+        if imported.error is not None:
+            consumer.on_message(f"Script failed: {imported.error}")
+        return True
 
     def remove(self, path: DevicePath) -> None:
         self.uos.remove(str(path))
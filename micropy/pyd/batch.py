@@ -0,0 +1,199 @@
+"""Batched execution of device statements.
+
+Statements queued on a :class:`CommandBatch` are flushed to the device as a
+single script, so a sequence of commands costs one REPL round trip instead
+of one each. The script reports per-statement results as frames::
+
+    @@V <index> <repr>          value of a statement added with `result=True`
+    @@B ok                      all statements ran
+    @@B err <index> <message>   statement at index raised, later ones did not run
+"""
+
+from __future__ import annotations
+
+import ast
+import textwrap
+from typing import Any, AnyStr, Callable, Optional
+
+import attr
+from micropy.exceptions import PyDeviceError
+
+from .abc import MessageConsumer
+from .consumers import NoOpConsumer
+
+__all__ = ["BatchResult", "CommandBatch", "BatchDecoder"]
+
+FRAME_VALUE = "@@V"
+FRAME_BATCH = "@@B"
+
+Executor = Callable[[str, MessageConsumer], Any]
+
+
+@attr.define
+class BatchResult:
+    """Result of a single batched statement.
+
+    Attributes:
+        statement: Statement source.
+        value: Value of the statement, if requested.
+        error: Error raised by the statement, if any.
+        executed: Whether the statement ran to completion.
+
+    """
+
+    statement: str
+    value: Any = None
+    error: Optional[str] = None
+    executed: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.executed and self.error is None
+
+
+class BatchDecoder:
+    """Decodes batch result frames onto their results.
+
+    Args:
+        results: Results of the flushed statements, in order.
+        consumer: Consumer to pass through non-frame output to.
+
+    """
+
+    finished: bool
+
+    def __init__(self, results: list[BatchResult], *, consumer: MessageConsumer = NoOpConsumer):
+        self.results = results
+        self.consumer = consumer
+        self.finished = False
+
+    def on_message(self, data: AnyStr) -> None:
+        """Consume device output."""
+        text = data.decode() if isinstance(data, bytes) else str(data)
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        """Consume a single line of device output."""
+        marker, _, payload = line.strip().partition(" ")
+        if marker == FRAME_VALUE:
+            index, _, value = payload.partition(" ")
+            try:
+                self.results[int(index)].value = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                # not a literal (i.e. an object repr); keep it as is.
+                self.results[int(index)].value = value
+        elif marker == FRAME_BATCH:
+            status, _, detail = payload.partition(" ")
+            failed = len(self.results)
+            if status == "err":
+                index, _, message = detail.partition(" ")
+                failed = int(index)
+                self.results[failed].error = message
+            for result in self.results[:failed]:
+                result.executed = True
+            self.finished = True
+        elif line.strip():
+            self.consumer.on_message(line)
+
+
+class CommandBatch:
+    """Queue of statements executed on the device in a single round trip.
+
+    Statements run in order and stop at the first one that raises.
+    Use as a context manager to flush on exit::
+
+        with backend.batch() as batch:
+            batch.add("import gc")
+            free = batch.add("gc.mem_free()", result=True)
+        free.value
+
+    Args:
+        execute: Runs a script on the device, passing its output to a consumer.
+        consumer: Consumer for any other device output.
+
+    """
+
+    def __init__(self, execute: Executor, *, consumer: MessageConsumer = NoOpConsumer):
+        self._execute = execute
+        self.consumer = consumer
+        self._statements: list[tuple[BatchResult, bool]] = []
+        self._cleanup: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def __enter__(self) -> CommandBatch:
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], *args: Any) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def add(self, statement: str, *, result: bool = False) -> BatchResult:
+        """Queue a statement.
+
+        Args:
+            statement: Statement to execute. May span multiple lines.
+            result: Report the value of `statement`, which must be an expression.
+
+        Returns:
+            Result of the statement, populated once flushed.
+
+        """
+        batch_result = BatchResult(statement)
+        self._statements.append((batch_result, result))
+        return batch_result
+
+    def cleanup(self, statement: str) -> None:
+        """Queue a statement that runs after all others, even if one raises."""
+        self._cleanup.append(statement)
+
+    def script(self) -> str:
+        """Device script executing the queued statements."""
+        body = []
+        for index, (batch_result, result) in enumerate(self._statements):
+            body.append(f"_bi = {index}")
+            if result:
+                body.append(f"print('{FRAME_VALUE}', {index}, repr({batch_result.statement}))")
+            else:
+                body.append(textwrap.dedent(batch_result.statement))
+        body.append(f"print('{FRAME_BATCH} ok')")
+        lines = [
+            "_bi = 0",
+            "try:",
+            textwrap.indent("\n".join(body), "    "),
+            "except Exception as _be:",
+            f"    print('{FRAME_BATCH} err', _bi, repr(_be))",
+        ]
+        if self._cleanup:
+            lines.extend(["finally:", textwrap.indent("\n".join(self._cleanup), "    ")])
+        return "\n".join(lines) + "\n"
+
+    def flush(self, *, check: bool = True) -> list[BatchResult]:
+        """Execute queued statements in a single round trip.
+
+        Args:
+            check: Raise if a statement failed.
+
+        Raises:
+            PyDeviceError: A statement raised, or the batch did not complete.
+
+        Returns:
+            Results of the flushed statements, in order.
+
+        """
+        if not self._statements and not self._cleanup:
+            return []
+        results = [r for r, _ in self._statements]
+        decoder = BatchDecoder(results, consumer=self.consumer)
+        script = self.script()
+        self._statements = []
+        self._cleanup = []
+        self._execute(script, decoder)
+        if not decoder.finished:
+            raise PyDeviceError("Batch ended unexpectedly.")
+        failed = next((r for r in results if r.error is not None), None)
+        if check and failed is not None:
+            raise PyDeviceError(f"{failed.statement!r} failed: {failed.error}")
+        return results
@@ -0,0 +1,516 @@
+"""Persistent device sessions.
+
+Connecting to a device (port detection, REPL handshake, soft reset) takes
+far longer than most commands run on it. :class:`DeviceBroker` holds one
+connection open in a background process and serves backend operations to
+other processes over a local Unix socket, so consecutive commands skip
+connecting altogether. :class:`BrokerPyDeviceBackend` is the client side,
+used in place of a device backend while a broker is running for its port::
+
+    python -m micropy.pyd.broker /dev/ttyUSB0
+
+Requests and responses are JSON lines. A request names a backend operation
+and its arguments; consumer callbacks made while it runs are relayed to the
+client as events, followed by the result (or error) of the operation::
+
+    {"op": "eval", "args": ["print(1)"], "kwargs": {}}
+    {"event": "on_message", "args": ["1"], "kwargs": {}}
+    {"result": null}
+
+The broker also serves ``calibrate``, calibrating the link it holds with
+:func:`~micropy.pyd.calibrate.calibrate` and applying the result to it.
+
+Requests from clients with a checksum set (i.e. ``PyDevice(checksum=...)``)
+carry it as ``"checksum"``, verifying the transfers of that request with it
+in place of the default of the broker's backend.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import socket
+import socketserver
+import sys
+import threading
+from pathlib import Path
+from typing import Any, AnyStr, Iterator, Optional, Sequence, Type
+
+from micropy import data
+from micropy.exceptions import PyDeviceConnectionError, PyDeviceError, PyDeviceUnsupportedError
+
+from .abc import (
+    DeviceEntry,
+    DevicePath,
+    HostPath,
+    MessageConsumer,
+    MetaPyDeviceBackend,
+    PyDeviceConsumer,
+    TransferEvent,
+)
+from .checksum import ChecksumAlgorithm
+from .consumers import ConsumerDelegate
+
+__all__ = [
+    "DeviceBroker",
+    "BrokerPyDeviceBackend",
+    "socket_path",
+    "is_running",
+    "shutdown",
+]
+
+BROKER_DIR = data.FILES / "brokers"
+# sockets serve the device to whoever can connect, so only to the owner.
+BROKER_DIR_MODE = 0o700
+SOCKET_MODE = 0o600
+# seconds to wait on a broker that is not responding.
+TIMEOUT = 2.0
+
+# backend operations served, others are rejected.
+OPERATIONS = frozenset(
+    {
+        "reset",
+        "resolve_path",
+        "connected",
+        "push_file",
+        "pull_file",
+        "list_dir",
+        "walk",
+        "remove",
+        "copy_dir",
+        "eval",
+        "eval_script",
+    }
+)
+# operations run by the broker itself, on its backend.
+_BROKER_OPERATIONS = frozenset({"calibrate"})
+# operations reporting progress or output to a consumer.
+_CONSUMER_OPERATIONS = frozenset(
+    {"push_file", "pull_file", "walk", "copy_dir", "eval", "eval_script"}
+)
+# operations taking host paths, resolved by the client as the broker runs elsewhere.
+_HOST_PATH_ARGS = {"push_file": 0, "pull_file": 1, "copy_dir": 1}
+
+
+def socket_path(port: str) -> Path:
+    """Socket a broker for `port` listens on."""
+    name = re.sub(r"[^\w.-]+", "-", port).strip("-") or "device"
+    if len(name) > 32:
+        # unix socket paths are limited to ~100 characters.
+        name = f"{name[-16:]}-{hashlib.sha1(port.encode()).hexdigest()[:12]}"
+    return BROKER_DIR / f"{name}.sock"
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": [_encode(v) for v in sorted(value)]}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise PyDeviceUnsupportedError(f"Can not send {type(value).__name__} to a device broker.")
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        if "__set__" in value:
+            return set(_decode(value["__set__"]))
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def _send(stream: io.BufferedIOBase, message: dict[str, Any]) -> None:
+    stream.write(json.dumps(message).encode() + b"\n")
+    stream.flush()
+
+
+class _RelayConsumer:
+    """Consumer relaying callbacks to the client of a request."""
+
+    def __init__(self, stream: io.BufferedIOBase):
+        self._stream = stream
+
+    def _relay(self, event: str, *args: Any, **kwargs: Any) -> None:
+        _send(self._stream, dict(event=event, args=_encode(args), kwargs=_encode(kwargs)))
+
+    def on_start(self, *, name: str | None = None, size: int | None = None) -> None:
+        self._relay("on_start", name=name, size=size)
+
+    def on_update(self, *, size: int | None = None) -> None:
+        self._relay("on_update", size=size)
+
+    def on_end(self) -> None:
+        self._relay("on_end")
+
+    def on_message(self, data: AnyStr) -> None:
+        self._relay("on_message", data)
+
+    def on_event(self, event: TransferEvent, **details: Any) -> None:
+        self._relay("on_event", event, **details)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    server: _BrokerServer
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            op = request.get("op")
+            if op == "ping":
+                _send(self.wfile, dict(result=self.server.broker.location))
+                continue
+            if op == "shutdown":
+                _send(self.wfile, dict(result=None))
+                threading.Thread(target=self.server.broker.shutdown, daemon=True).start()
+                return
+            _send(self.wfile, self.server.broker.dispatch(request, _RelayConsumer(self.wfile)))
+
+
+class _BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, broker: DeviceBroker):
+        self.broker = broker
+        super().__init__(str(path), _BrokerHandler)
+
+
+class DeviceBroker:
+    """Serves operations of a connected backend over a Unix socket.
+
+    Operations run one at a time, in the order they arrive,
+    as they share the link to the device.
+
+    Args:
+        backend: Connected backend to serve.
+        path: Socket to listen on. Defaults to the socket for the backend location.
+
+    """
+
+    def __init__(self, backend: MetaPyDeviceBackend, path: Optional[Path] = None):
+        self.backend = backend
+        self.location = backend.location
+        self.path = Path(path or socket_path(backend.location))
+        self._lock = threading.Lock()
+        self._server: Optional[_BrokerServer] = None
+
+    def dispatch(self, request: dict[str, Any], consumer: PyDeviceConsumer) -> dict[str, Any]:
+        """Run a request against the backend, returning the response to send."""
+        op = request.get("op")
+        try:
+            if op not in OPERATIONS | _BROKER_OPERATIONS:
+                raise PyDeviceUnsupportedError(f"Unsupported broker operation: {op}")
+            args = _decode(request.get("args", []))
+            kwargs = _decode(request.get("kwargs", {}))
+            checksum = request.get("checksum")
+            with self._lock:
+                attr = getattr(self if op in _BROKER_OPERATIONS else self.backend, op)
+                if not callable(attr):
+                    return dict(result=_encode(attr))
+                if op in _CONSUMER_OPERATIONS:
+                    kwargs["consumer"] = consumer
+                with self._checksum(checksum):
+                    return dict(result=_encode(attr(*args, **kwargs)))
+        except Exception as e:
+            return dict(error=dict(type=type(e).__name__, message=str(e)))
+
+    def calibrate(self, **kwargs: Any) -> dict[str, Any]:
+        """Calibrate the link to the device, applying the result to the served backend.
+
+        Args:
+            **kwargs: Options of :func:`~micropy.pyd.calibrate.calibrate`.
+
+        Raises:
+            PyDeviceUnsupportedError: The served backend can not be calibrated.
+
+        Returns:
+            The :class:`~micropy.pyd.calibrate.Calibration`, as a dict.
+
+        """
+        from .backend_upydevice import UPyDeviceBackend
+        from .calibrate import calibrate
+
+        if not isinstance(self.backend, UPyDeviceBackend):
+            raise PyDeviceUnsupportedError(
+                f"{type(self.backend).__name__} does not support calibration."
+            )
+        result = calibrate(self.backend, **kwargs)
+        self.backend.use_link_profile(result.profile)
+        return result.to_dict()
+
+    @contextlib.contextmanager
+    def _checksum(self, checksum: Optional[ChecksumAlgorithm]) -> Iterator[None]:
+        """Verify transfers with `checksum` for the duration of a request."""
+        if checksum is None:
+            yield
+            return
+        if not hasattr(self.backend, "checksum"):
+            raise PyDeviceUnsupportedError(
+                f"{type(self.backend).__name__} does not support checksum selection."
+            )
+        default = self.backend.checksum
+        self.backend.checksum = checksum
+        try:
+            yield
+        finally:
+            self.backend.checksum = default
+
+    def serve_forever(self) -> None:
+        """Serve until :meth:`shutdown` is called (i.e. by a client)."""
+        self.path.parent.mkdir(mode=BROKER_DIR_MODE, parents=True, exist_ok=True)
+        if self.path.parent == BROKER_DIR:
+            # mkdir leaves the mode of existing directories as is.
+            BROKER_DIR.chmod(BROKER_DIR_MODE)
+        if self.path.exists():
+            if is_running(self.location, path=self.path):
+                raise PyDeviceError(f"A broker is already running for {self.location}.")
+            # left behind by a broker that did not exit cleanly.
+            self.path.unlink()
+        self._server = _BrokerServer(self.path, self)
+        try:
+            self.path.chmod(SOCKET_MODE)
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.path.unlink(missing_ok=True)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class BrokerPyDeviceBackend(MetaPyDeviceBackend):
+    """Backend forwarding operations to a :class:`DeviceBroker`.
+
+    The broker holds the device connection, so connecting and disconnecting
+    only attach to and detach from the broker.
+
+    Attributes:
+        checksum: Checksum the broker verifies transfers of this client with,
+            or None for the default of the broker's backend.
+
+    """
+
+    location: str
+    path: Path
+    checksum: Optional[ChecksumAlgorithm] = None
+    _socket: Optional[socket.socket] = None
+    _stream: Optional[io.BufferedIOBase] = None
+
+    def establish(self, target: str) -> BrokerPyDeviceBackend:
+        self.location = target
+        self.path = socket_path(target)
+        return self
+
+    def connect(self) -> None:
+        if self._socket is not None:
+            return
+        try:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(str(self.path))
+        except OSError as e:
+            self._socket = None
+            raise PyDeviceConnectionError(self.location) from e
+        self._stream = self._socket.makefile("rwb")
+
+    def disconnect(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _request(
+        self,
+        op: str,
+        *args: Any,
+        consumer: MessageConsumer | PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        if op in _HOST_PATH_ARGS:
+            index = _HOST_PATH_ARGS[op]
+            args = (*args[:index], str(Path(args[index]).absolute()), *args[index + 1 :])
+        message = dict(op=op, args=_encode(args), kwargs=_encode(kwargs))
+        if self.checksum is not None:
+            message["checksum"] = self.checksum
+        self.connect()
+        assert self._stream is not None
+        try:
+            _send(self._stream, message)
+            delegate = ConsumerDelegate(consumer)
+            for line in self._stream:
+                response = json.loads(line)
+                if "event" in response:
+                    delegate.consumer_for(
+                        response["event"],
+                        *_decode(response["args"]),
+                        **_decode(response["kwargs"]),
+                    )
+                    continue
+                if "error" in response:
+                    error = response["error"]
+                    if error["type"] == PyDeviceUnsupportedError.__name__:
+                        raise PyDeviceUnsupportedError(error["message"])
+                    raise PyDeviceError(error["message"])
+                return _decode(response["result"])
+        except OSError as e:
+            self.disconnect()
+            raise PyDeviceConnectionError(self.location) from e
+        self.disconnect()
+        raise PyDeviceConnectionError(self.location)
+
+    def reset(self) -> None:
+        return self._request("reset")
+
+    def calibrate(self, **kwargs: Any) -> dict[str, Any]:
+        """Calibrate the link held by the broker, see :meth:`DeviceBroker.calibrate`."""
+        return self._request("calibrate", **kwargs)
+
+    def resolve_path(self, target_path: DevicePath | str | Path) -> DevicePath:
+        return DevicePath(self._request("resolve_path", str(target_path)))
+
+    @property
+    def connected(self) -> bool:
+        try:
+            return bool(self._request("connected"))
+        except PyDeviceError:
+            return False
+
+    def push_file(
+        self,
+        source_path: HostPath,
+        target_path: DevicePath,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> None:
+        return self._request("push_file", source_path, target_path, consumer=consumer, **kwargs)
+
+    def pull_file(
+        self,
+        source_path: DevicePath,
+        target_path: HostPath,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> None:
+        return self._request("pull_file", source_path, target_path, consumer=consumer, **kwargs)
+
+    def list_dir(self, path: DevicePath) -> list[DevicePath]:
+        return [DevicePath(p) for p in self._request("list_dir", path)]
+
+    def walk(
+        self, path: DevicePath | str = "/", *, consumer: MessageConsumer | None = None
+    ) -> list[DeviceEntry]:
+        return [DeviceEntry(*entry) for entry in self._request("walk", path, consumer=consumer)]
+
+    def remove(self, path: DevicePath) -> None:
+        return self._request("remove", path)
+
+    def copy_dir(
+        self,
+        source_path: DevicePath,
+        target_path: HostPath,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+        **kwargs: Any,
+    ) -> None:
+        return self._request("copy_dir", source_path, target_path, consumer=consumer, **kwargs)
+
+    def eval(self, command: str, *, consumer: MessageConsumer | None = None) -> Any:
+        return self._request("eval", command, consumer=consumer)
+
+    def eval_script(
+        self,
+        contents: AnyStr,
+        target_path: DevicePath | None = None,
+        *,
+        consumer: PyDeviceConsumer | None = None,
+    ) -> Any:
+        return self._request("eval_script", contents, target_path, consumer=consumer)
+
+
+def _control(port: str, op: str, path: Optional[Path] = None) -> Any:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(TIMEOUT)
+        sock.connect(str(path or socket_path(port)))
+        with sock.makefile("rwb") as stream:
+            _send(stream, dict(op=op))
+            return json.loads(stream.readline())["result"]
+
+
+def is_running(port: str, *, path: Optional[Path] = None) -> bool:
+    """Whether a broker for `port` is running and responding."""
+    path = path or socket_path(port)
+    if not hasattr(socket, "AF_UNIX") or not path.exists():
+        return False
+    try:
+        _control(port, "ping", path)
+    except (OSError, ValueError, KeyError):
+        return False
+    return True
+
+
+def shutdown(port: str) -> bool:
+    """Stop the broker for `port`, returning whether one was running."""
+    if not is_running(port):
+        return False
+    _control(port, "shutdown")
+    return True
+
+
+def _backend_cls(name: str) -> Type[MetaPyDeviceBackend]:
+    if name == "rshell":
+        from .backend_rshell import RShellPyDeviceBackend
+
+        return RShellPyDeviceBackend
+    from .backend_upydevice import UPyDeviceBackend
+
+    return UPyDeviceBackend
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Connect to a device and serve it until shut down."""
+    from .calibrate import LinkProfileStore
+    from .pydevice import PyDevice
+
+    parser = argparse.ArgumentParser(
+        prog="python -m micropy.pyd.broker", description="Hold a device connection open."
+    )
+    parser.add_argument("port", help="Port of device to connect to.")
+    parser.add_argument("--backend", choices=["upydevice", "rshell"], default="upydevice")
+    args = parser.parse_args(argv)
+    pyd: PyDevice[MetaPyDeviceBackend] = PyDevice(
+        args.port,
+        backend=_backend_cls(args.backend),
+        link_profiles=LinkProfileStore(data.LINK_PROFILES),
+    )
+    broker = DeviceBroker(pyd.pydevice)
+    print(f"Serving {args.port} on {broker.path} (pid {os.getpid()})", flush=True)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pyd.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
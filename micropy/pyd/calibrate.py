@@ -0,0 +1,273 @@
+"""Link calibration.
+
+:func:`calibrate` times transfers to a device over each transfer mode and
+chunk size, and picks the fastest setting that completed every transfer
+intact and without retries. The resulting :class:`~micropy.pyd.transfer.LinkProfile`
+is saved per device fingerprint in a :class:`LinkProfileStore`, so later
+connections to the device use it instead of probing device memory.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import string
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Literal, NamedTuple, Optional, Sequence
+
+import attr
+from micropy.exceptions import PyDeviceError, PyDeviceUnsupportedError
+
+from .abc import DevicePath, MetaPyDeviceBackend
+from .backend_upydevice import UPyDeviceBackend
+from .broker import BrokerPyDeviceBackend
+from .checksum import DEFAULT_CHECKSUM, new_checksum
+from .fingerprint import DeviceFingerprint
+from .rawpaste import LINE_SIZE
+from .transfer import LinkProfile, TransferState
+
+__all__ = ["CalibrationTrial", "Calibration", "LinkProfileStore", "calibrate", "CHUNK_SIZES"]
+
+CHUNK_SIZES = (256, 512, 1024, 2048, 4096)
+SAMPLE_SIZE = 8 * 1024
+CALIBRATION_PATH = DevicePath("/.micropy_calibrate")
+
+WriteMode = Literal["raw-paste", "repl"]
+ReadMode = Literal["stream", "chunked"]
+
+
+class CalibrationTrial(NamedTuple):
+    """Timed transfers with a single setting.
+
+    Attributes:
+        direction: ``write`` or ``read``.
+        mode: Transfer mode (``raw-paste``/``repl`` for writes,
+            ``stream``/``chunked`` for reads).
+        chunk_size: Chunk size used.
+        seconds: Mean seconds per transfer.
+        size: Bytes per transfer.
+        ok: Every transfer completed intact without retries.
+
+    """
+
+    direction: Literal["write", "read"]
+    mode: str
+    chunk_size: int
+    seconds: float
+    size: int
+    ok: bool
+
+    @property
+    def throughput(self) -> float:
+        return self.size / self.seconds if self.seconds else 0.0
+
+
+@attr.frozen
+class Calibration:
+    """Outcome of :func:`calibrate`.
+
+    Attributes:
+        profile: Fastest reliable settings.
+        trials: Every setting tried.
+
+    """
+
+    profile: LinkProfile
+    trials: list[CalibrationTrial]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"profile": attr.asdict(self.profile), "trials": [list(t) for t in self.trials]}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Calibration:
+        return cls(LinkProfile(**data["profile"]), [CalibrationTrial(*t) for t in data["trials"]])
+
+
+class LinkProfileStore:
+    """Link profiles per device fingerprint, persisted as json.
+
+    Args:
+        path: Host file to persist profiles to.
+
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def __len__(self) -> int:
+        return len(self._read())
+
+    def get(self, digest: str) -> Optional[LinkProfile]:
+        """Profile saved for the device fingerprint `digest`."""
+        data = self._read().get(digest)
+        if not data:
+            return None
+        try:
+            return LinkProfile(**data["profile"])
+        except (KeyError, TypeError):
+            return None
+
+    def save(self, fingerprint: DeviceFingerprint, profile: LinkProfile) -> None:
+        with self._lock:
+            data = self._read()
+            data[fingerprint.digest] = {
+                "device": f"{fingerprint.machine} ({fingerprint.release})",
+                "profile": attr.asdict(profile),
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(data, indent=2, sort_keys=True))
+
+
+def _sample(size: int) -> str:
+    rng = random.Random(size)
+    return "".join(rng.choices(string.ascii_letters + string.digits + "\n", k=size))
+
+
+def _time_write(
+    backend: UPyDeviceBackend, sample: str, path: DevicePath, repeats: int
+) -> tuple[float, bool]:
+    expected = new_checksum(DEFAULT_CHECKSUM)
+    expected.update(sample.encode())
+    seconds = 0.0
+    for _ in range(repeats):
+        transfer = TransferState()
+        started = time.perf_counter()
+        backend.write_file(sample, path, transfer=transfer)
+        seconds += time.perf_counter() - started
+        if transfer.attempts:
+            return seconds / repeats, False
+        digest = backend._compute_device_file_digest(
+            path, content_size=len(sample), checksum=DEFAULT_CHECKSUM
+        )
+        if digest != expected.hexdigest():
+            return seconds / repeats, False
+    return seconds / repeats, True
+
+
+def _time_read(
+    backend: UPyDeviceBackend, sample: str, path: DevicePath, repeats: int, *, stream: bool
+) -> tuple[float, bool]:
+    seconds = 0.0
+    for _ in range(repeats):
+        transfer = TransferState()
+        started = time.perf_counter()
+        contents = backend.read_file(path, stream=stream, size=len(sample), transfer=transfer)
+        seconds += time.perf_counter() - started
+        if transfer.attempts or contents != sample:
+            return seconds / repeats, False
+    return seconds / repeats, True
+
+
+def calibrate(
+    backend: MetaPyDeviceBackend,
+    *,
+    chunk_sizes: Sequence[int] = CHUNK_SIZES,
+    sample_size: int = SAMPLE_SIZE,
+    repeats: int = 2,
+    on_trial: Optional[Callable[[CalibrationTrial], Any]] = None,
+) -> Calibration:
+    """Find the fastest reliable transfer settings for a device.
+
+    Chunk sizes beyond what device memory allows are skipped.
+    The backend is left probing the device, use
+    :meth:`~micropy.pyd.backend_upydevice.UPyDeviceBackend.use_link_profile`
+    to apply the result.
+
+    Through a broker, the link is calibrated by the broker process, which
+    applies the result to its connection. Trials are then reported once
+    calibration completes.
+
+    Args:
+        backend: Connected UPyDevice backend, or a broker client serving one.
+        chunk_sizes: Chunk sizes to try.
+        sample_size: Bytes transferred per trial.
+        repeats: Transfers per trial.
+        on_trial: Called with each trial as it completes.
+
+    Raises:
+        PyDeviceError: No setting was reliable.
+        PyDeviceUnsupportedError: Backend can not be calibrated.
+
+    """
+    if isinstance(backend, BrokerPyDeviceBackend):
+        result = Calibration.from_dict(
+            backend.calibrate(
+                chunk_sizes=list(chunk_sizes), sample_size=sample_size, repeats=repeats
+            )
+        )
+        if on_trial is not None:
+            for trial in result.trials:
+                on_trial(trial)
+        return result
+    if not isinstance(backend, UPyDeviceBackend):
+        raise PyDeviceUnsupportedError(f"{type(backend).__name__} does not support calibration.")
+    backend.use_link_profile(None)
+    limit = backend._compute_chunk_size()
+    sizes = sorted({s for s in chunk_sizes if s <= limit}) or [limit]
+    sample = _sample(sample_size)
+    path = backend.resolve_path(CALIBRATION_PATH)
+    trials: list[CalibrationTrial] = []
+
+    def _record(trial: CalibrationTrial) -> None:
+        trials.append(trial)
+        if on_trial is not None:
+            on_trial(trial)
+
+    # the link is measured, not how well the sample compresses.
+    compress_min_size, backend.compress_min_size = backend.compress_min_size, None
+    try:
+        # raw-paste blocks are sent in whole lines.
+        paste_sizes = sorted({max(LINE_SIZE, s - s % LINE_SIZE) for s in sizes})
+        write_modes: tuple[tuple[WriteMode, list[int]], ...] = (
+            ("raw-paste", paste_sizes),
+            ("repl", sizes),
+        )
+        for write_mode, mode_sizes in write_modes:
+            for size in mode_sizes:
+                raw_paste = write_mode == "raw-paste"
+                backend.use_link_profile(LinkProfile(size, size, raw_paste=raw_paste))
+                seconds, ok = _time_write(backend, sample, path, repeats)
+                if write_mode == "raw-paste" and backend._raw_paste_supported is False:
+                    # device fell back to the REPL, which is timed next.
+                    break
+                _record(CalibrationTrial("write", write_mode, size, seconds, sample_size, ok))
+        read_modes: tuple[ReadMode, ...] = ("stream", "chunked")
+        for read_mode in read_modes:
+            for size in sizes:
+                backend.use_link_profile(LinkProfile(size, size))
+                stream = read_mode == "stream"
+                seconds, ok = _time_read(backend, sample, path, repeats, stream=stream)
+                _record(CalibrationTrial("read", read_mode, size, seconds, sample_size, ok))
+    finally:
+        backend.use_link_profile(None)
+        backend.compress_min_size = compress_min_size
+        try:
+            backend.remove(path)
+        except Exception:
+            pass
+
+    def _fastest(direction: str) -> CalibrationTrial:
+        reliable = [t for t in trials if t.direction == direction and t.ok]
+        if not reliable:
+            raise PyDeviceError(f"No reliable {direction} settings found for device.")
+        return min(reliable, key=lambda t: t.seconds)
+
+    write, read = _fastest("write"), _fastest("read")
+    profile = LinkProfile(
+        write_chunk_size=write.chunk_size,
+        read_chunk_size=read.chunk_size,
+        raw_paste=write.mode == "raw-paste",
+        stream_reads=read.mode == "stream",
+        write_throughput=round(write.throughput, 1),
+        read_throughput=round(read.throughput, 1),
+    )
+    return Calibration(profile, trials)
@@ -0,0 +1,104 @@
+"""Transfer checksums computed on both host and device.
+
+Each algorithm has a host implementation and a device-side snippet
+defining ``_C``, a class with ``update(b)`` and ``hexdigest()`` that
+helper scripts use to hash data as it is transferred.
+"""
+
+from __future__ import annotations
+
+import binascii
+import hashlib
+from typing import Literal, Optional, Protocol
+
+__all__ = [
+    "ChecksumAlgorithm",
+    "CHECKSUM_ALGORITHMS",
+    "DEFAULT_CHECKSUM",
+    "Crc32",
+    "new_checksum",
+    "device_checksum_code",
+]
+
+ChecksumAlgorithm = Literal["sha256", "crc32"]
+CHECKSUM_ALGORITHMS: tuple[ChecksumAlgorithm, ...] = ("sha256", "crc32")
+DEFAULT_CHECKSUM: ChecksumAlgorithm = "sha256"
+
+
+class Checksum(Protocol):
+    def update(self, data: bytes) -> None: ...
+
+    def hexdigest(self) -> str: ...
+
+
+class Crc32:
+    """Running crc32 with a hashlib-like interface."""
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def update(self, data: bytes) -> None:
+        self.value = binascii.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        return f"{self.value & 0xFFFFFFFF:08x}"
+
+
+def new_checksum(algorithm: ChecksumAlgorithm = DEFAULT_CHECKSUM) -> Checksum:
+    """Create a host-side checksum.
+
+    Raises:
+        ValueError: Unknown algorithm.
+
+    """
+    if algorithm == "sha256":
+        return hashlib.sha256()
+    if algorithm == "crc32":
+        return Crc32()
+    raise ValueError(f"Unknown checksum algorithm: {algorithm}")
+
+
+_DEVICE_CHECKSUMS = {
+    "sha256": """\
+import uhashlib
+class _C:
+    def __init__(self):
+        self.h = uhashlib.sha256()
+    def update(self, b):
+        self.h.update(b)
+    def hexdigest(self):
+        return ubinascii.hexlify(self.h.digest()).decode()
+""",
+    "crc32": """\
+class _C:
+    def __init__(self):
+        self.v = 0
+    def update(self, b):
+        self.v = ubinascii.crc32(b, self.v)
+    def hexdigest(self):
+        return '%08x' % (self.v & 0xffffffff)
+""",
+    None: """\
+class _C:
+    def update(self, b):
+        pass
+    def hexdigest(self):
+        return ''
+""",
+}
+
+
+def device_checksum_code(algorithm: Optional[ChecksumAlgorithm] = DEFAULT_CHECKSUM) -> str:
+    """Device-side source defining the ``_C`` checksum class.
+
+    Args:
+        algorithm: Checksum algorithm, or None to skip hashing.
+            Expects ``ubinascii`` to already be imported.
+
+    Raises:
+        ValueError: Unknown algorithm.
+
+    """
+    if algorithm not in _DEVICE_CHECKSUMS:
+        raise ValueError(f"Unknown checksum algorithm: {algorithm}")
+    return _DEVICE_CHECKSUMS[algorithm]
@@ -0,0 +1,117 @@
+"""Compressed file transfers.
+
+Files are compressed as zlib streams with a small window, so devices can
+decompress (and compress) them a chunk at a time in little RAM. Whether a
+device can do either is probed once per connection with
+:data:`micropy.pyd.scripts.COMPRESSION_PROBE_SCRIPT`:
+
+* ``deflate`` (MicroPython >= 1.21) decompresses, and compresses too if
+  the firmware was built with ``MICROPY_PY_DEFLATE_COMPRESS``.
+* ``zlib.DecompIO`` (``uzlib`` on older firmware) only decompresses.
+
+Devices with neither transfer files uncompressed.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import BinaryIO, Optional
+
+import attr
+
+from .transfer import COPY_CHUNK_SIZE, iter_chunks, spool
+
+__all__ = [
+    "DeviceCompression",
+    "WBITS",
+    "compress",
+    "decompress",
+    "max_compressed_size",
+    "worthwhile",
+]
+
+# log2 of the compression window; the device allocates a window of this size.
+WBITS = 10
+# least fraction of the size that compression must save to be used.
+MIN_SAVING = 0.1
+# suffix of compressed files staged on the device during transfers.
+STAGING_SUFFIX = ".mpz"
+
+
+@attr.frozen
+class DeviceCompression:
+    """Compression support of a device.
+
+    Attributes:
+        module: Device module that decompresses streams (``deflate``, ``zlib``
+            or ``uzlib``), None if the device has none.
+        compress: Whether the device can also compress streams.
+
+    """
+
+    module: Optional[str] = None
+    compress: bool = False
+
+    @property
+    def decompress(self) -> bool:
+        return self.module is not None
+
+    def decoder(self, stream: str) -> str:
+        """Device expression that decompresses the stream named `stream`."""
+        if self.module == "deflate":
+            return f"deflate.DeflateIO({stream}, deflate.ZLIB, {WBITS})"
+        return f"{self.module}.DecompIO({stream}, {WBITS})"
+
+    def encoder(self, stream: str) -> str:
+        """Device expression that compresses into the stream named `stream`."""
+        return f"deflate.DeflateIO({stream}, deflate.ZLIB, {WBITS})"
+
+
+def compress(source: BinaryIO) -> BinaryIO:
+    """Compress `source` as a zlib stream devices can decompress.
+
+    Returns:
+        Spooled compressed stream, from its start.
+
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, WBITS)
+    target = spool()
+    for chunk in iter_chunks(source):
+        target.write(compressor.compress(chunk))
+    target.write(compressor.flush())
+    target.seek(0)
+    return target
+
+
+def decompress(source: BinaryIO, target: BinaryIO) -> int:
+    """Decompress a zlib stream compressed by a device into `target`.
+
+    Raises:
+        zlib.error: Stream is corrupt or incomplete.
+
+    Returns:
+        Decompressed size.
+
+    """
+    decompressor = zlib.decompressobj()
+    size = 0
+    for chunk in iter_chunks(source):
+        # output is bounded too, as highly compressed chunks expand a lot.
+        data = decompressor.decompress(chunk, COPY_CHUNK_SIZE)
+        while data:
+            size += target.write(data)
+            data = decompressor.decompress(decompressor.unconsumed_tail, COPY_CHUNK_SIZE)
+    size += target.write(decompressor.flush())
+    if not decompressor.eof:
+        raise zlib.error("incomplete compressed stream")
+    return size
+
+
+def max_compressed_size(size: int) -> int:
+    """Largest compressed size worth sending instead of `size` bytes."""
+    return int(size * (1 - MIN_SAVING))
+
+
+def worthwhile(size: int, compressed_size: int) -> bool:
+    """Whether sending `compressed_size` bytes instead of `size` saves enough."""
+    return 0 < compressed_size <= max_compressed_size(size)
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
-from functools import partialmethod
-from typing import Any, Callable, NamedTuple, cast
+from typing import Any, Callable, Iterable, NamedTuple, Union
 
 from micropy.pyd.abc import (
     EndHandler,
+    EventConsumer,
+    EventHandler,
     MessageConsumer,
     MessageHandler,
     StartHandler,
     StreamConsumer,
+    TransferEvent,
     UpdateHandler,
 )
 from tqdm import tqdm
@@ -45,23 +47,60 @@ class ProgressStreamConsumer:
         self.bar.close()
 
 
+AnyConsumer = Union[StreamConsumer, MessageConsumer, EventConsumer]
+
+# handlers a delegate binds.
+_ACTIONS = ("on_message", "on_start", "on_update", "on_end", "on_event")
+
+
 class ConsumerDelegate:
-    consumers: list[StreamConsumer | MessageConsumer]
+    """Delegates each handler to the first of `consumers` that has it.
+
+    Handlers are bound once, when the delegate is created, so delegating
+    costs the same per chunk however many consumers there are.
+
+    Args:
+        consumers: Consumers to delegate to, in order of precedence.
+        observers: Consumers also called with every event they handle,
+            after the delegated handler (i.e. to record telemetry).
+
+    """
+
+    consumers: list[AnyConsumer]
+    observers: list[AnyConsumer]
+
+    on_message: MessageHandler
+    on_start: StartHandler
+    on_update: UpdateHandler
+    on_end: EndHandler
+    on_event: EventHandler
 
-    def __init__(self, *consumers: StreamConsumer | MessageConsumer | None):
+    def __init__(self, *consumers: AnyConsumer | None, observers: Iterable[AnyConsumer] = ()):
         self.consumers = [i for i in consumers if i]
+        self.observers = list(observers)
+        for action in _ACTIONS:
+            setattr(self, action, self._bind(action))
+
+    def _bind(self, action: str) -> Callable[..., Any]:
+        handler = next((getattr(i, action) for i in self.consumers if hasattr(i, action)), None)
+        observed = [getattr(i, action) for i in self.observers if hasattr(i, action)]
+        if not observed:
+            return handler or _no_op
+        primary = handler or _no_op
+
+        def _observed(*args: Any, **kwargs: Any) -> Any:
+            result = primary(*args, **kwargs)
+            for observer in observed:
+                observer(*args, **kwargs)
+            return result
+
+        return _observed
 
     def consumer_for(self, action: str, *args, **kwargs):
-        _consumer = next((i for i in self.consumers if hasattr(i, action)), None)
-        if _consumer is None:
+        if action not in _ACTIONS:
             # default noop
             return
-        return getattr(_consumer, action)(*args, **kwargs)
-
-    on_message = cast(MessageHandler, partialmethod(consumer_for, "on_message"))
-    on_start = cast(StartHandler, partialmethod(consumer_for, "on_start"))
-    on_update = cast(UpdateHandler, partialmethod(consumer_for, "on_update"))
-    on_end = cast(EndHandler, partialmethod(consumer_for, "on_end"))
+        return getattr(self, action)(*args, **kwargs)
 
 
 class StreamHandlers(NamedTuple):
@@ -74,10 +113,17 @@ class MessageHandlers(NamedTuple):
     on_message: MessageHandler
 
 
-def _no_op(*args, **kwargs):
+def _no_op(*args: Any, **kwargs: Any) -> None:
     return None
 
 
+def notify(consumer: Any, event: TransferEvent, **details: Any) -> None:
+    """Report a transfer event to `consumer`, if it handles events."""
+    handler = getattr(consumer, "on_event", None)
+    if handler is not None:
+        handler(event, **details)
+
+
 NoOpStreamConsumer = StreamHandlers(on_start=_no_op, on_update=_no_op, on_end=_no_op)
 NoOpMessageConsumer = MessageHandlers(on_message=_no_op)
 NoOpConsumer = ConsumerDelegate(NoOpMessageConsumer, NoOpMessageConsumer)
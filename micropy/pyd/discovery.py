@@ -0,0 +1,251 @@
+"""Device discovery.
+
+:func:`discover` probes serial ports for MicroPython boards concurrently,
+with short timeouts, so ports without a board (or with something else
+attached) are ruled out quickly. Each board found is identified by its
+firmware and unique id, and :class:`DeviceCache` keeps the results for a
+short while, so commands can refer to a board by id rather than port.
+
+Probing interrupts whatever program is running on a board, as any
+command sent to its REPL would.
+"""
+
+from __future__ import annotations
+
+import ast
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+import attr
+import serial
+from micropy.exceptions import PyDeviceError, PyDeviceUnsupportedError
+from serial.tools import list_ports
+
+from . import broker
+from .consumers import MessageHandlers
+from .parallel import DeviceResult, run_parallel
+from .rawpaste import RawPasteTransport
+
+__all__ = ["DeviceInfo", "DeviceCache", "candidate_ports", "probe_port", "discover"]
+
+# seconds to wait on a port for each response.
+PROBE_TIMEOUT = 1.0
+# seconds cached results are used for.
+CACHE_TTL = 300.0
+# shortest unique id prefix that selects a device.
+MIN_ID_PREFIX = 4
+
+PROBE_MARKER = "@@MPY_DEVICE:"
+
+PROBE_SCRIPT = """\
+import os,gc
+_u=os.uname()
+_i=None
+try:
+ import machine,ubinascii
+ _i=ubinascii.hexlify(machine.unique_id()).decode()
+except Exception:
+ pass
+gc.collect()
+print('{marker}'+repr([_u.sysname,_u.release,_u.version,_u.machine,_i,gc.mem_free()]))
+"""
+
+# usb serial adapters and native usb boards.
+_PORT_NAMES = re.compile(r"ttyUSB|ttyACM|usbmodem|usbserial|SLAB_USBtoUART|wchusbserial")
+
+
+@attr.frozen
+class DeviceInfo:
+    """MicroPython board found on a port.
+
+    Attributes:
+        port: Port the board is attached to.
+        sysname: Firmware port name (i.e. ``esp32``).
+        release: Firmware release (i.e. ``1.22.0``).
+        version: Firmware version and build date.
+        machine: Board and MCU description.
+        unique_id: Hex unique id of the MCU, if the firmware exposes one.
+        mem_free: Free heap in bytes, after a collection.
+        description: Description of the port reported by the host (i.e. USB product).
+
+    """
+
+    port: str
+    sysname: str
+    release: str
+    version: str
+    machine: str
+    unique_id: Optional[str] = None
+    mem_free: Optional[int] = None
+    description: str = ""
+
+    @classmethod
+    def from_output(cls, port: str, output: str, *, description: str = "") -> DeviceInfo:
+        """Parse output of :data:`PROBE_SCRIPT`.
+
+        Raises:
+            PyDeviceError: Output is not from the probe script.
+
+        """
+        for line in output.splitlines():
+            _, marker, values = line.partition(PROBE_MARKER)
+            if marker:
+                try:
+                    sysname, release, version, machine, unique_id, mem_free = ast.literal_eval(
+                        values.strip()
+                    )
+                except (ValueError, SyntaxError, TypeError) as e:
+                    raise PyDeviceError(f"Invalid probe output from {port}: {values!r}") from e
+                return cls(
+                    port, sysname, release, version, machine, unique_id, mem_free, description
+                )
+        raise PyDeviceError(f"No MicroPython board found on {port}.")
+
+
+class DeviceCache:
+    """Recently discovered devices, persisted as json.
+
+    Args:
+        path: Host file to persist devices to.
+        ttl: Seconds devices are remembered for.
+
+    """
+
+    def __init__(self, path: Path, *, ttl: float = CACHE_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[list[DeviceInfo]]:
+        """Cached devices, or None if there are none or they are stale."""
+        try:
+            cached = json.loads(self.path.read_text())
+            if time.time() - cached["updated"] > self.ttl:
+                return None
+            return [DeviceInfo(**device) for device in cached["devices"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, devices: Iterable[DeviceInfo]) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            data = dict(updated=time.time(), devices=[attr.asdict(d) for d in devices])
+            self.path.write_text(json.dumps(data, indent=2))
+
+    def update(self, devices: Iterable[DeviceInfo], *, ports: Iterable[str]) -> None:
+        """Replace cached devices on `ports` with `devices`, keeping those on other ports."""
+        ports = set(ports)
+        kept = [d for d in self.load() or [] if d.port not in ports]
+        self.save([*kept, *devices])
+
+    def port_for(self, device_id: str) -> Optional[str]:
+        """Port of the cached device with unique id (or unique id prefix) `device_id`.
+
+        Prefixes must be at least :data:`MIN_ID_PREFIX` characters.
+        """
+        if len(device_id) < MIN_ID_PREFIX:
+            return None
+        device_id = device_id.lower()
+        matches = {
+            d.port
+            for d in self.load() or []
+            if d.unique_id and d.unique_id.lower().startswith(device_id)
+        }
+        return matches.pop() if len(matches) == 1 else None
+
+
+def candidate_ports() -> dict[str, str]:
+    """Serial ports that may have a board attached, with their descriptions."""
+    return {
+        port.device: port.description if port.description != "n/a" else ""
+        for port in sorted(list_ports.comports(), key=lambda p: p.device)
+        if port.vid is not None or _PORT_NAMES.search(port.device)
+    }
+
+
+def _probe_serial(port: str, timeout: float) -> str:
+    with serial.Serial(port, 115200, timeout=timeout, write_timeout=timeout) as conn:
+        with RawPasteTransport(conn, timeout=timeout) as transport:
+            script = PROBE_SCRIPT.format(marker=PROBE_MARKER)
+            try:
+                output = transport.exec_raw(script)
+            except PyDeviceUnsupportedError:
+                output = transport.exec_raw_repl(script)
+    return output.decode(errors="replace")
+
+
+def _probe_broker(port: str) -> str:
+    lines: list[str] = []
+    client = broker.BrokerPyDeviceBackend().establish(port)
+    try:
+        client.eval(
+            PROBE_SCRIPT.format(marker=PROBE_MARKER),
+            consumer=MessageHandlers(
+                on_message=lambda x: lines.append(x.decode() if isinstance(x, bytes) else str(x))
+            ),
+        )
+    finally:
+        client.disconnect()
+    return "".join(lines)
+
+
+def probe_port(port: str, *, timeout: float = PROBE_TIMEOUT, description: str = "") -> DeviceInfo:
+    """Identify the MicroPython board on `port`.
+
+    Ports held by an attached broker are queried through it.
+
+    Args:
+        port: Serial port to probe.
+        timeout: Seconds to wait for each response.
+        description: Host description of the port.
+
+    Raises:
+        PyDeviceError: No MicroPython board responded on the port.
+
+    """
+    if broker.is_running(port):
+        output = _probe_broker(port)
+    else:
+        try:
+            output = _probe_serial(port, timeout)
+        except (OSError, serial.SerialException) as e:
+            raise PyDeviceError(f"Failed to open {port}: {e}") from e
+    return DeviceInfo.from_output(port, output, description=description)
+
+
+def discover(
+    ports: Optional[Iterable[str]] = None,
+    *,
+    timeout: float = PROBE_TIMEOUT,
+    cache: Optional[DeviceCache] = None,
+    on_result: Optional[Callable[[DeviceResult[DeviceInfo]], Any]] = None,
+) -> list[DeviceInfo]:
+    """Probe ports for MicroPython boards concurrently.
+
+    Args:
+        ports: Ports to probe. Defaults to :func:`candidate_ports`.
+        timeout: Seconds to wait on each response from a port.
+        cache: Cache to save the boards found to.
+        on_result: Called with the result of each port as it completes.
+
+    Returns:
+        Boards found, in port order.
+
+    """
+    descriptions = candidate_ports()
+    ports = list(descriptions if ports is None else ports)
+    results = run_parallel(
+        ports,
+        lambda port: probe_port(port, timeout=timeout, description=descriptions.get(port, "")),
+        # entering the raw REPL and running the probe takes a few responses.
+        timeout=timeout * 4,
+        on_result=on_result,
+    )
+    devices = [r.value for r in results if r.ok and r.value is not None]
+    if cache is not None:
+        cache.update(devices, ports=ports)
+    return devices
@@ -0,0 +1,105 @@
+"""Device firmware fingerprinting."""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+from typing import Any, AnyStr
+
+import attr
+
+from .abc import MetaPyDeviceBackend
+from .consumers import MessageHandlers
+
+FINGERPRINT_MARKER = "@@MPY_FINGERPRINT:"
+
+FINGERPRINT_SCRIPT = ";".join(
+    [
+        "import sys, os",
+        "_u=os.uname()",
+        "_i=sys.implementation",
+        (
+            "print('{marker}'+repr(["
+            "_u.sysname,_u.release,_u.version,_u.machine,"
+            "_i.name,'.'.join(str(v) for v in _i.version[:3]),"
+            "getattr(_i,'_mpy',0)]))"
+        ),
+        "help('modules')",
+    ]
+)
+
+
+@attr.define(frozen=True)
+class DeviceFingerprint:
+    """Identity of a device's firmware build.
+
+    Two devices with the same fingerprint should produce
+    identical stubs from createstubs.
+    """
+
+    sysname: str
+    release: str
+    version: str
+    machine: str
+    implementation: str
+    implementation_version: str
+    mpy: int = 0
+    modules_hash: str = ""
+
+    @property
+    def digest(self) -> str:
+        """Stable sha256 digest of fingerprint."""
+        data = json.dumps(attr.asdict(self), sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**attr.asdict(self), "digest": self.digest}
+
+    @classmethod
+    def from_output(cls, lines: list[str]) -> DeviceFingerprint:
+        """Parse fingerprint from fingerprint script output.
+
+        Args:
+            lines: Output lines of :data:`FINGERPRINT_SCRIPT`.
+
+        Raises:
+            ValueError: Fingerprint marker was not found in output.
+
+        """
+        output = "\n".join(lines).splitlines()
+        # match on list start to skip any echo of the command itself.
+        info_line = next((i for i in output if f"{FINGERPRINT_MARKER}[" in i), None)
+        if info_line is None:
+            raise ValueError("Failed to read device fingerprint.")
+        info = ast.literal_eval(info_line.split(FINGERPRINT_MARKER, 1)[1].strip())
+        modules: set[str] = set()
+        for line in output[output.index(info_line) + 1 :]:
+            if line.startswith("Plus any modules"):
+                break
+            modules.update(line.split())
+        modules_hash = hashlib.sha256(" ".join(sorted(modules)).encode()).hexdigest()
+        sysname, release, version, machine, impl, impl_version, mpy = info
+        return cls(
+            sysname, release, version, machine, impl, impl_version, int(mpy or 0), modules_hash
+        )
+
+
+def read_fingerprint(backend: MetaPyDeviceBackend) -> DeviceFingerprint:
+    """Query device fingerprint over the REPL.
+
+    Args:
+        backend: Connected pydevice backend.
+
+    Returns:
+        Fingerprint of connected device.
+
+    """
+    lines: list[str] = []
+
+    def _on_message(data: AnyStr) -> None:
+        lines.append(data.decode() if isinstance(data, bytes) else str(data))
+
+    command = FINGERPRINT_SCRIPT.format(marker=FINGERPRINT_MARKER)
+    backend.eval(command, consumer=MessageHandlers(on_message=_on_message))
+    return DeviceFingerprint.from_output(lines)
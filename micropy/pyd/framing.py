@@ -0,0 +1,282 @@
+"""Framed file streams from device output.
+
+Device helper scripts (see :mod:`micropy.pyd.scripts`) emit files as
+line-based frames so many files can be transferred in a single command::
+
+    @@F <size> <device path>    start of file
+    @@D <base64 data>           file data chunk
+    @@E <hex digest>            end of file, checksum of all chunks
+    @@Z                         end of stream
+
+Scripts that redirect their own file writes to the host instead emit::
+
+    @@W <w|a> <device path>     open file for writing or appending
+    @@D <base64 data>           file data chunk
+    @@C                         close file
+
+Single file reads are framed by offset, so the host can acknowledge
+each chunk and resume a broken stream from the last one it accepted::
+
+    @@R <offset> <base64 data>  file data chunk at offset
+    @@Z <size> [hex digest]     end of stream, checksum of whole file
+
+Device tree walks list one entry per frame::
+
+    @@T <f|d> <size> <mtime> <device path>
+    @@Z                         end of walk
+
+Device manifests list one file per frame, relative to the walked root::
+
+    @@M <size> <hex digest|-> <path>
+    @@Z                         end of manifest
+
+Any other output is passed through as a regular message.
+"""
+
+from __future__ import annotations
+
+import binascii
+import io
+from pathlib import Path, PurePosixPath
+from typing import IO, AnyStr, BinaryIO, Callable, Optional
+
+from micropy.exceptions import PyDeviceError
+
+from .abc import DeviceEntry, DevicePath, MessageConsumer, PyDeviceConsumer
+from .checksum import DEFAULT_CHECKSUM, ChecksumAlgorithm, new_checksum
+from .consumers import NoOpConsumer
+
+FRAME_FILE = "@@F"
+FRAME_DATA = "@@D"
+FRAME_END = "@@E"
+FRAME_STREAM_END = "@@Z"
+FRAME_WRITE = "@@W"
+FRAME_CLOSE = "@@C"
+FRAME_READ = "@@R"
+FRAME_MANIFEST = "@@M"
+FRAME_ENTRY = "@@T"
+
+
+class FrameDecoder:
+    """Decodes framed file streams into files on the host.
+
+    Args:
+        target_path: Host directory to write received files to.
+        consumer: Consumer to report per-file progress and
+            pass through non-frame output to.
+        resolve_target: Maps a device path to a path relative to `target_path`.
+            Defaults to the device path with its root stripped.
+        checksum: Checksum algorithm used by the device,
+            or None if the device does not send digests.
+
+    """
+
+    target_path: Path
+    files: dict[DevicePath, Path]
+    failed: dict[DevicePath, tuple[str, str]]
+    finished: bool
+
+    def __init__(
+        self,
+        target_path: Path,
+        *,
+        consumer: PyDeviceConsumer = NoOpConsumer,
+        resolve_target: Optional[Callable[[PurePosixPath], PurePosixPath]] = None,
+        checksum: Optional[ChecksumAlgorithm] = DEFAULT_CHECKSUM,
+    ):
+        self.target_path = Path(target_path)
+        self.consumer = consumer
+        self._resolve_target = resolve_target or (
+            lambda p: p.relative_to(list(p.parents)[-1]) if p.is_absolute() else p
+        )
+        self.files = {}
+        self.failed = {}
+        self.finished = False
+        self._current: Optional[DevicePath] = None
+        self._file: Optional[IO[bytes]] = None
+        self._size: Optional[int] = None
+        self._checksum = checksum or DEFAULT_CHECKSUM
+        self._hasher = new_checksum(self._checksum)
+
+    def on_message(self, data: AnyStr) -> None:
+        """Consume device output."""
+        text = data.decode() if isinstance(data, bytes) else str(data)
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        """Consume a single line of device output."""
+        marker, _, payload = line.strip().partition(" ")
+        if marker == FRAME_DATA and self._file is not None:
+            try:
+                chunk = binascii.a2b_base64(payload)
+            except binascii.Error:
+                self.consumer.on_message(f"Received corrupt chunk for {self._current}")
+                if self._current is not None:
+                    self.failed[self._current] = ("corrupt", "")
+                return
+            self._file.write(chunk)
+            self._hasher.update(chunk)
+            if self._size is not None:
+                self.consumer.on_update(size=len(chunk))
+        elif marker == FRAME_FILE:
+            size, _, device_path = payload.partition(" ")
+            self._start_file(DevicePath(device_path), int(size))
+        elif marker == FRAME_END and self._current is not None:
+            self._end_file(payload.strip())
+        elif marker == FRAME_WRITE:
+            mode, _, device_path = payload.partition(" ")
+            self._start_file(DevicePath(device_path), None, append=mode == "a")
+        elif marker == FRAME_CLOSE and self._current is not None:
+            self._end_file(None)
+        elif marker == FRAME_STREAM_END:
+            self.close()
+            self.finished = True
+        elif line.strip():
+            self.consumer.on_message(line)
+
+    def _start_file(
+        self, device_path: DevicePath, size: Optional[int], *, append: bool = False
+    ) -> None:
+        """Open the host file for `device_path`.
+
+        Raises:
+            PyDeviceError: Path resolves outside of :attr:`target_path`.
+
+        """
+        self.close()
+        dest = self.target_path / self._resolve_target(PurePosixPath(device_path))
+        # device output is untrusted, i.e. '/../../x'.
+        if not dest.resolve().is_relative_to(self.target_path.resolve()):
+            raise PyDeviceError(f"Refusing to write {device_path} outside of {self.target_path}")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        self._current = device_path
+        self._size = size
+        self._file = dest.open("ab" if append else "wb")
+        self._hasher = new_checksum(self._checksum)
+        self.files[device_path] = dest
+        if size is not None:
+            self.consumer.on_start(name=f"Reading {PurePosixPath(device_path).name}", size=size)
+
+    def _end_file(self, device_digest: Optional[str]) -> None:
+        digest = self._hasher.hexdigest()
+        if self._current is not None and device_digest and device_digest != digest:
+            self.failed[self._current] = (device_digest, digest)
+        self._current = None
+        self.close()
+
+    def close(self) -> None:
+        """Close current file, marking it failed if it was never completed."""
+        if self._current is not None:
+            self.failed[self._current] = ("incomplete", self._hasher.hexdigest())
+            self._current = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if self._size is not None:
+                self.consumer.on_end()
+
+
+class ChunkStreamDecoder:
+    """Decodes an offset framed single file stream into a buffer.
+
+    Chunks are only acknowledged (appended) when their offset matches
+    the end of the data received so far, so :attr:`offset` is always
+    a safe position to resume the stream from.
+
+    Args:
+        consumer: Consumer to report progress and
+            pass through non-frame output to.
+        buffer: Binary stream holding previously acknowledged data to resume from,
+            and to append received data to (i.e. the file being written).
+
+    """
+
+    offset: int
+    finished: bool
+    device_digest: Optional[str]
+
+    def __init__(
+        self, *, consumer: PyDeviceConsumer = NoOpConsumer, buffer: Optional[BinaryIO] = None
+    ):
+        self.consumer = consumer
+        self.finished = False
+        self.device_digest = None
+        self._buffer = buffer if buffer is not None else io.BytesIO()
+        self.offset = self._buffer.seek(0, io.SEEK_END)
+
+    def on_message(self, data: AnyStr) -> None:
+        """Consume device output."""
+        text = data.decode() if isinstance(data, bytes) else str(data)
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        """Consume a single line of device output."""
+        marker, _, payload = line.strip().partition(" ")
+        if marker == FRAME_READ:
+            offset, _, chunk_data = payload.partition(" ")
+            if int(offset) != self.offset:
+                # follows a rejected chunk; wait for resume.
+                return
+            try:
+                chunk = binascii.a2b_base64(chunk_data)
+            except binascii.Error:
+                self.consumer.on_message(f"Received corrupt chunk at {offset}")
+                return
+            self._buffer.write(chunk)
+            self.offset += len(chunk)
+            self.consumer.on_update(size=len(chunk))
+        elif marker == FRAME_STREAM_END:
+            size, _, device_digest = payload.partition(" ")
+            self.finished = int(size or -1) == self.offset
+            self.device_digest = device_digest.strip() or None
+        elif line.strip():
+            self.consumer.on_message(line)
+
+    def getvalue(self) -> bytes:
+        """Acknowledged file contents."""
+        self._buffer.seek(0)
+        return self._buffer.read(self.offset)
+
+
+class TreeDecoder:
+    """Decodes a device tree walk into :class:`DeviceEntry` items.
+
+    Args:
+        consumer: Consumer to pass through non-frame output to.
+
+    """
+
+    entries: list[DeviceEntry]
+    finished: bool
+
+    def __init__(self, *, consumer: MessageConsumer = NoOpConsumer):
+        self.consumer = consumer
+        self.entries = []
+        self.finished = False
+
+    def on_message(self, data: AnyStr) -> None:
+        """Consume device output."""
+        text = data.decode() if isinstance(data, bytes) else str(data)
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        """Consume a single line of device output."""
+        marker, _, payload = line.strip().partition(" ")
+        if marker == FRAME_ENTRY:
+            type_, size, mtime, path = payload.split(" ", 3)
+            self.entries.append(
+                DeviceEntry(
+                    path=DevicePath(path),
+                    type="dir" if type_ == "d" else "file",
+                    size=int(size),
+                    # filesystems without timestamps report 0.
+                    mtime=int(mtime) or None,
+                )
+            )
+        elif marker == FRAME_STREAM_END:
+            self.finished = True
+        elif line.strip():
+            self.consumer.on_message(line)
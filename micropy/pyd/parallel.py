@@ -0,0 +1,160 @@
+"""Run device operations against many devices in parallel.
+
+Each device runs on its own worker thread with its own backend connection,
+so devices only share the scheduler. A device that hangs past its timeout
+is reported as such and abandoned, without holding up the others.
+"""
+
+from __future__ import annotations
+
+import glob
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Generic, Iterable, Optional, TypeVar
+
+import attr
+
+__all__ = ["DeviceResult", "expand_ports", "run_parallel", "run_in_background"]
+
+T = TypeVar("T")
+
+GLOB_CHARS = set("*?[")
+
+
+@attr.define
+class DeviceResult(Generic[T]):
+    """Outcome of an operation on a single device.
+
+    Attributes:
+        port: Device port.
+        value: Value returned by the operation.
+        error: Exception raised by the operation, if any.
+        duration: Seconds the operation ran for.
+        timed_out: Operation was abandoned after exceeding its timeout.
+
+    """
+
+    port: str
+    value: Optional[T] = None
+    error: Optional[BaseException] = None
+    duration: float = 0.0
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out
+
+    @property
+    def status(self) -> str:
+        if self.timed_out:
+            return "timed out"
+        return "ok" if self.error is None else "failed"
+
+
+def expand_ports(patterns: Iterable[str]) -> list[str]:
+    """Expand port globs (i.e. ``/dev/ttyUSB*``), keeping order and dropping duplicates.
+
+    Patterns without glob characters are kept as-is,
+    since not every port is a path (i.e. ``COM3`` or a websocket address).
+    """
+    ports: dict[str, None] = {}
+    for pattern in patterns:
+        if GLOB_CHARS & set(pattern):
+            ports.update(dict.fromkeys(sorted(glob.glob(pattern))))
+        else:
+            ports[pattern] = None
+    return list(ports)
+
+
+def run_parallel(
+    ports: Iterable[str],
+    worker: Callable[[str], T],
+    *,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    on_result: Optional[Callable[[DeviceResult[T]], Any]] = None,
+) -> list[DeviceResult[T]]:
+    """Run `worker` for each port concurrently.
+
+    Args:
+        ports: Device ports.
+        worker: Operation to run with each port.
+        max_workers: Devices to run at once. Defaults to all of them.
+        timeout: Seconds before a device is abandoned as hung.
+        on_result: Called with each result as it completes.
+
+    Returns:
+        Results, in the same order as `ports`.
+
+    """
+    ports = list(ports)
+    results: dict[str, DeviceResult[T]] = {}
+    done: queue.Queue[DeviceResult[T]] = queue.Queue()
+    pending = list(reversed(ports))
+    running: dict[str, float] = {}
+    max_workers = max_workers or len(ports) or 1
+
+    def _work(port: str, started: float) -> None:
+        try:
+            value = worker(port)
+        except Exception as e:
+            done.put(DeviceResult(port, error=e, duration=time.monotonic() - started))
+        else:
+            done.put(DeviceResult(port, value=value, duration=time.monotonic() - started))
+
+    def _finish(result: DeviceResult[T]) -> None:
+        running.pop(result.port, None)
+        results[result.port] = result
+        if on_result is not None:
+            on_result(result)
+
+    while pending or running:
+        while pending and len(running) < max_workers:
+            port = pending.pop()
+            running[port] = started = time.monotonic()
+            # daemon, so an abandoned device can not keep the process alive.
+            threading.Thread(
+                target=_work, args=(port, started), name=f"pyd-{port}", daemon=True
+            ).start()
+        wait = None
+        if timeout is not None:
+            wait = max(0.0, min(running.values()) + timeout - time.monotonic())
+        try:
+            result = done.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            for port, started in list(running.items()):
+                if now - started >= timeout:  # type: ignore[operator]
+                    _finish(DeviceResult(port, duration=now - started, timed_out=True))
+            continue
+        if result.port in running:
+            _finish(result)
+    return [results[port] for port in ports]
+
+
+def run_in_background(fn: Callable[..., T], *args: Any, **kwargs: Any) -> Future[T]:
+    """Run blocking host work (i.e. preparing a script) while devices are busy.
+
+    The work runs on a daemon thread, so if it turns out to be unneeded
+    the process can exit without waiting for it.
+
+    Returns:
+        Future of the result of `fn`.
+
+    """
+    future: Future[T] = Future()
+
+    def _work() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    threading.Thread(target=_work, name="micropy-background", daemon=True).start()
+    return future
@@ -0,0 +1,318 @@
+"""Device script profiling.
+
+:func:`profile_script` runs a script on a device with
+:data:`~micropy.pyd.scripts.PROFILE_PRELUDE` prepended, which samples free
+and allocated heap (``gc.mem_free()``/``gc.mem_alloc()``) and the time
+elapsed (``time.ticks_us()``) as the script starts and ends. Functions and
+methods defined at the top level of the script are decorated to sample on
+each call and return as well, where that leaves them working as before:
+generators, coroutines and native emitter (i.e. ``@micropython.viper``)
+functions are left alone. Scripts the host cannot parse are only sampled
+at start and end.
+
+Samples are printed by the device as frames and streamed back through the
+message consumer::
+
+    @@P <start|call|return|error|end> <us> <mem free> <mem alloc> <label>
+
+:class:`ProfileDecoder` collects them, and :func:`summarize` reduces them to
+a :class:`ProfileReport`. Heap usage is only seen at samples, so the peak
+reported is the highest seen at a sample rather than the true peak.
+Printing samples takes some time and heap itself.
+"""
+
+from __future__ import annotations
+
+import ast
+import textwrap
+from typing import Any, AnyStr, Callable, Literal, NamedTuple, Optional
+
+import attr
+from micropy.exceptions import PyDeviceError, PyDeviceProfileError
+from typing_extensions import TypeGuard
+
+from . import scripts
+from .abc import MessageConsumer, MetaPyDeviceBackend
+from .consumers import ConsumerDelegate, NoOpConsumer
+
+__all__ = [
+    "ProfileSample",
+    "FunctionStats",
+    "ProfileReport",
+    "ProfileDecoder",
+    "instrument",
+    "summarize",
+    "profile_script",
+]
+
+FRAME_SAMPLE = "@@P"
+MODULE_LABEL = "<module>"
+
+SampleKind = Literal["start", "call", "return", "error", "end"]
+
+# decorators applied by the native code emitters, which need the bare function.
+_EMITTERS = {"native", "viper", "asm_thumb", "asm_xtensa"}
+
+
+class ProfileSample(NamedTuple):
+    """Heap and time sampled on the device.
+
+    Attributes:
+        kind: Point of the script sampled at.
+        time_us: Microseconds since the script started.
+        mem_free: Free heap in bytes.
+        mem_alloc: Allocated heap in bytes.
+        label: Function sampled at (i.e. ``Sensor.read``), :data:`MODULE_LABEL`
+            for the script itself, or the exception type for errors.
+
+    """
+
+    kind: SampleKind
+    time_us: int
+    mem_free: int
+    mem_alloc: int
+    label: str
+
+    @classmethod
+    def from_frame(cls, payload: str) -> ProfileSample:
+        """Parse the payload of a sample frame.
+
+        Raises:
+            PyDeviceError: Payload is not a sample.
+
+        """
+        try:
+            kind, time_us, mem_free, mem_alloc, label = payload.split(" ", 4)
+            return cls(kind, int(time_us), int(mem_free), int(mem_alloc), label)  # type: ignore
+        except ValueError as e:
+            raise PyDeviceError(f"Invalid profile sample: {payload!r}") from e
+
+
+@attr.frozen
+class FunctionStats:
+    """Calls to a profiled function.
+
+    Attributes:
+        name: Function label.
+        calls: Calls that returned (or raised).
+        total_us: Microseconds spent in the function, including nested and recursive calls.
+        max_us: Longest single call.
+        max_growth: Most the allocated heap grew over a single call, in bytes.
+
+    """
+
+    name: str
+    calls: int
+    total_us: int
+    max_us: int
+    max_growth: int
+
+    @property
+    def mean_us(self) -> float:
+        return self.total_us / self.calls if self.calls else 0.0
+
+
+@attr.frozen
+class ProfileReport:
+    """Summary of a profiled script.
+
+    Attributes:
+        samples: Samples in the order received.
+        duration_us: Microseconds from start to the last sample.
+        baseline_alloc: Allocated heap at start, after a collection.
+        peak_alloc: Most heap allocated at any sample.
+        min_free: Least free heap at any sample.
+        functions: Stats per function, most time first.
+        error: Type of exception the script raised, if any.
+        completed: Whether the end of the script was sampled.
+
+    """
+
+    samples: list[ProfileSample]
+    duration_us: int = 0
+    baseline_alloc: int = 0
+    peak_alloc: int = 0
+    min_free: int = 0
+    functions: list[FunctionStats] = attr.ib(factory=list)
+    error: Optional[str] = None
+    completed: bool = False
+
+    @property
+    def peak_growth(self) -> int:
+        """Most heap allocated at any sample beyond the baseline."""
+        return self.peak_alloc - self.baseline_alloc
+
+
+class ProfileDecoder:
+    """Collects profile samples from device output.
+
+    Args:
+        consumer: Consumer to pass through other output to.
+        on_sample: Called with each sample as it is received.
+
+    """
+
+    samples: list[ProfileSample]
+
+    def __init__(
+        self,
+        *,
+        consumer: MessageConsumer = NoOpConsumer,
+        on_sample: Optional[Callable[[ProfileSample], Any]] = None,
+    ):
+        self.consumer = consumer
+        self.on_sample = on_sample
+        self.samples = []
+
+    def on_message(self, data: AnyStr) -> None:
+        """Consume device output."""
+        text = data.decode() if isinstance(data, bytes) else str(data)
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        """Consume a single line of device output."""
+        marker, _, payload = line.strip().partition(" ")
+        if marker == FRAME_SAMPLE:
+            sample = ProfileSample.from_frame(payload)
+            self.samples.append(sample)
+            if self.on_sample is not None:
+                self.on_sample(sample)
+        elif line.strip():
+            self.consumer.on_message(line)
+
+
+def _is_emitted(decorator: ast.expr) -> bool:
+    target = decorator.func if isinstance(decorator, ast.Call) else decorator
+    name = target.attr if isinstance(target, ast.Attribute) else getattr(target, "id", None)
+    return name in _EMITTERS
+
+
+def _profilable(node: ast.stmt) -> TypeGuard[ast.FunctionDef]:
+    if not isinstance(node, ast.FunctionDef):
+        return False
+    if any(_is_emitted(d) for d in node.decorator_list):
+        return False
+    return not any(isinstance(n, (ast.Yield, ast.YieldFrom)) for n in ast.walk(node))
+
+
+def _decorate(node: ast.FunctionDef, label: str) -> None:
+    # innermost, so other decorators (i.e. staticmethod) wrap the sampled function.
+    node.decorator_list.append(
+        ast.Call(func=ast.Name("_mpy_pw", ast.Load()), args=[ast.Constant(label)], keywords=[])
+    )
+
+
+def instrument(source: str) -> str:
+    """Wrap `source` in the profiling prelude, sampling its functions.
+
+    Returns:
+        Script to run on the device in place of `source`.
+
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # i.e. syntax the host python does not support; only sample start and end.
+        body = f"exec({source!r})"
+    else:
+        # future imports must start a module, micropython ignores them anyway.
+        tree.body = [
+            node
+            for node in tree.body
+            if not (isinstance(node, ast.ImportFrom) and node.module == "__future__")
+        ]
+        for node in tree.body:
+            if _profilable(node):
+                _decorate(node, node.name)
+            elif isinstance(node, ast.ClassDef):
+                for method in node.body:
+                    if _profilable(method):
+                        _decorate(method, f"{node.name}.{method.name}")
+        body = ast.unparse(ast.fix_missing_locations(tree)) or "pass"
+    return (
+        f"{scripts.PROFILE_PRELUDE}"
+        f"try:\n{textwrap.indent(body, '    ')}\n"
+        "except BaseException as _mpy_e:\n"
+        "    _mpy_ps('error', type(_mpy_e).__name__)\n"
+        "    raise\n"
+        "finally:\n"
+        f"    _mpy_ps('end', {MODULE_LABEL!r})\n"
+    )
+
+
+def summarize(samples: list[ProfileSample]) -> ProfileReport:
+    """Reduce profile samples to a report."""
+    if not samples:
+        return ProfileReport(samples=[])
+    calls: dict[str, list[tuple[int, int]]] = {}
+    stack: list[ProfileSample] = []
+    error = None
+    completed = False
+    for sample in samples:
+        if sample.kind == "call":
+            stack.append(sample)
+        elif sample.kind == "return":
+            # pop to the matching call, in case a sample was lost.
+            while stack:
+                called = stack.pop()
+                if called.label == sample.label:
+                    calls.setdefault(sample.label, []).append(
+                        (sample.time_us - called.time_us, sample.mem_alloc - called.mem_alloc)
+                    )
+                    break
+        elif sample.kind == "error":
+            error = sample.label
+        elif sample.kind == "end":
+            completed = True
+    functions = [
+        FunctionStats(
+            name=name,
+            calls=len(timings),
+            total_us=sum(t for t, _ in timings),
+            max_us=max(t for t, _ in timings),
+            max_growth=max(g for _, g in timings),
+        )
+        for name, timings in calls.items()
+    ]
+    return ProfileReport(
+        samples=list(samples),
+        duration_us=samples[-1].time_us,
+        baseline_alloc=samples[0].mem_alloc,
+        peak_alloc=max(s.mem_alloc for s in samples),
+        min_free=min(s.mem_free for s in samples),
+        functions=sorted(functions, key=lambda f: f.total_us, reverse=True),
+        error=error,
+        completed=completed,
+    )
+
+
+def profile_script(
+    pydevice: MetaPyDeviceBackend,
+    source: str,
+    *,
+    consumer: MessageConsumer = NoOpConsumer,
+    on_sample: Optional[Callable[[ProfileSample], Any]] = None,
+) -> ProfileReport:
+    """Run `source` on a device, sampling its heap and timing.
+
+    Args:
+        pydevice: Connected device backend.
+        source: Script to profile.
+        consumer: Consumer for script output, and progress if it is a stream consumer too.
+        on_sample: Called with each sample as it is received.
+
+    Returns:
+        Summary of the samples.
+
+    Raises:
+        PyDeviceProfileError: Running the script failed, with a summary
+            of the samples received until then.
+
+    """
+    decoder = ProfileDecoder(consumer=consumer, on_sample=on_sample)
+    try:
+        pydevice.eval_script(instrument(source), consumer=ConsumerDelegate(decoder, consumer))
+    except Exception as e:
+        raise PyDeviceProfileError(str(e), summarize(decoder.samples)) from e
+    return summarize(decoder.samples)
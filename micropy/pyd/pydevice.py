@@ -2,24 +2,40 @@ from __future__ import annotations
 
 from io import BytesIO, StringIO
 from pathlib import Path
-from typing import AnyStr, Generic, Optional, Type
+from typing import TYPE_CHECKING, AnyStr, Generic, Optional, Type
+
+from micropy.exceptions import PyDeviceUnsupportedError
 
 from .abc import (
     AnyBackend,
+    DeviceEntry,
     DevicePath,
     HostPath,
     MessageConsumer,
     MetaPyDevice,
     MetaPyDeviceBackend,
+    PyDeviceConsumer,
     StreamConsumer,
 )
 from .backend_upydevice import UPyDeviceBackend
+from .checksum import ChecksumAlgorithm
 from .consumers import ConsumerDelegate
+from .fingerprint import DeviceFingerprint, read_fingerprint
+from .session import SessionRecorder
+from .telemetry import TelemetryConsumer
+
+if TYPE_CHECKING:
+    from .calibrate import LinkProfileStore
 
 
 class PyDevice(MetaPyDevice[AnyBackend], Generic[AnyBackend]):
     pydevice: AnyBackend
     consumer: ConsumerDelegate
+    recorder: SessionRecorder | None = None
+    telemetry: TelemetryConsumer | None = None
+    link_profiles: LinkProfileStore | None = None
+    # read on connect when looking up a link profile.
+    fingerprint: DeviceFingerprint | None = None
 
     def __init__(
         self,
@@ -30,11 +46,29 @@ class PyDevice(MetaPyDevice[AnyBackend], Generic[AnyBackend]):
         stream_consumer: StreamConsumer = None,
         message_consumer: MessageConsumer = None,
         delegate_cls: Type[ConsumerDelegate] = ConsumerDelegate,
+        checksum: ChecksumAlgorithm | None = None,
+        record_session: Path | None = None,
+        link_profiles: LinkProfileStore | None = None,
+        telemetry: TelemetryConsumer | None = None,
     ):
         self.pydevice = backend().establish(location)
-        self.consumer = delegate_cls(stream_consumer, message_consumer)
+        if checksum is not None and hasattr(self.pydevice, "checksum"):
+            # per-device default used to verify transfers.
+            self.pydevice.checksum = checksum
+        if record_session is not None:
+            self.recorder = SessionRecorder(
+                record_session,
+                backend=getattr(self.pydevice, "backend_name", backend.__name__),
+                port=location,
+            )
+        self.link_profiles = link_profiles
+        self.telemetry = telemetry
+        if telemetry is not None:
+            self.consumer = delegate_cls(stream_consumer, message_consumer, observers=[telemetry])
+        else:
+            self.consumer = delegate_cls(stream_consumer, message_consumer)
         if auto_connect and self.pydevice:
-            self.pydevice.connect()
+            self.connect()
 
     def copy_from(
         self,
@@ -71,14 +105,45 @@ class PyDevice(MetaPyDevice[AnyBackend], Generic[AnyBackend]):
     def remove(self, target_path: DevicePath) -> None:
         return self.pydevice.remove(target_path)
 
+    def walk(self, target_path: DevicePath | str = "/") -> list[DeviceEntry]:
+        return self.pydevice.walk(target_path, consumer=self.consumer)
+
     def connect(self):
-        return self.pydevice.connect()
+        result = self.pydevice.connect()
+        if self.recorder is not None:
+            serial = getattr(self.pydevice, "serial", None)
+            if serial is None:
+                raise PyDeviceUnsupportedError("Session recording requires a serial connection.")
+            self.recorder.attach(serial)
+        self._apply_link_profile()
+        return result
+
+    def _apply_link_profile(self) -> None:
+        use_link_profile = getattr(self.pydevice, "use_link_profile", None)
+        # skip reading the fingerprint until any device was calibrated.
+        if use_link_profile is None or not self.link_profiles:
+            return
+        try:
+            self.fingerprint = read_fingerprint(self.pydevice)
+        except Exception:
+            return
+        profile = self.link_profiles.get(self.fingerprint.digest)
+        if profile is not None:
+            use_link_profile(profile)
 
     def disconnect(self):
+        if self.recorder is not None:
+            self.recorder.detach()
+        if self.telemetry is not None:
+            self.telemetry.close()
         return self.pydevice.disconnect()
 
     def run_script(
-        self, content: AnyStr | StringIO | BytesIO, target_path: DevicePath | None = None
+        self,
+        content: AnyStr | StringIO | BytesIO,
+        target_path: DevicePath | None = None,
+        *,
+        consumer: PyDeviceConsumer | None = None,
     ):
         _content = (
             content
@@ -91,7 +156,7 @@ class PyDevice(MetaPyDevice[AnyBackend], Generic[AnyBackend]):
             )
             else content.read()
         )
-        return self.pydevice.eval_script(_content, target_path, consumer=self.consumer)
+        return self.pydevice.eval_script(_content, target_path, consumer=consumer or self.consumer)
 
     def run(self, content: str) -> str | None:
         return self.pydevice.eval(content, consumer=self.consumer)
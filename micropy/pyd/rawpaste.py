@@ -0,0 +1,237 @@
+"""MicroPython raw-paste REPL transport.
+
+Raw-paste mode (MicroPython >= 1.14) lets the host stream code to the
+device as fast as the device can compile it, using window-based flow
+control instead of waiting on a prompt per command::
+
+    host  -> \\x05A\\x01               request raw-paste mode
+    device-> R\\x01 <uint16 window>    supported, initial window size
+    host  -> <= window bytes          device sends \\x01 for each new window
+    host  -> \\x04                    end of data
+    device-> \\x04 <stdout> \\x04 <stderr> \\x04 >
+
+Older firmware replies ``R\\x00`` (understood, unsupported) or nothing at all.
+"""
+
+from __future__ import annotations
+
+import base64
+import io
+import struct
+import time
+from typing import Any, BinaryIO, Callable, Optional, Union
+
+from boltons import iterutils
+from micropy.exceptions import PyDeviceError, PyDeviceUnsupportedError
+from serial import SerialBase
+
+from .abc import DevicePath, PyDeviceConsumer
+from .consumers import NoOpConsumer
+
+RAW_REPL_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+RAW_PASTE_REQUEST = b"\x05A\x01"
+RAW_PASTE_SUPPORTED = b"R\x01"
+RAW_PASTE_UNSUPPORTED = b"R\x00"
+WINDOW_ACK = b"\x01"
+END_OF_DATA = b"\x04"
+
+# raw bytes per `a2b_base64` call; multiple of 3 so no padding mid-file.
+LINE_SIZE = 768
+
+
+class RawPasteTransport:
+    """Executes code and writes files over a raw-paste REPL session.
+
+    Use as a context manager to enter and leave the raw REPL::
+
+        with RawPasteTransport(serial) as transport:
+            transport.write_file(b"...", DevicePath("/main.py"))
+
+    Args:
+        serial: Open serial connection to the device.
+        timeout: Seconds to wait for device responses.
+
+    """
+
+    serial: SerialBase
+    timeout: float
+    window_size: int | None
+
+    def __init__(self, serial: SerialBase, *, timeout: float = 10.0):
+        self.serial = serial
+        self.timeout = timeout
+        self.window_size = None
+
+    def __enter__(self) -> RawPasteTransport:
+        self.enter_raw_repl()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.exit_raw_repl()
+
+    def _read_until(self, ending: bytes) -> bytes:
+        deadline = time.monotonic() + self.timeout
+        data = b""
+        while not data.endswith(ending):
+            if self.serial.in_waiting:
+                data += self.serial.read(1)
+                deadline = time.monotonic() + self.timeout
+            elif time.monotonic() > deadline:
+                raise PyDeviceError(f"Timed out waiting for device response: {data[-64:]!r}")
+            else:
+                time.sleep(0.001)
+        return data
+
+    def _read_exactly(self, size: int) -> bytes:
+        deadline = time.monotonic() + self.timeout
+        data = b""
+        while len(data) < size:
+            if self.serial.in_waiting:
+                data += self.serial.read(size - len(data))
+            elif time.monotonic() > deadline:
+                raise PyDeviceError(f"Timed out waiting for device response: {data!r}")
+            else:
+                time.sleep(0.001)
+        return data
+
+    def _drain(self) -> None:
+        time.sleep(0.05)
+        while self.serial.in_waiting:
+            self.serial.read(self.serial.in_waiting)
+
+    def enter_raw_repl(self) -> None:
+        """Interrupt any running program and enter the raw REPL."""
+        self.serial.write(b"\r\x03\x03")
+        self._drain()
+        self.serial.write(b"\r\x01")
+        self._read_until(RAW_REPL_BANNER)
+
+    def exit_raw_repl(self) -> None:
+        """Return to the friendly REPL."""
+        self.serial.write(b"\r\x02")
+        self._drain()
+
+    def _negotiate(self) -> int:
+        self.serial.write(RAW_PASTE_REQUEST)
+        response = self._read_exactly(2)
+        if response == RAW_PASTE_SUPPORTED:
+            (self.window_size,) = struct.unpack("<H", self._read_exactly(2))
+            return self.window_size
+        if response != RAW_PASTE_UNSUPPORTED:
+            # firmware predates raw-paste and re-sends the raw REPL banner,
+            # the start of which was consumed as the response above.
+            self._read_until(RAW_REPL_BANNER[len(response) :])
+        raise PyDeviceUnsupportedError("Device does not support raw-paste mode.")
+
+    def _paste(self, data: bytes) -> None:
+        window = self._negotiate()
+        window_remain = window
+        pos = 0
+        while pos < len(data):
+            while window_remain == 0 or self.serial.in_waiting:
+                flag = self._read_exactly(1)
+                if flag == WINDOW_ACK:
+                    window_remain += window
+                elif flag == END_OF_DATA:
+                    # device aborted (e.g. syntax error); acknowledge and stop.
+                    self.serial.write(END_OF_DATA)
+                    return
+                else:
+                    raise PyDeviceError(f"Unexpected data during raw-paste: {flag!r}")
+            chunk = data[pos : pos + window_remain]
+            self.serial.write(chunk)
+            window_remain -= len(chunk)
+            pos += len(chunk)
+        self.serial.write(END_OF_DATA)
+        self._read_until(END_OF_DATA)
+
+    def exec_raw(self, code: Union[str, bytes]) -> bytes:
+        """Execute code on the device.
+
+        Args:
+            code: Source to execute.
+
+        Raises:
+            PyDeviceUnsupportedError: Device does not support raw-paste mode.
+            PyDeviceError: Code raised an exception on the device.
+
+        Returns:
+            Standard output of the executed code.
+
+        """
+        self._paste(code.encode() if isinstance(code, str) else code)
+        return self._read_result()
+
+    def exec_raw_repl(self, code: Union[str, bytes]) -> bytes:
+        """Execute code in the raw REPL, for firmware without raw-paste mode.
+
+        Code is sent without flow control, so should be short enough
+        to fit in the device input buffer.
+
+        Raises:
+            PyDeviceError: Code raised an exception on the device.
+
+        Returns:
+            Standard output of the executed code.
+
+        """
+        self.serial.write((code.encode() if isinstance(code, str) else code) + END_OF_DATA)
+        self._read_until(b"OK")
+        return self._read_result()
+
+    def _read_result(self) -> bytes:
+        output = self._read_until(END_OF_DATA)[:-1]
+        error = self._read_until(END_OF_DATA)[:-1]
+        self._read_until(b">")
+        if error:
+            raise PyDeviceError(error.decode(errors="replace").strip())
+        return output
+
+    def write_file(
+        self,
+        contents: bytes | BinaryIO,
+        target_path: DevicePath,
+        *,
+        block_size: int = 4096,
+        consumer: PyDeviceConsumer = NoOpConsumer,
+        offset: int = 0,
+        on_ack: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Write a file to the device as base64 encoded blocks.
+
+        Each block is executed as a single paste, so only one block
+        needs to fit in device memory at a time.
+
+        Args:
+            contents: File contents, or a seekable binary stream to read them from.
+            target_path: Absolute device path to write to.
+            block_size: Raw bytes sent per paste.
+            consumer: Consumer to report progress to.
+            offset: Offset to resume writing from in an existing file.
+            on_ack: Called with the new offset after each block is written.
+
+        """
+        block_size = max(LINE_SIZE, block_size - block_size % LINE_SIZE)
+        open_file = (
+            f"_f=open('{target_path!s}','r+b')\n_f.seek({offset})"
+            if offset
+            else f"_f=open('{target_path!s}','wb')"
+        )
+        self.exec_raw(f"import ubinascii,gc\n{open_file}\n_w=_f.write\n_a=ubinascii.a2b_base64")
+        source = io.BytesIO(contents) if isinstance(contents, bytes) else contents
+        consumer.on_start(name=f"Writing {target_path!s}", size=source.seek(0, io.SEEK_END))
+        if offset:
+            consumer.on_update(size=offset)
+        source.seek(offset)
+        while block := source.read(block_size):
+            lines = (
+                f"_w(_a('{base64.b64encode(bytes(line)).decode()}'))"
+                for line in iterutils.chunked_iter(block, LINE_SIZE)
+            )
+            self.exec_raw("\n".join(lines))
+            offset += len(block)
+            if on_ack is not None:
+                on_ack(offset)
+            consumer.on_update(size=len(block))
+        consumer.on_end()
+        self.exec_raw("_f.close()\ndel _f,_w,_a\ngc.collect()")
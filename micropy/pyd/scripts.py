@@ -0,0 +1,310 @@
+"""Device-side helper scripts.
+
+Scripts are formatted with :meth:`str.format` before being sent to a device,
+so literal braces must be doubled. Frame markers emitted by these scripts
+are consumed by :class:`micropy.pyd.framing.FrameDecoder`.
+"""
+
+from __future__ import annotations
+
+__all__ = [
+    "TREE_PULL_SCRIPT",
+    "STREAM_READ_SCRIPT",
+    "STREAM_WRITES_PRELUDE",
+    "WALK_SCRIPT",
+    "MANIFEST_SCRIPT",
+    "MKDIRS_SCRIPT",
+    "SCRIPT_CACHE_DIR",
+    "SCRIPT_CACHE_SCRIPT",
+    "COMPRESSION_PROBE_SCRIPT",
+    "INFLATE_SCRIPT",
+    "DEFLATE_SCRIPT",
+    "PROFILE_PRELUDE",
+]
+
+# Walks `root` and streams every file as framed, base64 encoded chunks.
+# `checksum` is the device checksum class (see :mod:`micropy.pyd.checksum`).
+TREE_PULL_SCRIPT = """\
+import uos, ubinascii, gc
+{checksum}
+def _pull(d):
+    for e in uos.ilistdir(d):
+        p = (d if d != '/' else '') + '/' + e[0]
+        if e[1] == 0x4000:
+            _pull(p)
+            continue
+        f = open(p, 'rb')
+        h = _C()
+        print('@@F', uos.stat(p)[6], p)
+        while True:
+            b = f.read({chunk_size})
+            if not b:
+                break
+            h.update(b)
+            print('@@D', ubinascii.b2a_base64(b).decode(), end='')
+        f.close()
+        print('@@E', h.hexdigest())
+        gc.collect()
+_pull('{root}')
+print('@@Z')
+"""
+
+# Streams a single file from offset `pos` with one open handle.
+# Each chunk is framed with its offset so the host can acknowledge it.
+# The checksum covers the whole file, so on resume the acknowledged
+# prefix is re-hashed on the device rather than sent again.
+STREAM_READ_SCRIPT = """\
+import ubinascii, gc
+{checksum}
+h = _C()
+f = open('{path}', 'rb')
+p = 0
+while {hash_prefix} and p < {pos}:
+    b = f.read(min({chunk_size}, {pos} - p))
+    if not b:
+        break
+    h.update(b)
+    p += len(b)
+if p != {pos}:
+    f.seek({pos})
+    p = {pos}
+while True:
+    b = f.read({chunk_size})
+    if not b:
+        break
+    h.update(b)
+    print('@@R', p, ubinascii.b2a_base64(b).decode(), end='')
+    p += len(b)
+f.close()
+gc.collect()
+print('@@Z', p, h.hexdigest())
+"""
+
+# Walks `root` and prints the type, size and mtime of every entry below it.
+WALK_SCRIPT = """\
+import uos
+def _walk(d):
+    for e in uos.ilistdir(d):
+        p = (d if d != '/' else '') + '/' + e[0]
+        try:
+            s = uos.stat(p)
+            z, m = s[6], s[8]
+        except (OSError, IndexError):
+            z, m = e[3] if len(e) > 3 else 0, 0
+        print('@@T', 'd' if e[1] == 0x4000 else 'f', z, m, p)
+        if e[1] == 0x4000:
+            _walk(p)
+_walk('{root}')
+print('@@Z')
+"""
+
+# Walks `root` and prints the size and digest of every file, relative to `root`.
+# Only files whose size matches `sizes` (relative path -> host size) are hashed;
+# any other file differs from the host regardless of its contents.
+MANIFEST_SCRIPT = """\
+import uos, ubinascii, gc
+{checksum}
+_sizes = {sizes}
+# skip this script itself when it was written to the device to run.
+_self = globals().get('__name__', '') + '.py'
+def _walk(d, r):
+    try:
+        es = list(uos.ilistdir(d))
+    except OSError:
+        return
+    for e in es:
+        p = (d if d != '/' else '') + '/' + e[0]
+        n = (r + '/' if r else '') + e[0]
+        if e[1] == 0x4000:
+            _walk(p, n)
+            continue
+        if n == _self:
+            continue
+        s = uos.stat(p)[6]
+        if _sizes.get(n) != s:
+            print('@@M', s, '-', n)
+            continue
+        f = open(p, 'rb')
+        h = _C()
+        while True:
+            b = f.read({chunk_size})
+            if not b:
+                break
+            h.update(b)
+        f.close()
+        print('@@M', s, h.hexdigest(), n)
+        gc.collect()
+_walk('{root}', '')
+print('@@Z')
+"""
+
+# Prints the unique id of the board, i.e. to tell boards on the same port apart.
+DEVICE_ID_SCRIPT = (
+    "import machine, ubinascii; print('@@I', ubinascii.hexlify(machine.unique_id()).decode())"
+)
+
+# Creates each directory in `paths`, ignoring those that already exist.
+MKDIRS_SCRIPT = """\
+import uos
+for d in {paths}:
+    try:
+        uos.mkdir(d)
+    except OSError:
+        pass
+"""
+
+# Device directory of cached scripts, relative to the device root.
+SCRIPT_CACHE_DIR = ".micropy_cache"
+
+# Defines `_sc(d, n, s, b)`, which checks for script `n` of `s` bytes in cache
+# directory `d` and marks it most recently used, evicting least recently used
+# scripts to keep `b` bytes free for it. Returns whether `n` is cached.
+# Use order is kept in `d/index` (not formatted).
+SCRIPT_CACHE_SCRIPT = """\
+import uos
+def _sc(d, n, s, b):
+    try:
+        uos.mkdir(d)
+    except OSError:
+        pass
+    try:
+        f = open(d + '/index')
+        o = f.read().split()
+        f.close()
+    except OSError:
+        o = []
+    e = {}
+    for i in uos.ilistdir(d):
+        if i[0] != 'index':
+            e[i[0]] = uos.stat(d + '/' + i[0])[6]
+    h = e.get(n) == s
+    o = [x for x in o if x in e and x != n] + [x for x in e if x not in o and x != n]
+    t = sum(e[x] for x in o) + s
+    while o and t > b:
+        x = o.pop(0)
+        t -= e[x]
+        uos.remove(d + '/' + x)
+    o.append(n)
+    f = open(d + '/index', 'w')
+    f.write(' '.join(o))
+    f.close()
+    return h
+"""
+
+# Sets `_zc` to the compression support of the device, as
+# ``(decompressing module or None, can compress)`` (not formatted).
+COMPRESSION_PROBE_SCRIPT = """\
+_zc = (None, False)
+try:
+    import deflate
+    _zc = ('deflate', hasattr(deflate.DeflateIO, 'write'))
+except ImportError:
+    for _m in ('zlib', 'uzlib'):
+        try:
+            if hasattr(__import__(_m), 'DecompIO'):
+                _zc = (_m, False)
+                break
+        except ImportError:
+            pass
+"""
+
+# Decompresses `source` into `target` a chunk at a time, then removes `source`.
+# `decoder` reads `_f` (see :meth:`micropy.pyd.compression.DeviceCompression.decoder`).
+# Sets `_n` to the decompressed size.
+INFLATE_SCRIPT = """\
+import uos, gc, {module}
+_n = 0
+_f = open('{source}', 'rb')
+try:
+    _o = open('{target}', 'wb')
+    try:
+        _z = {decoder}
+        while True:
+            _b = _z.read({chunk_size})
+            if not _b:
+                break
+            _n += _o.write(_b)
+    finally:
+        _o.close()
+finally:
+    _f.close()
+    uos.remove('{source}')
+    gc.collect()
+"""
+
+# Compresses `source` into `target` a chunk at a time.
+# `encoder` writes to `_o` (see :meth:`micropy.pyd.compression.DeviceCompression.encoder`).
+# Sets `_n` to the compressed size, removing `target` if larger than `max_size`.
+DEFLATE_SCRIPT = """\
+import uos, gc, deflate
+_n = 0
+_f = open('{source}', 'rb')
+_o = open('{target}', 'wb')
+try:
+    _z = {encoder}
+    while True:
+        _b = _f.read({chunk_size})
+        if not _b:
+            break
+        _z.write(_b)
+    _z.close()
+    _n = _o.tell()
+finally:
+    _o.close()
+    _f.close()
+    if not 0 < _n <= {max_size}:
+        uos.remove('{target}')
+    gc.collect()
+"""
+
+# Redirects file writes to framed stdout output instead of the device filesystem.
+# Injected into createstubs prior to its entrypoint (not formatted).
+STREAM_WRITES_PRELUDE = """\
+import builtins
+try:
+    import ubinascii as _sw_b
+except ImportError:
+    import binascii as _sw_b
+class _StreamWriter:
+    def __init__(self, name, mode):
+        print('@@W', mode[0], name)
+    def write(self, s):
+        if s:
+            print('@@D', _sw_b.b2a_base64(s.encode() if isinstance(s, str) else s).decode(), end='')
+        return len(s)
+    def close(self):
+        print('@@C')
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+def open(name, mode='r', *args):
+    if 'w' in mode or 'a' in mode:
+        return _StreamWriter(name, mode)
+    return builtins.open(name, mode, *args)
+def ensure_folder(path):
+    pass
+"""
+
+# Samples the heap and elapsed time of a profiled script as
+# `@@P <kind> <us> <mem free> <mem alloc> <label>` frames, with microseconds
+# counted from the start of the script. `_mpy_pw(label)` decorates functions
+# to sample on call and return. Prepended to the script (not formatted).
+PROFILE_PRELUDE = """\
+import gc as _mpy_gc, time as _mpy_t
+def _mpy_ps(k, n):
+    print('@@P', k, _mpy_t.ticks_diff(_mpy_t.ticks_us(), _mpy_t0), _mpy_gc.mem_free(), _mpy_gc.mem_alloc(), n)
+def _mpy_pw(n):
+    def _d(f):
+        def _w(*a, **k):
+            _mpy_ps('call', n)
+            try:
+                return f(*a, **k)
+            finally:
+                _mpy_ps('return', n)
+        return _w
+    return _d
+_mpy_gc.collect()
+_mpy_t0 = _mpy_t.ticks_us()
+_mpy_ps('start', '<module>')
+"""
@@ -0,0 +1,338 @@
+"""Serial session recording and analysis.
+
+:class:`SessionRecorder` hooks the serial link of a connected backend and
+logs every write and read with a timestamp, so a slow transfer in the field
+can be examined afterwards. Recordings are JSON lines: a header, then one
+event per line::
+
+    {"version": 1, "backend": "upydevice", "port": "/dev/ttyUSB0", "started": "..."}
+    {"t": 0.0012, "dir": "tx", "n": 42, "data": "<base64>"}
+
+:func:`analyze` groups the events of a recording into command exchanges
+(host writes followed by the device response) and totals the time and
+bytes spent per kind of command. Recordings can be played back with
+:class:`~micropy.pyd.backend_replay.ReplayPyDeviceBackend`.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any, Iterable, Literal, NamedTuple, Optional
+
+import attr
+from micropy.exceptions import PyDeviceError
+from serial import SerialBase
+
+from .rawpaste import RAW_PASTE_REQUEST, WINDOW_ACK
+
+__all__ = [
+    "SessionEvent",
+    "SessionRecording",
+    "SessionRecorder",
+    "Exchange",
+    "CommandStats",
+    "SessionReport",
+    "classify_command",
+    "iter_exchanges",
+    "analyze",
+]
+
+VERSION = 1
+
+Direction = Literal["tx", "rx"]
+
+# markers in host commands (device scripts included), checked in order.
+_COMMAND_KINDS: tuple[tuple[str, tuple[bytes, ...]], ...] = (
+    ("write", (b"f.write(", b"_w(_a(", b"_sw_b", b"recv_file_from_host")),
+    ("read", (b"ch=f.read(", b"'@@R'", b"'@@F'", b"send_file_to_host")),
+    ("checksum", (b"hexdigest",)),
+    ("manifest", (b"'@@M'",)),
+    ("walk", (b"'@@T'", b"ilistdir", b"listdir")),
+    ("stat", (b"stat(",)),
+    ("memory", (b"mem_free",)),
+)
+
+
+class SessionEvent(NamedTuple):
+    """Bytes written to (``tx``) or read from (``rx``) the device.
+
+    Attributes:
+        time: Seconds since the recording started.
+        direction: ``tx`` for host writes, ``rx`` for device output.
+        data: Bytes transferred.
+
+    """
+
+    time: float
+    direction: Direction
+    data: bytes
+
+    def to_json(self) -> str:
+        return json.dumps(
+            dict(
+                t=round(self.time, 6),
+                dir=self.direction,
+                n=len(self.data),
+                data=base64.b64encode(self.data).decode(),
+            )
+        )
+
+    @classmethod
+    def from_json(cls, line: str) -> SessionEvent:
+        event = json.loads(line)
+        return cls(event["t"], event["dir"], base64.b64decode(event["data"]))
+
+
+@attr.define
+class SessionRecording:
+    """Serial session loaded from a recording.
+
+    Attributes:
+        header: Recording metadata (backend, port, start time).
+        events: Recorded events, in order.
+
+    """
+
+    header: dict[str, Any] = attr.field(factory=dict)
+    events: list[SessionEvent] = attr.field(factory=list)
+
+    @property
+    def backend(self) -> Optional[str]:
+        return self.header.get("backend")
+
+    @classmethod
+    def load(cls, path: Path) -> SessionRecording:
+        """Load a recording.
+
+        Raises:
+            PyDeviceError: File is not a session recording.
+
+        """
+        with Path(path).open() as f:
+            lines = [line for line in f if line.strip()]
+        try:
+            header = json.loads(lines[0]) if lines else {}
+            if header.get("version") != VERSION:
+                raise ValueError(f"unsupported version: {header.get('version')}")
+            events = [SessionEvent.from_json(line) for line in lines[1:]]
+        except (ValueError, KeyError, TypeError) as e:
+            raise PyDeviceError(f"Invalid session recording: {path} ({e})") from e
+        return cls(header, events)
+
+
+class SessionRecorder:
+    """Records serial traffic of a device to a file.
+
+    The recorder wraps ``read`` and ``write`` of the serial port instance,
+    which every other read method of :class:`~serial.SerialBase` goes through.
+    Events are flushed as they happen, so a recording survives a crash or hang.
+
+    Args:
+        path: Recording to write. Appended to if it exists.
+        backend: Name of the backend recorded, for replay.
+        port: Device port recorded.
+
+    """
+
+    path: Path
+
+    def __init__(self, path: Path, *, backend: str, port: str):
+        self.path = Path(path)
+        self.backend = backend
+        self.port = port
+        self._file: Optional[IO[str]] = None
+        self._serial: Optional[SerialBase] = None
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _record(self, direction: Direction, data: bytes) -> None:
+        event = SessionEvent(time.monotonic() - self._started, direction, bytes(data))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(event.to_json() + "\n")
+                self._file.flush()
+
+    def attach(self, serial: SerialBase) -> SessionRecorder:
+        """Start recording traffic on `serial`."""
+        self.detach()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a")
+        if self._file.tell() == 0:
+            header = dict(
+                version=VERSION,
+                backend=self.backend,
+                port=self.port,
+                started=datetime.now(timezone.utc).isoformat(),
+            )
+            self._file.write(json.dumps(header) + "\n")
+        read, write = serial.read, serial.write
+
+        def _read(size: int = 1) -> bytes:
+            data = read(size)
+            if data:
+                self._record("rx", data)
+            return data
+
+        def _write(data: bytes) -> Optional[int]:
+            self._record("tx", data)
+            return write(data)
+
+        serial.read, serial.write = _read, _write
+        self._serial = serial
+        return self
+
+    def detach(self) -> None:
+        """Stop recording and close the recording."""
+        if self._serial is not None:
+            del self._serial.read, self._serial.write
+            self._serial = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Exchange(NamedTuple):
+    """Host command and the device response to it.
+
+    Attributes:
+        start: Seconds into the session the command was sent.
+        end: Seconds into the session the last of the response was read.
+        sent: Bytes written by the host.
+        received: Bytes read from the device.
+
+    """
+
+    start: float
+    end: float
+    sent: bytes
+    received: bytes
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def kind(self) -> str:
+        return classify_command(self.sent)
+
+
+def classify_command(command: bytes) -> str:
+    """Kind of command sent to the device (i.e. ``write``, ``read``, ``walk``)."""
+    for kind, markers in _COMMAND_KINDS:
+        if any(marker in command for marker in markers):
+            return kind
+    if not any(chr(byte).isalnum() for byte in command.replace(RAW_PASTE_REQUEST, b"")):
+        return "control"
+    return "other"
+
+
+def iter_exchanges(events: Iterable[SessionEvent]) -> Iterable[Exchange]:
+    """Group events into exchanges.
+
+    An exchange starts with the first host write after device output
+    and runs until the next one. Raw-paste flow control acknowledgements
+    are part of the command being pasted, rather than a response to it.
+    """
+    start = end = 0.0
+    sent: list[bytes] = []
+    received: list[bytes] = []
+    responded = False
+    for event in events:
+        if event.direction == "tx":
+            if responded:
+                yield Exchange(start, end, b"".join(sent), b"".join(received))
+                sent, received, responded = [], [], False
+            if not sent:
+                start = event.time
+            sent.append(event.data)
+        else:
+            if not sent and not received:
+                # device output before any command (i.e. boot messages).
+                start = event.time
+            received.append(event.data)
+            responded = responded or not sent or event.data.strip(WINDOW_ACK) != b""
+        end = event.time
+    if sent or received:
+        yield Exchange(start, end, b"".join(sent), b"".join(received))
+
+
+@attr.define
+class CommandStats:
+    """Totals for a kind of command.
+
+    Attributes:
+        kind: Kind of command, see :func:`classify_command`.
+        count: Exchanges of this kind.
+        seconds: Time spent waiting on the device.
+        sent: Bytes written by the host.
+        received: Bytes read from the device.
+
+    """
+
+    kind: str
+    count: int = 0
+    seconds: float = 0.0
+    sent: int = 0
+    received: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second over the link while running these commands."""
+        return (self.sent + self.received) / self.seconds if self.seconds else 0.0
+
+
+@attr.define
+class SessionReport:
+    """Time and bytes spent per kind of command in a session.
+
+    Attributes:
+        commands: Totals per kind of command, most time consuming first.
+        duration: Seconds from the first to the last event.
+
+    """
+
+    commands: list[CommandStats] = attr.field(factory=list)
+    duration: float = 0.0
+
+    @property
+    def exchanges(self) -> int:
+        return sum(c.count for c in self.commands)
+
+    @property
+    def sent(self) -> int:
+        return sum(c.sent for c in self.commands)
+
+    @property
+    def received(self) -> int:
+        return sum(c.received for c in self.commands)
+
+    @property
+    def device_seconds(self) -> float:
+        """Time spent within exchanges, the remainder is spent on the host."""
+        return sum(c.seconds for c in self.commands)
+
+    @property
+    def throughput(self) -> float:
+        """Effective bytes per second over the whole session."""
+        return (self.sent + self.received) / self.duration if self.duration else 0.0
+
+
+def analyze(recording: SessionRecording) -> SessionReport:
+    """Summarize a recorded session per kind of command."""
+    stats: dict[str, CommandStats] = {}
+    for exchange in iter_exchanges(recording.events):
+        entry = stats.setdefault(exchange.kind, CommandStats(exchange.kind))
+        entry.count += 1
+        entry.seconds += exchange.duration
+        entry.sent += len(exchange.sent)
+        entry.received += len(exchange.received)
+    events = recording.events
+    duration = events[-1].time - events[0].time if events else 0.0
+    commands = sorted(stats.values(), key=lambda c: c.seconds, reverse=True)
+    return SessionReport(commands, duration)
@@ -0,0 +1,905 @@
+"""Simulated MicroPython device.
+
+:class:`SimulatedDevice` emulates a MicroPython board on a pseudo-terminal,
+speaking the friendly REPL, raw REPL and raw-paste protocols. Code sent to
+it runs in CPython against a host directory standing in for the device
+filesystem, with shims for the MicroPython modules used by micropy
+(``uos``, ``ubinascii``, ``uhashlib``, ``deflate``, ``gc``, ``machine``, ...).
+
+The serial link and device can be made as slow or as flaky as real
+hardware with :class:`SimulatorConfig`, so transfer protocols can be
+measured and tested without a board::
+
+    with SimulatedDevice(tmp_path, SimulatorConfig(baudrate=115200)) as device:
+        backend = SimulatedPyDeviceBackend(device).establish(str(tmp_path))
+        backend.connect()
+        backend.push_file(HostPath("main.py"), DevicePath("/main.py"))
+        device.stats.commands
+
+The pseudo-terminal is only available on POSIX hosts.
+"""
+
+from __future__ import annotations
+
+import ast
+import binascii
+import errno
+import hashlib
+import io
+import os
+import random
+import select
+import threading
+import time
+import types
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Collection, Iterator, Optional, Sequence
+
+import attr
+import upydevice
+from micropy.exceptions import PyDeviceError
+
+from .backend_upydevice import UPyDeviceBackend
+from .rawpaste import RAW_PASTE_REQUEST, RAW_PASTE_SUPPORTED, RAW_PASTE_UNSUPPORTED, RAW_REPL_BANNER
+
+__all__ = [
+    "SimulatorConfig",
+    "SimulatorStats",
+    "SimulatedDevice",
+    "SimulatedPyDeviceBackend",
+]
+
+RELEASE = "1.22.0"
+VERSION = f"v{RELEASE} on 2024-01-05"
+MACHINE = "micropy simulated device"
+# littlefs block size of most ports.
+FLASH_BLOCK_SIZE = 4096
+BANNER = f'MicroPython {VERSION}; {MACHINE}\r\nType "help()" for more information.\r\n'
+PROMPT = b">>> "
+
+CTRL_A = 0x01
+CTRL_B = 0x02
+CTRL_C = 0x03
+CTRL_D = 0x04
+CTRL_E = 0x05
+
+S_IFDIR = 0x4000
+S_IFREG = 0x8000
+
+# host modules standing in for their micropython counterparts.
+_NATIVE_MODULES = {
+    "ujson": "json",
+    "ure": "re",
+    "ustruct": "struct",
+    "uio": "io",
+    "uerrno": "errno",
+    "ucollections": "collections",
+    "urandom": "random",
+    "uarray": "array",
+    "uselect": "select",
+    "math": "math",
+    "json": "json",
+    "struct": "struct",
+    "errno": "errno",
+    "array": "array",
+}
+
+
+@attr.frozen
+class SimulatorConfig:
+    """Simulated device and serial link characteristics.
+
+    Attributes:
+        baudrate: Serial link speed; bytes are delayed as if sent at this rate.
+            None for no delay.
+        latency: Seconds taken by the device to start executing each command.
+        mem_free: Free device RAM in bytes. Code, reads and conversions
+            larger than this raise `MemoryError` on the device.
+        raw_paste: Support raw-paste mode (MicroPython >= 1.14).
+        window: Raw-paste flow control window in bytes.
+        compression: Compression modules of the firmware: ``"deflate"`` for
+            ``deflate`` with compression (MicroPython >= 1.21), ``"inflate"`` for
+            ``deflate`` without it, ``"zlib"`` for ``zlib.DecompIO`` (older
+            firmware) or None for neither.
+        flash_free: Free filesystem space in bytes reported by ``uos.statvfs``.
+            None to report that of the host directory. Writes are not limited.
+        error_rate: Chance of each command failing with an injected `OSError`.
+        fail_commands: Numbers of commands (counting from 1) to fail.
+        seed: Seed for injected errors.
+
+    """
+
+    baudrate: Optional[int] = None
+    latency: float = 0.0
+    mem_free: int = 100_000
+    raw_paste: bool = True
+    window: int = 256
+    compression: Optional[str] = "deflate"
+    flash_free: Optional[int] = None
+    error_rate: float = 0.0
+    fail_commands: Collection[int] = frozenset()
+    seed: Optional[int] = None
+
+
+@attr.define
+class SimulatorStats:
+    """Traffic seen by a simulated device.
+
+    Attributes:
+        commands: Commands executed, one per host round trip.
+        pastes: Commands received in raw-paste mode.
+        failures: Commands failed by error injection.
+        bytes_in: Bytes received from the host.
+        bytes_out: Bytes sent to the host.
+
+    """
+
+    commands: int = 0
+    pastes: int = 0
+    failures: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    def reset(self) -> None:
+        self.commands = self.pastes = self.failures = self.bytes_in = self.bytes_out = 0
+
+
+class _SoftReset(Exception):
+    """Raised by `machine.reset()` on the device."""
+
+
+class _DeviceFile:
+    """Device file handle, enforcing RAM limits on reads."""
+
+    def __init__(self, file: io.IOBase, alloc: Callable[[int], None]):
+        self._file = file
+        self._alloc = alloc
+
+    def read(self, size: int = -1) -> Any:
+        self._alloc(size if size >= 0 else os.fstat(self._file.fileno()).st_size)
+        return self._file.read(size)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._file)
+
+    def __enter__(self) -> _DeviceFile:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._file.close()
+
+
+# `deflate` stream formats.
+DEFLATE_AUTO, DEFLATE_RAW, DEFLATE_ZLIB, DEFLATE_GZIP = range(4)
+
+
+class _InflateIO:
+    """``deflate.DeflateIO`` decompressing a device stream, enforcing RAM limits."""
+
+    alloc: Callable[[int], None] = staticmethod(lambda size: None)
+
+    def __init__(
+        self, stream: Any, format: int = DEFLATE_AUTO, wbits: int = 0, close: bool = False
+    ):
+        wbits = wbits or 15
+        self.alloc(1 << wbits)
+        self._stream = stream
+        self._close = close
+        self._wbits = {
+            DEFLATE_AUTO: 32 + 15,
+            DEFLATE_RAW: -wbits,
+            DEFLATE_ZLIB: wbits,
+            DEFLATE_GZIP: 16 + wbits,
+        }[format]
+        self._decompressor: Any = None
+        self._pending = b""
+
+    def read(self, size: int = -1) -> bytes:
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj(self._wbits)
+        while (size < 0 or len(self._pending) < size) and not self._decompressor.eof:
+            chunk = self._stream.read(256)
+            if not chunk:
+                raise OSError(errno.EIO, "EIO")
+            self._pending += self._decompressor.decompress(chunk)
+        data = self._pending if size < 0 else self._pending[:size]
+        self._pending = self._pending[len(data) :]
+        return data
+
+    def close(self) -> None:
+        if self._close:
+            self._stream.close()
+
+
+class _DeflateIO(_InflateIO):
+    """``deflate.DeflateIO`` built with compression support."""
+
+    _compressor: Any = None
+
+    def write(self, data: bytes) -> int:
+        if self._compressor is None:
+            # streams of unknown format are compressed as zlib.
+            wbits = self._wbits if self._wbits < 32 else 15
+            self._compressor = zlib.compressobj(9, zlib.DEFLATED, wbits)
+        self._stream.write(self._compressor.compress(bytes(data)))
+        return len(data)
+
+    def close(self) -> None:
+        if self._compressor is not None:
+            self._stream.write(self._compressor.flush())
+            self._compressor = None
+        super().close()
+
+
+class _DecompIO(_InflateIO):
+    """``zlib.DecompIO`` of older firmware."""
+
+    def __init__(self, stream: Any, wbits: int = 0):
+        format = DEFLATE_RAW if wbits < 0 else DEFLATE_GZIP if wbits > 15 else DEFLATE_ZLIB
+        super().__init__(stream, format, abs(wbits) & 15)
+
+
+class _Stdout:
+    """Device standard output, streamed to the host as it is written."""
+
+    def __init__(self, send: Callable[[bytes], None]):
+        self._send = send
+        self.buffer = types.SimpleNamespace(write=self._write_bytes)
+
+    def write(self, text: str) -> int:
+        # print output is "cooked" by micropython, translating line endings.
+        self._send(_crlf(str(text)))
+        return len(text)
+
+    def _write_bytes(self, data: bytes) -> int:
+        self._send(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class _Stdin:
+    """Device standard input, read from the host on demand."""
+
+    def __init__(self, recv: Callable[[int], bytes], *, binary: bool = False):
+        self._recv = recv
+        self._binary = binary
+        if not binary:
+            self.buffer = _Stdin(recv, binary=True)
+
+    def read(self, size: int = 1) -> str | bytes:
+        data = self._recv(size)
+        return data if self._binary else data.decode(errors="replace")
+
+    def readinto(self, buffer: bytearray, size: Optional[int] = None) -> int:
+        data = self._recv(len(buffer) if size is None else size)
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class _Interpreter:
+    """Runs device code in CPython against a host directory.
+
+    Args:
+        root: Host directory used as the device filesystem.
+        config: Device characteristics.
+        send: Sends device output to the host.
+        recv: Reads the given number of bytes of host input.
+
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        config: SimulatorConfig,
+        *,
+        send: Callable[[bytes], None],
+        recv: Callable[[int], bytes],
+    ):
+        self.root = root
+        self.config = config
+        self.cwd = PurePosixPath("/")
+        self.out = _Stdout(send)
+        self.stdin = _Stdin(recv)
+        self.modules: dict[str, types.ModuleType] = {}
+        self.namespace: dict[str, Any] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear device state, as on a soft reboot."""
+        self.cwd = PurePosixPath("/")
+        self.modules = self._shims()
+        self.namespace = {"__name__": "__main__", "__builtins__": self._builtins()}
+
+    def host_path(self, path: str) -> Path:
+        device_path = PurePosixPath(os.path.normpath(str(self.cwd / str(path))))
+        return self.root.joinpath(*device_path.parts[1:])
+
+    def alloc(self, size: int) -> None:
+        if size > self.config.mem_free:
+            raise MemoryError(f"memory allocation failed, allocating {size} bytes")
+
+    def _oserror(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        def _wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return fn(*args, **kwargs)
+            except OSError as e:
+                code = e.errno or errno.EIO
+                raise OSError(code, errno.errorcode.get(code, "EIO")) from None
+
+        return _wrapper
+
+    def _open(self, path: str, mode: str = "r", *args: Any, **kwargs: Any) -> _DeviceFile:
+        file = self._oserror(open)(self.host_path(path), mode, *args, **kwargs)
+        return _DeviceFile(file, self.alloc)
+
+    def _shims(self) -> dict[str, types.ModuleType]:
+        def _module(name: str, **attrs: Any) -> types.ModuleType:
+            module = types.ModuleType(name)
+            vars(module).update(attrs)
+            return module
+
+        def _stat(path: str) -> tuple[int, ...]:
+            st = os.stat(self.host_path(path))
+            mode = S_IFDIR if os.path.isdir(self.host_path(path)) else S_IFREG
+            return (mode, 0, 0, 0, 0, 0, st.st_size, int(st.st_atime), int(st.st_mtime), 0)
+
+        def _ilistdir(path: str = ".") -> list[tuple[str, int, int, int]]:
+            return [
+                (
+                    e.name,
+                    S_IFDIR if e.is_dir() else S_IFREG,
+                    0,
+                    0 if e.is_dir() else e.stat().st_size,
+                )
+                for e in sorted(os.scandir(self.host_path(path)), key=lambda e: e.name)
+            ]
+
+        def _statvfs(path: str) -> tuple[int, ...]:
+            st = os.statvfs(self.host_path(path))
+            if self.config.flash_free is None:
+                # same field order as on the device.
+                return tuple(st)
+            free = self.config.flash_free // FLASH_BLOCK_SIZE
+            return (FLASH_BLOCK_SIZE, FLASH_BLOCK_SIZE, st.f_blocks, free, free, 0, 0, 0, 0, 255)
+
+        def _chdir(path: str) -> None:
+            if not self.host_path(path).is_dir():
+                raise FileNotFoundError(errno.ENOENT, path)
+            self.cwd = PurePosixPath(os.path.normpath(str(self.cwd / path)))
+
+        uname = types.SimpleNamespace(
+            sysname="simulator",
+            nodename="simulator",
+            release=RELEASE,
+            version=VERSION,
+            machine=MACHINE,
+        )
+        wrap = self._oserror
+        uos = _module(
+            "uos",
+            ilistdir=wrap(_ilistdir),
+            listdir=wrap(lambda path=".": [e[0] for e in _ilistdir(path)]),
+            stat=wrap(_stat),
+            statvfs=wrap(_statvfs),
+            remove=wrap(lambda path: os.remove(self.host_path(path))),
+            mkdir=wrap(lambda path: os.mkdir(self.host_path(path))),
+            rmdir=wrap(lambda path: os.rmdir(self.host_path(path))),
+            rename=wrap(lambda src, dst: os.rename(self.host_path(src), self.host_path(dst))),
+            chdir=wrap(_chdir),
+            getcwd=lambda: str(self.cwd),
+            uname=lambda: uname,
+            sep="/",
+        )
+
+        def _checked(fn: Callable[[Any], Any]) -> Callable[..., Any]:
+            def _wrapper(data: bytes, *args: Any) -> Any:
+                self.alloc(len(data) * 2)
+                return fn(data, *args)
+
+            return _wrapper
+
+        ubinascii = _module(
+            "ubinascii",
+            a2b_base64=_checked(binascii.a2b_base64),
+            b2a_base64=_checked(binascii.b2a_base64),
+            hexlify=_checked(binascii.hexlify),
+            unhexlify=_checked(binascii.unhexlify),
+            crc32=binascii.crc32,
+        )
+        uhashlib = _module("uhashlib", sha256=hashlib.sha256, sha1=hashlib.sha1, md5=hashlib.md5)
+        gc = _module(
+            "gc",
+            collect=lambda: None,
+            mem_free=lambda: self.config.mem_free,
+            mem_alloc=lambda: 0,
+            enable=lambda: None,
+            disable=lambda: None,
+        )
+
+        def _reset() -> None:
+            raise _SoftReset()
+
+        machine = _module(
+            "machine",
+            reset=_reset,
+            soft_reset=_reset,
+            unique_id=lambda: b"\x00\x01\x02\x03\x04\x05",
+            freq=lambda *args: 160_000_000,
+        )
+        usys = _module(
+            "usys",
+            platform="simulator",
+            implementation=types.SimpleNamespace(
+                name="micropython", version=(1, 22, 0, ""), _mpy=6
+            ),
+            version=f"3.4.0; MicroPython {VERSION}",
+            byteorder="little",
+            maxsize=2**31 - 1,
+            path=["", "/lib"],
+            modules={},
+            stdout=self.out,
+            stdin=self.stdin,
+            print_exception=lambda e, *args: self.out.write(self.format_exception(e)),
+        )
+        utime = _module(
+            "utime",
+            time=lambda: int(time.time()),
+            sleep=time.sleep,
+            sleep_ms=lambda ms: time.sleep(ms / 1000),
+            sleep_us=lambda us: time.sleep(us / 1_000_000),
+            ticks_ms=lambda: int(time.monotonic() * 1000),
+            ticks_us=lambda: int(time.monotonic() * 1_000_000),
+            ticks_diff=lambda a, b: a - b,
+        )
+        micropython = _module(
+            "micropython",
+            const=lambda v: v,
+            opt_level=lambda *args: 0,
+            mem_info=lambda *args: self.out.write(f"free: {self.config.mem_free}\n"),
+            kbd_intr=lambda *args: None,
+        )
+        shims = dict(
+            uos=uos,
+            ubinascii=ubinascii,
+            uhashlib=uhashlib,
+            gc=gc,
+            machine=machine,
+            usys=usys,
+            utime=utime,
+            micropython=micropython,
+        )
+        shims.update(os=uos, binascii=ubinascii, hashlib=uhashlib, sys=usys, time=utime)
+        alloc = {"alloc": staticmethod(self.alloc)}
+        if self.config.compression in ("deflate", "inflate"):
+            base = _DeflateIO if self.config.compression == "deflate" else _InflateIO
+            shims["deflate"] = _module(
+                "deflate",
+                DeflateIO=type("DeflateIO", (base,), alloc),
+                AUTO=DEFLATE_AUTO,
+                RAW=DEFLATE_RAW,
+                ZLIB=DEFLATE_ZLIB,
+                GZIP=DEFLATE_GZIP,
+            )
+        elif self.config.compression == "zlib":
+            shims["zlib"] = _module("zlib", DecompIO=type("DecompIO", (_DecompIO,), alloc))
+        return shims
+
+    def _import(
+        self,
+        name: str,
+        globals: Optional[dict[str, Any]] = None,
+        locals: Optional[dict[str, Any]] = None,
+        fromlist: Sequence[str] = (),
+        level: int = 0,
+    ) -> types.ModuleType:
+        root_name = name.partition(".")[0]
+        if root_name in self.modules:
+            return self.modules[root_name]
+        # modules imported from the filesystem, as on the device.
+        imported = self.modules["usys"].modules
+        if root_name in imported:
+            return imported[root_name]
+        if root_name in _NATIVE_MODULES:
+            return __import__(_NATIVE_MODULES[root_name], fromlist=fromlist or ())
+        for search_path in self.modules["usys"].path:
+            source = self.host_path(f"{search_path or '.'}/{root_name}.py")
+            if source.is_file():
+                return self._load_module(root_name, source)
+            if source.with_suffix(".mpy").is_file():
+                raise ImportError(f"incompatible .mpy file: {root_name}.mpy")
+        raise ImportError(f"no module named '{root_name}'")
+
+    def _load_module(self, name: str, source: Path) -> types.ModuleType:
+        code = source.read_text()
+        self.alloc(len(code))
+        module = types.ModuleType(name)
+        module.__builtins__ = self.namespace["__builtins__"]  # type: ignore[attr-defined]
+        imported = self.modules["usys"].modules
+        imported[name] = module
+        try:
+            exec(compile(code, name + ".py", "exec"), vars(module))
+        except BaseException:
+            del imported[name]
+            raise
+        return module
+
+    def _help(self, topic: Any = None) -> None:
+        if topic == "modules":
+            names = sorted({*self.modules, *self.modules["usys"].modules, *_NATIVE_MODULES})
+            self.out.write("\n".join(names) + "\nPlus any modules on the filesystem\n")
+        else:
+            self.out.write(f"Welcome to MicroPython ({MACHINE})!\n")
+
+    def _builtins(self) -> dict[str, Any]:
+        import builtins
+
+        def _print(*args: Any, **kwargs: Any) -> None:
+            kwargs.setdefault("file", self.out)
+            print(*args, **kwargs)
+
+        return {
+            **vars(builtins),
+            "open": self._open,
+            "print": _print,
+            "help": self._help,
+            "__import__": self._import,
+        }
+
+    def format_exception(self, error: BaseException) -> str:
+        if isinstance(error, OSError) and error.errno:
+            message = f"[Errno {error.errno}] {errno.errorcode.get(error.errno, '')}"
+        else:
+            message = str(error)
+        line = f"{type(error).__name__}: {message}" if message else type(error).__name__
+        return (
+            f'Traceback (most recent call last):\n  File "<stdin>", line 1, in <module>\n{line}\n'
+        )
+
+    def execute(self, code: str, *, echo: bool = False) -> tuple[str, bool]:
+        """Execute device code, streaming its output.
+
+        Args:
+            code: Source to execute.
+            echo: Print the value of expression statements, as the friendly REPL does.
+
+        Returns:
+            Traceback (if raised), and whether the device reset.
+
+        """
+        error = ""
+        reset = False
+        try:
+            self.alloc(len(code))
+            tree = ast.parse(code, "<stdin>")
+            for node in tree.body:
+                if echo and isinstance(node, ast.Expr):
+                    value = eval(
+                        compile(ast.Expression(node.value), "<stdin>", "eval"), self.namespace
+                    )
+                    if value is not None:
+                        self.out.write(repr(value) + "\n")
+                else:
+                    exec(compile(ast.Module([node], []), "<stdin>", "exec"), self.namespace)
+        except _SoftReset:
+            reset = True
+        except (Exception, SystemExit) as e:
+            error = self.format_exception(e)
+        return error, reset
+
+
+def _crlf(text: str) -> bytes:
+    return text.replace("\r\n", "\n").replace("\n", "\r\n").encode()
+
+
+class SimulatedDevice:
+    """MicroPython device emulated on a pseudo-terminal.
+
+    Args:
+        root: Host directory used as the device filesystem.
+        config: Device and serial link characteristics.
+
+    """
+
+    root: Path
+    config: SimulatorConfig
+    stats: SimulatorStats
+
+    def __init__(self, root: Path, config: Optional[SimulatorConfig] = None):
+        self.root = Path(root)
+        self.config = config or SimulatorConfig()
+        self.stats = SimulatorStats()
+        self._interpreter = _Interpreter(
+            self.root, self.config, send=self._send_output, recv=self._recv
+        )
+        self._quiet = False
+        self._random = random.Random(self.config.seed)
+        self._master: Optional[int] = None
+        self._slave: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._mode = "friendly"
+        self._line = b""
+        self._code = b""
+        self._paste_unacked = 0
+        self._port = ""
+
+    @property
+    def port(self) -> str:
+        """Serial port of the simulated device."""
+        if not self._port:
+            raise PyDeviceError("Simulated device is not running.")
+        return self._port
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self) -> SimulatedDevice:
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def start(self) -> SimulatedDevice:
+        """Create the pseudo-terminal and start serving the REPL."""
+        if self.running:
+            return self
+        import tty
+
+        self._master, self._slave = os.openpty()
+        # keep the slave end open, so the device survives hosts (dis)connecting.
+        tty.setraw(self._slave)
+        self._port = os.ttyname(self._slave)
+        self._stopped.clear()
+        # output of the initial boot is lost, as no host is connected yet.
+        self._quiet = True
+        try:
+            self._boot()
+        finally:
+            self._quiet = False
+        self._thread = threading.Thread(
+            target=self._serve, name=f"pyd-sim-{self._port}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the device and close the pseudo-terminal."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+        self._port = ""
+
+    def _delay(self, size: int) -> None:
+        if self.config.baudrate:
+            # 8N1 framing: 10 bits on the wire per byte.
+            time.sleep(size * 10 / self.config.baudrate)
+
+    def _send(self, data: bytes) -> None:
+        if not data or self._master is None:
+            return
+        self._delay(len(data))
+        self.stats.bytes_out += len(data)
+        view = memoryview(data)
+        while view and not self._stopped.is_set():
+            _, writable, _ = select.select([], [self._master], [], 0.05)
+            if writable:
+                view = view[os.write(self._master, view) :]
+
+    def _send_output(self, data: bytes) -> None:
+        if not self._quiet:
+            self._send(data)
+
+    def _recv(self, size: int) -> bytes:
+        data = b""
+        master = self._master
+        if master is None:
+            return data
+        while len(data) < size and not self._stopped.is_set():
+            readable, _, _ = select.select([master], [], [], 0.05)
+            if readable:
+                chunk = os.read(master, size - len(data))
+                self._delay(len(chunk))
+                self.stats.bytes_in += len(chunk)
+                data += chunk
+        return data
+
+    def _serve(self) -> None:
+        master = self._master
+        if master is None:
+            return
+        while not self._stopped.is_set():
+            readable, _, _ = select.select([master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                data = os.read(master, 4096)
+            except OSError:
+                continue
+            self._delay(len(data))
+            self.stats.bytes_in += len(data)
+            for byte in data:
+                self._feed(byte)
+
+    def _boot(self) -> None:
+        self._interpreter.reset()
+        self._mode = "friendly"
+        self._line = self._code = b""
+        for script in ("boot.py", "main.py"):
+            if (self.root / script).is_file():
+                error, _ = self._interpreter.execute((self.root / script).read_text())
+                self._send_output(_crlf(error))
+
+    def _soft_reboot(self) -> None:
+        self._send(_crlf("MPY: soft reboot\n"))
+        self._boot()
+        self._send(_crlf(BANNER))
+
+    def _run(self, code: str, *, echo: bool = False) -> tuple[bytes, bool]:
+        """Execute a command, streaming its output.
+
+        Returns:
+            Traceback (if raised), and whether the device reset.
+
+        """
+        self.stats.commands += 1
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        if self.stats.commands in self.config.fail_commands or (
+            self.config.error_rate and self._random.random() < self.config.error_rate
+        ):
+            self.stats.failures += 1
+            return _crlf(self._interpreter.format_exception(OSError(errno.EIO, "EIO"))), False
+        error, reset = self._interpreter.execute(code, echo=echo)
+        return _crlf(error), reset
+
+    def _feed(self, byte: int) -> None:
+        if self._mode == "paste":
+            self._feed_paste(byte)
+        elif self._mode == "raw":
+            self._feed_raw(byte)
+        else:
+            self._feed_friendly(byte)
+
+    def _feed_friendly(self, byte: int) -> None:
+        if byte == CTRL_A:
+            self._mode = "raw"
+            self._line = self._code = b""
+            self._send(b"\r\n" + RAW_REPL_BANNER)
+        elif byte == CTRL_B:
+            self._line = b""
+            self._send(b"\r\n" + _crlf(BANNER) + PROMPT)
+        elif byte == CTRL_C:
+            self._line = b""
+            self._send(b"\r\n" + PROMPT)
+        elif byte == CTRL_D:
+            self._line = b""
+            self._send(b"\r\n")
+            self._soft_reboot()
+            self._send(PROMPT)
+        elif byte == ord("\r"):
+            line, self._line = self._line, b""
+            if not line.strip():
+                self._send(b"\r\n" + PROMPT)
+                return
+            self._send(line + b"\r\n")
+            error, reset = self._run(line.decode(errors="replace"), echo=True)
+            self._send(error)
+            if reset:
+                self._soft_reboot()
+            self._send(PROMPT)
+        elif byte in (0x08, 0x7F):
+            self._line = self._line[:-1]
+        elif byte != ord("\n"):
+            self._line += bytes([byte])
+
+    def _feed_raw(self, byte: int) -> None:
+        if self._code + bytes([byte]) == RAW_PASTE_REQUEST[: len(self._code) + 1] and (
+            self._code or byte == RAW_PASTE_REQUEST[0]
+        ):
+            self._code += bytes([byte])
+            if self._code == RAW_PASTE_REQUEST:
+                self._code = b""
+                if not self.config.raw_paste:
+                    self._send(RAW_PASTE_UNSUPPORTED)
+                    return
+                self._mode = "paste"
+                self._paste_unacked = 0
+                self._send(RAW_PASTE_SUPPORTED + self.config.window.to_bytes(2, "little"))
+            return
+        if byte == CTRL_A:
+            self._code = b""
+            self._send(b"\r\n" + RAW_REPL_BANNER)
+        elif byte == CTRL_B:
+            self._mode = "friendly"
+            self._code = b""
+            self._send(b"\r\n" + _crlf(BANNER) + PROMPT)
+        elif byte == CTRL_C:
+            self._code = b""
+        elif byte == CTRL_D:
+            code, self._code = self._code, b""
+            self._send(b"OK")
+            if not code:
+                self._raw_reboot()
+                return
+            error, reset = self._run(code.decode(errors="replace"))
+            self._send(b"\x04" + error + b"\x04>")
+            if reset:
+                self._raw_reboot()
+        else:
+            self._code += bytes([byte])
+
+    def _raw_reboot(self) -> None:
+        self._soft_reboot()
+        self._mode = "raw"
+        self._send(RAW_REPL_BANNER)
+
+    def _feed_paste(self, byte: int) -> None:
+        if byte == CTRL_D:
+            code, self._code = self._code, b""
+            self._mode = "raw"
+            self.stats.pastes += 1
+            self._send(b"\x04")
+            error, reset = self._run(code.decode(errors="replace"))
+            self._send(b"\x04" + error + b"\x04>")
+            if reset:
+                self._raw_reboot()
+            return
+        self._code += bytes([byte])
+        self._paste_unacked += 1
+        if self._paste_unacked == self.config.window:
+            self._paste_unacked = 0
+            self._send(b"\x01")
+
+
+class _SimulatedSerialDevice(upydevice.SerialDevice):
+    """Serial device that skips port enumeration, as pseudo-terminals are not listed."""
+
+    def _get_serial_port_data(self, serialport: str) -> tuple[str, str, str]:
+        return ("Simulated MicroPython", "micropy", "SIM")
+
+
+class SimulatedPyDeviceBackend(UPyDeviceBackend):
+    """UPyDevice backend connected to a :class:`SimulatedDevice`.
+
+    The device is started on :meth:`establish`, serving the host directory
+    given as the target, unless an already running device is given.
+
+    Args:
+        device: Running simulated device to connect to.
+        config: Characteristics of the device started on :meth:`establish`.
+
+    """
+
+    device: Optional[SimulatedDevice]
+
+    def __init__(
+        self, device: Optional[SimulatedDevice] = None, *, config: Optional[SimulatorConfig] = None
+    ):
+        self.device = device
+        self._config = config
+
+    def establish(self, target: str) -> SimulatedPyDeviceBackend:
+        if self.device is None:
+            self.device = SimulatedDevice(Path(target), self._config)
+        self.device.start()
+        self.location = target
+        self._pydevice = _SimulatedSerialDevice(self.device.port, init=True, autodetect=True)
+        return self
+
+    def close(self) -> None:
+        """Disconnect and stop the simulated device."""
+        self.disconnect()
+        if self.device is not None:
+            self.device.stop()
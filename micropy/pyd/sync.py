@@ -0,0 +1,351 @@
+"""Incremental deployment of host files to a device.
+
+Files are compared by manifest, a mapping of device paths (relative to
+the device root) to their size and digest. Only new or changed files are
+uploaded, and the last deployed manifest is cached on the host per board
+(by ``machine.unique_id()``), so an unchanged project can be skipped
+without querying the files on the device at all.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path, PurePosixPath
+from typing import Any, AnyStr, Iterable, NamedTuple, Optional, Sequence
+
+import attr
+from micropy.exceptions import PyDeviceError
+
+from . import scripts
+from .abc import DevicePath, HostPath, MetaPyDeviceBackend, PyDeviceConsumer
+from .checksum import DEFAULT_CHECKSUM, ChecksumAlgorithm, device_checksum_code, new_checksum
+from .consumers import ConsumerDelegate, MessageHandlers, NoOpConsumer
+from .framing import FRAME_MANIFEST, FRAME_STREAM_END
+from .transfer import iter_chunks
+
+__all__ = [
+    "ManifestEntry",
+    "Manifest",
+    "ManifestDecoder",
+    "ManifestCache",
+    "SyncPlan",
+    "collect_files",
+    "build_manifest",
+    "read_device_id",
+    "fetch_device_manifest",
+    "plan_sync",
+    "sync",
+]
+
+FRAME_DEVICE_ID = "@@I"
+# digest reported by the device for files it did not hash.
+UNHASHED = "-"
+IGNORED_NAMES = {"__pycache__"}
+IGNORED_SUFFIXES = {".pyc"}
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    digest: str
+
+
+Manifest = dict[str, ManifestEntry]
+
+
+class ManifestDecoder:
+    """Decodes a device manifest from device output.
+
+    Args:
+        consumer: Consumer to pass through non-frame output to.
+
+    """
+
+    entries: Manifest
+    finished: bool
+
+    def __init__(self, *, consumer: PyDeviceConsumer = NoOpConsumer):
+        self.consumer = consumer
+        self.entries = {}
+        self.finished = False
+
+    def on_message(self, data: AnyStr) -> None:
+        """Consume device output."""
+        text = data.decode() if isinstance(data, bytes) else str(data)
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        """Consume a single line of device output."""
+        marker, _, payload = line.strip().partition(" ")
+        if marker == FRAME_MANIFEST:
+            size, digest, path = payload.split(" ", 2)
+            self.entries[path] = ManifestEntry(int(size), digest)
+        elif marker == FRAME_STREAM_END:
+            self.finished = True
+        elif line.strip():
+            self.consumer.on_message(line)
+
+
+class ManifestCache:
+    """Last deployed manifest per device, persisted as json.
+
+    Safe to share between threads deploying to different devices.
+
+    Args:
+        path: Host file to persist manifests to.
+
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, key: str, *, checksum: ChecksumAlgorithm) -> Optional[Manifest]:
+        """Cached manifest for `key`, if it was hashed with `checksum`."""
+        data = self._read().get(key)
+        if not data or data.get("checksum") != checksum:
+            return None
+        return {p: ManifestEntry(*e) for p, e in data["files"].items()}
+
+    def save(self, key: str, manifest: Manifest, *, checksum: ChecksumAlgorithm) -> None:
+        with self._lock:
+            data = self._read()
+            data[key] = {"checksum": checksum, "files": {p: list(e) for p, e in manifest.items()}}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(data, indent=2, sort_keys=True))
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self.path.write_text(json.dumps(data, indent=2, sort_keys=True))
+
+
+@attr.frozen
+class SyncPlan:
+    """Changes required to bring a device in line with the host.
+
+    Attributes:
+        upload: Paths to upload, new or changed.
+        delete: Stale paths to remove from the device.
+        unchanged: Paths already up to date.
+
+    """
+
+    upload: list[str] = attr.field(factory=list)
+    delete: list[str] = attr.field(factory=list)
+    unchanged: list[str] = attr.field(factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.upload or self.delete)
+
+
+def collect_files(sources: Sequence[tuple[Path, str]]) -> dict[str, Path]:
+    """Map device paths to the host files deployed to them.
+
+    Args:
+        sources: Pairs of host directories and the device directory
+            (relative to the device root) they deploy to. When several
+            sources provide the same device path, the first one wins.
+
+    Returns:
+        Device paths mapped to host files.
+
+    """
+    files: dict[str, Path] = {}
+    for host_dir, device_dir in sources:
+        host_dir = Path(host_dir)
+        if not host_dir.is_dir():
+            continue
+        for path in sorted(host_dir.rglob("*")):
+            rel_path = path.relative_to(host_dir)
+            if (
+                not path.is_file()
+                or any(p in IGNORED_NAMES or p.startswith(".") for p in rel_path.parts)
+                or path.suffix in IGNORED_SUFFIXES
+            ):
+                continue
+            device_path = str(PurePosixPath(device_dir, *rel_path.parts)).lstrip("/")
+            files.setdefault(device_path, path)
+    return files
+
+
+def build_manifest(
+    files: dict[str, Path], *, checksum: ChecksumAlgorithm = DEFAULT_CHECKSUM
+) -> Manifest:
+    """Compute the manifest of host files."""
+    manifest: Manifest = {}
+    for device_path, host_path in files.items():
+        hasher = new_checksum(checksum)
+        size = 0
+        with host_path.open("rb") as source:
+            for chunk in iter_chunks(source):
+                hasher.update(chunk)
+                size += len(chunk)
+        manifest[device_path] = ManifestEntry(size, hasher.hexdigest())
+    return manifest
+
+
+def read_device_id(backend: MetaPyDeviceBackend) -> Optional[str]:
+    """Unique id of the connected board, if its firmware exposes one."""
+    lines: list[str] = []
+
+    def _on_message(data: AnyStr) -> None:
+        lines.append(data.decode() if isinstance(data, bytes) else str(data))
+
+    try:
+        backend.eval(scripts.DEVICE_ID_SCRIPT, consumer=MessageHandlers(on_message=_on_message))
+    except Exception:
+        return None
+    for line in "".join(lines).splitlines():
+        marker, _, device_id = line.strip().partition(" ")
+        if marker == FRAME_DEVICE_ID and device_id:
+            return device_id
+    return None
+
+
+def fetch_device_manifest(
+    backend: MetaPyDeviceBackend,
+    *,
+    sizes: dict[str, int],
+    checksum: ChecksumAlgorithm = DEFAULT_CHECKSUM,
+    consumer: PyDeviceConsumer = NoOpConsumer,
+    chunk_size: int = 512,
+) -> Manifest:
+    """Fetch the manifest of all files on the device with a single script.
+
+    Args:
+        backend: Connected device backend.
+        sizes: Host file sizes by device path. Device files of any other size
+            are reported without a digest, as they differ regardless.
+        checksum: Checksum algorithm to hash files with.
+        consumer: Consumer for device output.
+        chunk_size: Bytes read per hash update on the device.
+
+    Raises:
+        PyDeviceError: Manifest stream ended unexpectedly.
+
+    """
+    decoder = ManifestDecoder(consumer=consumer)
+    script = scripts.MANIFEST_SCRIPT.format(
+        root=backend.resolve_path("/"),
+        sizes=repr(sizes),
+        chunk_size=chunk_size,
+        checksum=device_checksum_code(checksum),
+    )
+    backend.eval_script(script, consumer=ConsumerDelegate(decoder, consumer))
+    if not decoder.finished:
+        raise PyDeviceError("Device manifest ended unexpectedly.")
+    return decoder.entries
+
+
+def plan_sync(
+    local: Manifest,
+    device: Manifest,
+    *,
+    tracked: Iterable[str] = (),
+    prune: bool = False,
+) -> SyncPlan:
+    """Plan the changes required to bring `device` in line with `local`.
+
+    Args:
+        local: Manifest of host files.
+        device: Manifest of device files.
+        tracked: Paths previously deployed from the host. Those no longer
+            present on the host are stale.
+        prune: Treat every device file missing on the host as stale.
+
+    """
+    plan = SyncPlan()
+    for path, entry in sorted(local.items()):
+        (plan.unchanged if device.get(path) == entry else plan.upload).append(path)
+    stale = set(device) if prune else set(tracked) & set(device)
+    # scripts cached on the device by the backend are not project files.
+    cached = {p for p in stale if p.startswith(f"{scripts.SCRIPT_CACHE_DIR}/")}
+    plan.delete.extend(sorted(stale - cached - set(local)))
+    return plan
+
+
+def sync(
+    backend: MetaPyDeviceBackend,
+    files: dict[str, Path],
+    *,
+    manifest: Optional[Manifest] = None,
+    cache: Optional[ManifestCache] = None,
+    cache_key: Optional[str] = None,
+    checksum: ChecksumAlgorithm = DEFAULT_CHECKSUM,
+    consumer: PyDeviceConsumer = NoOpConsumer,
+    prune: bool = False,
+    force: bool = False,
+    dry_run: bool = False,
+) -> SyncPlan:
+    """Deploy host files to a device, transferring only what changed.
+
+    If the host files match the cached manifest of the last deployment,
+    the device is not queried at all.
+
+    Args:
+        backend: Connected device backend.
+        files: Host files by device path, see :func:`collect_files`.
+        manifest: Manifest of `files` hashed with `checksum`, if already built.
+        cache: Cache of previously deployed manifests.
+        cache_key: Key identifying the device in `cache`. Defaults to the unique
+            id of the board, or its location if the firmware does not expose one.
+        checksum: Checksum algorithm to compare files with.
+        consumer: Consumer for progress and output.
+        prune: Remove every device file that is not on the host,
+            rather than only previously deployed ones.
+        force: Query the device even if nothing changed locally.
+        dry_run: Plan changes without applying them.
+
+    Returns:
+        The planned (or applied) changes.
+
+    """
+    local = manifest if manifest is not None else build_manifest(files, checksum=checksum)
+    cached = None
+    if cache is not None:
+        # another board may have been attached to the same port since.
+        cache_key = cache_key or read_device_id(backend) or backend.location
+        cached = cache.load(cache_key, checksum=checksum)
+    if cached == local and not force and not prune:
+        return SyncPlan(unchanged=sorted(local))
+
+    device = fetch_device_manifest(
+        backend,
+        sizes={p: e.size for p, e in local.items()},
+        checksum=checksum,
+        consumer=consumer,
+    )
+    plan = plan_sync(local, device, tracked=cached or (), prune=prune)
+    if dry_run:
+        return plan
+
+    root = PurePosixPath(backend.resolve_path("/"))
+    dirs = {
+        str(root / parent)
+        for path in plan.upload
+        for parent in PurePosixPath(path).parents
+        if str(parent) != "."
+    }
+    if dirs:
+        backend.eval_script(
+            scripts.MKDIRS_SCRIPT.format(paths=repr(sorted(dirs, key=len))), consumer=consumer
+        )
+    for path in plan.upload:
+        backend.push_file(
+            HostPath(str(files[path])), DevicePath(str(root / path)), consumer=consumer
+        )
+    for path in plan.delete:
+        backend.remove(DevicePath(str(root / path)))
+    if cache is not None and cache_key is not None:
+        cache.save(cache_key, local, checksum=checksum)
+    return plan
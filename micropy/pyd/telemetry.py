@@ -0,0 +1,171 @@
+"""Transfer telemetry.
+
+:class:`TelemetryConsumer` observes the progress and recovery events a
+backend reports to its consumer and keeps a :class:`TransferRecord` per
+transfer: bytes moved, elapsed time, the latency of each chunk, and the
+retries, device resets and integrity failures it took. Records are
+appended to a JSON lines file and/or passed to a callback as each
+transfer ends::
+
+    {"name": "Writing /main.py", "size": 2048, "bytes": 2048, "elapsed": 0.41, ...}
+
+Attach one to a device with ``PyDevice(..., telemetry=TelemetryConsumer(path))``.
+It observes the device consumer rather than replacing it, so progress is
+still reported as usual.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Callable, Optional
+
+import attr
+
+from .abc import TransferEvent
+
+__all__ = ["TransferRecord", "TelemetryConsumer"]
+
+# event counters of a record, by event.
+_COUNTERS: dict[str, str] = {
+    "retry": "retries",
+    "reset": "resets",
+    "integrity_failure": "integrity_failures",
+}
+
+
+@attr.define
+class TransferRecord:
+    """Telemetry of a single transfer.
+
+    Attributes:
+        name: Name the transfer was started with (i.e. ``Writing /main.py``).
+        size: Expected size in bytes, if known.
+        started: Unix time the transfer started at.
+        elapsed: Seconds from start to end.
+        bytes: Bytes reported as transferred, including any offset resumed from.
+        chunk_latencies: Seconds between consecutive progress updates.
+        retries: Times the transfer was retried or resumed.
+        resets: Times the device was reset to recover.
+        integrity_failures: Times the transferred file failed verification.
+        completed: Whether the transfer ended, rather than being abandoned.
+
+    """
+
+    name: Optional[str] = None
+    size: Optional[int] = None
+    started: float = attr.ib(factory=time.time)
+    elapsed: float = 0.0
+    bytes: int = 0
+    chunk_latencies: list[float] = attr.ib(factory=list)
+    retries: int = 0
+    resets: int = 0
+    integrity_failures: int = 0
+    completed: bool = False
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes per second, if any time elapsed."""
+        return self.bytes / self.elapsed if self.elapsed > 0 else None
+
+    def to_json(self) -> str:
+        data = attr.asdict(self)
+        data["elapsed"] = round(self.elapsed, 6)
+        data["chunk_latencies"] = [round(i, 6) for i in self.chunk_latencies]
+        return json.dumps(data)
+
+
+class TelemetryConsumer:
+    """Stream and event consumer recording telemetry of each transfer.
+
+    Events reported during a transfer count toward it. Events reported
+    between transfers (i.e. verification failing after a file was written)
+    count toward the next transfer, which is the attempt they led to. A
+    transfer started before the last one ended means the last was
+    abandoned, so it is recorded as incomplete.
+
+    Args:
+        path: JSON lines file to append records to.
+        callback: Called with each record as its transfer ends.
+
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        *,
+        callback: Optional[Callable[[TransferRecord], Any]] = None,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.callback = callback
+        self.records: list[TransferRecord] = []
+        self._file: Optional[IO[str]] = None
+        self._current: Optional[TransferRecord] = None
+        self._pending = TransferRecord()
+        self._tick = 0.0
+        self._begun = 0.0
+        self._lock = threading.Lock()
+
+    def on_start(self, *, name: Optional[str] = None, size: Optional[int] = None) -> None:
+        with self._lock:
+            if self._current is not None:
+                self._finish(completed=False)
+            pending = self._pending
+            self._current = TransferRecord(
+                name=name,
+                size=size,
+                retries=pending.retries,
+                resets=pending.resets,
+                integrity_failures=pending.integrity_failures,
+            )
+            self._pending = TransferRecord()
+            self._begun = self._tick = time.perf_counter()
+
+    def on_update(self, *, size: Optional[int] = None) -> None:
+        with self._lock:
+            if self._current is None:
+                return
+            now = time.perf_counter()
+            self._current.chunk_latencies.append(now - self._tick)
+            self._current.bytes += size or 0
+            self._tick = now
+
+    def on_end(self) -> None:
+        with self._lock:
+            if self._current is not None:
+                self._finish(completed=True)
+
+    def on_event(self, event: TransferEvent, **details: Any) -> None:
+        counter = _COUNTERS.get(event)
+        if counter is None:
+            return
+        with self._lock:
+            record = self._current or self._pending
+            setattr(record, counter, getattr(record, counter) + 1)
+
+    def close(self) -> None:
+        """Record any transfer left open as incomplete and close the file."""
+        with self._lock:
+            if self._current is not None:
+                self._finish(completed=False)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _finish(self, *, completed: bool) -> None:
+        record = self._current
+        assert record is not None
+        self._current = None
+        record.elapsed = time.perf_counter() - self._begun
+        record.completed = completed
+        self.records.append(record)
+        if self.path is not None:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self.path.open("a")
+            self._file.write(record.to_json() + "\n")
+            self._file.flush()
+        if self.callback is not None:
+            self.callback(record)
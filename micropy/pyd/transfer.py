@@ -0,0 +1,129 @@
+"""Transfer progress, chunk size tuning and calibrated link settings."""
+
+from __future__ import annotations
+
+import io
+import tempfile
+from typing import BinaryIO, Iterator
+
+import attr
+
+__all__ = ["TransferState", "ChunkSizeTuner", "LinkProfile", "iter_chunks", "spool"]
+
+# bytes read from host files at a time.
+COPY_CHUNK_SIZE = 64 * 1024
+# bytes of spooled transfer data kept in memory before spilling to disk.
+SPOOL_SIZE = 1024 * 1024
+
+
+def spool() -> BinaryIO:
+    """Temporary buffer for transfer data, spilling to disk once it grows large."""
+    return tempfile.SpooledTemporaryFile(SPOOL_SIZE)  # type: ignore[return-value]
+
+
+def iter_chunks(
+    source: BinaryIO, chunk_size: int = COPY_CHUNK_SIZE, *, offset: int = 0
+) -> Iterator[bytes]:
+    """Read `source` a chunk at a time, starting from `offset`."""
+    source.seek(offset)
+    while chunk := source.read(chunk_size):
+        yield chunk
+
+
+@attr.define
+class TransferState:
+    """Acknowledged progress of a single transfer.
+
+    Shared across retry attempts, so a failed transfer resumes
+    from the last acknowledged offset instead of byte zero.
+
+    Attributes:
+        offset: Bytes acknowledged so far.
+        attempts: Failed attempts so far.
+        buffer: Data received so far, for reads (i.e. the file being written).
+
+    """
+
+    offset: int = 0
+    attempts: int = 0
+    buffer: BinaryIO = attr.field(factory=io.BytesIO)
+
+    def restart(self) -> None:
+        """Discard progress, i.e. after an integrity failure."""
+        self.offset = 0
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+
+class ChunkSizeTuner:
+    """Tunes transfer chunk size from the observed error rate.
+
+    The error rate is an exponentially weighted average over chunks,
+    so an isolated glitch only shrinks chunks slightly while sustained
+    errors shrink them quickly. After a streak of clean chunks the
+    size grows back towards `maximum`.
+
+    Args:
+        size: Initial chunk size.
+        minimum: Smallest chunk size to shrink to.
+        maximum: Largest chunk size to grow to.
+        smoothing: Weight of the latest chunk in the error rate.
+        grow_after: Consecutive successful chunks before growing.
+
+    """
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        minimum: int = 32,
+        maximum: int = 4096,
+        smoothing: float = 0.2,
+        grow_after: int = 16,
+    ):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.smoothing = smoothing
+        self.grow_after = grow_after
+        self.error_rate = 0.0
+        self._streak = 0
+
+    def record_success(self) -> None:
+        self.error_rate *= 1 - self.smoothing
+        self._streak += 1
+        if self._streak >= self.grow_after and self.error_rate < 0.05:
+            self.size = min(self.maximum, self.size + max(self.size // 4, 1))
+            self._streak = 0
+
+    def record_failure(self) -> None:
+        self.error_rate = self.error_rate * (1 - self.smoothing) + self.smoothing
+        self._streak = 0
+        self.size = max(self.minimum, int(self.size * (1 - self.error_rate)))
+
+    def limit(self, size: int) -> int:
+        """Clamp `size` to the tuned chunk size."""
+        return max(1, min(size, self.size))
+
+
+@attr.frozen
+class LinkProfile:
+    """Transfer settings calibrated for a device link.
+
+    Attributes:
+        write_chunk_size: Bytes written per command (or raw-paste block).
+        read_chunk_size: Bytes read per chunk.
+        raw_paste: Write over raw-paste mode, otherwise over the REPL.
+        stream_reads: Stream reads through a single command,
+            otherwise read each chunk with its own command.
+        write_throughput: Measured write speed, in bytes per second.
+        read_throughput: Measured read speed, in bytes per second.
+
+    """
+
+    write_chunk_size: int
+    read_chunk_size: int
+    raw_paste: bool = True
+    stream_reads: bool = True
+    write_throughput: float = 0.0
+    read_throughput: float = 0.0
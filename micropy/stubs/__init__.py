@@ -7,6 +7,7 @@ to stub files/frozen modules and their usage in MicropyCli
 """
 
 from . import source
+from .index import StubIndex, StubIndexMatch
 from .manifest import StubsManifest
 from .package import AnyStubPackage, StubPackage
 from .repo import StubRepository
@@ -27,4 +28,6 @@ __all__ = [
     "MicropythonStubsManifest",
     "RepositoryInfo",
     "StubRepositoryPackage",
+    "StubIndex",
+    "StubIndexMatch",
 ]
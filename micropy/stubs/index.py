@@ -0,0 +1,210 @@
+"""
+micropy.stubs.index
+~~~~~~~~~~~~~~
+
+This module contains a persistent module/symbol index
+built from installed stub files.
+"""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, NamedTuple, Optional
+
+from micropy.logger import Log
+
+if TYPE_CHECKING:
+    from micropy.stubs.stubs import Stub
+
+__all__ = ["StubIndex", "StubIndexMatch"]
+
+
+class StubIndexMatch(NamedTuple):
+    """Single result of a stub index query."""
+
+    stub: str
+    module: str
+    symbol: Optional[str]
+    path: Path
+
+
+class StubIndex:
+    """Module and symbol index across installed stubs.
+
+    Each stub file is parsed once and its top-level classes and
+    functions are cached by the sha256 of its contents. File stats
+    are used to avoid re-hashing unchanged files, so syncing an
+    up to date index only costs a ``stat`` per file.
+
+    Args:
+        path: Path to persist the index to.
+            If None, the index is kept in memory only.
+
+    """
+
+    VERSION = 1
+    STUB_SUFFIXES = (".pyi", ".py")
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.log = Log.add_logger("StubIndex", stdout=False, show_title=False)
+        self._stubs: dict[str, dict[str, Any]] = {}
+        self._symbols: dict[str, list[str]] = {}
+        self._modules: dict[str, list[tuple[str, Path]]] = {}
+        self._dirty = False
+        self.load()
+
+    def load(self) -> None:
+        """Load persisted index from disk."""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            self.log.debug(f"failed to load stub index, rebuilding: {e}")
+            return
+        if data.get("version") != self.VERSION:
+            return
+        self._stubs = data.get("stubs", {})
+        self._symbols = data.get("symbols", {})
+        self._build_lookup()
+
+    def save(self) -> None:
+        """Persist index to disk if it changed."""
+        if not self.path or not self._dirty:
+            return
+        # drop symbols no longer referenced by any stub file.
+        hashes = {f["hash"] for s in self._stubs.values() for f in s["files"].values()}
+        self._symbols = {k: v for k, v in self._symbols.items() if k in hashes}
+        data = dict(version=self.VERSION, stubs=self._stubs, symbols=self._symbols)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(data))
+        self._dirty = False
+
+    @staticmethod
+    def iter_roots(stub: Stub) -> Iterable[Path]:
+        """Iterate unique stub file roots for a stub."""
+        roots = [getattr(stub, "stubs", None), getattr(stub, "frozen", None)]
+        seen = set()
+        for root in roots:
+            if root is None or root in seen or not Path(root).exists():
+                continue
+            seen.add(root)
+            yield Path(root)
+
+    @classmethod
+    def module_name(cls, rel_path: Path) -> str:
+        """Resolve dotted module name from a path relative to a stub root."""
+        parts = list(rel_path.with_suffix("").parts)
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        return ".".join(parts)
+
+    @staticmethod
+    def parse_symbols(contents: bytes) -> list[str]:
+        """Parse top-level class and function names from stub source."""
+        try:
+            tree = ast.parse(contents)
+        except (SyntaxError, ValueError):
+            return []
+        nodes = (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+        return sorted({n.name for n in tree.body if isinstance(n, nodes)})
+
+    def _iter_stub_files(self, stub: Stub) -> Iterable[tuple[str, Path, Path]]:
+        for root in self.iter_roots(stub):
+            files: dict[str, Path] = {}
+            for suffix in reversed(self.STUB_SUFFIXES):
+                for file_path in root.rglob(f"*{suffix}"):
+                    # prefer .pyi over .py when both exist.
+                    files[str(file_path.relative_to(root).with_suffix(""))] = file_path
+            for file_path in files.values():
+                yield str(file_path), file_path, file_path.relative_to(root)
+
+    def _index_stub(self, stub: Stub) -> None:
+        entry = self._stubs.get(stub.name, {})
+        old_files: dict[str, dict[str, Any]] = entry.get("files", {})
+        files: dict[str, dict[str, Any]] = {}
+        for key, file_path, rel_path in self._iter_stub_files(stub):
+            file_stat = file_path.stat()
+            stamp = [file_stat.st_size, file_stat.st_mtime_ns]
+            existing = old_files.get(key)
+            if existing and existing["stamp"] == stamp and existing["hash"] in self._symbols:
+                files[key] = existing
+                continue
+            contents = file_path.read_bytes()
+            digest = hashlib.sha256(contents).hexdigest()
+            if digest not in self._symbols:
+                self._symbols[digest] = self.parse_symbols(contents)
+            files[key] = dict(stamp=stamp, hash=digest, module=self.module_name(rel_path))
+        if files != old_files or entry.get("path") != str(stub.path):
+            self._stubs[stub.name] = dict(path=str(stub.path), files=files)
+            self._dirty = True
+
+    def sync(self, stubs: Iterable[Stub]) -> bool:
+        """Incrementally update index to match given stubs.
+
+        Args:
+            stubs: Currently installed stubs.
+
+        Returns:
+            True if the index changed.
+
+        """
+        stubs = list(stubs)
+        names = {s.name for s in stubs}
+        for name in set(self._stubs) - names:
+            self.log.debug(f"removing {name} from stub index.")
+            del self._stubs[name]
+            self._dirty = True
+        for stub in stubs:
+            self._index_stub(stub)
+        changed = self._dirty
+        if changed:
+            self._build_lookup()
+            self.save()
+        return changed
+
+    def _build_lookup(self) -> None:
+        self._modules = {}
+        for name, entry in self._stubs.items():
+            for file_path, file_info in entry["files"].items():
+                self._modules.setdefault(file_info["module"], []).append((name, Path(file_path)))
+
+    def _iter_symbol(self, module: str, symbol: str) -> Iterable[StubIndexMatch]:
+        for stub_name, file_path in self._modules.get(module, []):
+            file_info = self._stubs[stub_name]["files"][str(file_path)]
+            if symbol in self._symbols.get(file_info["hash"], []):
+                yield StubIndexMatch(stub_name, module, symbol, file_path)
+
+    def which(self, query: str) -> list[StubIndexMatch]:
+        """Find stubs providing a module or symbol.
+
+        Args:
+            query: module name (``uasyncio``), dotted symbol (``network.WLAN``),
+                or bare symbol name (``WLAN``).
+
+        Returns:
+            List of matches, sorted by stub and module name.
+
+        """
+        query = query.strip()
+        results: list[StubIndexMatch] = [
+            StubIndexMatch(stub_name, query, None, file_path)
+            for stub_name, file_path in self._modules.get(query, [])
+        ]
+        if "." in query:
+            module, symbol = query.rsplit(".", 1)
+            results.extend(self._iter_symbol(module, symbol))
+        elif not results:
+            for module in self._modules:
+                results.extend(self._iter_symbol(module, query))
+        return sorted(results, key=lambda m: (m.stub, m.module, m.symbol or ""))
+
+    def __contains__(self, stub_name: str) -> bool:
+        return stub_name in self._stubs
+
+    def __len__(self) -> int:
+        return len(self._stubs)
@@ -3,13 +3,14 @@ from __future__ import annotations
 import json
 import shutil
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 from distlib import locators, metadata
 from micropy import data, utils
 from micropy.exceptions import StubError, StubValidationError
 from micropy.logger import Log
 from micropy.stubs import source
+from micropy.stubs.index import StubIndex, StubIndexMatch
 from packaging.utils import parse_sdist_filename
 
 if TYPE_CHECKING:
@@ -22,6 +23,8 @@ class StubManager:
     Kwargs:
         resource (str): Default resource path
         repos ([StubRepo]): Repos for Remote Stubs
+        index_path (str): Path to persist the stub symbol index to.
+            Defaults to a sibling of resource, if provided.
 
     Raises:
         StubError: a stub is missing a def file
@@ -37,11 +40,15 @@ class StubManager:
     _schema = data.SCHEMAS / "stubs.json"
     _firm_schema = data.SCHEMAS / "firmware.json"
 
-    def __init__(self, resource=None, repos=None):
+    def __init__(self, resource=None, repos=None, index_path=None):
         self._loaded = set()
         self._firmware = set()
+        self._index = None
         self.resource = resource
         self.repo = repos
+        if index_path is None and resource:
+            index_path = Path(str(resource)).parent / "stubs.index.json"
+        self.index_path = index_path
         self.log = Log.add_logger("Stubs", stdout=False, show_title=False)
         if self.resource:
             self.load_from(resource, strict=False)
@@ -67,6 +74,34 @@ class StubManager:
         other = [s for s in loaded if s.firmware is None]
         yield ("Unknown", other)
 
+    @property
+    def index(self) -> StubIndex:
+        """Module/symbol index of installed stubs.
+
+        The index is synced with currently loaded stubs
+        on each access, only re-parsing stub files that changed.
+
+        Returns:
+            StubIndex: Synced stub index.
+
+        """
+        if self._index is None:
+            self._index = StubIndex(self.index_path)
+        self._index.sync(self._loaded | self._firmware)
+        return self._index
+
+    def which(self, query: str) -> list[StubIndexMatch]:
+        """Find installed stubs providing a module or symbol.
+
+        Args:
+            query (str): Module (``uasyncio``) or symbol (``network.WLAN``) to find.
+
+        Returns:
+            [StubIndexMatch]: Matching stub modules/symbols.
+
+        """
+        return self.index.which(query)
+
     def verbose_log(self, state):
         """Enable Stub logging to stdout.
 
@@ -335,7 +370,7 @@ class StubManager:
         )
         return self._load(stub_source, copy_to=dest)
 
-    def from_stubber(self, path, dest):
+    def from_stubber(self, path, dest, fingerprint=None):
         """Formats stubs generated by createstubs.py.
 
         Creates a stub package from the stubs generated by
@@ -345,6 +380,8 @@ class StubManager:
         Args:
             path (str): path to generated stubs
             dest (str): path to output
+            fingerprint (dict, optional): device fingerprint to
+                record in the stubs info file. Defaults to None.
 
         Returns:
             str: formatted stubs
@@ -366,10 +403,35 @@ class StubManager:
         info_file = out_stub / "info.json"
         stub_path = out_stub / "stubs"
         out_stub.mkdir(exist_ok=True, parents=True)
+        if fingerprint:
+            mod_data["fingerprint"] = fingerprint
         json.dump(mod_data, info_file.open("w+"))
         shutil.copytree(path, stub_path)
         return out_stub
 
+    def find_by_fingerprint(
+        self, digest: str, changeset: Optional[str] = None
+    ) -> Optional[DeviceStub]:
+        """Find installed device stub generated from a matching device.
+
+        Args:
+            digest (str): device fingerprint digest
+            changeset (str, optional): createstubs changeset key the
+                stub must have been generated with. Defaults to None.
+
+        Returns:
+            DeviceStub: Matching stub, if any.
+
+        """
+        for stub in self._loaded:
+            fingerprint = stub.info.get("fingerprint") or {}
+            if fingerprint.get("digest") != digest:
+                continue
+            if changeset is not None and fingerprint.get("changeset") != changeset:
+                continue
+            return stub
+        return None
+
     def from_metadata(self, package_name: str, path: Path) -> dict[str, str]:
         """Creates stub info.json meta from dist metadata.
 
@@ -2,20 +2,25 @@
 
 from __future__ import annotations
 
+import hashlib
 import importlib.util
 import io
+import json
 import sys
 from pathlib import Path
 from types import ModuleType
-from typing import Optional
+from typing import Any, Optional
 
 import libcst as cst
 import libcst.codemod as codemod
 import micropy.data
+from micropy.pyd import scripts
 from stubber import minify
 from stubber.codemod import board as stub_board
 from stubber.utils import stubmaker
 
+from ._compat import metadata
+
 
 def locate_create_stubs() -> Path:
     """Locate createstubs.py"""
@@ -83,6 +88,81 @@ def generate_stub(path, log_func=None):
     return files
 
 
+class StreamWritesCodemod(codemod.Codemod):
+    """Redirects createstubs file writes to framed stdout output.
+
+    Generated stubs are then streamed to the host as they are created,
+    rather than being written to (and later read back from) device flash.
+    """
+
+    def transform_module_impl(self, tree: cst.Module) -> cst.Module:
+        prelude = cst.parse_module(scripts.STREAM_WRITES_PRELUDE)
+        # inject just before the `if __name__ == "__main__"` entrypoint.
+        entry_idx = max(i for i, node in enumerate(tree.body) if isinstance(node, cst.If))
+        return tree.with_changes(
+            body=(*tree.body[:entry_idx], *prelude.body, *tree.body[entry_idx:])
+        )
+
+
+def _changeset_key(change_set: Optional[stub_board.ListChangeSet]) -> Optional[dict[str, Any]]:
+    """Serialize changeset into a stable, hashable form."""
+    if change_set is None:
+        return None
+    module = cst.Module(body=[])
+    return dict(
+        add=[module.code_for_node(node) for node in change_set.add],
+        remove=[repr(matcher) for matcher in change_set.remove],
+        replace=change_set.replace,
+    )
+
+
+def create_stubs_cache_key(
+    *,
+    variant: stub_board.CreateStubsVariant,
+    modules_set: Optional[stub_board.ListChangeSet] = None,
+    problem_set: Optional[stub_board.ListChangeSet] = None,
+    exclude_set: Optional[stub_board.ListChangeSet] = None,
+    compile: bool = False,
+    stream: bool = False,
+) -> str:
+    """Compute cache key for a prepared createstubs script.
+
+    The prepared script is a pure function of its inputs, the installed
+    micropython-stubber version and, when streaming, the injected
+    :data:`~micropy.pyd.scripts.STREAM_WRITES_PRELUDE`.
+
+    Returns:
+        sha256 hex digest of inputs.
+
+    """
+    key_data = dict(
+        variant=str(variant.value),
+        modules=_changeset_key(modules_set),
+        problem=_changeset_key(problem_set),
+        exclude=_changeset_key(exclude_set),
+        compile=compile,
+        stream=stream,
+        stubber=metadata.version("micropython-stubber"),
+    )
+    if stream:
+        # scripts streamed with a previous micropy may inject an outdated prelude.
+        key_data["prelude"] = hashlib.sha256(scripts.STREAM_WRITES_PRELUDE.encode()).hexdigest()
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+
+def check_create_stubs_options(
+    *, variant: Optional[stub_board.CreateStubsVariant] = None, stream: bool = False
+) -> None:
+    """Check createstubs options can be used together.
+
+    Raises:
+        ValueError: Options are incompatible.
+
+    """
+    if stream and variant == stub_board.CreateStubsVariant.DB:
+        raise ValueError("The db variant persists progress to flash and cannot be streamed.")
+
+
 def prepare_create_stubs(
     *,
     variant: Optional[stub_board.CreateStubsVariant] = None,
@@ -90,24 +170,84 @@ def prepare_create_stubs(
     problem_set: Optional[stub_board.ListChangeSet] = None,
     exclude_set: Optional[stub_board.ListChangeSet] = None,
     compile: bool = False,
+    stream: bool = False,
+    cache_dir: Optional[Path] = None,
+    use_cache: bool = True,
 ) -> io.StringIO | io.BytesIO:
+    """Prepare createstubs script for execution on a device.
+
+    Results are cached by :func:`create_stubs_cache_key`,
+    as preparing the script (codemod, minify, cross-compile) is slow.
+
+    Args:
+        variant: Createstubs variant. Defaults to base.
+        modules_set: Changes to modules to stub.
+        problem_set: Changes to problematic modules.
+        exclude_set: Changes to excluded modules.
+        compile: Cross compile result to .mpy.
+        stream: Stream generated stubs over stdout instead of writing
+            them to the device filesystem. See :class:`StreamWritesCodemod`.
+        cache_dir: Directory to cache results in.
+            Defaults to ``~/.micropy/cache/createstubs``.
+        use_cache: Read and write the cache. Defaults to True.
+
+    Returns:
+        Prepared script source (or bytecode, if compiled).
+
+    """
     if stub_board is None:
         raise ImportError("micropython-stubber requires a python version of >= 3.8")
     variant = variant or stub_board.CreateStubsVariant.BASE
+    check_create_stubs_options(variant=variant, stream=stream)
+    cache_path: Optional[Path] = None
+    if use_cache:
+        cache_key = create_stubs_cache_key(
+            variant=variant,
+            modules_set=modules_set,
+            problem_set=problem_set,
+            exclude_set=exclude_set,
+            compile=compile,
+            stream=stream,
+        )
+        cache_dir = Path(cache_dir or micropy.data.FILES / "cache" / "createstubs")
+        cache_path = cache_dir / f"{cache_key}{'.mpy' if compile else '.py'}"
+        if cache_path.exists():
+            if compile:
+                return io.BytesIO(cache_path.read_bytes())
+            return io.StringIO(cache_path.read_text())
     ctx = codemod.CodemodContext()
     code_mod = stub_board.CreateStubsCodemod(
         ctx, variant=variant, modules=modules_set, problematic=problem_set, excluded=exclude_set
     )
     create_stubs = cst.parse_module(locate_create_stubs().read_text())
-    result = code_mod.transform_module_impl(create_stubs).code
+    result_tree = code_mod.transform_module_impl(create_stubs)
+    if stream:
+        result_tree = StreamWritesCodemod(ctx).transform_module_impl(result_tree)
+    result = result_tree.code
     result_io = io.StringIO(result)
     minified_io = io.StringIO()
     minify.minify(result_io, minified_io, keep_report=True, diff=False)
     minified_io.seek(0)
-    # TODO: compile w/ mpy-cross
+    output_io: io.StringIO | io.BytesIO = minified_io
     if compile:
         compiled_io = io.BytesIO()
         minify.cross_compile(minified_io, compiled_io)
         compiled_io.seek(0)
-        return compiled_io
-    return minified_io
+        output_io = compiled_io
+    if cache_path is not None:
+        _write_cache(cache_path, output_io.getvalue())
+    return output_io
+
+
+def _write_cache(path: Path, contents: str | bytes) -> None:
+    """Atomically write cache file, ignoring failures."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(contents, bytes):
+            tmp_path.write_bytes(contents)
+        else:
+            tmp_path.write_text(contents)
+        tmp_path.replace(path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
@@ -40,7 +40,7 @@ def micropy_obj(
     mpy.repo = mock_repo
     if param := getattr(request, "param", MicroPyScenario()):
         if param.impl_add:
-            mpy.stubs.add = lambda i: i
+            mpy.stubs.add = lambda i, **kwargs: i
         mpy.project.exists = param.project_exists
         stubs = ["a-stub"] if param.has_stubs else []
         mpy.stubs.__iter__.return_value = iter(stubs)
@@ -1,12 +1,16 @@
 from pathlib import Path
 from typing import List, NamedTuple, Optional
 
+import micropy.exceptions as exc
 import pytest
 import typer
 from micropy import utils
 from micropy.app import main as main_app
 from micropy.app.main import TemplateEnum, app
 from micropy.project import Project
+from micropy.pyd import broker, calibrate, discovery, fingerprint, profiler, session
+from micropy.pyd import sync as device_sync
+from micropy.pyd import transfer
 from pytest_mock import MockFixture
 from tests.app.conftest import MicroPyScenario, context_mock
 
@@ -251,3 +255,371 @@ def test_main_version(runner):
     result = runner.invoke(app, ["version"])
     assert result.exit_code == 0
     assert "Micropy Version:" in result.stdout
+
+
+@pytest.mark.parametrize("command", ["deploy", "sync"])
+def test_main_deploy(mocker: MockFixture, micropy_obj, runner, tmp_path, command):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    project.name = "proj"
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("print('hi')\n")
+    pyd_mock = mocker.patch("micropy.app.main.PyDevice")
+    sync_mock = mocker.patch(
+        "micropy.app.main.device_sync.sync",
+        return_value=device_sync.SyncPlan(upload=["main.py"]),
+    )
+    result = runner.invoke(app, [command, "/dev/port"], obj=micropy_obj, catch_exceptions=False)
+    assert result.exit_code == 0
+    assert sync_mock.call_args.args[1] == {"main.py": tmp_path / "src" / "main.py"}
+    pyd_mock.return_value.disconnect.assert_called_once()
+
+
+def test_main_deploy__up_to_date(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    project.name = "proj"
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("print('hi')\n")
+    files = device_sync.collect_files([(tmp_path / "src", "")])
+    device_sync.ManifestCache(project.data_path / "device_manifest.json").save(
+        "3c71bf", device_sync.build_manifest(files), checksum="sha256"
+    )
+    pydevice = mocker.patch("micropy.app.main.PyDevice").return_value.pydevice
+    pydevice.resolve_path.return_value = "/"
+    read_id = mocker.patch("micropy.app.main.device_sync.read_device_id", return_value="3c71bf")
+    fetch = mocker.patch("micropy.app.main.device_sync.fetch_device_manifest", return_value={})
+    result = runner.invoke(app, ["deploy", "/dev/port"], obj=micropy_obj, catch_exceptions=False)
+    assert result.exit_code == 0
+    assert "up to date" in result.stdout
+    fetch.assert_not_called()
+    # another board on the same port.
+    read_id.return_value = "a0b1c2"
+    result = runner.invoke(app, ["deploy", "/dev/port"], obj=micropy_obj, catch_exceptions=False)
+    assert result.exit_code == 0
+    fetch.assert_called_once()
+    pydevice.push_file.assert_called_once()
+
+
+def test_main_deploy__many(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    project.name = "proj"
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("print('hi')\n")
+    for name in ("ttyUSB0", "ttyUSB1"):
+        (tmp_path / name).touch()
+
+    def _pydevice(port, **kwargs):
+        if port.endswith("ttyUSB1"):
+            raise exc.PyDeviceError("no device")
+        return mocker.MagicMock()
+
+    mocker.patch("micropy.app.main.PyDevice", side_effect=_pydevice)
+    sync_mock = mocker.patch(
+        "micropy.app.main.device_sync.sync",
+        return_value=device_sync.SyncPlan(upload=["main.py"]),
+    )
+    result = runner.invoke(
+        app, ["deploy", f"{tmp_path}/ttyUSB*", "/dev/port"], obj=micropy_obj, catch_exceptions=False
+    )
+    assert result.exit_code == 1
+    assert sync_mock.call_count == 2
+    # hashed once, rather than per device.
+    local = device_sync.build_manifest({"main.py": tmp_path / "src" / "main.py"})
+    assert all(c.kwargs["manifest"] == local for c in sync_mock.call_args_list)
+    assert "1 upload, 0 delete, 0 unchanged" in result.stdout
+    assert "failed" in result.stdout
+
+
+def test_main_deploy__record_session(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    (tmp_path / "src").mkdir()
+    pyd_mock = mocker.patch("micropy.app.main.PyDevice")
+    mocker.patch("micropy.app.main.device_sync.sync", return_value=device_sync.SyncPlan())
+    args = ["deploy", "--record-session", "session.jsonl"]
+    result = runner.invoke(app, [*args, "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert pyd_mock.call_args.kwargs["record_session"] == Path("session.jsonl")
+    pyd_mock.reset_mock()
+    result = runner.invoke(app, [*args, "/dev/ttyUSB0", "/dev/ttyUSB1"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert {c.kwargs["record_session"] for c in pyd_mock.call_args_list} == {
+        Path("session-ttyUSB0.jsonl"),
+        Path("session-ttyUSB1.jsonl"),
+    }
+
+
+def test_main_deploy__telemetry(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    (tmp_path / "src").mkdir()
+    pyd_mock = mocker.patch("micropy.app.main.PyDevice")
+    mocker.patch("micropy.app.main.device_sync.sync", return_value=device_sync.SyncPlan())
+    result = runner.invoke(app, ["deploy", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert pyd_mock.call_args.kwargs["telemetry"] is None
+    args = ["deploy", "--telemetry", "telemetry.jsonl", "/dev/ttyUSB0", "/dev/ttyUSB1"]
+    result = runner.invoke(app, args, obj=micropy_obj)
+    assert result.exit_code == 0
+    assert {c.kwargs["telemetry"].path for c in pyd_mock.call_args_list[1:]} == {
+        Path("telemetry-ttyUSB0.jsonl"),
+        Path("telemetry-ttyUSB1.jsonl"),
+    }
+
+
+def test_main_device_analyze(micropy_obj, runner, tmp_path):
+    path = tmp_path / "session.jsonl"
+    events = [
+        session.SessionEvent(0.0, "tx", b"f.write(b'x' * 100)\r"),
+        session.SessionEvent(0.5, "rx", b">>> "),
+        session.SessionEvent(1.0, "tx", b"import gc;gc.mem_free()\r"),
+        session.SessionEvent(1.25, "rx", b"1000\r\n>>> "),
+    ]
+    header = '{"version": 1, "backend": "upydevice", "port": "/dev/ttyUSB0"}'
+    path.write_text("\n".join([header, *(e.to_json() for e in events)]))
+    result = runner.invoke(app, ["device", "analyze", str(path)], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert "write" in result.stdout
+    assert "memory" in result.stdout
+    assert "2 exchanges" in result.stdout
+
+
+def test_main_device_analyze__invalid(micropy_obj, runner, tmp_path):
+    path = tmp_path / "session.jsonl"
+    path.write_text("not json")
+    result = runner.invoke(app, ["device", "analyze", str(path)], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "Invalid session recording" in result.stdout
+
+
+def test_main_device_calibrate(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    pyd_mock = mocker.patch("micropy.app.device.PyDevice")
+    device = fingerprint.DeviceFingerprint(
+        "esp32", "1.20.0", "v1.20.0", "ESP32 module", "micropython", "1.20.0"
+    )
+    mocker.patch("micropy.app.device.read_fingerprint", return_value=device)
+    profile = transfer.LinkProfile(1024, 2048, write_throughput=4000.0, read_throughput=8000.0)
+    trials = [
+        calibrate.CalibrationTrial("write", "raw-paste", 1024, 0.25, 1000, True),
+        calibrate.CalibrationTrial("read", "stream", 2048, 0.125, 1000, True),
+    ]
+    calibrate_mock = mocker.patch(
+        "micropy.app.device.calibrate", return_value=calibrate.Calibration(profile, trials)
+    )
+    mocker.patch("micropy.app.device.data.LINK_PROFILES", tmp_path / "link_profiles.json")
+    args = ["device", "calibrate", "/dev/ttyUSB0", "-s", "1024", "-s", "2048"]
+    result = runner.invoke(app, args, obj=micropy_obj)
+    assert result.exit_code == 0
+    assert calibrate_mock.call_args.kwargs["chunk_sizes"] == [1024, 2048]
+    pyd_mock.return_value.disconnect.assert_called_once()
+    assert "raw-paste" in result.stdout
+    store = calibrate.LinkProfileStore(tmp_path / "link_profiles.json")
+    assert store.get(device.digest) == profile
+
+
+def test_main_device_calibrate__unreliable(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    mocker.patch("micropy.app.device.PyDevice")
+    mocker.patch("micropy.app.device.read_fingerprint")
+    mocker.patch(
+        "micropy.app.device.calibrate",
+        side_effect=exc.PyDeviceError("No reliable write settings found for device."),
+    )
+    mocker.patch("micropy.app.device.data.LINK_PROFILES", tmp_path / "link_profiles.json")
+    result = runner.invoke(app, ["device", "calibrate", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "No reliable write settings" in result.stdout
+    assert not (tmp_path / "link_profiles.json").exists()
+
+
+def test_main_device_calibrate__attached(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    pyd_mock = mocker.patch("micropy.app.device.PyDevice")
+    mocker.patch("micropy.app.device.read_fingerprint")
+    profile = transfer.LinkProfile(1024, 2048)
+    mocker.patch("micropy.app.device.calibrate", return_value=calibrate.Calibration(profile, []))
+    mocker.patch.object(broker, "is_running", return_value=True)
+    args = ["device", "calibrate", "/dev/ttyUSB0", "--no-save"]
+    result = runner.invoke(app, args, obj=micropy_obj)
+    assert result.exit_code == 0
+    assert pyd_mock.call_args.kwargs["backend"] is broker.BrokerPyDeviceBackend
+
+
+def test_main_deploy__attached(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    (tmp_path / "src").mkdir()
+    pyd_mock = mocker.patch("micropy.app.main.PyDevice")
+    mocker.patch("micropy.app.main.device_sync.sync", return_value=device_sync.SyncPlan())
+    mocker.patch.object(broker, "is_running", return_value=True)
+    result = runner.invoke(app, ["deploy", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert pyd_mock.call_args.kwargs["backend"] is broker.BrokerPyDeviceBackend
+    # sessions are recorded on the device link.
+    args = ["deploy", "/dev/ttyUSB0", "--record-session", "session.jsonl"]
+    result = runner.invoke(app, args, obj=micropy_obj)
+    assert result.exit_code == 0
+    assert pyd_mock.call_args.kwargs["backend"] is not broker.BrokerPyDeviceBackend
+
+
+def test_main_device_attach(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    mocker.patch.object(broker, "BROKER_DIR", tmp_path)
+    is_running = mocker.patch.object(broker, "is_running", side_effect=[False, False, True])
+    popen = mocker.patch("micropy.app.device.subprocess.Popen")
+    popen.return_value.poll.return_value = None
+    result = runner.invoke(app, ["device", "attach", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert "Attached to" in result.stdout
+    assert popen.call_args.args[0][1:4] == ["-m", "micropy.pyd.broker", "/dev/ttyUSB0"]
+    assert popen.call_args.kwargs["start_new_session"]
+    # already attached.
+    is_running.side_effect = None
+    is_running.return_value = True
+    result = runner.invoke(app, ["device", "attach", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert "Already attached" in result.stdout
+    assert popen.call_count == 1
+
+
+def test_main_device_attach__failed(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    mocker.patch.object(broker, "BROKER_DIR", tmp_path)
+    mocker.patch.object(broker, "is_running", return_value=False)
+    popen = mocker.patch("micropy.app.device.subprocess.Popen")
+    popen.return_value.poll.return_value = 1
+    result = runner.invoke(app, ["device", "attach", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "Failed to attach" in result.stdout
+
+
+def test_main_device_detach(mocker: MockFixture, micropy_obj, runner):
+    shutdown = mocker.patch.object(broker, "shutdown", side_effect=[True, False])
+    result = runner.invoke(app, ["device", "detach", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert "Detached from" in result.stdout
+    shutdown.assert_called_once_with("/dev/ttyUSB0")
+    result = runner.invoke(app, ["device", "detach", "/dev/ttyUSB0"], obj=micropy_obj)
+    assert "No device attached" in result.stdout
+
+
+def test_main_device_profile(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    pyd_mock = mocker.patch("micropy.app.device.PyDevice")
+    mocker.patch("micropy.app.device.broker.is_running", return_value=False)
+    script = tmp_path / "main.py"
+    script.write_text("def run():\n    pass\nrun()\n")
+    sample = profiler.ProfileSample
+    report = profiler.summarize(
+        [
+            sample("start", 0, 9000, 1000, "<module>"),
+            sample("call", 100, 8000, 2000, "run"),
+            sample("return", 2600, 7000, 3000, "run"),
+            sample("end", 3000, 8500, 1500, "<module>"),
+        ]
+    )
+    profile_mock = mocker.patch("micropy.app.device.profiler.profile_script", return_value=report)
+    result = runner.invoke(app, ["device", "profile", "/dev/ttyUSB0", str(script)], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert profile_mock.call_args.args[1] == script.read_text()
+    pyd_mock.return_value.disconnect.assert_called_once()
+    assert "run" in result.stdout
+    assert "2.5ms" in result.stdout
+    assert "3.0ms" in result.stdout
+
+
+def test_main_device_profile__error(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    mocker.patch("micropy.app.device.PyDevice")
+    mocker.patch("micropy.app.device.broker.is_running", return_value=False)
+    script = tmp_path / "main.py"
+    script.write_text("raise ValueError")
+    report = profiler.summarize(
+        [
+            profiler.ProfileSample("start", 0, 9000, 1000, "<module>"),
+            profiler.ProfileSample("error", 10, 9000, 1000, "ValueError"),
+            profiler.ProfileSample("end", 20, 9000, 1000, "<module>"),
+        ]
+    )
+    mocker.patch("micropy.app.device.profiler.profile_script", return_value=report)
+    result = runner.invoke(app, ["device", "profile", "/dev/ttyUSB0", str(script)], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "ValueError" in result.stdout
+
+
+def test_main_device_profile__failed(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    mocker.patch("micropy.app.device.PyDevice")
+    mocker.patch("micropy.app.device.broker.is_running", return_value=False)
+    script = tmp_path / "main.py"
+    script.write_text("def run():\n    pass\nrun()\n")
+    report = profiler.summarize(
+        [
+            profiler.ProfileSample("start", 0, 9000, 1000, "<module>"),
+            profiler.ProfileSample("call", 100, 8000, 2000, "run"),
+            profiler.ProfileSample("return", 2600, 7000, 3000, "run"),
+        ]
+    )
+    mocker.patch(
+        "micropy.app.device.profiler.profile_script",
+        side_effect=exc.PyDeviceProfileError("connection lost", report),
+    )
+    result = runner.invoke(app, ["device", "profile", "/dev/ttyUSB0", str(script)], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "connection lost" in result.stdout
+    # samples received before the failure are still reported.
+    assert "2.5ms" in result.stdout
+
+
+def test_main_devices(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    mocker.patch("micropy.app.main.data.DEVICE_CACHE", tmp_path / "devices.json")
+    board = discovery.DeviceInfo(
+        "/dev/ttyUSB0", "esp32", "1.22.0", "v1.22.0", "ESP32 module", "3c71bf0a", 112000
+    )
+
+    def _discover(ports, *, cache, **kwargs):
+        cache.update([board], ports=[board.port])
+        return [board]
+
+    discover = mocker.patch.object(discovery, "discover", side_effect=_discover)
+    result = runner.invoke(app, ["devices"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert "3c71bf0a" in result.stdout
+    assert "Found 1 MicroPython board." in result.stdout
+    assert discover.call_args.args[0] is None
+    # recent results are reused, unless refreshed.
+    runner.invoke(app, ["devices"], obj=micropy_obj)
+    assert discover.call_count == 1
+    runner.invoke(app, ["devices", "--refresh"], obj=micropy_obj)
+    assert discover.call_count == 2
+    discover.side_effect = None
+    discover.return_value = []
+    result = runner.invoke(app, ["devices", "/dev/ttyACM0"], obj=micropy_obj)
+    assert discover.call_args.args[0] == ["/dev/ttyACM0"]
+    assert result.exit_code == 1
+    assert "No MicroPython boards found" in result.stdout
+
+
+def test_main_deploy__device_id(mocker: MockFixture, micropy_obj, runner, tmp_path):
+    project = micropy_obj.project
+    project.path = tmp_path
+    project.data_path = tmp_path / ".micropy"
+    (tmp_path / "src").mkdir()
+    cache_path = tmp_path / "devices.json"
+    mocker.patch("micropy.app.devices.data.DEVICE_CACHE", cache_path)
+    discovery.DeviceCache(cache_path).save(
+        [discovery.DeviceInfo("/dev/ttyUSB3", "esp32", "1.22.0", "v1.22.0", "ESP32", "3c71bf0a")]
+    )
+    pyd_mock = mocker.patch("micropy.app.main.PyDevice")
+    mocker.patch("micropy.app.main.device_sync.sync", return_value=device_sync.SyncPlan())
+    result = runner.invoke(app, ["deploy", "3c71bf"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert pyd_mock.call_args.args[0] == "/dev/ttyUSB3"
+
+
+def test_main_deploy__no_match(micropy_obj, runner, tmp_path):
+    micropy_obj.project.path = tmp_path
+    result = runner.invoke(app, ["deploy", f"{tmp_path}/ttyUSB*"], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "No devices found" in result.stdout
@@ -1,10 +1,11 @@
+import threading
 from pathlib import Path
 
 import pytest
 from micropy.app import stubs as stubs_app
 from micropy.app.stubs import stubs_app as app
 from micropy.exceptions import StubError, StubNotFound
-from micropy.pyd import PyDevice
+from micropy.pyd import MetaPyDeviceBackend, PyDevice
 from micropy.stubs import StubRepositoryPackage
 from micropy.stubs.source import StubSource
 from pytest_mock import MockerFixture
@@ -74,6 +75,8 @@ def test_stubs_create(mocker: MockerFixture, pyb_mock, micropy_obj, runner):
     print(result.stdout)
     pyb_mock.run_script.assert_called_once()
     pyb_mock.disconnect.assert_called_once()
+    # the backend cleans up the script it ran.
+    pyb_mock.remove.assert_not_called()
 
 
 def test_stubs_create__connect_error(pydevice_mock, micropy_obj, runner):
@@ -91,6 +94,19 @@ def test_stubs_create__script_error(pyb_mock, micropy_obj, runner):
         assert result.return_value is None
 
 
+def test_stubs_create__stream(mocker: MockerFixture, pyb_mock, micropy_obj, runner):
+    def run_script(content, target_path, consumer=None):
+        consumer.on_message("@@W w /stubs/board/mod.py\n@@D YWJj\n@@C\n")
+
+    pyb_mock.run_script.side_effect = run_script
+    pyb_mock.copy_from = mocker.MagicMock()
+    micropy_obj.stubs.add = mocker.MagicMock()
+    result = runner.invoke(app, ["create", "--stream", "/dev/port"], obj=micropy_obj)
+    assert result.exit_code == 0
+    pyb_mock.copy_from.assert_not_called()
+    assert micropy_obj.stubs.from_stubber.call_args.args[0].name == "stubs"
+
+
 @pytest.mark.parametrize("force", [True, False])
 @pytest.mark.parametrize("micropy_obj", [MicroPyScenario(impl_add=False)], indirect=True)
 def test_stubs_add_success(micropy_obj, runner, stubs_locator_mock, mock_repo, force):
@@ -164,3 +180,107 @@ def test_stubs_search_no_results(mocker: MockerFixture, micropy_obj, runner):
 
     assert result.exit_code == 0
     assert "No results found for: nonexistent" in result.stdout
+
+
+def test_stubs_which(mocker: MockerFixture, micropy_obj, runner):
+    from micropy.stubs import StubIndexMatch
+
+    micropy_obj.stubs.which.return_value = [
+        StubIndexMatch("esp32-micropython-1.20.0", "network", "WLAN", Path("network.pyi"))
+    ]
+    result = runner.invoke(app, ["which", "network.WLAN"], obj=micropy_obj)
+    assert result.exit_code == 0
+    assert "network.WLAN" in result.stdout
+    assert "esp32-micropython-1.20.0" in result.stdout
+    micropy_obj.stubs.which.assert_called_once_with("network.WLAN")
+
+
+def test_stubs_which__not_found(micropy_obj, runner):
+    micropy_obj.stubs.which.return_value = []
+    result = runner.invoke(app, ["which", "nothing"], obj=micropy_obj)
+    assert result.exit_code == 1
+    assert "No installed stubs provide" in result.stdout
+
+
+@pytest.mark.parametrize("force", [True, False])
+def test_stubs_create__fingerprint_match(
+    mocker: MockerFixture, pyb_mock, micropy_obj, runner, force
+):
+    fingerprint = mocker.MagicMock(digest="abc")
+    fingerprint.to_dict.return_value = {"digest": "abc"}
+    mocker.patch("micropy.app.stubs.read_fingerprint", return_value=fingerprint)
+    existing = mocker.MagicMock()
+    existing.name = "esp32-micropython-1.20.0"
+    micropy_obj.stubs.find_by_fingerprint.return_value = existing
+    micropy_obj.stubs.add = mocker.MagicMock(return_value=existing)
+    args = ["create", "/dev/port", *(["--force"] if force else [])]
+    result = runner.invoke(app, args, obj=micropy_obj, catch_exceptions=False)
+    assert result.exit_code == 0
+    pyb_mock.disconnect.assert_called_once()
+    if force:
+        pyb_mock.run_script.assert_called_once()
+        assert micropy_obj.stubs.from_stubber.call_args.kwargs["fingerprint"]["digest"] == "abc"
+        micropy_obj.stubs.add.assert_called_once_with(mocker.ANY, force=True)
+    else:
+        pyb_mock.run_script.assert_not_called()
+        assert "matches installed stubs" in result.stdout
+
+
+def test_stubs_create__stream_db(pyb_mock, micropy_obj, runner):
+    args = ["create", "--stream", "--variant", "db", "/dev/port"]
+    result = runner.invoke(app, args, obj=micropy_obj)
+    assert "cannot be streamed" in result.stdout
+    pyb_mock.run_script.assert_not_called()
+
+
+def test_stubs_create__fingerprint_match_skips_prepare(
+    mocker: MockerFixture, pyb_mock, micropy_obj, runner
+):
+    release = threading.Event()
+    mocker.patch("micropy.app.stubs.prepare_create_stubs", side_effect=lambda **_: release.wait())
+    fingerprint = mocker.MagicMock(digest="abc")
+    mocker.patch("micropy.app.stubs.read_fingerprint", return_value=fingerprint)
+    micropy_obj.stubs.find_by_fingerprint.return_value = mocker.MagicMock()
+    try:
+        result = runner.invoke(app, ["create", "/dev/port"], obj=micropy_obj)
+        # returned while createstubs was still being prepared.
+        assert result.exit_code == 0
+        assert not release.is_set()
+    finally:
+        release.set()
+
+
+def test_stubs_create__many(mocker: MockerFixture, pyb_mock, micropy_obj, runner):
+    micropy_obj.stubs.add = mocker.MagicMock()
+    result = runner.invoke(
+        app, ["create", "/dev/port0", "/dev/port1"], obj=micropy_obj, catch_exceptions=False
+    )
+    assert result.exit_code == 0
+    assert pyb_mock.run_script.call_count == 2
+    assert micropy_obj.stubs.add.call_count == 2
+    assert "/dev/port0" in result.stdout and "/dev/port1" in result.stdout
+
+
+def test_stubs_create__many_scripts(mocker: MockerFixture, micropy_obj, runner):
+    scripts = []
+
+    def _copy_dir(source_path, target_path, **kwargs):
+        (Path(target_path) / "stubs").mkdir()
+
+    def _pydevice(port, **kwargs):
+        backend = mocker.MagicMock(MetaPyDeviceBackend)
+        backend.establish.return_value = backend
+        backend.eval_script.side_effect = lambda contents, *args, **kwargs: scripts.append(contents)
+        backend.copy_dir.side_effect = _copy_dir
+        return PyDevice(port, backend=lambda: backend, auto_connect=False)
+
+    mocker.patch("micropy.app.stubs.PyDevice", side_effect=_pydevice)
+    mocker.patch("micropy.app.stubs.read_fingerprint", return_value=None)
+    micropy_obj.stubs.add = mocker.MagicMock()
+    result = runner.invoke(
+        app, ["create", "/dev/port0", "/dev/port1"], obj=micropy_obj, catch_exceptions=False
+    )
+    assert result.exit_code == 0
+    # every device runs the whole script, rather than the first draining a shared buffer.
+    assert len(scripts) == 2
+    assert scripts[0] and scripts[0] == scripts[1]
@@ -18,8 +18,42 @@ mock_vscode_exts = [
 ]
 
 
-def pytest_collection_modifyitems(items):
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Run transfer benchmarks against a simulated device.",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: transfer benchmark, run with --benchmark")
+    config.benchmark_results = []
+
+
+def pytest_collection_modifyitems(config, items):
     items.reverse()
+    if not config.getoption("--benchmark"):
+        skip = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+        for item in items:
+            if "benchmark" in item.keywords:
+                item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = getattr(config, "benchmark_results", [])
+    if not results:
+        return
+    terminalreporter.section("transfer benchmarks")
+    terminalreporter.write_line(
+        f"{'backend':<22}{'operation':<12}{'chunk':>7}{'KiB/s':>10}{'trips':>7}{'secs':>8}"
+    )
+    for result in sorted(results):
+        terminalreporter.write_line(
+            f"{result.backend:<22}{result.operation:<12}{result.chunk_size:>7}"
+            f"{result.throughput / 1024:>10.1f}{result.round_trips:>7}{result.seconds:>8.2f}"
+        )
 
 
 @pytest.fixture(autouse=True)
@@ -0,0 +1,143 @@
+"""Transfer throughput benchmarks against a simulated device.
+
+Skipped unless run with ``--benchmark``; results are summarized
+at the end of the session::
+
+    pytest tests/test_benchmarks.py --benchmark -n 0
+"""
+
+from __future__ import annotations
+
+import random
+import string
+import sys
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+from micropy.pyd import DevicePath, HostPath, MetaPyDeviceBackend
+from micropy.pyd.simulator import SimulatedDevice, SimulatedPyDeviceBackend, SimulatorConfig
+
+pytestmark = [
+    pytest.mark.benchmark,
+    pytest.mark.skipif(sys.platform.startswith("win"), reason="requires a pseudo-terminal"),
+]
+
+FILE_SIZE = 8 * 1024
+TREE_FILES = 4
+BAUDRATE = 115_200
+CHUNK_SIZES = [256, 1024, 4096]
+
+
+class BenchmarkResult(NamedTuple):
+    backend: str
+    operation: str
+    chunk_size: int
+    seconds: float
+    size: int
+    round_trips: int
+
+    @property
+    def throughput(self) -> float:
+        return self.size / self.seconds
+
+
+def _contents(size: int) -> str:
+    rng = random.Random(size)
+    return "".join(rng.choices(string.ascii_letters + string.digits + "\n", k=size))
+
+
+@pytest.fixture(params=CHUNK_SIZES)
+def chunk_size(request: pytest.FixtureRequest) -> int:
+    return request.param
+
+
+@pytest.fixture
+def device_root(tmp_path: Path) -> Path:
+    root = tmp_path / "device"
+    (root / "tree").mkdir(parents=True)
+    (root / "main.txt").write_text(_contents(FILE_SIZE))
+    for index in range(TREE_FILES):
+        (root / "tree" / f"mod{index}.py").write_text(_contents(FILE_SIZE // TREE_FILES))
+    return root
+
+
+@pytest.fixture(params=["upydevice", "upydevice-no-paste", "rshell"])
+def backend(request: pytest.FixtureRequest, device_root: Path, chunk_size: int, monkeypatch):
+    config = SimulatorConfig(baudrate=BAUDRATE, raw_paste=request.param != "upydevice-no-paste")
+    device = SimulatedDevice(device_root, config).start()
+    if request.param == "rshell":
+        rsh = pytest.importorskip("rshell.main")
+        from micropy.pyd.backend_rshell import RShellPyDeviceBackend
+
+        monkeypatch.setattr(rsh, "DEVS", [])
+        monkeypatch.setattr(rsh, "BUFFER_SIZE", chunk_size)
+        pyd: MetaPyDeviceBackend = RShellPyDeviceBackend().establish(device.port)
+    else:
+        pyd = SimulatedPyDeviceBackend(device).establish(str(device_root))
+        # pin chunks to the benchmarked size rather than sizing from free memory.
+        monkeypatch.setattr(pyd, "_compute_chunk_size", lambda: chunk_size)
+        pyd.write_tuner.size = pyd.write_tuner.maximum = chunk_size
+    pyd.connect()
+    pyd.name = request.param
+    pyd.device = device
+    yield pyd
+    pyd.disconnect()
+    device.stop()
+
+
+def _measure(request, backend, operation: str, chunk_size: int, size: int, fn) -> None:
+    device: SimulatedDevice = backend.device
+    device.stats.reset()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    result = BenchmarkResult(
+        backend.name, operation, chunk_size, seconds, size, device.stats.commands
+    )
+    request.config.benchmark_results.append(result)
+
+
+def test_push(request, backend, chunk_size, tmp_path):
+    source = tmp_path / "push.txt"
+    source.write_text(_contents(FILE_SIZE))
+    _measure(
+        request,
+        backend,
+        "push",
+        chunk_size,
+        FILE_SIZE,
+        lambda: backend.push_file(HostPath(str(source)), DevicePath("/push.txt")),
+    )
+    assert (backend.device.root / "push.txt").read_text() == source.read_text()
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_pull(request, backend, chunk_size, tmp_path, stream):
+    if backend.name == "rshell" and not stream:
+        pytest.skip("rshell always streams reads")
+    target = tmp_path / "pull.txt"
+    kwargs = {} if backend.name == "rshell" else dict(stream=stream)
+    _measure(
+        request,
+        backend,
+        "pull" if stream else "pull-chunk",
+        chunk_size,
+        FILE_SIZE,
+        lambda: backend.pull_file(DevicePath("/main.txt"), HostPath(str(target)), **kwargs),
+    )
+    assert target.read_text() == (backend.device.root / "main.txt").read_text()
+
+
+def test_copy_dir(request, backend, chunk_size, tmp_path):
+    target = tmp_path / "copied"
+    _measure(
+        request,
+        backend,
+        "copy_dir",
+        chunk_size,
+        FILE_SIZE,
+        lambda: backend.copy_dir(DevicePath("/tree"), HostPath(str(target))),
+    )
+    assert len(list(target.rglob("*.py"))) == TREE_FILES
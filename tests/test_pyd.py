@@ -1,16 +1,53 @@
 from __future__ import annotations
 
+import ast
+import asyncio
+import binascii
+import builtins
+import contextlib
 import hashlib
-import stat
+import io
+import json
+import os
+import random
 import sys
-from pathlib import PurePosixPath
+import tempfile
+import threading
+import time
+import types
+import zlib
+from pathlib import Path
 from typing import Literal, Type
 from unittest.mock import ANY, MagicMock
 
 import pytest
-from micropy.exceptions import PyDeviceError
-from micropy.pyd import backend_rshell, backend_upydevice, consumers
-from micropy.pyd.abc import DevicePath, MetaPyDeviceBackend, PyDeviceConsumer
+import serial
+from micropy.exceptions import PyDeviceError, PyDeviceProfileError, PyDeviceUnsupportedError
+from micropy.pyd import (
+    aio,
+    backend_replay,
+    backend_rshell,
+    backend_upydevice,
+    batch,
+    broker,
+    calibrate,
+    checksum,
+    compression,
+    consumers,
+    discovery,
+    fingerprint,
+    framing,
+    parallel,
+    profiler,
+    rawpaste,
+    scripts,
+    session,
+    simulator,
+    sync,
+    telemetry,
+    transfer,
+)
+from micropy.pyd.abc import DeviceEntry, DevicePath, HostPath, MetaPyDeviceBackend, PyDeviceConsumer
 from micropy.pyd.pydevice import PyDevice
 from pytest_mock import MockFixture
 
@@ -42,6 +79,145 @@ def mock_rsh(mocker: MockFixture):
     return mock_rsh
 
 
+class DeviceScriptRunner:
+    """Runs device-side helper scripts in CPython against a host directory."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def host_path(self, path: str) -> Path:
+        return self.root / str(path).lstrip("/")
+
+    def _modules(self) -> dict[str, types.ModuleType]:
+        uos = types.ModuleType("uos")
+        uos.ilistdir = lambda d: [
+            (e.name, 0x4000 if e.is_dir() else 0x8000, 0, e.stat().st_size)
+            for e in os.scandir(self.host_path(d))
+        ]
+        uos.listdir = lambda d="/": sorted(os.listdir(self.host_path(d)))
+        uos.stat = lambda p: tuple(os.stat(self.host_path(p)))
+        uos.remove = lambda p: os.remove(self.host_path(p))
+        uos.mkdir = lambda p: os.mkdir(self.host_path(p))
+        gc = types.ModuleType("gc")
+        gc.collect = lambda: None
+        gc.mem_free = lambda: 100_000
+        return dict(uos=uos, ubinascii=binascii, uhashlib=hashlib, gc=gc)
+
+    def __call__(self, script: str, namespace: dict | None = None) -> list[str]:
+        out = io.StringIO()
+        device_open = lambda p, *args, **kws: open(self.host_path(p), *args, **kws)  # noqa: E731
+        modules = self._modules()
+        real_import = __import__
+
+        def _import(name, *args, **kwargs):
+            return modules.get(name) or real_import(name, *args, **kwargs)
+
+        device_builtins = {**vars(builtins), "open": device_open, "__import__": _import}
+        namespace = {} if namespace is None else namespace
+        namespace["__builtins__"] = device_builtins
+        with contextlib.redirect_stdout(out):
+            exec(script, namespace)
+        return out.getvalue().splitlines(keepends=True)
+
+
+def decode_write(command: str) -> bytes:
+    """Bytes a plain file write command writes."""
+    expr = command.removeprefix("contents = ").removesuffix("; f.write(contents)")
+    ubinascii = types.SimpleNamespace(a2b_base64=binascii.a2b_base64)
+    return eval(expr, {"ubinascii": ubinascii})
+
+
+def ack_batches(cmd: MagicMock, side_effect=None) -> list[str]:
+    """Make a mock `cmd` acknowledge command batches.
+
+    Returns:
+        Scripts of acknowledged batches.
+
+    """
+    batches = []
+
+    def _cmd(command, *args, **kwargs):
+        if command.startswith("exec(") and "@@B ok" in command:
+            batches.append(ast.literal_eval(command[5:-1]))
+            kwargs["pipe"]("@@B ok\n")
+            return None
+        return side_effect(command, *args, **kwargs) if side_effect else None
+
+    cmd.side_effect = _cmd
+    return batches
+
+
+class FakeRawReplSerial(serial.SerialBase):
+    """Serial port speaking the MicroPython raw REPL and raw-paste protocols."""
+
+    def __init__(self, root: Path, *, window: int = 32, raw_paste: bool = True):
+        super().__init__()
+        self.run = DeviceScriptRunner(root)
+        self.window = window
+        self.raw_paste = raw_paste
+        self.namespace: dict = {}
+        self.output = bytearray()
+        self.state = "friendly"
+        self.pastes = 0
+        self._raw = b""
+        self._code = b""
+        self._unacked = 0
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.output)
+
+    def read(self, size: int = 1) -> bytes:
+        data = bytes(self.output[:size])
+        del self.output[:size]
+        return data
+
+    def write(self, data: bytes) -> int:
+        for byte in data:
+            self._feed(bytes([byte]))
+        return len(data)
+
+    def _exec(self) -> None:
+        out, err = b"", b""
+        try:
+            out = "".join(self.run(self._code.decode(), self.namespace)).encode()
+        except Exception as e:
+            err = f"Traceback (most recent call last):\n{e!r}".encode()
+        self.output += b"\x04" + out + b"\x04" + err + b"\x04>"
+        self.pastes += 1
+
+    def _feed(self, byte: bytes) -> None:
+        if self.state == "paste":
+            if byte == b"\x04":
+                self._exec()
+                self.state = "raw"
+                return
+            assert self._unacked < self.window, "host overran the raw-paste window"
+            self._code += byte
+            self._unacked += 1
+            if self._unacked == self.window:
+                self._unacked = 0
+                self.output += b"\x01"
+        elif self.state == "raw" and (self._raw or byte == b"\x05"):
+            self._raw += byte
+            if not rawpaste.RAW_PASTE_REQUEST.startswith(self._raw):
+                self._raw = b""
+            elif self._raw == rawpaste.RAW_PASTE_REQUEST:
+                self._raw = b""
+                if not self.raw_paste:
+                    self.output += rawpaste.RAW_REPL_BANNER
+                    return
+                self.state = "paste"
+                self._code = b""
+                self._unacked = 0
+                self.output += rawpaste.RAW_PASTE_SUPPORTED + self.window.to_bytes(2, "little")
+        elif byte == b"\x01":
+            self.state = "raw"
+            self.output += rawpaste.RAW_REPL_BANNER
+        elif byte == b"\x02":
+            self.state = "friendly"
+
+
 class MockAdapter:
     backend: Literal["upy", "rsh"]
     mock: MagicMock
@@ -71,6 +247,8 @@ class MockAdapter:
 
 
 MOCK_PORT = "/dev/port"
+# device root detection response: (cwd, root listing).
+MOCK_ROOT = ("/", ["boot.py", "main.py"])
 
 IS_WIN_PY310 = sys.version_info >= (3, 10) and sys.platform.startswith("win")
 
@@ -179,11 +357,26 @@ class TestPyDeviceBackend:
         pyd = self.pyd_cls().establish(MOCK_PORT)
         pyd.connect()
         pyd._pydevice.exec_raw = mocker.Mock(return_value=[b"", b""])
+        batches = ack_batches(m.device.cmd) if m.is_upy else []
+        if m.is_upy:
+            pyd.script_cache_budget = 0
         pyd.eval_script(b"import something", "somefile.py", **with_consumer)
         if m.is_upy:
             if "consumer" in with_consumer:
                 with_consumer["consumer"].on_start.assert_called_once()
-            m.device.cmd.assert_any_call("import ubinascii")
+            assert "import gc, ubinascii" in batches[0]
+            # script is imported and removed in a single batch.
+            assert "import somefile" in batches[-1]
+            assert "uos.remove('/somefile.py')" in batches[-1]
+            # named scripts are cached on the device by content hash.
+            batches.clear()
+            pyd.script_cache_budget = 1024
+            pyd.eval_script(b"import something", "somefile.py", **with_consumer)
+            module = f"_mpy_{hashlib.sha256(b'import something').hexdigest()[:16]}"
+            assert f"_sc('/.micropy_cache', '{module}.py', 16, 1024)" in batches[0]
+            assert "f = open('/.micropy_cache/" in batches[1]
+            assert f"import {module}" in batches[-1]
+            assert "uos.remove" not in batches[-1]
             mock_random = mocker.patch("random.sample", return_value="abc.py")
             pyd = self.pyd_cls().establish(MOCK_PORT)
             pyd.connect()
@@ -210,14 +403,14 @@ class TestPyDeviceBackend:
             # upy only
             return
         # content size
-        m.mock_uos.return_value.stat.side_effect = ["ENOENT", [0, 0, 0, 0, 0, 0, 8]]
+        m.mock_uos.return_value.stat.side_effect = [[0, 0, 0, 0, 0, 0, 8]]
         # chunk size will default to 8/4
-        m.device.cmd.side_effect = [8, b"Hi", b" t", b"he", b"re"]
+        m.device.cmd.side_effect = [MOCK_ROOT, 8, b"Hi", b" t", b"he", b"re"]
         pyd = self.pyd_cls().establish(MOCK_PORT)
         res = pyd.read_file("/some/path", verify_integrity=False)
         assert res == "Hi there"
         mock_upy_retry.assert_not_called()
-        assert m.device.cmd.call_count == 5
+        assert m.device.cmd.call_count == 6
 
     def test_read_file__with_integrity(self, mock_upy_retry, pymock):
         m = pymock
@@ -225,18 +418,18 @@ class TestPyDeviceBackend:
             # upy only
             return
         # content size
-        m.mock_uos.return_value.stat.side_effect = ["ENOENT", [0, 0, 0, 0, 0, 0, 8]]
+        m.mock_uos.return_value.stat.side_effect = [[0, 0, 0, 0, 0, 0, 8]]
         # chunk size will default to 8/4
         chunks = [b"Hi", b" t", b"he", b"re"]
         chunks_hash = hashlib.sha256()
         for chunk in chunks:
             chunks_hash.update(chunk)
-        m.device.cmd.side_effect = [8, *chunks, chunks_hash.hexdigest()]
+        m.device.cmd.side_effect = [MOCK_ROOT, 8, *chunks, chunks_hash.hexdigest()]
         pyd = self.pyd_cls().establish(MOCK_PORT)
         res = pyd.read_file("/some/path", verify_integrity=True)
         assert res == "Hi there"
         mock_upy_retry.assert_not_called()
-        assert m.device.cmd.call_count == 6
+        assert m.device.cmd.call_count == 7
 
     def test_read_file__with_integrity_fail(self, mock_upy_retry, pymock, mocker: MockFixture):
         m = pymock
@@ -244,16 +437,16 @@ class TestPyDeviceBackend:
             # upy only
             return
         # content size
-        m.mock_uos.return_value.stat.side_effect = ["ENOENT", [0, 0, 0, 0, 0, 0, 8]]
+        m.mock_uos.return_value.stat.side_effect = [[0, 0, 0, 0, 0, 0, 8]]
         # chunk size will default to 8/4
         chunks = [b"Hi", b" t", b"he", b"re"]
-        m.device.cmd.side_effect = [8, *chunks, "notrightsha"]
+        m.device.cmd.side_effect = [MOCK_ROOT, 8, *chunks, "notrightsha"]
         reset_mock = mocker.MagicMock()
         pyd = self.pyd_cls().establish(MOCK_PORT)
         pyd.reset = reset_mock
         pyd.read_file("/some/path", verify_integrity=True)
         assert reset_mock.call_count == 4
-        assert m.device.cmd.call_count == 6
+        assert m.device.cmd.call_count == 7
 
     def test_read_file__bad_chunk(self, mock_upy_retry, pymock, mocker: MockFixture):
         m = pymock
@@ -261,16 +454,16 @@ class TestPyDeviceBackend:
             # upy only
             return
         # content size
-        m.mock_uos.return_value.stat.side_effect = ["ENOENT", [0, 0, 0, 0, 0, 0, 8]]
+        m.mock_uos.return_value.stat.side_effect = [[0, 0, 0, 0, 0, 0, 8]]
         # chunk size will default to 8/4
         chunks = [b"Hi", b"", b" t", b"he", b"re"]
-        m.device.cmd.side_effect = [8, *chunks]
+        m.device.cmd.side_effect = [MOCK_ROOT, 8, *chunks]
         m.mock.Device.return_value.reset = mocker.MagicMock(return_value=None)
         pyd = self.pyd_cls().establish(MOCK_PORT)
         res = pyd.read_file("/some/path", verify_integrity=False)
         assert res == "Hi there"
         mock_upy_retry.assert_not_called()
-        assert m.device.cmd.call_count == 6
+        assert m.device.cmd.call_count == 7
         assert m.mock.Device.return_value.reset.call_count == 1
 
     def test_read_file__error_chunk(self, mock_upy_retry, pymock, mocker: MockFixture):
@@ -279,57 +472,351 @@ class TestPyDeviceBackend:
             # upy only
             return
         # content size
-        m.mock_uos.return_value.stat.side_effect = ["ENOENT", [0, 0, 0, 0, 0, 0, 8]]
+        m.mock_uos.return_value.stat.side_effect = [[0, 0, 0, 0, 0, 0, 8]]
         # chunk size will default to 8/4
         chunks = [b"Hi", RuntimeError, b" t", b"he", b"re"]
-        m.device.cmd.side_effect = [8, *chunks]
+        m.device.cmd.side_effect = [MOCK_ROOT, 8, *chunks]
         reset_mock = mocker.MagicMock()
         pyd = self.pyd_cls().establish(MOCK_PORT)
         pyd.reset = reset_mock
         pyd.read_file("/some/path", verify_integrity=True)
         assert reset_mock.call_count == 5
-        assert m.device.cmd.call_count == 4
+        assert m.device.cmd.call_count == 5
 
     def test_pull_file(self, pymock, tmp_path, mock_upy_retry):
         m = pymock
         pyd = self.pyd_cls().establish(MOCK_PORT)
         pyd.connect()
         if m.is_upy:
-            m.mock_uos.return_value.stat.side_effect = [
-                "ENOENT",  # resolve root
-                "ENOENT",  # resolve root
-                [0, 0, 0, 0, 0, 0, 8],
-            ]
+            m.mock_uos.return_value.stat.side_effect = [[0, 0, 0, 0, 0, 0, 8]]
             # chunk size will default to 8/4
-            m.device.cmd.side_effect = [8, b"Hi", b" t", b"he", b"re"]
-            pyd.pull_file("/some/path", (tmp_path / "out.txt"), verify_integrity=False)
+            m.device.cmd.side_effect = [MOCK_ROOT, 8, b"Hi", b" t", b"he", b"re"]
+            pyd.pull_file(
+                "/some/path", (tmp_path / "out.txt"), verify_integrity=False, stream=False
+            )
             assert (tmp_path / "out.txt").read_text() == "Hi there"
         else:
             m.mock.find_serial_device_by_port.return_value.name_path = "/"
             pyd.pull_file("/some/path", (tmp_path / "out.txt"))
             m.mock.cp.assert_called_once_with("/some/path", str(tmp_path / "out.txt"))
 
-    def test_iter_files(self, pymock):
+    def test_iter_files(self, pymock, mocker: MockFixture):
         m = pymock
         if m.is_rsh:
             return
         pyd = self.pyd_cls().establish(MOCK_PORT)
         pyd.connect()
-        m.device.cmd.side_effect = [
-            None,
-            None,
-            None,
-            [("name", "stat", "", "")],
-            None,
-            [("name", stat.S_IFDIR, "", "")],
-            None,
-            [("underName", "", "", "")],
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+        output = [
+            "@@T d 0 0 /some/path/name\n",
+            "@@T f 12 0 /some/path/name/underName\n",
+            "@@Z\n",
         ]
-        assert list(pyd.iter_files("/some/path")) == []
-        m.device.cmd.assert_any_call("import uos", silent=True)
-        m.device.cmd.assert_any_call("list(uos.ilistdir('/some/path'))", silent=True, rtn_resp=True)
-        assert list(pyd.iter_files("/some/path")) == [PurePosixPath("/some/path/name")]
-        assert list(pyd.iter_files("/some/path")) == [PurePosixPath("/some/path/name/underName")]
+        m.device.cmd.side_effect = lambda cmd, pipe, **kws: [pipe(line) for line in output]
+        assert list(pyd.iter_files("/some/path")) == ["/some/path/name/underName"]
+        # whole tree is walked with a single command.
+        m.device.cmd.assert_called_once()
+        assert "uos.ilistdir" in m.device.cmd.call_args.args[0]
+
+
+@pytest.fixture
+def device_fs(tmp_path):
+    root = tmp_path / "device"
+    stubs_dir = root / "stubs" / "esp32_1_20_0"
+    (stubs_dir / "umqtt").mkdir(parents=True)
+    (stubs_dir / "modules.json").write_text('{"firmware": {}}')
+    (stubs_dir / "umqtt" / "simple.py").write_text("class MQTTClient: ...\n" * 50)
+    (stubs_dir / "blob.bin").write_bytes(bytes(range(256)) * 3)
+    (stubs_dir / "empty.py").write_text("")
+    return root
+
+
+class TestFraming:
+    def test_tree_pull_script(self, device_fs, tmp_path):
+        run = DeviceScriptRunner(device_fs)
+        lines = run(
+            scripts.TREE_PULL_SCRIPT.format(
+                root="/stubs", chunk_size=64, checksum=checksum.device_checksum_code()
+            )
+        )
+        out = tmp_path / "out"
+        decoder = framing.FrameDecoder(out)
+        for line in lines:
+            decoder.on_message(line)
+        assert decoder.finished
+        assert decoder.failed == {}
+        assert len(decoder.files) == 4
+        for device_path, host_path in decoder.files.items():
+            assert host_path.read_bytes() == run.host_path(device_path).read_bytes()
+        assert (out / "stubs" / "esp32_1_20_0" / "blob.bin").exists()
+
+    def test_decoder__integrity(self, device_fs, tmp_path, mocker: MockFixture):
+        run = DeviceScriptRunner(device_fs)
+        lines = run(
+            scripts.TREE_PULL_SCRIPT.format(
+                root="/stubs/esp32_1_20_0/umqtt",
+                chunk_size=64,
+                checksum=checksum.device_checksum_code(),
+            )
+        )
+        consumer = mocker.MagicMock(PyDeviceConsumer)
+        decoder = framing.FrameDecoder(tmp_path, consumer=consumer)
+        for line in lines:
+            if line.startswith(framing.FRAME_END):
+                line = f"{framing.FRAME_END} notthesha\n"
+            decoder.on_message(line)
+        decoder.on_message(b"some other output\n")
+        assert list(decoder.failed) == ["/stubs/esp32_1_20_0/umqtt/simple.py"]
+        consumer.on_start.assert_called_once()
+        consumer.on_end.assert_called_once()
+        consumer.on_message.assert_called_once_with("some other output")
+
+    def test_decoder__incomplete(self, tmp_path):
+        decoder = framing.FrameDecoder(tmp_path)
+        decoder.on_message("@@F 10 /a.py\n@@D YWJj\n")
+        decoder.close()
+        assert "/a.py" in decoder.failed
+        assert not decoder.finished
+
+    def test_decoder__stream_writes(self, tmp_path):
+        decoder = framing.FrameDecoder(tmp_path)
+        decoder.on_message("@@W w /stubs/board/a.py\n@@D YWJj\n@@C\n")
+        decoder.on_message("@@W a /stubs/board/a.py\n@@D ZGVm\n@@C\n")
+        assert decoder.failed == {}
+        assert (tmp_path / "stubs" / "board" / "a.py").read_bytes() == b"abcdef"
+
+    @pytest.mark.parametrize("frame", ["@@F 3 /../../x.py", "@@W w /stubs/../../../x.py"])
+    def test_decoder__traversal(self, tmp_path, frame):
+        decoder = framing.FrameDecoder(tmp_path / "out" / "staging")
+        with pytest.raises(PyDeviceError, match="outside"):
+            decoder.on_message(f"{frame}\n@@D YWJj\n")
+        assert not list(tmp_path.rglob("x.py"))
+
+    def test_stream_writes_prelude(self, tmp_path):
+        script = scripts.STREAM_WRITES_PRELUDE + "\n".join(
+            [
+                "ensure_folder('/stubs/board')",
+                "with open('/stubs/board/mod.py', 'w') as f:",
+                "    f.write('def foo(): ...\\n')",
+                "print('done')",
+            ]
+        )
+        lines = DeviceScriptRunner(tmp_path / "device")(script)
+        decoder = framing.FrameDecoder(tmp_path / "out")
+        for line in lines:
+            decoder.on_message(line)
+        decoder.close()
+        assert decoder.failed == {}
+        assert not (tmp_path / "device").exists()
+        assert (tmp_path / "out" / "stubs" / "board" / "mod.py").read_text() == "def foo(): ...\n"
+
+
+class TestStreamRead:
+    @pytest.fixture
+    def contents(self, device_fs):
+        path = device_fs / "log.txt"
+        path.write_text("".join(f"line {i}\n" for i in range(1000)))
+        return path.read_bytes()
+
+    @pytest.fixture
+    def pyd(self, mock_upy, mock_upy_uos, device_fs, contents, mocker: MockFixture):
+        run = DeviceScriptRunner(device_fs)
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        pyd.device_runs = 0
+        mock_upy_uos.return_value.stat.return_value = [0, 0, 0, 0, 0, 0, len(contents)]
+        # compressed reads are covered by TestCompression.
+        pyd.compress_min_size = None
+        mocker.patch.object(pyd, "_compute_chunk_size", return_value=500)
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+        mocker.patch.object(pyd, "reset")
+
+        def _eval(command, *, consumer):
+            pyd.device_runs += 1
+            for line in run(command):
+                consumer.on_message(line)
+
+        mocker.patch.object(pyd, "eval", side_effect=_eval)
+        return pyd
+
+    def test_decoder__resume(self):
+        decoder = framing.ChunkStreamDecoder()
+        decoder.on_message("@@R 0 YWJj\n@@R 3 !!!!\n@@R 6 Z2hp\n@@Z 9\n")
+        assert decoder.offset == 3
+        assert not decoder.finished
+        decoder.on_message("@@R 3 ZGVm\n@@R 6 Z2hp\n@@Z 9\n")
+        assert decoder.finished
+        assert decoder.getvalue() == b"abcdefghi"
+
+    def test_read_file__stream(self, pyd, contents, mocker: MockFixture):
+        consumer = mocker.MagicMock(PyDeviceConsumer)
+        result = pyd.read_file("/log.txt", stream=True, verify_integrity=False, consumer=consumer)
+        assert result.encode() == contents
+        assert pyd.device_runs == 1
+        assert sum(c.kwargs["size"] for c in consumer.on_update.call_args_list) == len(contents)
+        pyd._pydevice.cmd.assert_not_called()
+
+    def test_read_file__stream_resume(self, pyd, device_fs, contents, mocker: MockFixture):
+        run = DeviceScriptRunner(device_fs)
+        calls = []
+
+        def _eval(command, *, consumer):
+            lines = run(command)
+            calls.append(command)
+            if len(calls) == 1:
+                # drop connection after two chunks.
+                for line in lines[:2]:
+                    consumer.on_message(line)
+                raise PyDeviceError("connection lost")
+            for line in lines:
+                consumer.on_message(line)
+
+        pyd.eval.side_effect = _eval
+        (device_fs / "log.txt").write_text("abc" * 1000)
+        pyd.uos.stat.return_value = [0, 0, 0, 0, 0, 0, 3000]
+        result = pyd.read_file("/log.txt", stream=True, verify_integrity=False)
+        assert result == "abc" * 1000
+        assert len(calls) == 2
+        assert "f.seek(500)" not in calls[0] and "f.seek(1000)" in calls[1]
+        pyd.reset.assert_called_once()
+
+    @pytest.mark.parametrize("algorithm", checksum.CHECKSUM_ALGORITHMS)
+    def test_read_file__stream_checksum(self, pyd, contents, algorithm, mocker: MockFixture):
+        digest_spy = mocker.spy(pyd, "_compute_device_file_digest")
+        result = pyd.read_file("/log.txt", stream=True, checksum=algorithm)
+        assert result.encode() == contents
+        assert pyd.device_runs == 1
+        digest_spy.assert_not_called()
+
+    def test_read_file__stream_checksum_resume(self, pyd, device_fs, mocker: MockFixture):
+        run = DeviceScriptRunner(device_fs)
+        (device_fs / "log.txt").write_text("xyz" * 1000)
+        pyd.uos.stat.return_value = [0, 0, 0, 0, 0, 0, 3000]
+        runs = []
+
+        def _eval(command, *, consumer):
+            lines = run(command)
+            runs.append(lines)
+            # first run is cut short after the first chunk.
+            for line in lines[: 1 if len(runs) == 1 else None]:
+                consumer.on_message(line)
+
+        pyd.eval.side_effect = _eval
+        digest_spy = mocker.spy(pyd, "_compute_device_file_digest")
+        assert pyd.read_file("/log.txt", stream=True, checksum="crc32") == "xyz" * 1000
+        assert len(runs) == 2
+        digest_spy.assert_not_called()
+
+    def test_read_file__chunked_checksum_after_reset(self, pyd, mocker: MockFixture):
+        pyd.uos.stat.return_value = [0, 0, 0, 0, 0, 0, 4]
+        pyd._pydevice.cmd.side_effect = [b"ab", b"", b"cd"]
+        digest = hashlib.sha256(b"abcd").hexdigest()
+        digest_mock = mocker.patch.object(pyd, "_compute_device_file_digest", return_value=digest)
+        mocker.patch.object(pyd, "_compute_chunk_size", return_value=2)
+        assert pyd.read_file("/log.txt") == "abcd"
+        first_cmd = pyd._pydevice.cmd.call_args_list[0].args[0]
+        assert "_h=_C();_h.update(ch)" in first_cmd
+        digest_mock.assert_called_once()
+
+
+class TestUPyDeviceBulk:
+    @pytest.fixture
+    def pyd(self, mock_upy, mock_upy_uos, device_fs, mocker: MockFixture):
+        run = DeviceScriptRunner(device_fs)
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        mocker.patch.object(pyd, "_compute_chunk_size", return_value=32)
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+
+        def _eval_script(script, target_path=None, *, consumer):
+            for line in run(script):
+                consumer.on_message(line)
+
+        mocker.patch.object(pyd, "eval_script", side_effect=_eval_script)
+        mocker.patch.object(pyd, "pull_file")
+        mocker.patch.object(pyd, "walk", return_value=[])
+        return pyd
+
+    def test_copy_dir(self, pyd, device_fs, tmp_path):
+        pyd.copy_dir(DevicePath("/stubs"), tmp_path / "out", verify_integrity=True)
+        out_file = tmp_path / "out" / "stubs" / "esp32_1_20_0" / "umqtt" / "simple.py"
+        assert out_file.read_text() == "class MQTTClient: ...\n" * 50
+        pyd.pull_file.assert_not_called()
+        pyd.walk.assert_not_called()
+
+    def test_copy_dir__repull_failed(self, pyd, mocker: MockFixture, tmp_path):
+        decoder = framing.FrameDecoder(tmp_path)
+        decoder.files = {"/stubs/a.py": tmp_path / "a.py", "/stubs/sys.py": tmp_path / "sys.py"}
+        decoder.failed = {"/stubs/a.py": ("x", "y"), "/stubs/sys.py": ("x", "y")}
+        mocker.patch.object(pyd, "pull_tree", return_value=decoder)
+        pyd.copy_dir(DevicePath("/stubs"), tmp_path, exclude_integrity={"sys.py"})
+        pyd.pull_file.assert_called_once_with(
+            "/stubs/a.py", str(tmp_path / "a.py"), verify_integrity=True
+        )
+
+    def test_copy_dir__fallback(self, pyd, tmp_path):
+        pyd.eval_script.side_effect = RuntimeError("no stream")
+        pyd.copy_dir(DevicePath("/stubs"), tmp_path)
+        pyd.walk.assert_called_once_with("/stubs")
+
+    def test_copy_dir__no_bulk(self, pyd, tmp_path):
+        pyd.copy_dir(DevicePath("/stubs"), tmp_path, bulk=False)
+        pyd.eval_script.assert_not_called()
+        pyd.walk.assert_called_once()
+
+    def test_copy_dir__walk_sizes(self, pyd, tmp_path):
+        pyd.walk.return_value = [
+            DeviceEntry(DevicePath("/stubs/umqtt"), "dir", 0),
+            DeviceEntry(DevicePath("/stubs/umqtt/simple.py"), "file", 1100, 1700000000),
+        ]
+        pyd.copy_dir(DevicePath("/stubs"), tmp_path, bulk=False)
+        # size is known from the walk, so files are not stat'ed again.
+        pyd.pull_file.assert_called_once_with(
+            "/stubs/umqtt/simple.py",
+            str(tmp_path / "stubs" / "umqtt" / "simple.py"),
+            verify_integrity=True,
+            size=1100,
+        )
+
+
+class TestWalk:
+    def test_walk_script(self, device_fs):
+        lines = DeviceScriptRunner(device_fs)(scripts.WALK_SCRIPT.format(root="/stubs"))
+        decoder = framing.TreeDecoder()
+        for line in lines:
+            decoder.on_message(line)
+        assert decoder.finished
+        entries = {e.path: e for e in decoder.entries}
+        assert entries["/stubs/esp32_1_20_0"].is_dir
+        blob = entries["/stubs/esp32_1_20_0/blob.bin"]
+        assert (blob.type, blob.size) == ("file", 768)
+        assert blob.mtime == int((device_fs / "stubs/esp32_1_20_0/blob.bin").stat().st_mtime)
+        # parents are listed before their children.
+        paths = [e.path for e in decoder.entries]
+        assert paths.index("/stubs/esp32_1_20_0/umqtt") < paths.index(
+            "/stubs/esp32_1_20_0/umqtt/simple.py"
+        )
+        assert len(entries) == 6
+
+    def test_decoder__no_mtime(self, mocker: MockFixture):
+        consumer = mocker.MagicMock()
+        decoder = framing.TreeDecoder(consumer=consumer)
+        decoder.on_message("@@T f 3 0 /a file.py\nhello\n")
+        assert decoder.entries == [DeviceEntry(DevicePath("/a file.py"), "file", 3, None)]
+        consumer.on_message.assert_called_once_with("hello")
+        assert not decoder.finished
+
+    def test_walk__incomplete(self, mock_upy, mocker: MockFixture):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+        mocker.patch.object(pyd, "eval")
+        with pytest.raises(PyDeviceError):
+            pyd.walk("/")
+
+    def test_pydevice_walk(self, mocker: MockFixture):
+        backend = mocker.MagicMock(MetaPyDeviceBackend)
+        backend.return_value.establish.return_value = backend.return_value
+        pyd = PyDevice(MOCK_PORT, backend=backend, auto_connect=False)
+        pyd.walk("/lib")
+        backend.return_value.walk.assert_called_once_with("/lib", consumer=pyd.consumer)
 
 
 class TestPyDevice:
@@ -472,6 +959,29 @@ class TestConsumers:
         delegate = consumers.ConsumerDelegate(consumers.MessageHandlers(on_message=lambda m: m))
         assert delegate.on_message("a") == "a"
 
+    def test_delegate__observers(self):
+        calls = []
+        primary = consumers.StreamHandlers(
+            on_start=lambda **_: None,
+            on_update=lambda *, size: calls.append(("primary", size)),
+            on_end=lambda: None,
+        )
+        observer = MagicMock(spec=["on_update", "on_event"])
+        observer.on_update.side_effect = lambda *, size: calls.append(("observer", size))
+        delegate = consumers.ConsumerDelegate(primary, observers=[observer])
+        delegate.on_update(size=3)
+        assert calls == [("primary", 3), ("observer", 3)]
+        # events reach observers even if no consumer handles them.
+        delegate.consumer_for("on_event", "reset")
+        observer.on_event.assert_called_once_with("reset")
+        assert delegate.consumer_for("consumer_for", "on_end") is None
+
+    def test_notify(self):
+        consumer = MagicMock(spec=["on_event"])
+        consumers.notify(consumer, "retry", offset=4)
+        consumer.on_event.assert_called_once_with("retry", offset=4)
+        consumers.notify(consumers.MessageHandlers(on_message=print), "retry")
+
     @pytest.mark.skipif(
         IS_WIN_PY310, reason="skipping due to rshell/pyreadline broken for >=py310 on windows."
     )
@@ -484,3 +994,1627 @@ class TestConsumers:
             rsh_cons.on_message(i.encode())
         assert len(calls) == 2
         assert calls == ["a line.", "next line."]
+
+
+class TestFingerprint:
+    OUTPUT = [
+        "import sys, os;_u=os.uname()...FINGERPRINT:'+repr([...]))\n",
+        "@@MPY_FINGERPRINT:['esp32', '1.20.0', 'v1.20.0 on 2023-04-26', 'ESP32 module', 'micropython', '1.20.0', 6]\n",
+        "__main__          gc                uasyncio/stream   uselect\n",
+        "_boot             inisetup          ubinascii         network\n",
+        "Plus any modules on the filesystem\n",
+    ]
+
+    def test_from_output(self):
+        fp = fingerprint.DeviceFingerprint.from_output(self.OUTPUT)
+        assert fp.sysname == "esp32"
+        assert fp.implementation_version == "1.20.0"
+        assert fp.mpy == 6
+        assert fp.modules_hash
+        reordered = [*self.OUTPUT[:2], self.OUTPUT[3], self.OUTPUT[2], self.OUTPUT[4]]
+        assert fingerprint.DeviceFingerprint.from_output(reordered).digest == fp.digest
+        changed = [*self.OUTPUT[:2], self.OUTPUT[3], self.OUTPUT[4]]
+        assert fingerprint.DeviceFingerprint.from_output(changed).digest != fp.digest
+        assert fp.to_dict()["digest"] == fp.digest
+
+    def test_from_output__missing(self):
+        with pytest.raises(ValueError):
+            fingerprint.DeviceFingerprint.from_output(["nothing here"])
+
+    def test_read_fingerprint(self, mocker: MockFixture):
+        backend = mocker.MagicMock(MetaPyDeviceBackend)
+
+        def _eval(command, *, consumer):
+            for line in self.OUTPUT:
+                consumer.on_message(line.encode())
+
+        backend.eval.side_effect = _eval
+        fp = fingerprint.read_fingerprint(backend)
+        assert fp == fingerprint.DeviceFingerprint.from_output(self.OUTPUT)
+        assert "help('modules')" in backend.eval.call_args.args[0]
+
+
+class TestRawPaste:
+    @pytest.fixture
+    def pyd(self, mock_upy, mock_upy_uos, tmp_path, mocker: MockFixture):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        # compressed writes are covered by TestCompression.
+        pyd.compress_min_size = None
+        mocker.patch.object(pyd, "_compute_chunk_size", return_value=1000)
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+        return pyd
+
+    def test_exec_raw(self, tmp_path):
+        port = FakeRawReplSerial(tmp_path)
+        with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+            assert transport.exec_raw("x = 40\nprint(x + 2)") == b"42\n"
+            assert transport.window_size == 32
+            with pytest.raises(PyDeviceError, match="ZeroDivisionError"):
+                transport.exec_raw("1/0")
+        assert port.state == "friendly"
+
+    def test_exec_raw__unsupported(self, tmp_path):
+        port = FakeRawReplSerial(tmp_path, raw_paste=False)
+        with pytest.raises(PyDeviceUnsupportedError):
+            with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+                transport.exec_raw("print(1)")
+
+    @pytest.mark.parametrize(
+        "contents", [b"\x00\x01binary\xff" * 300, "text content\n" * 200], ids=["bytes", "str"]
+    )
+    def test_write_file(self, pyd, tmp_path, contents, mocker: MockFixture):
+        port = FakeRawReplSerial(tmp_path)
+        pyd._pydevice.serial = port
+        consumer = mocker.MagicMock(PyDeviceConsumer)
+        pyd.write_file(contents, DevicePath("/main.py"), consumer=consumer)
+        expected = contents if isinstance(contents, bytes) else contents.encode()
+        assert (tmp_path / "main.py").read_bytes() == expected
+        # setup, blocks (<=1000 bytes, rounded to whole lines), close.
+        assert port.pastes == 2 + -(-len(expected) // rawpaste.LINE_SIZE)
+        assert pyd._raw_paste_supported is True
+        consumer.on_start.assert_called_once()
+        consumer.on_end.assert_called_once()
+        assert not any("open(" in str(c) for c in pyd._pydevice.cmd.call_args_list)
+
+    def test_write_file__fallback(self, pyd, tmp_path):
+        port = FakeRawReplSerial(tmp_path, raw_paste=False)
+        pyd._pydevice.serial = port
+        batches = ack_batches(pyd._pydevice.cmd)
+        pyd.write_file("content", DevicePath("/main.py"))
+        assert pyd._raw_paste_supported is False
+        assert "f = open('/main.py', 'wb')" in batches[0]
+        port.write = MagicMock()
+        pyd.write_file("content", DevicePath("/main.py"))
+        port.write.assert_not_called()
+
+
+class TestChecksum:
+    @pytest.mark.parametrize("algorithm", checksum.CHECKSUM_ALGORITHMS)
+    def test_device_matches_host(self, algorithm, tmp_path):
+        data = bytes(range(256)) * 10
+        script = "import ubinascii\n" + checksum.device_checksum_code(algorithm)
+        script += (
+            f"h = _C()\nh.update({data[:1000]!r})\nh.update({data[1000:]!r})\nprint(h.hexdigest())"
+        )
+        host = checksum.new_checksum(algorithm)
+        host.update(data)
+        assert DeviceScriptRunner(tmp_path)(script) == [host.hexdigest() + "\n"]
+
+    def test_crc32(self):
+        import zlib
+
+        crc = checksum.Crc32()
+        crc.update(b"hello ")
+        crc.update(b"world")
+        assert crc.hexdigest() == f"{zlib.crc32(b'hello world'):08x}"
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            checksum.new_checksum("md5")
+        with pytest.raises(ValueError):
+            checksum.device_checksum_code("md5")
+
+    def test_pydevice_checksum(self, mock_upy):
+        pyd = PyDevice(MOCK_PORT, backend=backend_upydevice.UPyDeviceBackend, checksum="crc32")
+        assert pyd.pydevice.checksum == "crc32"
+        assert backend_upydevice.UPyDeviceBackend.checksum == "sha256"
+
+
+class TestTransfer:
+    def test_tuner__glitch(self):
+        tuner = transfer.ChunkSizeTuner(512)
+        tuner.record_failure()
+        # a single glitch only shrinks chunks slightly.
+        assert 256 < tuner.size < 512
+        for _ in range(64):
+            tuner.record_success()
+        assert tuner.size > 512
+        assert tuner.error_rate < 0.05
+
+    def test_tuner__sustained_errors(self):
+        tuner = transfer.ChunkSizeTuner(512, minimum=32)
+        for _ in range(3):
+            tuner.record_failure()
+        assert tuner.size < 256
+        for _ in range(20):
+            tuner.record_failure()
+        assert tuner.size == 32
+        assert tuner.limit(4096) == 32
+        assert tuner.limit(8) == 8
+
+    def test_retry__resumes_write(self, mock_upy, mock_upy_uos, mocker: MockFixture):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+        reset = mocker.patch.object(pyd, "reset")
+        pyd.BUFFER_SIZE = 4
+        writes = []
+
+        def _cmd(command, **kwargs):
+            if command.startswith("contents = "):
+                if len(writes) == 2 and not reset.called:
+                    raise RuntimeError("glitch")
+                writes.append(decode_write(command))
+
+        batches = ack_batches(pyd._pydevice.cmd, _cmd)
+        mock_upy_uos.return_value.stat.return_value = [0, 0, 0, 0, 0, 0, 8]
+        pyd.write_file("0123456789abcdef", DevicePath("/main.py"))
+        reset.assert_called_once()
+        assert b"".join(writes) == b"0123456789abcdef"
+        assert "f = open('/main.py', 'r+b'); _ = f.seek(8)" in batches[-2]
+        assert pyd.write_tuner.error_rate > 0
+
+    @pytest.mark.parametrize(
+        "contents,max_ratio",
+        [
+            ("def main():\n    print('hello')\n" * 32, 1.1),
+            (bytes(range(256)) * 4, 1.4),
+        ],
+    )
+    def test_write_file__plain_encoding(self, mock_upy, mock_upy_uos, mocker, contents, max_ratio):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        mocker.patch.object(pyd, "resolve_path", side_effect=lambda p: DevicePath(str(p)))
+        mocker.patch.object(pyd, "_write_file_compressed", return_value=False)
+        mocker.patch.object(pyd, "_write_file_raw_paste", return_value=False)
+        commands = []
+
+        def _cmd(command, **kwargs):
+            if command.startswith("contents = "):
+                commands.append(command)
+
+        ack_batches(pyd._pydevice.cmd, _cmd)
+        pyd.write_file(contents, DevicePath("/main.py"))
+        expected = contents.encode() if isinstance(contents, str) else contents
+        assert b"".join(decode_write(c) for c in commands) == expected
+        # escaping binary data in a bytes literal would take up to 4 bytes per byte.
+        sent = sum(len(c) - len("contents = ; f.write(contents)") for c in commands)
+        assert sent <= len(expected) * max_ratio
+
+    def test_retry__integrity_restarts(self, mock_upy, mocker: MockFixture):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        mocker.patch.object(pyd, "reset")
+        states = []
+
+        def _read(self_, *args, transfer, **kwargs):
+            states.append(transfer.offset)
+            if len(states) == 1:
+                transfer.offset = 10
+                raise PyDeviceError("glitch")
+            if len(states) == 2:
+                raise backend_upydevice.PyDeviceFileIntegrityError("a", "b", "c")
+            return "done"
+
+        wrapped = backend_upydevice.retry(_read)
+        assert wrapped(pyd, verify_integrity=True) == "done"
+        assert states == [0, 10, 0]
+
+    def test_raw_paste__resume(self, tmp_path):
+        (tmp_path / "main.py").write_bytes(b"x" * 768)
+        port = FakeRawReplSerial(tmp_path)
+        acks = []
+        contents = bytes(range(256)) * 12
+        with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+            transport.write_file(
+                contents, DevicePath("/main.py"), block_size=768, offset=768, on_ack=acks.append
+            )
+        # resumed into the existing file rather than rewriting the start.
+        assert (tmp_path / "main.py").read_bytes() == b"x" * 768 + contents[768:]
+        assert acks == [1536, 2304, 3072]
+
+
+class TestReadiness:
+    class PromptSerial(serial.SerialBase):
+        def __init__(self, ready_after: int):
+            super().__init__()
+            self.ready_after = ready_after
+            self.probes = 0
+            self.output = b""
+
+        @property
+        def in_waiting(self) -> int:
+            return len(self.output)
+
+        def read(self, size: int = 1) -> bytes:
+            data, self.output = self.output[:size], self.output[size:]
+            return data
+
+        def write(self, data: bytes) -> int:
+            self.probes += 1
+            if self.probes > self.ready_after:
+                self.output += b"\r\n>>> "
+            return len(data)
+
+    def test_reset__probes_repl(self, mock_upy, mocker: MockFixture):
+        sleep = mocker.spy(backend_upydevice.time, "sleep")
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        pyd._pydevice.serial = self.PromptSerial(ready_after=2)
+        pyd.reset()
+        pyd._pydevice.reset.assert_called_once()
+        pyd._pydevice.connect.assert_called_once()
+        assert pyd._pydevice.serial.probes == 3
+        assert not any(c.args[0] >= 1 for c in sleep.call_args_list)
+
+    def test_reset__not_ready(self, mock_upy, mocker: MockFixture):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        port = self.PromptSerial(ready_after=1000)
+        assert pyd._wait_ready(port, timeout=0.3) is False
+        mocker.patch.object(pyd, "_wait_ready", return_value=False)
+        pyd._pydevice.serial = port
+        with pytest.raises(PyDeviceError):
+            pyd.reset()
+
+
+class TestSync:
+    @pytest.fixture
+    def project(self, tmp_path):
+        src = tmp_path / "project" / "src"
+        (src / "lib").mkdir(parents=True)
+        (src / "main.py").write_text("import app\n")
+        (src / "app.py").write_text("print('hello')\n")
+        (src / "__pycache__").mkdir()
+        (src / "__pycache__" / "app.cpython-311.pyc").write_bytes(b"\x00")
+        pkgs = tmp_path / "project" / ".micropy" / "project" / "umqtt"
+        pkgs.mkdir(parents=True)
+        (pkgs / "simple.py").write_text("class MQTTClient: ...\n")
+        return sync.collect_files([(src, ""), (pkgs.parent, "lib")])
+
+    @pytest.fixture
+    def device(self, tmp_path, mocker: MockFixture):
+        root = tmp_path / "device"
+        root.mkdir()
+        run = DeviceScriptRunner(root)
+        backend = mocker.MagicMock(MetaPyDeviceBackend)
+        backend.location = MOCK_PORT
+        backend.resolve_path.side_effect = lambda p: DevicePath(str(p))
+
+        def _eval_script(script, target_path=None, *, consumer):
+            for line in run(script):
+                consumer.on_message(line)
+
+        def _push_file(source_path, target_path, **kwargs):
+            run.host_path(target_path).write_bytes(Path(source_path).read_bytes())
+
+        backend.eval_script.side_effect = _eval_script
+        backend.push_file.side_effect = _push_file
+        backend.remove.side_effect = lambda p: run.host_path(p).unlink()
+        backend.root = root
+        return backend
+
+    def test_collect_files(self, project):
+        assert sorted(project) == ["app.py", "lib/umqtt/simple.py", "main.py"]
+
+    def test_build_manifest(self, tmp_path):
+        # spans several read chunks.
+        contents = random.Random(0).randbytes(150_000)
+        (tmp_path / "asset.bin").write_bytes(contents)
+        manifest = sync.build_manifest({"asset.bin": tmp_path / "asset.bin"})
+        expected = sync.ManifestEntry(len(contents), hashlib.sha256(contents).hexdigest())
+        assert manifest == {"asset.bin": expected}
+
+    @pytest.mark.parametrize("algorithm", checksum.CHECKSUM_ALGORITHMS)
+    def test_manifest_script(self, device, project, algorithm):
+        device.root.joinpath("main.py").write_text("import app\n")
+        device.root.joinpath("app.py").write_text("print('HELLO')\n")
+        device.root.joinpath("boot.py").write_text("")
+        local = sync.build_manifest(project, checksum=algorithm)
+        manifest = sync.fetch_device_manifest(
+            device, sizes={p: e.size for p, e in local.items()}, checksum=algorithm
+        )
+        assert manifest["main.py"] == local["main.py"]
+        # same size, different contents.
+        assert manifest["app.py"].size == local["app.py"].size
+        assert manifest["app.py"] != local["app.py"]
+        # not on host, so not hashed.
+        assert manifest["boot.py"] == sync.ManifestEntry(0, sync.UNHASHED)
+
+    def test_plan_sync(self):
+        local = {"a.py": sync.ManifestEntry(1, "a"), "b.py": sync.ManifestEntry(1, "b")}
+        device = {
+            "a.py": sync.ManifestEntry(1, "a"),
+            "b.py": sync.ManifestEntry(1, "x"),
+            "old.py": sync.ManifestEntry(1, "-"),
+            "data.json": sync.ManifestEntry(1, "-"),
+            f"{scripts.SCRIPT_CACHE_DIR}/_mpy_0123.py": sync.ManifestEntry(1, "-"),
+        }
+        plan = sync.plan_sync(local, device, tracked=["a.py", "old.py", "gone.py"])
+        assert plan == sync.SyncPlan(upload=["b.py"], delete=["old.py"], unchanged=["a.py"])
+        plan = sync.plan_sync(local, device, prune=True)
+        assert plan.delete == ["data.json", "old.py"]
+
+    def test_sync(self, device, project, tmp_path):
+        cache = sync.ManifestCache(tmp_path / "manifest.json")
+        device.root.joinpath("main.py").write_text("import app\n")
+        plan = sync.sync(device, project, cache=cache)
+        assert plan.upload == ["app.py", "lib/umqtt/simple.py"]
+        assert plan.unchanged == ["main.py"]
+        for device_path, host_path in project.items():
+            assert device.root.joinpath(device_path).read_bytes() == host_path.read_bytes()
+        assert cache.load(MOCK_PORT, checksum="sha256") == sync.build_manifest(project)
+
+        # nothing changed locally: device is not queried.
+        device.eval_script.reset_mock()
+        plan = sync.sync(device, project, cache=cache)
+        assert not plan.changed
+        device.eval_script.assert_not_called()
+
+        # removed locally: deleted from device, unrelated files are kept.
+        device.root.joinpath("data.json").write_text("{}")
+        project.pop("app.py").unlink()
+        device.push_file.reset_mock()
+        plan = sync.sync(device, project, cache=cache)
+        assert plan == sync.SyncPlan(
+            delete=["app.py"], unchanged=["lib/umqtt/simple.py", "main.py"]
+        )
+        device.push_file.assert_not_called()
+        assert not device.root.joinpath("app.py").exists()
+        assert device.root.joinpath("data.json").exists()
+
+    def test_sync__device_id(self, device, project, tmp_path):
+        cache = sync.ManifestCache(tmp_path / "manifest.json")
+        device_id = "3c71bf"
+        device.eval.side_effect = lambda command, *, consumer: consumer.on_message(
+            f"@@I {device_id}\r\n"
+        )
+        sync.sync(device, project, cache=cache)
+        assert cache.load("3c71bf", checksum="sha256") == sync.build_manifest(project)
+        # another board attached to the same port is queried, rather than taken as up to date.
+        device_id = "a0b1c2"
+        device.eval_script.reset_mock()
+        plan = sync.sync(device, project, cache=cache)
+        device.eval_script.assert_called()
+        assert plan.upload == []
+        assert cache.load("a0b1c2", checksum="sha256") is not None
+
+    def test_read_device_id(self, tmp_path):
+        with simulator.SimulatedDevice(tmp_path) as device:
+            pyd = simulator.SimulatedPyDeviceBackend(device).establish(str(tmp_path))
+            pyd.connect()
+            assert sync.read_device_id(pyd) == "000102030405"
+            pyd.disconnect()
+
+    def test_sync__dry_run(self, device, project, tmp_path):
+        cache = sync.ManifestCache(tmp_path / "manifest.json")
+        plan = sync.sync(device, project, cache=cache, dry_run=True)
+        assert len(plan.upload) == 3
+        device.push_file.assert_not_called()
+        assert cache.load(MOCK_PORT, checksum="sha256") is None
+
+    def test_manifest_cache(self, tmp_path):
+        cache = sync.ManifestCache(tmp_path / "manifest.json")
+        assert cache.load("port", checksum="sha256") is None
+        manifest = {"main.py": sync.ManifestEntry(3, "abc")}
+        cache.save("port", manifest, checksum="sha256")
+        assert cache.load("port", checksum="sha256") == manifest
+        assert cache.load("port", checksum="crc32") is None
+        cache.clear("port")
+        assert cache.load("port", checksum="sha256") is None
+
+
+class TestRootDetection:
+    @pytest.fixture
+    def pyd(self, mock_upy):
+        return backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+
+    @pytest.mark.parametrize(
+        "response,path,expected",
+        [
+            (("/flash", ["flash", "sd"]), "main.py", "/flash/main.py"),
+            (("/flash", ["flash", "sd"]), "/lib/mod.py", "/flash/lib/mod.py"),
+            (("/flash", ["flash", "sd"]), "/sd/data.txt", "/sd/data.txt"),
+            (("/flash", ["flash"]), "/sd/data.txt", "/flash/sd/data.txt"),
+            (("/sd", ["flash", "sd"]), "main.py", "/sd/main.py"),
+            (("/sd", ["flash", "sd"]), "/flash/boot.py", "/flash/boot.py"),
+            (("/", ["flash", "main.py"]), "/main.py", "/main.py"),
+            (("/", ["boot.py"]), "lib/mod.py", "/lib/mod.py"),
+            (None, "main.py", "/main.py"),
+        ],
+    )
+    def test_resolve_path(self, pyd, response, path, expected):
+        pyd._pydevice.cmd.return_value = response
+        assert pyd.resolve_path(path) == expected
+        assert pyd.resolve_path(path) == expected
+        # detected once, then resolved on the host.
+        pyd._pydevice.cmd.assert_called_once()
+
+    def test_detect_failure(self, pyd):
+        pyd._pydevice.cmd.side_effect = [RuntimeError("busy"), ("/flash", ["flash"])]
+        assert pyd.resolve_path("main.py") == "/main.py"
+        # failures are not cached.
+        assert pyd.resolve_path("main.py") == "/flash/main.py"
+
+    def test_reconnect(self, pyd):
+        pyd._pydevice.cmd.return_value = ("/flash", ["flash"])
+        pyd.resolve_path("main.py")
+        pyd.connect()
+        pyd._pydevice.cmd.return_value = ("/", [])
+        assert pyd.resolve_path("main.py") == "/main.py"
+        assert pyd._pydevice.cmd.call_count == 2
+
+
+class TestBatch:
+    @pytest.fixture
+    def run(self, tmp_path):
+        runner = DeviceScriptRunner(tmp_path)
+        namespace = {}
+
+        def _execute(script, consumer):
+            for line in runner(script, namespace):
+                consumer.on_message(line)
+
+        return _execute
+
+    def test_flush(self, run, tmp_path, mocker: MockFixture):
+        consumer = mocker.MagicMock()
+        execute = mocker.Mock(side_effect=run)
+        with batch.CommandBatch(execute, consumer=consumer) as cmds:
+            cmds.add("import uos")
+            cmds.add("f = open('/out.txt', 'w')\nf.write('hi')\nf.close()")
+            listing = cmds.add("uos.listdir('/')", result=True)
+            cmds.add("print('done')")
+            size = cmds.add("uos.stat('/out.txt')[6]", result=True)
+        execute.assert_called_once()
+        assert listing.value == ["out.txt"]
+        assert size.value == 2 and size.ok
+        consumer.on_message.assert_called_once_with("done")
+        assert (tmp_path / "out.txt").read_text() == "hi"
+        assert len(cmds) == 0
+
+    def test_flush__error(self, run, tmp_path):
+        cmds = batch.CommandBatch(run)
+        first = cmds.add("x = 1")
+        failed = cmds.add("open('/missing.txt')")
+        skipped = cmds.add("x = 2")
+        cmds.cleanup("f = open('/cleanup.txt', 'w'); f.close()")
+        with pytest.raises(PyDeviceError, match="missing.txt"):
+            cmds.flush()
+        assert first.ok
+        assert not failed.ok and "No such file" in failed.error
+        assert not skipped.executed
+        # cleanup runs despite the failure.
+        assert (tmp_path / "cleanup.txt").exists()
+
+    def test_flush__unfinished(self, mocker: MockFixture):
+        cmds = batch.CommandBatch(mocker.Mock())
+        cmds.add("import gc")
+        with pytest.raises(PyDeviceError):
+            cmds.flush()
+        assert cmds.flush() == []
+
+    def test_backend_batch(self, mock_upy):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        batches = ack_batches(pyd._pydevice.cmd)
+        with pyd.batch() as cmds:
+            cmds.add("import gc")
+            cmds.add("gc.collect()")
+        assert len(batches) == 1
+        assert "import gc" in batches[0] and "gc.collect()" in batches[0]
+
+
+class TestAsync:
+    @pytest.fixture
+    def backend(self, mocker: MockFixture):
+        backend = mocker.MagicMock(MetaPyDeviceBackend)
+        backend.location = MOCK_PORT
+        return backend
+
+    def test_backend__non_blocking(self, backend):
+        calls = []
+
+        def _eval(command, **kwargs):
+            calls.append((command, threading.current_thread().name))
+            time.sleep(0.1)
+            return command
+
+        backend.eval.side_effect = _eval
+
+        async def _main():
+            device = aio.AsyncPyDeviceBackend(backend)
+            ticks = 0
+
+            async def _host_work():
+                nonlocal ticks
+                while len(calls) < 2:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            results = await asyncio.gather(device.eval("a"), device.eval("b"), _host_work())
+            await device.aclose()
+            return results[:2], ticks
+
+        results, ticks = asyncio.run(_main())
+        assert results == ["a", "b"]
+        # calls to one device run in order on its worker thread.
+        assert [c[0] for c in calls] == ["a", "b"]
+        assert calls[0][1] != threading.current_thread().name
+        # host work progressed while the device was busy.
+        assert ticks > 1
+        backend.disconnect.assert_called_once()
+
+    def test_backend__daemon(self, backend):
+        hung = threading.Event()
+        backend.eval.side_effect = lambda command, **kwargs: hung.wait()
+
+        async def _main():
+            device = aio.AsyncPyDeviceBackend(backend)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(device.eval("while True: pass"), 0.1)
+            return [t for t in threading.enumerate() if t.name == f"pyd-{MOCK_PORT}"]
+
+        # a hung device does not keep the process from exiting.
+        workers = asyncio.run(_main())
+        assert workers and all(t.daemon for t in workers)
+        hung.set()
+
+    def test_backend__consumer(self, backend):
+        def _pull_file(source_path, target_path, *, consumer, **kwargs):
+            consumer.on_start(name="Reading main.py", size=4)
+            consumer.on_update(size=4)
+            consumer.on_message("done")
+            consumer.on_end()
+
+        backend.pull_file.side_effect = _pull_file
+
+        async def _main():
+            device = aio.AsyncPyDeviceBackend(backend)
+            consumer = aio.AsyncConsumer()
+            task = asyncio.create_task(device.pull_file("/main.py", "main.py", consumer=consumer))
+            task.add_done_callback(lambda _: consumer.close())
+            return [event async for event in consumer]
+
+        events = asyncio.run(_main())
+        assert [e.kind for e in events] == ["start", "update", "message", "end"]
+        assert events[0] == aio.ConsumerEvent("start", name="Reading main.py", size=4)
+        assert events[2].data == "done"
+
+    def test_backend__split_consumers(self, backend):
+        def _eval(command, *, consumer):
+            consumer.on_start(name="Running", size=1)
+            consumer.on_message("out")
+            consumer.on_end()
+
+        backend.eval.side_effect = _eval
+
+        async def _main():
+            device = aio.AsyncPyDeviceBackend(backend)
+            stream, messages = aio.AsyncStreamConsumer(), aio.AsyncMessageConsumer()
+            await device.eval("print('out')", consumer=consumers.ConsumerDelegate(stream, messages))
+            stream.close()
+            messages.close()
+            return [e async for e in stream], [e async for e in messages]
+
+        progress, output = asyncio.run(_main())
+        assert [e.kind for e in progress] == ["start", "end"]
+        assert output == [aio.ConsumerEvent("message", data="out")]
+
+    def test_backend__default_consumer(self, backend):
+        asyncio.run(aio.AsyncPyDeviceBackend(backend).walk("/lib"))
+        backend.walk.assert_called_once_with("/lib")
+
+    def test_background_loop(self):
+        async def _double(value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        with aio.BackgroundLoop() as loop:
+            assert loop.run(_double(2)) == 4
+            assert loop.submit(_double(3)).result(timeout=5) == 6
+        with pytest.raises(RuntimeError):
+            loop.submit(_double(1))
+
+    def test_sync_facade(self, tmp_path):
+        (tmp_path / "host").mkdir()
+        (tmp_path / "device").mkdir()
+        (tmp_path / "host" / "main.py").write_text("print('hi')\n")
+        with simulator.SimulatedDevice(tmp_path / "device") as sim:
+            with aio.BackgroundLoop() as loop:
+                device = loop.run(
+                    aio.AsyncPyDeviceBackend.establish(
+                        str(tmp_path / "device"),
+                        backend=lambda: simulator.SimulatedPyDeviceBackend(sim),
+                    )
+                )
+                loop.run(device.connect())
+                source, pulled = tmp_path / "host" / "main.py", tmp_path / "pulled.py"
+                loop.run(device.push_file(HostPath(str(source)), DevicePath("/main.py")))
+                messages = MagicMock(spec=["on_message"])
+                loop.run(device.eval("import main", consumer=messages))
+                loop.run(device.pull_file(DevicePath("/main.py"), HostPath(str(pulled))))
+                loop.run(device.aclose())
+        assert pulled.read_text() == "print('hi')\n"
+        assert "hi" in "".join(str(c.args[0]) for c in messages.on_message.call_args_list)
+
+
+class TestParallel:
+    def test_expand_ports(self, tmp_path):
+        for name in ("ttyUSB1", "ttyUSB0", "ttyACM0"):
+            (tmp_path / name).touch()
+        ports = parallel.expand_ports([f"{tmp_path}/ttyUSB*", "COM3", f"{tmp_path}/ttyUSB0"])
+        assert ports == [f"{tmp_path}/ttyUSB0", f"{tmp_path}/ttyUSB1", "COM3"]
+        assert parallel.expand_ports([f"{tmp_path}/ttyS*"]) == []
+
+    def test_run_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def _worker(port):
+            # only passes if all devices run at once.
+            barrier.wait()
+            if port == "b":
+                raise PyDeviceError("Failed to connect.")
+            return port.upper()
+
+        done = []
+        results = parallel.run_parallel(["a", "b", "c"], _worker, on_result=done.append)
+        assert [r.port for r in results] == ["a", "b", "c"]
+        assert [r.value for r in results] == ["A", None, "C"]
+        assert [r.status for r in results] == ["ok", "failed", "ok"]
+        assert isinstance(results[1].error, PyDeviceError)
+        assert sorted(r.port for r in done) == ["a", "b", "c"]
+
+    def test_run_parallel__max_workers(self):
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def _worker(port):
+            with lock:
+                active.append(port)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(port)
+            return port
+
+        results = parallel.run_parallel(list("abcde"), _worker, max_workers=2)
+        assert all(r.ok for r in results)
+        assert max(peak) <= 2
+
+    def test_run_in_background(self):
+        future = parallel.run_in_background(sum, [1, 2, 3])
+        assert future.result(timeout=5) == 6
+        failed = parallel.run_in_background(int, "x")
+        with pytest.raises(ValueError):
+            failed.result(timeout=5)
+
+    def test_run_parallel__timeout(self):
+        hung = threading.Event()
+
+        def _worker(port):
+            if port == "hung":
+                hung.wait(5)
+            return port
+
+        started = time.monotonic()
+        results = parallel.run_parallel(["hung", "a", "b"], _worker, timeout=0.2)
+        hung.set()
+        assert time.monotonic() - started < 2
+        assert [r.status for r in results] == ["timed out", "ok", "ok"]
+        assert not results[0].ok
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="requires a pseudo-terminal")
+class TestSimulator:
+    @pytest.fixture
+    def device(self, tmp_path):
+        with simulator.SimulatedDevice(tmp_path, simulator.SimulatorConfig(seed=0)) as device:
+            yield device
+
+    @pytest.fixture
+    def port(self, device):
+        with serial.Serial(device.port, timeout=1) as port:
+            yield port
+
+    def _repl(self, port, line: str) -> bytes:
+        port.write(line.encode() + b"\r")
+        data = b""
+        while not data.endswith(b">>> "):
+            data += port.read(1) or pytest.fail(f"no prompt: {data!r}")
+        return data
+
+    def test_friendly_repl(self, device, port):
+        assert self._repl(port, "print(40 + 2)") == b"print(40 + 2)\r\n42\r\n>>> "
+        assert b"[Errno 2] ENOENT" in self._repl(port, "open('/missing.py')")
+        assert device.stats.commands == 2
+
+    def test_raw_paste(self, device, port, tmp_path):
+        with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+            transport.write_file(b"x" * 1000, DevicePath("/main.py"), block_size=256)
+            assert transport.exec_raw("import uos\nprint(uos.stat('/main.py')[6])") == b"1000\r\n"
+        assert (tmp_path / "main.py").read_bytes() == b"x" * 1000
+        assert device.stats.pastes == device.stats.commands
+
+    def test_raw_paste__unsupported(self, tmp_path):
+        config = simulator.SimulatorConfig(raw_paste=False)
+        with simulator.SimulatedDevice(tmp_path, config) as device:
+            with serial.Serial(device.port, timeout=1) as port:
+                with pytest.raises(PyDeviceUnsupportedError):
+                    with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+                        transport.exec_raw("print(1)")
+
+    def test_mem_free(self, tmp_path):
+        (tmp_path / "big.txt").write_bytes(b"x" * 2048)
+        config = simulator.SimulatorConfig(mem_free=1024)
+        with simulator.SimulatedDevice(tmp_path, config) as device:
+            with serial.Serial(device.port, timeout=1) as port:
+                out = self._repl(port, "f = open('big.txt'); f.read(512); f.read()")
+        assert b"MemoryError: memory allocation failed, allocating 2048 bytes" in out
+
+    def test_fail_commands(self, tmp_path):
+        config = simulator.SimulatorConfig(fail_commands={2})
+        with simulator.SimulatedDevice(tmp_path, config) as device:
+            with serial.Serial(device.port, timeout=1) as port:
+                with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+                    assert transport.exec_raw("print(1)") == b"1\r\n"
+                    with pytest.raises(PyDeviceError, match="EIO"):
+                        transport.exec_raw("print(2)")
+        assert device.stats.failures == 1
+
+    def test_backend(self, tmp_path):
+        (tmp_path / "lib").mkdir()
+        (tmp_path / "lib" / "mod.py").write_text("value = 42\n")
+        pyd = simulator.SimulatedPyDeviceBackend().establish(str(tmp_path))
+        try:
+            pyd.connect()
+            consumer = MagicMock()
+            pyd.eval("import mod; print(mod.value)", consumer=consumer)
+            output = "".join(c.args[0] for c in consumer.on_message.call_args_list)
+            assert output.strip() == "42"
+            pyd.write_file("print('hi')\n", DevicePath("/main.py"))
+            assert pyd.read_file(DevicePath("/main.py")) == "print('hi')\n"
+            assert [e.path for e in pyd.walk("/lib")] == ["/lib/mod.py"]
+        finally:
+            pyd.close()
+
+
+class TestSession:
+    def _record(self, tmp_path) -> Path:
+        port = FakeRawReplSerial(tmp_path)
+        path = tmp_path / "session.jsonl"
+        recorder = session.SessionRecorder(path, backend="upydevice", port="/dev/ttyUSB0")
+        recorder.attach(port)
+        with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+            transport.write_file(b"x" * 2000, DevicePath("/main.py"), block_size=1024)
+            assert transport.exec_raw("print(open('/main.py').read().count('x'))") == b"2000\n"
+        recorder.detach()
+        assert "read" not in vars(port)
+        return path
+
+    def test_record(self, tmp_path):
+        recording = session.SessionRecording.load(self._record(tmp_path))
+        assert recording.backend == "upydevice"
+        assert recording.header["port"] == "/dev/ttyUSB0"
+        assert {e.direction for e in recording.events} == {"tx", "rx"}
+        times = [e.time for e in recording.events]
+        assert times == sorted(times)
+
+    def test_load__invalid(self, tmp_path):
+        path = tmp_path / "session.jsonl"
+        path.write_text('{"not": "a recording"}\n')
+        with pytest.raises(PyDeviceError, match="Invalid session recording"):
+            session.SessionRecording.load(path)
+
+    def test_iter_exchanges(self):
+        events = [
+            session.SessionEvent(0.0, "rx", b"boot"),
+            session.SessionEvent(1.0, "tx", b"f.write(b'x')"),
+            session.SessionEvent(1.1, "tx", b"\r"),
+            session.SessionEvent(1.5, "rx", b"1"),
+            session.SessionEvent(2.0, "tx", b"\x03"),
+            session.SessionEvent(2.25, "rx", b">>> "),
+        ]
+        exchanges = list(session.iter_exchanges(events))
+        assert [(e.sent, e.received) for e in exchanges] == [
+            (b"", b"boot"),
+            (b"f.write(b'x')\r", b"1"),
+            (b"\x03", b">>> "),
+        ]
+        assert [e.kind for e in exchanges] == ["control", "write", "control"]
+        assert exchanges[1].duration == 0.5
+
+    @pytest.mark.parametrize(
+        "command,kind",
+        [
+            (b"_w(_a('eHh4'))", "write"),
+            (b"f=open('/a', 'rb');_=f.seek(0);ch=f.read(256);f.close();ch", "read"),
+            (b"h.hexdigest()", "checksum"),
+            (scripts.WALK_SCRIPT.encode(), "walk"),
+            (b"import gc;_=gc.collect();gc.mem_free()", "memory"),
+            (b"\x05A\x01", "control"),
+            (b"import sys", "other"),
+        ],
+    )
+    def test_classify_command(self, command, kind):
+        assert session.classify_command(command) == kind
+
+    def test_analyze(self, tmp_path):
+        report = session.analyze(session.SessionRecording.load(self._record(tmp_path)))
+        kinds = {c.kind: c for c in report.commands}
+        assert kinds["write"].count == 3
+        assert kinds["write"].sent > 2000
+        assert kinds["control"].count >= 4
+        assert report.sent == sum(c.sent for c in report.commands)
+        assert report.exchanges == sum(c.count for c in report.commands)
+        assert 0 < report.device_seconds <= report.duration
+
+    def test_replay(self, tmp_path):
+        recording = session.SessionRecording.load(self._record(tmp_path))
+        port = backend_replay.ReplaySerial(recording)
+        with rawpaste.RawPasteTransport(port, timeout=1) as transport:
+            transport.write_file(b"y" * 2000, DevicePath("/main.py"), block_size=1024)
+            assert transport.exec_raw("print(open('/main.py').read().count('y'))") == b"2000\n"
+        assert port.exhausted
+
+    def test_replay__diverged(self, tmp_path):
+        recording = session.SessionRecording.load(self._record(tmp_path))
+        port = backend_replay.ReplaySerial(recording)
+        port.read(port.in_waiting)
+        port.write(b"\r\x03\x03")
+        with pytest.raises(PyDeviceError, match="diverged"):
+            port.write(b"unexpected")
+        port.read(port.in_waiting)
+        with pytest.raises(PyDeviceError, match="diverged"):
+            for _ in range(backend_replay.MAX_STARVED_READS + 1):
+                port.read(port.in_waiting)
+
+    def test_replay_backend__unsupported(self, tmp_path):
+        path = tmp_path / "session.jsonl"
+        session.SessionRecorder(path, backend="rshell", port="/dev/ttyUSB0").attach(
+            FakeRawReplSerial(tmp_path)
+        ).detach()
+        with pytest.raises(PyDeviceUnsupportedError):
+            backend_replay.ReplayPyDeviceBackend().establish(str(path))
+
+    @pytest.mark.skipif(sys.platform.startswith("win"), reason="requires a pseudo-terminal")
+    def test_record_replay__pydevice(self, tmp_path):
+        root = tmp_path / "device"
+        root.mkdir()
+        path = tmp_path / "session.jsonl"
+        with simulator.SimulatedDevice(root) as device:
+            pyd = PyDevice(
+                str(root),
+                backend=lambda: simulator.SimulatedPyDeviceBackend(device),
+                record_session=path,
+            )
+            pyd.pydevice.write_file("content", DevicePath("/main.py"))
+            pyd.disconnect()
+        replayed = PyDevice(str(path), backend=backend_replay.ReplayPyDeviceBackend)
+        replayed.pydevice.write_file("content", DevicePath("/main.py"))
+        assert replayed.pydevice.serial.exhausted
+
+
+class TestCalibrate:
+    FINGERPRINT = fingerprint.DeviceFingerprint(
+        "esp32", "1.20.0", "v1.20.0", "ESP32 module", "micropython", "1.20.0"
+    )
+
+    @pytest.fixture
+    def mock_backend(self, mocker: MockFixture):
+        backend = mocker.MagicMock(backend_upydevice.UPyDeviceBackend)
+        backend._compute_chunk_size.return_value = 2048
+        backend.resolve_path.side_effect = DevicePath
+        return backend
+
+    def _patch_trials(self, mocker: MockFixture, write: dict, read: dict):
+        """Time trials by (mode, chunk size), unreliable unless listed."""
+
+        def _write(pyd, sample, path, repeats):
+            profile = pyd.use_link_profile.call_args.args[0]
+            mode = "raw-paste" if profile.raw_paste else "repl"
+            seconds = write.get((mode, profile.write_chunk_size))
+            return (seconds or 1.0, seconds is not None)
+
+        def _read(pyd, sample, path, repeats, *, stream):
+            profile = pyd.use_link_profile.call_args.args[0]
+            seconds = read.get(("stream" if stream else "chunked", profile.read_chunk_size))
+            return (seconds or 1.0, seconds is not None)
+
+        mocker.patch.object(calibrate, "_time_write", side_effect=_write)
+        mocker.patch.object(calibrate, "_time_read", side_effect=_read)
+
+    def test_calibrate__fastest_reliable(self, mock_backend, mocker):
+        self._patch_trials(
+            mocker,
+            write={("raw-paste", 768): 0.5, ("repl", 256): 0.4, ("repl", 1024): 0.1},
+            read={("stream", 1024): 0.2, ("chunked", 256): 0.3},
+        )
+        trials = []
+        result = calibrate.calibrate(
+            mock_backend, chunk_sizes=(256, 1024, 4096), sample_size=1000, on_trial=trials.append
+        )
+        assert result.profile == transfer.LinkProfile(
+            write_chunk_size=1024,
+            read_chunk_size=1024,
+            raw_paste=False,
+            stream_reads=True,
+            write_throughput=10000.0,
+            read_throughput=5000.0,
+        )
+        # sizes beyond device memory are skipped, raw-paste is sent in whole lines.
+        assert [(t.mode, t.chunk_size) for t in trials] == [
+            ("raw-paste", 768),
+            ("repl", 256),
+            ("repl", 1024),
+            ("stream", 256),
+            ("stream", 1024),
+            ("chunked", 256),
+            ("chunked", 1024),
+        ]
+        assert result.trials == trials
+        # settings are reset and the sample removed afterwards.
+        mock_backend.use_link_profile.assert_called_with(None)
+        mock_backend.remove.assert_called_once_with(calibrate.CALIBRATION_PATH)
+
+    def test_calibrate__unreliable(self, mock_backend, mocker):
+        self._patch_trials(mocker, write={("repl", 256): 0.4}, read={})
+        with pytest.raises(PyDeviceError, match="No reliable read settings"):
+            calibrate.calibrate(mock_backend, chunk_sizes=(256,))
+        mock_backend.remove.assert_called_once()
+
+    def test_calibrate__simulator(self, tmp_path):
+        pyd = simulator.SimulatedPyDeviceBackend().establish(str(tmp_path))
+        try:
+            pyd.connect()
+            result = calibrate.calibrate(pyd, chunk_sizes=(256, 1024), sample_size=1024, repeats=1)
+        finally:
+            pyd.close()
+        assert all(t.ok for t in result.trials)
+        assert len(result.trials) == 7
+        assert result.profile.write_throughput > 0
+        assert not (tmp_path / calibrate.CALIBRATION_PATH.lstrip("/")).exists()
+        # sample is sent as is during calibration only.
+        assert pyd.compress_min_size == backend_upydevice.UPyDeviceBackend.compress_min_size
+
+    def test_calibrate__unsupported(self, mocker):
+        with pytest.raises(PyDeviceUnsupportedError, match="does not support calibration"):
+            calibrate.calibrate(mocker.MagicMock(MetaPyDeviceBackend))
+
+    def test_store(self, tmp_path):
+        store = calibrate.LinkProfileStore(tmp_path / "profiles" / "link_profiles.json")
+        assert not store
+        assert store.get(self.FINGERPRINT.digest) is None
+        profile = transfer.LinkProfile(512, 1024, raw_paste=False)
+        store.save(self.FINGERPRINT, profile)
+        assert len(store) == 1
+        assert calibrate.LinkProfileStore(store.path).get(self.FINGERPRINT.digest) == profile
+        store.path.write_text('{"abc": {"profile": {"unknown": 1}}}')
+        assert store.get("abc") is None
+        store.path.write_text("not json")
+        assert not store
+
+    def test_use_link_profile(self, mock_upy):
+        pyd = backend_upydevice.UPyDeviceBackend().establish(MOCK_PORT)
+        pyd.use_link_profile(transfer.LinkProfile(512, 1024, raw_paste=False, stream_reads=False))
+        assert pyd._compute_chunk_size() == 1024
+        assert pyd.write_tuner.size == pyd.write_tuner.maximum == 512
+        assert pyd.read_tuner.size == pyd.read_tuner.maximum == 1024
+        assert pyd._raw_paste_supported is False
+        # no probing of device memory.
+        mock_upy.SerialDevice.return_value.cmd.assert_not_called()
+        pyd.use_link_profile(None)
+        assert pyd.link_profile is None
+        assert pyd._raw_paste_supported is None
+
+    def test_pydevice__link_profile(self, mocker: MockFixture, tmp_path):
+        mock_backend = mocker.MagicMock(backend_upydevice.UPyDeviceBackend)
+        mock_backend.return_value.establish.return_value = mock_backend.return_value
+        mock_read = mocker.patch(
+            "micropy.pyd.pydevice.read_fingerprint", return_value=self.FINGERPRINT
+        )
+        store = calibrate.LinkProfileStore(tmp_path / "link_profiles.json")
+        # nothing calibrated yet, fingerprint is not read.
+        PyDevice(MOCK_PORT, backend=mock_backend, link_profiles=store)
+        mock_read.assert_not_called()
+        profile = transfer.LinkProfile(512, 1024)
+        store.save(self.FINGERPRINT, profile)
+        pyd = PyDevice(MOCK_PORT, backend=mock_backend, link_profiles=store)
+        assert pyd.fingerprint == self.FINGERPRINT
+        mock_backend.return_value.use_link_profile.assert_called_once_with(profile)
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="requires unix sockets")
+class TestBroker:
+    @pytest.fixture
+    def device_root(self, tmp_path):
+        root = tmp_path / "device"
+        (root / "lib").mkdir(parents=True)
+        (root / "lib" / "mod.py").write_text("value = 42\n")
+        return root
+
+    @pytest.fixture
+    def served(self, device_root, monkeypatch):
+        # tmp_path is too long for a unix socket path.
+        with tempfile.TemporaryDirectory(prefix="mpy") as broker_dir:
+            monkeypatch.setattr(broker, "BROKER_DIR", Path(broker_dir) / "brokers")
+            yield from self._serve(device_root)
+
+    def _serve(self, device_root):
+        pyd = simulator.SimulatedPyDeviceBackend().establish(str(device_root))
+        pyd.connect()
+        device_broker = broker.DeviceBroker(pyd)
+        thread = threading.Thread(target=device_broker.serve_forever, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not broker.is_running(pyd.location):
+            assert time.monotonic() < deadline, "broker did not start"
+            time.sleep(0.01)
+        yield device_broker
+        broker.shutdown(pyd.location)
+        thread.join(5)
+        pyd.close()
+
+    @pytest.fixture
+    def client(self, served):
+        client = broker.BrokerPyDeviceBackend().establish(served.location)
+        client.connect()
+        yield client
+        client.disconnect()
+
+    def test_socket_path(self):
+        assert broker.socket_path("/dev/ttyUSB0").name == "dev-ttyUSB0.sock"
+        assert broker.socket_path("COM3").name == "COM3.sock"
+        long_path = broker.socket_path("/tmp/" + "x" * 200 + "/device")
+        assert len(long_path.name) < 40
+        assert long_path != broker.socket_path("/tmp/" + "y" * 200 + "/device")
+
+    def test_eval(self, client):
+        consumer = MagicMock()
+        client.eval("import mod; print(mod.value)", consumer=consumer)
+        output = "".join(c.args[0] for c in consumer.on_message.call_args_list)
+        assert output.strip() == "42"
+        assert client.connected
+        assert client.resolve_path("lib") == "/lib"
+
+    def test_transfer(self, client, device_root, tmp_path, monkeypatch):
+        # host paths are relative to the client, not the broker.
+        monkeypatch.chdir(tmp_path)
+        Path("main.py").write_text("print('hi')\n")
+        consumer = MagicMock()
+        client.push_file(HostPath("main.py"), DevicePath("/main.py"), consumer=consumer)
+        assert (device_root / "main.py").read_text() == "print('hi')\n"
+        consumer.on_start.assert_called()
+        client.pull_file(DevicePath("/lib/mod.py"), HostPath("mod.py"))
+        assert Path("mod.py").read_text() == "value = 42\n"
+        entries = client.walk("/lib")
+        assert entries == [DeviceEntry(DevicePath("/lib/mod.py"), "file", 11, ANY)]
+        client.remove(DevicePath("/main.py"))
+        assert not (device_root / "main.py").exists()
+
+    def test_errors(self, served, client):
+        response = served.dispatch({"op": "establish", "args": ["/dev/other"]}, MagicMock())
+        assert response["error"]["type"] == "PyDeviceUnsupportedError"
+        with pytest.raises(PyDeviceUnsupportedError, match="Can not send"):
+            client.push_file(HostPath("main.py"), DevicePath("/main.py"), transfer=object())
+        # one client waiting on the device does not keep others from connecting.
+        other = broker.BrokerPyDeviceBackend().establish(served.location)
+        assert other.resolve_path("/") == "/"
+        other.disconnect()
+
+    def test_permissions(self, served):
+        assert served.path.parent.stat().st_mode & 0o777 == 0o700
+        assert served.path.stat().st_mode & 0o777 == 0o600
+
+    def test_checksum(self, served, tmp_path, mocker: MockFixture):
+        seen = []
+
+        def _pull_file(*args, **kwargs):
+            seen.append(served.backend.checksum)
+
+        mocker.patch.object(served.backend, "pull_file", side_effect=_pull_file)
+        pyd = PyDevice(served.location, backend=broker.BrokerPyDeviceBackend, checksum="crc32")
+        pyd.pydevice.pull_file(DevicePath("/lib/mod.py"), HostPath(str(tmp_path / "mod.py")))
+        pyd.disconnect()
+        client = broker.BrokerPyDeviceBackend().establish(served.location)
+        client.pull_file(DevicePath("/lib/mod.py"), HostPath(str(tmp_path / "mod.py")))
+        client.disconnect()
+        # only for the request of the client that set it.
+        assert seen == ["crc32", "sha256"]
+        assert served.backend.checksum == "sha256"
+
+    def test_calibrate(self, served, client):
+        trials: list[calibrate.CalibrationTrial] = []
+        result = calibrate.calibrate(
+            client, chunk_sizes=(256,), sample_size=512, repeats=1, on_trial=trials.append
+        )
+        assert trials == result.trials
+        assert all(t.ok for t in trials)
+        # the broker transfers with the calibrated link from then on.
+        assert served.backend.link_profile == result.profile
+
+    def test_stale_socket(self, served, tmp_path):
+        assert not broker.is_running("/dev/missing")
+        with pytest.raises(PyDeviceError, match="already running"):
+            broker.DeviceBroker(served.backend).serve_forever()
+        path = broker.socket_path("/dev/stale")
+        path.write_text("")
+        assert not broker.is_running("/dev/stale")
+        client = broker.BrokerPyDeviceBackend().establish("/dev/stale")
+        with pytest.raises(PyDeviceError):
+            client.eval("print(1)")
+
+    def test_shutdown(self, served):
+        assert broker.shutdown(served.location)
+        deadline = time.monotonic() + 5
+        while served.path.exists():
+            assert time.monotonic() < deadline, "broker did not stop"
+            time.sleep(0.01)
+        assert not broker.shutdown(served.location)
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="requires a pseudo-terminal")
+class TestDiscovery:
+    OUTPUT = (
+        "@@MPY_DEVICE:['esp32', '1.22.0', 'v1.22.0 on 2024-01-05', 'ESP32 module', "
+        "'3c71bf0a1b2c', 112000]\r\n"
+    )
+
+    def _info(self, port: str, unique_id: str) -> discovery.DeviceInfo:
+        return discovery.DeviceInfo(port, "esp32", "1.22.0", "v1.22.0", "ESP32", unique_id)
+
+    def test_from_output(self):
+        info = discovery.DeviceInfo.from_output("/dev/ttyUSB0", self.OUTPUT, description="CP2102")
+        assert info.unique_id == "3c71bf0a1b2c"
+        assert info.mem_free == 112000
+        assert info.description == "CP2102"
+        with pytest.raises(PyDeviceError, match="No MicroPython board"):
+            discovery.DeviceInfo.from_output("/dev/ttyUSB0", "garbage")
+        with pytest.raises(PyDeviceError, match="Invalid probe output"):
+            discovery.DeviceInfo.from_output("/dev/ttyUSB0", "@@MPY_DEVICE:[1, 2]")
+
+    def test_discover(self, tmp_path):
+        paste = simulator.SimulatedDevice(tmp_path, simulator.SimulatorConfig()).start()
+        no_paste = simulator.SimulatedDevice(
+            tmp_path, simulator.SimulatorConfig(raw_paste=False)
+        ).start()
+        # nothing answers on the other end.
+        controller, silent = os.openpty()
+        cache = discovery.DeviceCache(tmp_path / "devices.json")
+        results = []
+        ports = [paste.port, no_paste.port, os.ttyname(silent)]
+        try:
+            started = time.monotonic()
+            devices = discovery.discover(
+                ports,
+                timeout=0.5,
+                cache=cache,
+                on_result=results.append,
+            )
+            elapsed = time.monotonic() - started
+        finally:
+            paste.stop()
+            no_paste.stop()
+            os.close(controller)
+            os.close(silent)
+        assert [d.port for d in devices] == ports[:2]
+        assert devices[0].machine == simulator.MACHINE
+        assert devices[0].unique_id == "000102030405"
+        assert devices[0].mem_free == 100_000
+        assert [r.ok for r in results].count(False) == 1
+        # ports are probed at once, not one after another.
+        assert elapsed < 1.5
+        assert cache.load() == devices
+
+    def test_probe_broker(self, mocker: MockFixture):
+        mocker.patch.object(broker, "is_running", return_value=True)
+        client = mocker.patch.object(broker, "BrokerPyDeviceBackend")
+        client.return_value.establish.return_value.eval.side_effect = (
+            lambda script, consumer: consumer.on_message(self.OUTPUT)
+        )
+        info = discovery.probe_port("/dev/ttyUSB0")
+        assert info.unique_id == "3c71bf0a1b2c"
+        client.return_value.establish.return_value.disconnect.assert_called_once()
+
+    def test_candidate_ports(self, mocker: MockFixture):
+        ports = [
+            types.SimpleNamespace(device="/dev/ttyS0", vid=None, description="n/a"),
+            types.SimpleNamespace(device="/dev/ttyACM0", vid=None, description="n/a"),
+            types.SimpleNamespace(device="COM3", vid=0x10C4, description="CP2102"),
+        ]
+        mocker.patch.object(discovery.list_ports, "comports", return_value=ports)
+        assert discovery.candidate_ports() == {"/dev/ttyACM0": "", "COM3": "CP2102"}
+
+    def test_cache(self, tmp_path, mocker: MockFixture):
+        cache = discovery.DeviceCache(tmp_path / "devices.json", ttl=60)
+        assert cache.load() is None
+        cache.save([self._info("/dev/ttyUSB0", "3c71bf0a"), self._info("/dev/ttyUSB1", "3c71ff01")])
+        assert cache.port_for("3C71BF") == "/dev/ttyUSB0"
+        # ambiguous or too short.
+        assert cache.port_for("3c71") is None
+        assert cache.port_for("3c7") is None
+        cache.update([self._info("/dev/ttyUSB1", "aabbccdd")], ports=["/dev/ttyUSB1"])
+        assert [d.unique_id for d in cache.load()] == ["3c71bf0a", "aabbccdd"]
+        mocker.patch.object(discovery.time, "time", return_value=time.time() + 120)
+        assert cache.load() is None
+        assert cache.port_for("3c71bf") is None
+
+
+class TestScriptCache:
+    SCRIPT = "print('ran', " + "0 + " * 400 + "1)\n"
+
+    @pytest.fixture
+    def backend(self, tmp_path):
+        with simulator.SimulatedDevice(tmp_path) as device:
+            pyd = simulator.SimulatedPyDeviceBackend(device).establish(str(tmp_path))
+            pyd.connect()
+            pyd.device = device
+            yield pyd
+            pyd.disconnect()
+
+    def _run(self, backend, script: str, path: str = "helper.py") -> str:
+        consumer = MagicMock()
+        backend.eval_script(script, DevicePath(path), consumer=consumer)
+        return "".join(str(c.args[0]) for c in consumer.on_message.call_args_list)
+
+    def test_cached(self, backend, tmp_path):
+        cache_dir = tmp_path / scripts.SCRIPT_CACHE_DIR
+        assert "ran 1" in self._run(backend, self.SCRIPT)
+        cached = [p.name for p in cache_dir.iterdir() if p.name != "index"]
+        assert len(cached) == 1 and cached[0].endswith(".py")
+        backend.device.stats.reset()
+        # runs again without uploading.
+        assert "ran 1" in self._run(backend, self.SCRIPT)
+        assert backend.device.stats.bytes_in < len(self.SCRIPT)
+        assert not (tmp_path / "helper.py").exists()
+
+    def test_evict(self, backend, tmp_path):
+        backend.script_cache_budget = len(self.SCRIPT) * 2 + 10
+        first, second, third = (self.SCRIPT.replace("1)", f"{n})") for n in (1, 2, 3))
+        self._run(backend, first)
+        self._run(backend, second)
+        # first is used most recently, so second is evicted for third.
+        self._run(backend, first)
+        assert "ran 3" in self._run(backend, third)
+        cache_dir = tmp_path / scripts.SCRIPT_CACHE_DIR
+        index = (cache_dir / "index").read_text().split()
+        assert len(index) == 2
+        assert sorted(index) == sorted(p.name for p in cache_dir.iterdir() if p.name != "index")
+        backend.device.stats.reset()
+        self._run(backend, first)
+        assert backend.device.stats.bytes_in < len(self.SCRIPT)
+
+    def test_uncached(self, backend, tmp_path):
+        # anonymous scripts are one-off, and too large ones do not fit.
+        assert "ran 1" in self._run(backend, self.SCRIPT, path=None)
+        backend.script_cache_budget = 16
+        assert "ran 1" in self._run(backend, self.SCRIPT)
+        assert not (tmp_path / scripts.SCRIPT_CACHE_DIR).exists()
+        assert not (tmp_path / "helper.py").exists()
+
+    def test_failed(self, backend):
+        assert "Script failed" in self._run(backend, "raise ValueError('boom')\n")
+        assert "Script failed" in self._run(backend, "raise ValueError('boom')\n")
+
+
+class TestCompression:
+    CONTENTS = "".join(f"def func_{i}(a: int, b: str) -> None: ...\n" for i in range(200))
+
+    @pytest.fixture
+    def backend(self, request, tmp_path):
+        config = simulator.SimulatorConfig(compression=getattr(request, "param", "deflate"))
+        with simulator.SimulatedDevice(tmp_path, config) as device:
+            pyd = simulator.SimulatedPyDeviceBackend(device).establish(str(tmp_path))
+            pyd.connect()
+            yield pyd
+            pyd.disconnect()
+
+    def test_codec(self):
+        data = self.CONTENTS.encode() * 100
+        packed = compression.compress(io.BytesIO(data)).read()
+        assert compression.worthwhile(len(data), len(packed))
+        unpacked = io.BytesIO()
+        assert compression.decompress(io.BytesIO(packed), unpacked) == len(data)
+        assert unpacked.getvalue() == data
+        with pytest.raises(zlib.error):
+            compression.decompress(io.BytesIO(packed[:-10]), io.BytesIO())
+        assert not compression.worthwhile(100, 95)
+
+    @pytest.mark.parametrize(
+        "backend,expected",
+        [
+            ("deflate", compression.DeviceCompression("deflate", True)),
+            ("inflate", compression.DeviceCompression("deflate", False)),
+            ("zlib", compression.DeviceCompression("zlib", False)),
+            (None, compression.DeviceCompression()),
+        ],
+        indirect=["backend"],
+    )
+    def test_transfer(self, backend, expected, tmp_path):
+        consumer = MagicMock()
+        stats = backend.device.stats
+        backend.write_file(self.CONTENTS, DevicePath("/stub.pyi"), consumer=consumer)
+        assert backend._compression == expected
+        assert (tmp_path / "stub.pyi").read_text() == self.CONTENTS
+        assert (stats.bytes_in < len(self.CONTENTS) / 2) is expected.decompress
+        stats.reset()
+        for stream in (True, False):
+            read = backend.read_file(DevicePath("/stub.pyi"), stream=stream, consumer=consumer)
+            assert read == self.CONTENTS
+        assert (stats.bytes_out < len(self.CONTENTS)) is expected.compress
+        assert [p.name for p in tmp_path.iterdir()] == ["stub.pyi"]
+
+    def test_transfer__small(self, backend, tmp_path):
+        backend.write_file("x = 1\n", DevicePath("/main.py"))
+        assert backend.read_file(DevicePath("/main.py")) == "x = 1\n"
+        # not worth probing the device for.
+        assert backend._compression is None
+
+    def test_transfer__incompressible(self, backend, tmp_path):
+        contents = random.Random(0).randbytes(4096)
+        consumer = MagicMock()
+        backend.write_file(contents, DevicePath("/data.bin"), consumer=consumer)
+        assert (tmp_path / "data.bin").read_bytes() == contents
+        assert not any("Compressed" in str(c) for c in consumer.on_message.call_args_list)
+        # device compressed it, then found it was not worth reading compressed.
+        staged = backend._stage_compressed_read(DevicePath("/data.bin"), 4096, consumer=consumer)
+        assert staged is None
+        assert [p.name for p in tmp_path.iterdir()] == ["data.bin"]
+
+    def test_write_file__fallback(self, backend, tmp_path, mocker: MockFixture):
+        # corrupt stream fails to decompress on the device.
+        corrupt = io.BytesIO(b"x\x9c" + b"\xff" * 200)
+        mocker.patch.object(compression, "compress", return_value=corrupt)
+        consumer = MagicMock()
+        backend.write_file(self.CONTENTS, DevicePath("/stub.pyi"), consumer=consumer)
+        assert (tmp_path / "stub.pyi").read_text() == self.CONTENTS
+        assert backend._compression == compression.DeviceCompression()
+        assert any("falling back" in str(c) for c in consumer.on_message.call_args_list)
+        assert [p.name for p in tmp_path.iterdir()] == ["stub.pyi"]
+
+    @pytest.mark.parametrize("flash_free,compressed", [(100_000, True), (8_192, False)])
+    def test_write_file__flash_free(self, tmp_path, flash_free, compressed):
+        config = simulator.SimulatorConfig(flash_free=flash_free)
+        consumer = MagicMock()
+        with simulator.SimulatedDevice(tmp_path, config) as device:
+            backend = simulator.SimulatedPyDeviceBackend(device).establish(str(tmp_path))
+            backend.connect()
+            # stub is ~8k uncompressed, plus the staged compressed file.
+            backend.write_file(self.CONTENTS, DevicePath("/stub.pyi"), consumer=consumer)
+            backend.disconnect()
+        messages = [str(c) for c in consumer.on_message.call_args_list]
+        assert any("Compressed" in m for m in messages) is compressed
+        assert any("Not enough space" in m for m in messages) is not compressed
+        assert (tmp_path / "stub.pyi").read_text() == self.CONTENTS
+        assert [p.name for p in tmp_path.iterdir()] == ["stub.pyi"]
+
+
+class TestHostStreaming:
+    @pytest.fixture
+    def backend(self, tmp_path):
+        (tmp_path / "device").mkdir()
+        with simulator.SimulatedDevice(tmp_path / "device") as device:
+            pyd = simulator.SimulatedPyDeviceBackend(device).establish(str(tmp_path / "device"))
+            pyd.connect()
+            yield pyd
+            pyd.disconnect()
+
+    @pytest.fixture(params=[2 * 1024, None], ids=["compressed", "plain"])
+    def contents(self, request, backend, tmp_path):
+        backend.compress_min_size = request.param
+        rng = random.Random(0)
+        # binary data, line endings and invalid utf-8 survive the round trip.
+        return b"line\r\n" * 500 + rng.randbytes(2000) + b"\xff\xfe\r"
+
+    def test_push_pull(self, backend, contents, tmp_path):
+        (tmp_path / "asset.bin").write_bytes(contents)
+        backend.push_file(HostPath(str(tmp_path / "asset.bin")), DevicePath("/asset.bin"))
+        assert (tmp_path / "device" / "asset.bin").read_bytes() == contents
+        for stream in (True, False):
+            target = tmp_path / f"pulled_{stream}.bin"
+            backend.pull_file(DevicePath("/asset.bin"), HostPath(str(target)), stream=stream)
+            assert target.read_bytes() == contents
+        assert not list(tmp_path.glob("*.part"))
+
+    def test_write_file__stream(self, backend, contents, tmp_path):
+        source = io.BytesIO(contents)
+        backend.write_file(source, DevicePath("/asset.bin"))
+        assert (tmp_path / "device" / "asset.bin").read_bytes() == contents
+
+    def test_read_file_into(self, backend, contents, tmp_path):
+        (tmp_path / "device" / "asset.bin").write_bytes(contents)
+        sink = io.BytesIO(b"stale contents")
+        assert backend.read_file_into(DevicePath("/asset.bin"), sink) == len(contents)
+        assert sink.getvalue() == contents
+
+    def test_pull_file__failed(self, backend, tmp_path, mocker: MockFixture):
+        target = tmp_path / "main.py"
+        target.write_text("previous")
+        mocker.patch.object(backend, "read_file_into", return_value=None)
+        backend.pull_file(DevicePath("/main.py"), HostPath(str(target)))
+        assert target.read_text() == "previous"
+        assert not list(tmp_path.glob("*.part"))
+
+
+class TestTelemetry:
+    def test_records(self, tmp_path):
+        records = []
+        cons = telemetry.TelemetryConsumer(tmp_path / "telemetry.jsonl", callback=records.append)
+        cons.on_start(name="Writing /main.py", size=4)
+        cons.on_update(size=2)
+        cons.on_event("retry", offset=2, error="timeout")
+        cons.on_event("reset")
+        cons.on_update(size=2)
+        cons.on_end()
+        cons.close()
+        assert len(records) == 1
+        record = records[0]
+        assert record.name == "Writing /main.py"
+        assert (record.size, record.bytes) == (4, 4)
+        assert len(record.chunk_latencies) == 2
+        assert (record.retries, record.resets, record.integrity_failures) == (1, 1, 0)
+        assert record.completed
+        lines = (tmp_path / "telemetry.jsonl").read_text().splitlines()
+        assert [json.loads(line)["name"] for line in lines] == ["Writing /main.py"]
+
+    def test_events_between_transfers(self):
+        cons = telemetry.TelemetryConsumer()
+        cons.on_start(name="Writing /a.py", size=1)
+        cons.on_event("retry")
+        # retried before the first attempt ended.
+        cons.on_start(name="Writing /a.py", size=1)
+        cons.on_end()
+        cons.on_event("integrity_failure")
+        cons.on_event("reset")
+        cons.on_start(name="Writing /a.py", size=1)
+        cons.on_end()
+        cons.on_start(name="Reading /b.py", size=1)
+        cons.close()
+        first, second, third, fourth = cons.records
+        assert (first.retries, first.completed) == (1, False)
+        assert (second.retries, second.completed) == (0, True)
+        assert (third.integrity_failures, third.resets, third.completed) == (1, 1, True)
+        assert (fourth.name, fourth.completed) == ("Reading /b.py", False)
+
+    def test_pydevice(self, tmp_path, mocker: MockFixture):
+        (tmp_path / "device").mkdir()
+        contents = b"data" * 256
+        (tmp_path / "device" / "asset.bin").write_bytes(contents)
+        cons = telemetry.TelemetryConsumer(tmp_path / "telemetry.jsonl")
+        with simulator.SimulatedDevice(tmp_path / "device") as device:
+            pyb = PyDevice(
+                str(tmp_path / "device"),
+                backend=lambda: simulator.SimulatedPyDeviceBackend(device),
+                stream_consumer=MagicMock(spec=["on_start", "on_update", "on_end"]),
+                telemetry=cons,
+            )
+            eval_ = pyb.pydevice.eval
+            failed = []
+
+            def _eval(command, **kwargs):
+                if "@@R" in command and not failed:
+                    failed.append(command)
+                    raise OSError("injected")
+                return eval_(command, **kwargs)
+
+            mocker.patch.object(pyb.pydevice, "eval", side_effect=_eval)
+            pyb.copy_from(DevicePath("/asset.bin"), HostPath(str(tmp_path / "asset.bin")))
+            pyb.disconnect()
+        assert (tmp_path / "asset.bin").read_bytes() == contents
+        (record,) = cons.records
+        assert record.name.startswith("Reading asset.bin")
+        assert (record.bytes, record.retries, record.resets) == (len(contents), 1, 1)
+        assert record.completed
+        assert (tmp_path / "telemetry.jsonl").read_text().count("\n") == 1
+
+
+class TestProfiler:
+    SCRIPT = """\
+from __future__ import annotations
+import micropython
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+@micropython.viper
+def fast(x):
+    return x
+class Sensor:
+    @staticmethod
+    def read():
+        return [0] * 100
+    def stream(self):
+        yield 1
+print('fib', fib(6), Sensor.read()[0], list(Sensor().stream()))
+"""
+
+    def test_instrument(self):
+        instrumented = profiler.instrument(self.SCRIPT)
+        assert instrumented.startswith(scripts.PROFILE_PRELUDE)
+        assert "__future__" not in instrumented
+        tree = ast.parse(instrumented)
+        decorated = {
+            node.name
+            for node in ast.walk(tree)
+            if isinstance(node, ast.FunctionDef)
+            and any("_mpy_pw" in ast.unparse(d) for d in node.decorator_list)
+        }
+        assert decorated == {"fib", "read"}
+        # sampled innermost, under staticmethod.
+        assert "@staticmethod\n        @_mpy_pw('Sensor.read')" in instrumented
+
+    def test_instrument__syntax_error(self):
+        instrumented = profiler.instrument("print(1 if)")
+        assert "exec('print(1 if)')" in instrumented
+        assert "_mpy_ps('end', '<module>')" in instrumented
+
+    def test_decoder(self):
+        messages, samples = [], []
+        decoder = profiler.ProfileDecoder(
+            consumer=consumers.MessageHandlers(on_message=messages.append),
+            on_sample=samples.append,
+        )
+        decoder.on_message("@@P start 0 1000 200 <module>\nhello\n@@P end 50 900 300 <module>\n")
+        assert messages == ["hello"]
+        assert samples == decoder.samples
+        assert samples[1] == profiler.ProfileSample("end", 50, 900, 300, "<module>")
+        with pytest.raises(PyDeviceError):
+            decoder.feed_line("@@P start x")
+
+    def test_summarize(self):
+        sample = profiler.ProfileSample
+        report = profiler.summarize(
+            [
+                sample("start", 0, 1000, 100, "<module>"),
+                sample("call", 10, 990, 110, "outer"),
+                sample("call", 20, 980, 120, "inner"),
+                sample("return", 50, 700, 400, "inner"),
+                sample("return", 70, 800, 300, "outer"),
+                sample("call", 80, 800, 300, "outer"),
+                sample("return", 90, 800, 300, "outer"),
+                sample("error", 95, 800, 300, "ValueError"),
+                sample("end", 100, 850, 250, "<module>"),
+            ]
+        )
+        outer, inner = report.functions
+        assert (outer.name, outer.calls, outer.total_us, outer.max_us) == ("outer", 2, 70, 60)
+        assert (inner.calls, inner.total_us, inner.max_growth) == (1, 30, 280)
+        assert (report.duration_us, report.peak_alloc, report.peak_growth) == (100, 400, 300)
+        assert report.min_free == 700
+        assert (report.error, report.completed) == ("ValueError", True)
+        assert profiler.summarize([]) == profiler.ProfileReport(samples=[])
+
+    def test_profile_script__simulator(self, tmp_path):
+        messages = []
+        script = self.SCRIPT.replace("@micropython.viper\n", "")
+        with simulator.SimulatedDevice(tmp_path) as device:
+            pyd = simulator.SimulatedPyDeviceBackend(device).establish(str(tmp_path))
+            pyd.connect()
+            consumer = MagicMock(spec=["on_start", "on_update", "on_end"])
+            consumer.on_message = messages.append
+            report = profiler.profile_script(pyd, script, consumer=consumer)
+            failed = profiler.profile_script(pyd, "raise ValueError('bad')", consumer=consumer)
+            pyd.disconnect()
+        assert messages[0] == "fib 8 0 [1]"
+        assert {f.name: f.calls for f in report.functions} == {"fib": 25, "Sensor.read": 1}
+        assert report.completed and report.error is None
+        assert report.samples[0].kind == "start"
+        assert failed.error == "ValueError"
+        assert not list(tmp_path.glob("*.py"))
+
+    def test_profile_script__device_error(self):
+        pyd = MagicMock()
+
+        def _eval_script(contents, *, consumer):
+            consumer.on_message("@@P start 0 9000 1000 <module>\n@@P call 5 9000 1000 fib\n")
+            raise PyDeviceError("connection lost")
+
+        pyd.eval_script.side_effect = _eval_script
+        with pytest.raises(PyDeviceProfileError, match="connection lost") as exc_info:
+            profiler.profile_script(pyd, "fib(30)")
+        report = exc_info.value.report
+        assert [s.kind for s in report.samples] == ["start", "call"]
+        assert not report.completed
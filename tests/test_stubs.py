@@ -229,3 +229,72 @@ def test_iter_by_firm_stubs(mocker):
     manager._firmware = {firm_stub}
     stub_iter = list(manager.iter_by_firmware())
     assert stub_iter == [(firm_stub, [dev_stub]), ("Unknown", [unk_stub])]
+
+
+def test_stub_index(shared_datadir, tmp_path, mocker):
+    """should index stub modules and symbols"""
+    index_path = tmp_path / "stubs.index.json"
+    stub = stubs.stubs.DeviceStub(shared_datadir / "esp32_test_stub")
+    index = stubs.StubIndex(index_path)
+    assert index.sync([stub])
+    assert index_path.exists()
+    assert [(m.stub, m.module, m.symbol) for m in index.which("machine.ADC")] == [
+        ("esp32-1.11.0", "machine", "ADC")
+    ]
+    assert [m.module for m in index.which("ntptime")] == ["ntptime"]
+    assert index.which("ntptime")[0].path.suffix == ".pyi"
+    assert [m.module for m in index.which("settime")] == ["ntptime"]
+    assert index.which("machine.NotReal") == []
+    # should not reparse unchanged stubs.
+    parse_spy = mocker.spy(stubs.StubIndex, "parse_symbols")
+    index = stubs.StubIndex(index_path)
+    assert not index.sync([stub])
+    assert index.which("machine.I2C")
+    parse_spy.assert_not_called()
+    # removed stubs are dropped.
+    assert index.sync([])
+    assert index.which("machine") == []
+
+
+def test_stub_index__changed_file(shared_datadir, tmp_path):
+    """should reindex changed stub files"""
+    stub_path = tmp_path / "esp32_test_stub"
+    shutil.copytree(shared_datadir / "esp32_test_stub", stub_path)
+    stub = stubs.stubs.DeviceStub(stub_path)
+    index = stubs.StubIndex()
+    index.sync([stub])
+    assert not index.which("machine.WLAN")
+    with (stub_path / "stubs" / "machine.py").open("a") as f:
+        f.write("\n\nclass WLAN:\n    pass\n")
+    assert index.sync([stub])
+    assert index.which("machine.WLAN")
+
+
+def test_manager_which(shared_datadir, tmp_path):
+    """should query installed stubs"""
+    resource = tmp_path / "stubs"
+    resource.mkdir()
+    manager = stubs.StubManager(resource=resource)
+    manager.add(shared_datadir / "fware_test_stub")
+    manager.add(shared_datadir / "esp32_test_stub")
+    assert manager.index_path == tmp_path / "stubs.index.json"
+    assert {m.stub for m in manager.which("utarfile")} == {"micropython"}
+    assert {m.stub for m in manager.which("ntptime")} == {"esp32-micropython-1.11.0"}
+    assert manager.index_path.exists()
+
+
+def test_manager_find_by_fingerprint(shared_datadir, tmp_path):
+    """should find stubs created from a matching device"""
+    gen_path = tmp_path / "generated"
+    shutil.copytree(shared_datadir / "stubber_test_stub", gen_path / "esp32_1_11_0")
+    (tmp_path / "stubs").mkdir()
+    manager = stubs.StubManager(resource=tmp_path / "stubs")
+    out_stub = manager.from_stubber(
+        gen_path, tmp_path / "out", fingerprint={"digest": "abc", "changeset": "123"}
+    )
+    stub = manager.add(out_stub)
+    assert stub.info["fingerprint"]["digest"] == "abc"
+    assert manager.find_by_fingerprint("abc", changeset="123") == stub
+    assert manager.find_by_fingerprint("abc") == stub
+    assert manager.find_by_fingerprint("abc", changeset="456") is None
+    assert manager.find_by_fingerprint("def") is None
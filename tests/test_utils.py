@@ -129,10 +129,71 @@ def test_prepare_create_stubs__py37():
 
 
 @pytest.mark.xfail(sys.version_info < (3, 8), reason="requires python >= 3.8", raises=ImportError)
-def test_prepare_create_stubs():
-    create_stubs = utils.stub.prepare_create_stubs()
+def test_prepare_create_stubs(tmp_path, mocker):
+    parse_spy = mocker.spy(utils.stub.cst, "parse_module")
+    create_stubs = utils.stub.prepare_create_stubs(cache_dir=tmp_path, use_cache=False)
     assert isinstance(create_stubs, io.StringIO)
     assert len(create_stubs.getvalue()) > 1
+    parse_spy.assert_called()
+    assert not list(tmp_path.iterdir())
+
+
+def test_prepare_create_stubs__cache(tmp_path, mocker):
+    create_stubs = utils.stub.prepare_create_stubs(cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("*.py"))) == 1
+    parse_spy = mocker.spy(utils.stub.cst, "parse_module")
+    cached = utils.stub.prepare_create_stubs(cache_dir=tmp_path)
+    parse_spy.assert_not_called()
+    assert isinstance(cached, io.StringIO)
+    assert cached.getvalue() == create_stubs.getvalue()
+    utils.stub.prepare_create_stubs(cache_dir=tmp_path, use_cache=False)
+    parse_spy.assert_called_once()
+
+
+def test_prepare_create_stubs__stream(tmp_path):
+    from stubber.codemod import board
+
+    create_stubs = utils.stub.prepare_create_stubs(stream=True, cache_dir=tmp_path)
+    source = create_stubs.getvalue()
+    assert "@@W" in source
+    compile(source, "createstubs.py", "exec")
+    with pytest.raises(ValueError):
+        utils.stub.prepare_create_stubs(
+            variant=board.CreateStubsVariant.DB, stream=True, cache_dir=tmp_path
+        )
+
+
+def test_create_stubs_cache_key():
+    from stubber.codemod import board
+    from stubber.codemod.modify_list import ListChangeSet
+
+    base_key = utils.stub.create_stubs_cache_key(variant=board.CreateStubsVariant.BASE)
+    assert base_key == utils.stub.create_stubs_cache_key(variant=board.CreateStubsVariant.BASE)
+    keys = {
+        base_key,
+        utils.stub.create_stubs_cache_key(variant=board.CreateStubsVariant.MEM),
+        utils.stub.create_stubs_cache_key(variant=board.CreateStubsVariant.BASE, compile=True),
+        utils.stub.create_stubs_cache_key(
+            variant=board.CreateStubsVariant.BASE,
+            modules_set=ListChangeSet.from_strings(add=["mod"]),
+        ),
+        utils.stub.create_stubs_cache_key(
+            variant=board.CreateStubsVariant.BASE,
+            modules_set=ListChangeSet.from_strings(add=["mod"], replace=True),
+        ),
+    }
+    assert len(keys) == 5
+
+
+def test_create_stubs_cache_key__prelude(mocker):
+    from stubber.codemod import board
+
+    variant = board.CreateStubsVariant.BASE
+    plain = utils.stub.create_stubs_cache_key(variant=variant)
+    streamed = utils.stub.create_stubs_cache_key(variant=variant, stream=True)
+    mocker.patch.object(utils.stub.scripts, "STREAM_WRITES_PRELUDE", "changed = True\n")
+    assert utils.stub.create_stubs_cache_key(variant=variant) == plain
+    assert utils.stub.create_stubs_cache_key(variant=variant, stream=True) != streamed
 
 
 def test_generate_stub(shared_datadir, tmp_path, mocker):